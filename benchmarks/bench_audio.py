@@ -0,0 +1,163 @@
+"""
+音频基准：本进程运行 WhipStandIn，推流端在子进程中用 whip_publish_webrtc 推合成视频，对比
+  video          —— 只有视频
+  audio20/audio10 —— 视频 + 合成 beep 音频（Opus 20ms / 10ms 帧）
+统计音频给事件循环带来的额外负担（推流进程 CPU、每 5ms 一次的探测协程的唤醒延迟）
+以及服务端测得的视频条码延迟和音频 beep 延迟。
+
+运行: python -m benchmarks.bench_audio --width 640 --height 480 --duration 10
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import sys
+import time
+
+from webrtc.SyntheticSource import SYNTHETIC_SOURCE
+from webrtc.WHIP_WebRTC import whip_publish_webrtc
+from webrtc.WhipStandIn import WhipStandIn, percentile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+STREAM_ID = "bench-audio"
+CASES = {"video": None, "audio20": 20, "audio10": 10}
+
+
+async def probe_loop(lags, interval=0.005):
+    """事件循环唤醒延迟：每次 sleep(interval) 实际多睡了多久（ms）"""
+    loop = asyncio.get_running_loop()
+    while True:
+        start = loop.time()
+        await asyncio.sleep(interval)
+        lags.append((loop.time() - start - interval) * 1000)
+
+
+async def publish(args):
+    """子进程：推流并在测量窗口结束时输出 RESULT 行，收到 stdin 的一行后退出"""
+    logging.getLogger("WHIP_Publisher").setLevel(logging.WARNING)
+    task = asyncio.ensure_future(whip_publish_webrtc(
+        args.url, STREAM_ID, camera_index=SYNTHETIC_SOURCE, width=args.width, height=args.height, fps=args.fps,
+        reconnect=False, audio="tone" if args.frame_ms else None, audio_frame_ms=args.frame_ms or 20,
+    ))
+    lags = []
+    probe = asyncio.ensure_future(probe_loop(lags))
+    try:
+        await asyncio.sleep(args.warmup)
+        lags.clear()
+        print("READY", flush=True)
+        start, start_cpu = time.monotonic(), time.process_time()
+        await asyncio.sleep(args.duration)
+        elapsed, cpu = time.monotonic() - start, time.process_time() - start_cpu
+        result = {
+            "cpu_pct": cpu / elapsed * 100,
+            "lag_p50_ms": percentile(lags, 0.5),
+            "lag_p99_ms": percentile(lags, 0.99),
+            "lag_max_ms": max(lags, default=None),
+        }
+        print("RESULT " + json.dumps(result), flush=True)
+        await asyncio.get_running_loop().run_in_executor(None, sys.stdin.readline)
+    finally:
+        probe.cancel()
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+
+
+def server_stats(server):
+    session = next((s for s in server.sessions.values() if s.stream_id == STREAM_ID), None)
+    if session is None:
+        return {}
+    result = {"recv_fps": session.stats.to_dict()["fps"], "video_p50_ms": session.stats.to_dict()["latency_p50_ms"]}
+    if session.audio is not None:
+        audio = session.audio.to_dict()
+        result.update(audio_kbps=audio["kbps"], audio_p50_ms=audio["latency_p50_ms"],
+                      audio_p95_ms=audio["latency_p95_ms"])
+    return result
+
+
+async def run_case(server, args, frame_ms):
+    process = await asyncio.create_subprocess_exec(
+        sys.executable, "-m", "benchmarks.bench_audio", "--publish", "--url", server.url,
+        "--width", str(args.width), "--height", str(args.height), "--fps", str(args.fps),
+        "--frame-ms", str(frame_ms or 0), "--warmup", str(args.warmup), "--duration", str(args.duration),
+        cwd=ROOT, stdin=asyncio.subprocess.PIPE, stdout=asyncio.subprocess.PIPE,
+    )
+    result = None
+    try:
+        while True:
+            line = await process.stdout.readline()
+            if not line:
+                break
+            line = line.decode().strip()
+            if line == "READY":
+                server.reset_stats()
+            elif line.startswith("RESULT "):
+                result = json.loads(line[len("RESULT "):])
+                result.update(server_stats(server))
+                process.stdin.write(b"\n")
+                await process.stdin.drain()
+        await process.wait()
+    finally:
+        if process.returncode is None:
+            process.kill()
+            await process.wait()
+    return result
+
+
+def fmt(value, spec=".1f"):
+    return "-" if value is None else format(value, spec)
+
+
+async def run(args):
+    server = WhipStandIn(port=args.port)
+    await server.start()
+    rows = []
+    try:
+        for name in args.cases.split(","):
+            result = await run_case(server, args, CASES[name])
+            rows.append((name, result))
+            print(f"{name}: {result}", file=sys.stderr)
+    finally:
+        await server.stop()
+
+    print(f"视频 {args.width}x{args.height} @{args.fps}fps，预热 {args.warmup}s，测量 {args.duration}s")
+    print(
+        f"{'场景':<10}{'CPU%':>7}{'循环延迟p50':>12}{'p99':>7}{'max':>7}{'接收fps':>9}{'视频p50':>9}"
+        f"{'音频kbps':>10}{'音频p50':>9}{'音频p95':>9}"
+    )
+    for name, r in rows:
+        if r is None:
+            print(f"{name:<10}  推流失败")
+            continue
+        print(
+            f"{name:<10}{fmt(r['cpu_pct']):>7}{fmt(r['lag_p50_ms'], '.2f'):>12}{fmt(r['lag_p99_ms'], '.2f'):>7}"
+            f"{fmt(r['lag_max_ms'], '.1f'):>7}{fmt(r.get('recv_fps')):>9}{fmt(r.get('video_p50_ms'), '.0f'):>9}"
+            f"{fmt(r.get('audio_kbps')):>10}{fmt(r.get('audio_p50_ms')):>9}{fmt(r.get('audio_p95_ms')):>9}"
+        )
+    print("注: 音频延迟为 beep 起点的采集时刻到服务端收到该包，包含分块（最多一帧）、编码、打包和本机网络；")
+    print("    beep 起点落在一帧中的位置取决于推流启动的时刻，每次运行在 0 到一帧之间，多跑几次看范围")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="音频轨道基准")
+    parser.add_argument("--cases", default=",".join(CASES), help=f"逗号分隔的场景（{', '.join(CASES)}）")
+    parser.add_argument("--width", type=int, default=640)
+    parser.add_argument("--height", type=int, default=480)
+    parser.add_argument("--fps", type=int, default=30)
+    parser.add_argument("--warmup", type=float, default=3.0)
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--port", type=int, default=17790)
+    # 以下为推流子进程使用的参数
+    parser.add_argument("--publish", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--url", default=None, help=argparse.SUPPRESS)
+    parser.add_argument("--frame-ms", type=int, default=0, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.publish:
+        asyncio.run(publish(args))
+    else:
+        asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
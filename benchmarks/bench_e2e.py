@@ -0,0 +1,250 @@
+"""
+端到端基准：本进程运行 WhipStandIn（服务端解码并读出画面中的时间戳条码），
+推流端在子进程中用合成源（SyntheticSource）推 N 路流，按 分辨率 x 路数 的矩阵统计
+glass-to-glass 延迟、服务端收到的帧率、编码耗时以及推流进程的 CPU 和内存。
+不需要摄像头和显示器，普通 Linux 主机即可运行。
+--whep 时本进程再用 WhepSubscriber 拉取每一路，额外统计拉流端的延迟（--jitter 为抖动缓冲帧数）。
+
+运行: python -m benchmarks.bench_e2e --resolutions 320x240,640x480 --streams 1,2 --duration 10
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+
+from webrtc.EncoderProfile import PROFILES
+from webrtc.MultiPublisher import MultiStreamPublisher, StreamSpec
+from webrtc.SenderHooks import time_encoder
+from webrtc.SyntheticSource import SYNTHETIC_SOURCE, frame_luma, read_stamp, stamp_latency_ms
+from webrtc.WhepSubscriber import WhepSubscriber
+from webrtc.WhipClient import WhipClient, create_http_session
+from webrtc.WhipStandIn import WhipStandIn, percentile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+STREAM_PREFIX = "bench-"
+
+
+def rss_mb(pid="self"):
+    """进程常驻内存（MB），读取 /proc"""
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except FileNotFoundError:
+        pass
+    return 0.0
+
+
+async def hook_encoders(publisher, samples):
+    """aiortc 编码器在第一帧时才创建，轮询直到每路都挂上计时"""
+    pending = [stream.pc.getSenders()[0] for stream in publisher.streams.values()]
+    while pending:
+        pending = [sender for sender in pending if not time_encoder(sender, samples.append)]
+        await asyncio.sleep(0.2)
+
+
+async def publish(args):
+    """子进程：推流并在测量窗口结束时输出 RESULT 行，收到 stdin 的一行后退出"""
+    specs = [
+        StreamSpec(
+            source=SYNTHETIC_SOURCE, width=args.width, height=args.height, fps=args.fps,
+            stream_id=f"{STREAM_PREFIX}{i}", encode_mode=args.encode_mode, encoder_profile=args.profile,
+        )
+        for i in range(args.streams)
+    ]
+    publisher = MultiStreamPublisher(args.url, specs)
+    encode_samples = []
+    hook_task = None
+    try:
+        await publisher.start()
+        if args.encode_mode == "inline":
+            hook_task = asyncio.ensure_future(hook_encoders(publisher, encode_samples))
+        await asyncio.sleep(args.warmup)
+
+        await publisher.collect_stats()
+        encode_samples.clear()
+        print("READY", flush=True)
+        await asyncio.sleep(args.duration)
+        stats = await publisher.collect_stats()
+
+        streams = stats["streams"].values()
+        cpu = stats["aggregate"]["process_cpu_pct"]
+        rss = rss_mb()
+        if args.encode_mode == "process":
+            # 编码在子进程中，CPU 和内存要加上各个编码进程
+            cpu += sum(s["source_cpu_pct"] for s in streams)
+            encode_ms = [stream.track.stats()["encode_avg_ms"] for stream in publisher.streams.values()]
+            rss += sum(rss_mb(stream.track.process.pid) for stream in publisher.streams.values())
+            encode_avg = sum(encode_ms) / len(encode_ms) if encode_ms else 0.0
+        else:
+            encode_avg = sum(encode_samples) / len(encode_samples) * 1000 if encode_samples else 0.0
+        result = {
+            "send_fps": sum(s["fps"] for s in streams) / max(len(stats["streams"]), 1),
+            "bitrate_kbps": stats["aggregate"]["bitrate_kbps"],
+            "encode_ms": encode_avg,
+            "cpu_pct": cpu,
+            "rss_mb": rss,
+        }
+        print("RESULT " + json.dumps(result), flush=True)
+        # 等主进程取完服务端统计再关闭会话
+        await asyncio.get_running_loop().run_in_executor(None, sys.stdin.readline)
+    finally:
+        if hook_task is not None:
+            hook_task.cancel()
+        await publisher.close()
+
+
+def server_stats(server, streams):
+    """服务端各路推流会话的帧率和条码延迟"""
+    sessions = [
+        s for s in server.sessions.values()
+        if s.kind == "whip" and s.stream_id.startswith(STREAM_PREFIX)
+    ]
+    latencies = [latency for s in sessions for latency in s.stats.latencies]
+    fps = [s.stats.to_dict()["fps"] for s in sessions]
+    return {
+        "sessions": len(sessions),
+        "recv_fps": sum(fps) / streams if streams else 0.0,
+        "latency_p50_ms": percentile(latencies, 0.5),
+        "latency_p95_ms": percentile(latencies, 0.95),
+        "latency_max_ms": max(latencies, default=None),
+    }
+
+
+async def watch(subscriber, latencies, measuring):
+    async for frame in subscriber.frames():
+        stamp = read_stamp(frame_luma(frame))
+        if stamp is not None and measuring.is_set():
+            latencies.append(stamp_latency_ms(stamp))
+
+
+async def run_case(server, args, width, height, streams, whip_client=None):
+    process = await asyncio.create_subprocess_exec(
+        sys.executable, "-m", "benchmarks.bench_e2e", "--publish",
+        "--url", server.url, "--width", str(width), "--height", str(height), "--fps", str(args.fps),
+        "--streams", str(streams), "--encode-mode", args.encode_mode,
+        "--warmup", str(args.warmup), "--duration", str(args.duration),
+        *(("--profile", args.profile) if args.profile else ()),
+        cwd=ROOT, stdin=asyncio.subprocess.PIPE, stdout=asyncio.subprocess.PIPE,
+    )
+    result = None
+    subscribers, tasks, whep_latencies = [], [], []
+    measuring = asyncio.Event()
+    try:
+        while True:
+            line = await process.stdout.readline()
+            if not line:
+                break
+            line = line.decode().strip()
+            if line == "READY":
+                if whip_client is not None:
+                    # 拉流在推流预热之后开始，首帧之前的延迟不计入
+                    jitter_frames = None if args.jitter < 0 else args.jitter
+                    for i in range(streams):
+                        subscriber = WhepSubscriber(whip_client, f"{STREAM_PREFIX}{i}", jitter_frames=jitter_frames)
+                        subscribers.append(await subscriber.start())
+                        tasks.append(asyncio.ensure_future(watch(subscriber, whep_latencies, measuring)))
+                    await asyncio.sleep(1.0)
+                server.reset_stats()
+                measuring.set()
+            elif line.startswith("RESULT "):
+                result = json.loads(line[len("RESULT "):])
+                result.update(server_stats(server, streams))
+                if whip_client is not None:
+                    result["whep_p50_ms"] = percentile(whep_latencies, 0.5)
+                    result["whep_p95_ms"] = percentile(whep_latencies, 0.95)
+                for task in tasks:
+                    task.cancel()
+                for subscriber in subscribers:
+                    await subscriber.close()
+                process.stdin.write(b"\n")
+                await process.stdin.drain()
+        await process.wait()
+    finally:
+        if process.returncode is None:
+            process.kill()
+            await process.wait()
+    return result
+
+
+def fmt(value, spec=".1f"):
+    return "-" if value is None else format(value, spec)
+
+
+async def run(args):
+    server = WhipStandIn(port=args.port)
+    await server.start()
+    http_session = whip_client = None
+    if args.whep:
+        http_session = create_http_session()
+        whip_client = WhipClient(server.url, http_session)
+    rows = []
+    try:
+        for resolution in args.resolutions.split(","):
+            width, height = (int(v) for v in resolution.split("x"))
+            for streams in (int(v) for v in args.streams.split(",")):
+                result = await run_case(server, args, width, height, streams, whip_client)
+                rows.append((resolution, streams, result))
+                print(f"{resolution} x{streams}: {result}", file=sys.stderr)
+    finally:
+        if http_session is not None:
+            await http_session.close()
+        await server.stop()
+
+    print(
+        f"编码模式 {args.encode_mode}，编码配置档 {args.profile or '无'}，{args.fps}fps，"
+        f"预热 {args.warmup}s，测量 {args.duration}s"
+    )
+    header = (
+        f"{'分辨率':<10}{'路数':>4}{'发送fps':>9}{'接收fps':>9}{'延迟p50':>9}{'延迟p95':>9}"
+        f"{'延迟max':>9}{'编码ms':>8}{'CPU%/路':>9}{'内存MB/路':>11}{'kbps/路':>9}"
+        + (f"{'WHEP p50':>10}{'WHEP p95':>10}" if args.whep else "")
+    )
+    print(header)
+    for resolution, streams, r in rows:
+        if r is None:
+            print(f"{resolution:<10}{streams:>4}  推流失败")
+            continue
+        print(
+            f"{resolution:<10}{streams:>4}{fmt(r['send_fps']):>9}{fmt(r['recv_fps']):>9}"
+            f"{fmt(r['latency_p50_ms'], '.0f'):>9}{fmt(r['latency_p95_ms'], '.0f'):>9}"
+            f"{fmt(r['latency_max_ms'], '.0f'):>9}{fmt(r['encode_ms'], '.2f'):>8}"
+            f"{fmt(r['cpu_pct'] / streams):>9}{fmt(r['rss_mb'] / streams):>11}"
+            f"{fmt(r['bitrate_kbps'] / streams, '.0f'):>9}"
+            + (f"{fmt(r['whep_p50_ms'], '.0f'):>10}{fmt(r['whep_p95_ms'], '.0f'):>10}" if args.whep else "")
+        )
+    print("注: 延迟为采集时刻到服务端解码完成，包含编码、打包、本机网络、抖动缓冲和解码")
+    if args.whep:
+        print("    WHEP 延迟在此基础上还包含测试服务为每个订阅者的重新编码（live777 只转发，不重新编码）")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="WHIP 端到端延迟基准")
+    parser.add_argument("--resolutions", default="320x240,640x480,1280x720")
+    parser.add_argument("--streams", default="1,2,4", help="路数列表")
+    parser.add_argument("--fps", type=int, default=30)
+    parser.add_argument("--encode-mode", default="inline", choices=("inline", "process"))
+    parser.add_argument("--profile", default=None, choices=tuple(PROFILES), help="编码配置档，默认不使用")
+    parser.add_argument("--warmup", type=float, default=3.0)
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--port", type=int, default=17778)
+    parser.add_argument("--whep", action="store_true", help="同时用 WhepSubscriber 拉流并统计拉流端延迟")
+    parser.add_argument("--jitter", type=int, default=0, help="拉流端抖动缓冲帧数，-1 为 aiortc 默认")
+    # 以下为推流子进程使用的参数
+    parser.add_argument("--publish", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--url", default=None, help=argparse.SUPPRESS)
+    parser.add_argument("--width", type=int, default=640, help=argparse.SUPPRESS)
+    parser.add_argument("--height", type=int, default=480, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.publish:
+        args.streams = int(args.streams)
+        asyncio.run(publish(args))
+    else:
+        asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+"""
+编码配置档基准：用合成源（SyntheticSource）生成同一组帧，分别交给各配置档对应的 aiortc 编码器，
+统计每帧编码耗时（墙钟和 CPU，多线程编码时 CPU 会高于墙钟）和输出码率。
+编码按配置档的首选编码进行（"aiortc" 档不设偏好，aiortc 默认先协商 VP8），--codec 可统一指定。
+
+运行: python -m benchmarks.bench_encoder --width 1280 --height 720 --frames 300
+"""
+import argparse
+import fractions
+import time
+
+from aiortc.rtcrtpparameters import RTCRtpCodecParameters
+
+from webrtc.EncoderProfile import PROFILES, create_profiled_encoder, get_profile
+from webrtc.FrameConverter import ZeroCopyI420Converter
+from webrtc.SyntheticSource import SyntheticCapture
+from webrtc.WhipStandIn import percentile
+
+# aiortc 未设置编码偏好时的首选编码
+AIORTC_DEFAULT_CODEC = "video/VP8"
+VIDEO_TIME_BASE = fractions.Fraction(1, 90000)
+
+
+def synthetic_frames(width, height, fps, count):
+    """预先生成 count 帧 I420 VideoFrame，各配置档编码完全相同的画面"""
+    capture = SyntheticCapture(width, height, fps=1000)
+    converter = ZeroCopyI420Converter()
+    frames = []
+    for i in range(count):
+        _, bgr = converter.read(capture)
+        frame = converter.convert(bgr)
+        frame.pts = i * 90000 // fps
+        frame.time_base = VIDEO_TIME_BASE
+        frames.append(frame)
+    return frames
+
+
+def bench(profile, mime_type, frames, fps):
+    codec = RTCRtpCodecParameters(mimeType=mime_type, clockRate=90000)
+    # "aiortc" 档等价于不使用配置档
+    encoder = create_profiled_encoder(codec, None if profile.name == "aiortc" else profile)
+    wall, cpu = [], []
+    total_bytes = 0
+    for i, frame in enumerate(frames):
+        start, start_cpu = time.perf_counter(), time.process_time()
+        payloads, _ = encoder.encode(frame, i == 0)
+        wall.append((time.perf_counter() - start) * 1000)
+        cpu.append((time.process_time() - start_cpu) * 1000)
+        total_bytes += sum(len(p) for p in payloads)
+    # 第一帧包含编码器初始化，不计入耗时
+    wall, cpu = wall[1:], cpu[1:]
+    return {
+        "encode_ms": sum(wall) / len(wall),
+        "encode_p95_ms": percentile(wall, 0.95),
+        "cpu_ms": sum(cpu) / len(cpu),
+        "kbps": total_bytes * 8 * fps / len(frames) / 1000,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="编码配置档基准")
+    parser.add_argument("--width", type=int, default=1280)
+    parser.add_argument("--height", type=int, default=720)
+    parser.add_argument("--fps", type=int, default=30)
+    parser.add_argument("--frames", type=int, default=300)
+    parser.add_argument("--profiles", default=",".join(PROFILES), help="逗号分隔的配置档名称")
+    parser.add_argument("--codec", default=None, choices=("h264", "vp8"), help="统一使用该编码，默认按配置档的首选")
+    args = parser.parse_args()
+
+    frames = synthetic_frames(args.width, args.height, args.fps, args.frames)
+    print(f"分辨率 {args.width}x{args.height}, {args.fps}fps, {args.frames} 帧")
+    print(f"{'配置档':<14}{'编码':<8}{'ms/帧':>8}{'p95':>8}{'CPU ms/帧':>11}{'kbps':>8}")
+    for name in args.profiles.split(","):
+        profile = get_profile(name)
+        if args.codec is not None:
+            mime_type = f"video/{args.codec.upper()}"
+        else:
+            mime_type = profile.codecs[0] if profile.codecs else AIORTC_DEFAULT_CODEC
+        r = bench(profile, mime_type, frames, args.fps)
+        print(
+            f"{name:<14}{mime_type[6:]:<8}{r['encode_ms']:>8.2f}{r['encode_p95_ms']:>8.2f}"
+            f"{r['cpu_ms']:>11.2f}{r['kbps']:>8.0f}"
+        )
+    print("注: 码率为编码器目标码率下的实际输出（aiortc 默认 H264 1Mbps、VP8 500kbps），同码率下更慢的 preset 画质更好")
+
+
+if __name__ == "__main__":
+    main()
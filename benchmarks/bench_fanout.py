@@ -0,0 +1,96 @@
+"""
+共享采集基准：同一个视频源输出多个分辨率时，对比
+  separate —— 每个分辨率一个 CameraStreamTrack，各自采集、缩放和颜色转换（现有做法）
+  fanout   —— 一个 FrameFanOut，采集和 I420 转换一次，再逐级缩小到各个分辨率
+统计各路实际送出的帧率和进程 CPU（不含编码，编码开销两种做法相同）。默认用合成源，不需要摄像头。
+
+运行: python -m benchmarks.bench_fanout --capture 1280x720 --outputs 1280x720,640x360,320x180 --duration 10
+"""
+import argparse
+import asyncio
+import time
+
+from webrtc.FrameFanOut import FrameFanOut
+from webrtc.SyntheticSource import SYNTHETIC_SOURCE
+from webrtc.WHIP_WebRTC import CameraStreamTrack
+
+
+def parse_size(text):
+    width, height = (int(v) for v in text.split("x"))
+    return width, height
+
+
+async def consume(track, counts, index, stop):
+    while not stop.is_set():
+        await track.recv()
+        counts[index] += 1
+
+
+async def measure(tracks, duration, warmup):
+    counts = [0] * len(tracks)
+    stop = asyncio.Event()
+    tasks = [asyncio.ensure_future(consume(track, counts, i, stop)) for i, track in enumerate(tracks)]
+    await asyncio.sleep(warmup)
+    counts[:] = [0] * len(tracks)
+    start, start_cpu = time.monotonic(), time.process_time()
+    await asyncio.sleep(duration)
+    elapsed, cpu = time.monotonic() - start, time.process_time() - start_cpu
+    stop.set()
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    return [count / elapsed for count in counts], cpu / elapsed * 100
+
+
+async def run_separate(args, capture, outputs):
+    tracks = []
+    for width, height in outputs:
+        track = CameraStreamTrack(args.source, capture[0], capture[1], args.fps)
+        track.set_output(width, height)
+        tracks.append(track)
+    try:
+        return await measure(tracks, args.duration, args.warmup)
+    finally:
+        for track in tracks:
+            track.stop()
+
+
+async def run_fanout(args, capture, outputs):
+    fanout = FrameFanOut(args.source, capture[0], capture[1], args.fps)
+    tracks = [fanout.track(width, height) for width, height in outputs]
+    try:
+        result = await measure(tracks, args.duration, args.warmup)
+        return result + (fanout.stats()["scale_avg_ms"],)
+    finally:
+        for track in tracks:
+            track.stop()
+
+
+async def run(args):
+    capture = parse_size(args.capture)
+    outputs = [parse_size(size) for size in args.outputs.split(",")]
+    separate_fps, separate_cpu = await run_separate(args, capture, outputs)
+    fanout_fps, fanout_cpu, scale_ms = await run_fanout(args, capture, outputs)
+
+    print(f"视频源 {args.source}，采集 {args.capture} @{args.fps}fps，测量 {args.duration}s")
+    print(f"{'做法':<10}{'CPU%':>8}  各路帧率 ({args.outputs})")
+    print(f"{'separate':<10}{separate_cpu:>8.1f}  " + " / ".join(f"{fps:.1f}" for fps in separate_fps))
+    print(f"{'fanout':<10}{fanout_cpu:>8.1f}  " + " / ".join(f"{fps:.1f}" for fps in fanout_fps))
+    print(f"fanout 每帧缩放到全部输出尺寸共 {scale_ms:.2f} ms")
+    print("注: CPU 为整个进程（采集线程 + 事件循环），合成源每次采集本身也有画面生成的开销，与摄像头读取相当")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="共享采集基准")
+    parser.add_argument("--source", default=SYNTHETIC_SOURCE, help="视频源，写法见 FrameSource")
+    parser.add_argument("--capture", default="1280x720", help="采集分辨率")
+    parser.add_argument("--outputs", default="1280x720,640x360,320x180", help="逗号分隔的输出分辨率")
+    parser.add_argument("--fps", type=int, default=30)
+    parser.add_argument("--warmup", type=float, default=2.0)
+    parser.add_argument("--duration", type=float, default=10.0)
+    args = parser.parse_args()
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,138 @@
+"""
+关键帧请求限流基准：本进程内两个 RTCPeerConnection 直连（不经过 WHIP），推流端发送合成画面，
+接收端模拟观众集中进入房间时 SFU 转发来的 PLI/FIR：每一批 --viewers 个请求在 --window 秒内随机到达，
+共 --bursts 批，批间隔 --gap 秒。分别统计
+  off      —— 逐个响应（aiortc 默认行为，KeyframeLimiter(min_interval=0, timeout=0) 只计数不限流）
+  limited  —— KeyframeLimiter(min_interval=--min-interval)
+发出的关键帧数、平均和峰值（1 秒窗口）码率、关键帧占的字节比例（码率控制下关键帧越多，
+留给其余帧的字节越少，画质越差），以及每个请求从收到到关键帧编码完成的等待时间。
+
+运行: python -m benchmarks.bench_keyframes --viewers 20 --window 2 --bursts 3
+"""
+import argparse
+import asyncio
+import random
+import struct
+import time
+
+from aiortc import RTCPeerConnection
+from aiortc.mediastreams import MediaStreamError
+from aiortc.rtp import RtcpPsfbPacket
+
+from webrtc.EncoderProfile import add_profiled_track, get_profile
+from webrtc.KeyframeLimiter import RTCP_PSFB_FIR, KeyframeLimiter
+from webrtc.SenderHooks import tee_encoded
+from webrtc.WHIP_WebRTC import CameraStreamTrack
+
+
+async def connect(publisher, viewer):
+    await publisher.setLocalDescription(await publisher.createOffer())
+    await viewer.setRemoteDescription(publisher.localDescription)
+    await viewer.setLocalDescription(await viewer.createAnswer())
+    await publisher.setRemoteDescription(viewer.localDescription)
+
+
+async def drain(track):
+    try:
+        while True:
+            await track.recv()
+    except MediaStreamError:
+        pass
+
+
+async def send_fir(receiver, ssrc, seq):
+    # aiortc 的接收端没有发送 FIR 的接口，按 RFC 5104 自己拼 FCI：SSRC + 序号 + 3 字节保留
+    packet = RtcpPsfbPacket(fmt=RTCP_PSFB_FIR, ssrc=receiver._RTCRtpReceiver__rtcp_ssrc or 1, media_ssrc=0,
+                            fci=struct.pack("!IB3x", ssrc, seq % 256))
+    await receiver._send_rtcp(packet)
+
+
+async def run_pass(args, limiter, rng):
+    track = CameraStreamTrack("synthetic", args.width, args.height, args.fps)
+    publisher, viewer = RTCPeerConnection(), RTCPeerConnection()
+    drain_tasks = []
+    viewer.on("track", lambda t: drain_tasks.append(asyncio.ensure_future(drain(t))))
+    sender = add_profiled_track(publisher, track, get_profile(args.profile))
+    frames = []
+    tee_encoded(sender, lambda codec, data, timestamp, keyframe, size: frames.append(
+        (time.monotonic(), len(data), keyframe)))
+    try:
+        await connect(publisher, viewer)
+        while publisher.connectionState != "connected":
+            await asyncio.sleep(0.05)
+        limiter.attach(sender)
+        receiver = viewer.getReceivers()[0]
+        # 等编码器起来、开始转存码流后再开始计时
+        while not frames:
+            await asyncio.sleep(0.05)
+        await asyncio.sleep(1.0)
+        start = time.monotonic()
+        fir_seq = 0
+        for burst in range(args.bursts):
+            offsets = sorted(rng.uniform(0, args.window) for _ in range(args.viewers))
+            burst_start = time.monotonic()
+            for offset in offsets:
+                await asyncio.sleep(max(0.0, burst_start + offset - time.monotonic()))
+                if rng.random() < args.fir:
+                    fir_seq += 1
+                    await send_fir(receiver, sender._ssrc, fir_seq)
+                else:
+                    await receiver._send_rtcp_pli(sender._ssrc)
+            await asyncio.sleep(max(0.0, burst_start + args.gap - time.monotonic()))
+        end = time.monotonic()
+    finally:
+        await publisher.close()
+        await viewer.close()
+        track.stop()
+        for task in drain_tasks:
+            task.cancel()
+
+    sizes = [(t, size, keyframe) for t, size, keyframe in frames if start <= t < end]
+    seconds = end - start
+    windows = {}
+    for t, size, _ in sizes:
+        windows[int(t - start)] = windows.get(int(t - start), 0) + size
+    total = sum(size for _, size, _ in sizes)
+    return {
+        "seconds": seconds,
+        "kbps": total * 8 / seconds / 1000,
+        "keyframe_share": sum(size for _, size, keyframe in sizes if keyframe) / total if total else 0.0,
+        "peak_kbps": max(windows.values()) * 8 / 1000 if windows else 0.0,
+        **limiter.stats(),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="关键帧请求限流基准")
+    parser.add_argument("--width", type=int, default=640)
+    parser.add_argument("--height", type=int, default=480)
+    parser.add_argument("--fps", type=int, default=30)
+    parser.add_argument("--profile", default="low-latency")
+    parser.add_argument("--viewers", type=int, default=20, help="每批进入的观众数（即请求数）")
+    parser.add_argument("--window", type=float, default=2.0, help="一批请求分散到达的时间窗（秒）")
+    parser.add_argument("--bursts", type=int, default=3)
+    parser.add_argument("--gap", type=float, default=5.0, help="相邻两批的间隔（秒）")
+    parser.add_argument("--fir", type=float, default=0.25, help="用 FIR 而不是 PLI 请求的比例")
+    parser.add_argument("--min-interval", type=float, default=1.0)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    results = {}
+    for name, limiter in (
+            ("off", KeyframeLimiter(min_interval=0, timeout=0)),
+            ("limited", KeyframeLimiter(min_interval=args.min_interval))):
+        results[name] = asyncio.run(run_pass(args, limiter, random.Random(args.seed)))
+
+    print(f"{args.width}x{args.height}@{args.fps} {args.profile}，每批 {args.viewers} 个请求 / {args.window}s，"
+          f"{args.bursts} 批，FIR 比例 {args.fir}，min_interval {args.min_interval}s")
+    print(f"{'场景':<9}{'请求':>6}{'转发':>6}{'关键帧':>7}{'kbps':>8}{'峰值kbps':>10}{'关键帧字节':>8}"
+          f"{'等待p50':>9}{'等待p99':>9}{'最大':>8}")
+    for name, r in results.items():
+        latency = r["time_to_keyframe"]
+        print(f"{name:<9}{sum(r['requests'].values()):>6}{r['forced']:>6}{r['keyframes']:>7}{r['kbps']:>8.0f}"
+              f"{r['peak_kbps']:>10.0f}{r['keyframe_share'] * 100:>11.0f}%"
+              f"{latency['p50_ms']:>7.0f}ms{latency['p99_ms']:>7.0f}ms{latency['max_ms']:>6.0f}ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,158 @@
+"""
+运动门控基准：把一段录好的视频逐帧解码，按采集时间线（第 i 帧在 i/fps 秒）分别
+  full   —— 每帧都编码（现状）
+  gated  —— 经 MotionGate 判断，静止时只按 idle 帧率编码
+统计分析 + 编码的 CPU、输出码率、关键帧数，以及有运动的帧是否都在当帧送出（恢复是否在一帧以内）。
+编码器与进程编码模式相同（ProcessEncoder.create_encoder，默认 low-latency 配置档 H264）。
+
+不指定 --clip 时先生成一段固定机位的测试录像：静止的纹理背景 + 传感器噪声，左上角每秒跳一次的时间水印，
+中间有几段物体移动（时间表见 MOTION_SCHEDULE），已知每一帧是否有运动，可以检查漏送；
+生成的录像会用 libx264 压缩一遍，和真实摄像头的录像一样带压缩噪声。时间水印默认用 --ignore 排除。
+
+运行: python -m benchmarks.bench_motion --seconds 60
+      python -m benchmarks.bench_motion --clip lobby.mp4 --ignore ""
+"""
+import argparse
+import os
+import tempfile
+import time
+
+import av
+import cv2
+import numpy as np
+
+from webrtc.EncoderProfile import get_profile
+from webrtc.FramePacer import VIDEO_TIME_BASE
+from webrtc.MotionGate import MotionGate, parse_region
+from webrtc.ProcessEncoder import create_encoder
+
+# 生成录像中物体移动的时间段（秒，按录像时长的比例）
+MOTION_SCHEDULE = ((0.15, 0.22), (0.45, 0.47), (0.70, 0.80))
+CLOCK_BAND = "0,0,1,0.08"
+
+
+def make_clip(path, width, height, fps, seconds, seed=0):
+    """生成测试录像，返回每一帧是否有运动的列表"""
+    rng = np.random.default_rng(seed)
+    noise = rng.integers(0, 256, (height, width, 3), dtype=np.uint8)
+    background = cv2.GaussianBlur(noise, (0, 0), 6)
+    count = int(seconds * fps)
+    spans = [(int(a * count), int(b * count)) for a, b in MOTION_SCHEDULE]
+    truth = []
+
+    container = av.open(path, "w")
+    stream = container.add_stream("libx264", rate=fps)
+    stream.width, stream.height, stream.pix_fmt = width, height, "yuv420p"
+    stream.options = {"crf": "20", "preset": "veryfast"}
+    for i in range(count):
+        image = background.copy()
+        moving = False
+        for start, end in spans:
+            if start <= i < end:
+                # 一个“人”从左走到右
+                x = int((i - start) / (end - start) * (width - width // 8))
+                cv2.rectangle(image, (x, height // 3), (x + width // 8, height * 5 // 6), (60, 80, 150), -1)
+                moving = True
+        cv2.rectangle(image, (0, 0), (width // 3, height // 14), (0, 0, 0), -1)
+        cv2.putText(image, f"00:{i // fps // 60:02d}:{i // fps % 60:02d}", (4, height // 14 - 6),
+                    cv2.FONT_HERSHEY_SIMPLEX, height / 800, (255, 255, 255), 1)
+        # 传感器噪声
+        image = cv2.add(image, rng.normal(0, 2, image.shape).astype(np.int8), dtype=cv2.CV_8U)
+        for packet in stream.encode(av.VideoFrame.from_ndarray(image, format="bgr24")):
+            container.mux(packet)
+        truth.append(moving)
+    for packet in stream.encode():
+        container.mux(packet)
+    container.close()
+    return truth
+
+
+def run_pass(path, gate, profile, bitrate):
+    """解码整段录像并按需编码；只统计门控分析和编码的 CPU，不含解码"""
+    container = av.open(path)
+    stream = container.streams.video[0]
+    fps = float(stream.average_rate or 30)
+    encoder = None
+    cpu = 0.0
+    sent = []
+    total_bytes = 0
+    keyframes = 0
+    for i, frame in enumerate(container.decode(stream)):
+        if frame.format.name != "yuv420p":
+            frame = frame.reformat(format="yuv420p")
+        now = i / fps
+        start = time.process_time()
+        admitted = gate is None or gate.admit(frame, now)
+        if admitted:
+            if encoder is None:
+                encoder = create_encoder("h264", frame.width, frame.height, round(fps), bitrate, profile)
+            frame.pts = int(now * 90000)
+            frame.time_base = VIDEO_TIME_BASE
+            for packet in encoder.encode(frame):
+                total_bytes += packet.size
+                keyframes += packet.is_keyframe
+        cpu += time.process_time() - start
+        sent.append(admitted)
+    for packet in encoder.encode():
+        total_bytes += packet.size
+    container.close()
+    seconds = len(sent) / fps
+    return {
+        "frames": len(sent),
+        "encoded": sum(sent),
+        "keyframes": keyframes,
+        "cpu_s": cpu,
+        "cpu_pct": cpu / seconds * 100,
+        "kbps": total_bytes * 8 / seconds / 1000,
+        "sent": sent,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="运动门控基准")
+    parser.add_argument("--clip", default=None, help="录像文件，不指定时生成测试录像")
+    parser.add_argument("--width", type=int, default=640)
+    parser.add_argument("--height", type=int, default=480)
+    parser.add_argument("--fps", type=int, default=30)
+    parser.add_argument("--seconds", type=float, default=60.0, help="生成的测试录像时长")
+    parser.add_argument("--profile", default="low-latency")
+    parser.add_argument("--bitrate", type=int, default=1_000_000)
+    parser.add_argument("--idle-fps", type=float, default=1.0)
+    parser.add_argument("--hold", type=float, default=2.0)
+    parser.add_argument("--ignore", default=None,
+                        help=f"运动检测忽略的区域 x,y,w,h，多个用 ; 分隔（生成的录像默认 {CLOCK_BAND}，即时间水印）")
+    args = parser.parse_args()
+
+    truth = None
+    path = args.clip
+    if path is None:
+        path = os.path.join(tempfile.gettempdir(), f"motion-{args.width}x{args.height}-{args.seconds:g}s.mp4")
+        print(f"生成测试录像 {path} ...")
+        truth = make_clip(path, args.width, args.height, args.fps, args.seconds)
+        ignore = CLOCK_BAND if args.ignore is None else args.ignore
+    else:
+        ignore = args.ignore or ""
+    regions = [parse_region(r) for r in ignore.split(";") if r]
+
+    profile = get_profile(args.profile)
+    full = run_pass(path, None, profile, args.bitrate)
+    gate = MotionGate(idle_fps=args.idle_fps, hold=args.hold, ignore=regions)
+    gated = run_pass(path, gate, profile, args.bitrate)
+
+    print(f"录像 {path}，{full['frames']} 帧，配置档 {args.profile}，码率 {args.bitrate // 1000}kbps，"
+          f"idle {args.idle_fps}fps，hold {args.hold}s，忽略区域 {regions or '无'}")
+    print(f"{'场景':<8}{'编码帧':>8}{'关键帧':>8}{'CPU s':>8}{'CPU%':>7}{'kbps':>8}")
+    for name, r in (("full", full), ("gated", gated)):
+        print(f"{name:<8}{r['encoded']:>8}{r['keyframes']:>8}{r['cpu_s']:>8.2f}{r['cpu_pct']:>7.1f}{r['kbps']:>8.0f}")
+    print(f"节省: CPU {(1 - gated['cpu_s'] / full['cpu_s']) * 100:.0f}%，"
+          f"带宽 {(1 - gated['kbps'] / full['kbps']) * 100:.0f}%")
+    stats = gate.stats()
+    print(f"门控: 静止 {stats['static_s']}s，恢复 {stats['wakeups']} 次，每帧分析 {stats['analysis_avg_ms']:.3f}ms")
+    if truth is not None:
+        moving = [i for i, m in enumerate(truth) if m]
+        missed = [i for i in moving if not gated["sent"][i]]
+        print(f"有运动的帧 {len(moving)}，漏送 {len(missed)}" + (f"（第 {missed[:10]} 帧）" if missed else ""))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,159 @@
+"""
+信令服务器压测：每个房间 1 个 python 发送端 + N 个 browser 接收端，
+发送端按给定速率广播带时间戳的消息，统计转发吞吐和端到端延迟分位数
+
+运行: python -m benchmarks.bench_signaling --rooms 200 --browsers 5 --messages 200 --rate 20
+不指定 --url 时会在本机启动 server/run.py；--workers N 启动多 worker，延迟按发送端和接收端
+是否在同一个 worker 上分开统计（跨 worker 的消息经过 backplane）
+"""
+import argparse
+import asyncio
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+
+import websockets
+
+SERVER_SCRIPT = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "server", "run.py")
+BENCH_PREFIX = '{"type":"bench"'
+
+
+def percentile(values, q):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+def raise_fd_limit():
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft < hard:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+    return resource.getrlimit(resource.RLIMIT_NOFILE)[0]
+
+
+async def connect(url, room, role):
+    """返回 (websocket, worker id)"""
+    websocket = await websockets.connect(
+        f"{url}/rooms/{room}?role={role}", compression=None, max_queue=None, open_timeout=60
+    )
+    # 等待服务器的 welcome
+    welcome = json.loads(await websocket.recv())
+    return websocket, welcome.get("worker")
+
+
+async def receiver(websocket, latencies, expected, done):
+    received = 0
+    async for message in websocket:
+        if message.startswith(BENCH_PREFIX):
+            latencies.append(time.monotonic() - json.loads(message)["t"])
+            received += 1
+            if received >= expected:
+                break
+    done.append(received)
+
+
+def report(name, latencies):
+    print(
+        "{} 延迟 p50 {:.2f}ms  p99 {:.2f}ms  max {:.2f}ms  ({} 条)".format(
+            name, percentile(latencies, 0.5) * 1000, percentile(latencies, 0.99) * 1000,
+            max(latencies, default=0) * 1000, len(latencies),
+        )
+    )
+
+
+async def sender(websocket, messages, rate, payload):
+    interval = 1.0 / rate if rate > 0 else 0
+    start = time.monotonic()
+    for seq in range(messages):
+        if interval:
+            delay = start + seq * interval - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+        await websocket.send(f'{BENCH_PREFIX},"seq":{seq},"t":{time.monotonic()},"sdp":"{payload}"}}')
+
+
+async def run(args):
+    url = args.url
+    server = None
+    if url is None:
+        url = f"ws://127.0.0.1:{args.port}"
+        server = subprocess.Popen(
+            [sys.executable, SERVER_SCRIPT, "--port", str(args.port), "--log-level", "WARNING",
+             "--max-queue", str(args.max_queue), "--workers", str(args.workers)],
+            cwd=os.path.dirname(SERVER_SCRIPT),
+        )
+        await asyncio.sleep(1.0 + 0.3 * args.workers)
+
+    try:
+        t0 = time.monotonic()
+        semaphore = asyncio.Semaphore(200)
+
+        async def join(room, role):
+            async with semaphore:
+                return await connect(url, f"bench{room}", role)
+
+        # 先连发送端，记下每个房间发送端所在的 worker
+        senders = await asyncio.gather(*(join(room, "python") for room in range(args.rooms)))
+        receivers = await asyncio.gather(*(
+            join(room, "browser") for room in range(args.rooms) for _ in range(args.browsers)
+        ))
+        connect_time = time.monotonic() - t0
+        peers = len(senders) + len(receivers)
+        print(f"已连接 {peers} 个对端（{args.rooms} 个房间），耗时 {connect_time:.1f}s")
+
+        # 丢弃连接阶段产生的 peer-joined 通知
+        await asyncio.sleep(0.5)
+
+        same, cross, done = [], [], []
+        payload = "x" * args.payload
+        start = time.monotonic()
+        recv_tasks = []
+        for i, (ws, worker) in enumerate(receivers):
+            latencies = same if worker == senders[i // args.browsers][1] else cross
+            recv_tasks.append(asyncio.ensure_future(receiver(ws, latencies, args.messages, done)))
+        await asyncio.gather(*(sender(ws, args.messages, args.rate, payload) for ws, _ in senders))
+        try:
+            await asyncio.wait_for(asyncio.gather(*recv_tasks), args.timeout)
+        except asyncio.TimeoutError:
+            for task in recv_tasks:
+                task.cancel()
+        elapsed = time.monotonic() - start
+
+        expected = len(receivers) * args.messages
+        delivered = len(same) + len(cross)
+        print(f"投递 {delivered}/{expected} 条消息，耗时 {elapsed:.2f}s，{delivered / elapsed:.0f} msg/s")
+        report("全部", same + cross)
+        if cross:
+            report("同 worker", same)
+            report("跨 worker", cross)
+        await asyncio.gather(*(ws.close() for ws, _ in senders + receivers), return_exceptions=True)
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="信令服务器压测")
+    parser.add_argument("--url", default=None, help="已运行的信令服务器，例如 ws://127.0.0.1:1111")
+    parser.add_argument("--port", type=int, default=11111)
+    parser.add_argument("--rooms", type=int, default=200)
+    parser.add_argument("--browsers", type=int, default=5, help="每个房间的接收端数量")
+    parser.add_argument("--messages", type=int, default=200, help="每个发送端发送的消息数")
+    parser.add_argument("--rate", type=float, default=20, help="每个发送端每秒消息数，0 为不限速")
+    parser.add_argument("--payload", type=int, default=200, help="消息体附加字节数（模拟 SDP/候选）")
+    parser.add_argument("--max-queue", type=int, default=256)
+    parser.add_argument("--workers", type=int, default=1, help="本机启动服务器时的 worker 数")
+    parser.add_argument("--timeout", type=float, default=60)
+    args = parser.parse_args()
+
+    print(f"文件描述符上限 {raise_fd_limit()}")
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
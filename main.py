@@ -1,5 +1,6 @@
-from webrtc import WHIP_WebRTC
+from webrtc.PublisherConfig import main
 
 if __name__ == '__main__':
-    WHIP_WebRTC.run() # 填写live777推流服务器+ip  ： http://ip:port ; example:
-    # WHIP_WebRTC.run(live777Url="http://huai-xhy.site:7777") # 填写live777推流服务器+ip  ： http://ip:port
+    # 参数见 python main.py --help，配置文件写法见 publisher.example.toml 和 webrtc/PublisherConfig.py
+    # example: python main.py --url http://huai-xhy.site:7777 或 python main.py --config publisher.toml
+    main()
@@ -0,0 +1,249 @@
+"""
+信令服务器的跨进程/跨主机消息总线（backplane）。
+
+每个 worker 只持有连到自己的对端；房间内的消息在本地投递之后，再通过 backplane 发布到该房间的频道，
+订阅了这个房间（即本地有该房间对端）的其他 worker 收到后投递给自己的对端。
+
+- LocalBroker / LocalBackplane：同一进程内的多个 hub 互连，用于测试
+- BrokerServer / SocketBackplane：长度前缀帧协议的轻量 broker，监听 unix socket（单机多 worker）
+  或 TCP 地址（多主机），worker 作为客户端连接
+
+接口只有 start(on_message) / subscribe(room) / unsubscribe(room) / publish(room, data) / close()，
+换成 Redis、NATS 等实现时保持这几个方法即可。
+"""
+import asyncio
+import logging
+import struct
+
+logger = logging.getLogger("Signaling")
+
+# broker 帧: 4 字节长度 + 1 字节操作码 + 2 字节房间名长度 + 房间名 + 数据
+_FRAME_HEADER = struct.Struct("!IBH")
+OP_SUBSCRIBE = 1
+OP_UNSUBSCRIBE = 2
+OP_PUBLISH = 3
+
+# 信封: 1 字节类型 + 三个 2 字节长度前缀字段（发送方 id、发送方角色、目标 id）+ 原始消息
+_FIELD = struct.Struct("!H")
+KIND_TEXT = 0
+KIND_BINARY = 1
+KIND_PRESENCE = 2
+
+
+def pack_envelope(kind, sender_id, sender_role, target, payload):
+    """跨 worker 转发的消息信封，payload 原样附在末尾，不做 json 编码"""
+    parts = [bytes((kind,))]
+    for field in (sender_id, sender_role or "", target or ""):
+        data = field.encode()
+        parts.append(_FIELD.pack(len(data)))
+        parts.append(data)
+    parts.append(payload.encode() if isinstance(payload, str) else payload)
+    return b"".join(parts)
+
+
+def unpack_envelope(data):
+    """返回 (kind, sender_id, sender_role, target, payload)，文本消息的 payload 为 str"""
+    kind = data[0]
+    offset = 1
+    fields = []
+    for _ in range(3):
+        (length,) = _FIELD.unpack_from(data, offset)
+        offset += _FIELD.size
+        fields.append(data[offset:offset + length].decode())
+        offset += length
+    payload = data[offset:]
+    if kind != KIND_BINARY:
+        payload = payload.decode()
+    sender_id, sender_role, target = fields
+    return kind, sender_id, sender_role or None, target or None, payload
+
+
+def _pack_frame(op, room, data=b""):
+    room = room.encode()
+    return _FRAME_HEADER.pack(1 + _FIELD.size + len(room) + len(data), op, len(room)) + room + data
+
+
+async def _read_frames(reader):
+    """逐帧读取，返回 (op, room, data, 原始帧)"""
+    while True:
+        header = await reader.readexactly(_FRAME_HEADER.size)
+        length, op, room_len = _FRAME_HEADER.unpack(header)
+        body = await reader.readexactly(length - 1 - _FIELD.size)
+        yield op, body[:room_len].decode(), body[room_len:], header + body
+
+
+def parse_address(address):
+    """'unix:/path'、'/path' 为 unix socket，'host:port' 为 TCP"""
+    if address.startswith("unix:"):
+        return "unix", address[5:]
+    if address.startswith("/"):
+        return "unix", address
+    host, _, port = address.rpartition(":")
+    return "tcp", (host or "0.0.0.0", int(port))
+
+
+class LocalBroker:
+    """进程内 broker，同一事件循环里的多个 LocalBackplane 通过它互相投递"""
+
+    def __init__(self):
+        self.rooms = {}
+
+    def backplane(self):
+        return LocalBackplane(self)
+
+
+class LocalBackplane:
+    """进程内实现，用于测试跨 worker 路由逻辑"""
+
+    def __init__(self, broker):
+        self.broker = broker
+        self.on_message = None
+        self.published = 0
+
+    async def start(self, on_message):
+        self.on_message = on_message
+
+    def subscribe(self, room):
+        self.broker.rooms.setdefault(room, set()).add(self)
+
+    def unsubscribe(self, room):
+        members = self.broker.rooms.get(room)
+        if members is not None:
+            members.discard(self)
+            if not members:
+                del self.broker.rooms[room]
+
+    def publish(self, room, data):
+        self.published += 1
+        loop = asyncio.get_running_loop()
+        for member in self.broker.rooms.get(room, ()):
+            if member is not self:
+                loop.call_soon(member.on_message, room, data)
+
+    async def close(self):
+        for room in list(self.broker.rooms):
+            self.unsubscribe(room)
+
+
+class BrokerServer:
+    """
+    房间频道 broker：记录每个连接订阅的房间，PUBLISH 帧原样转发给订阅了该房间的其他连接。
+    转发不拆包，只读帧头取房间名；单个慢 worker 的写缓冲超过 write_limit 时断开它，避免拖住整个 broker
+    """
+
+    def __init__(self, address, write_limit=16 * 1024 * 1024):
+        self.address = address
+        self.write_limit = write_limit
+        self.rooms = {}
+        self.forwarded = 0
+        self._server = None
+        self._handlers = set()
+
+    async def start(self):
+        family, addr = parse_address(self.address)
+        if family == "unix":
+            self._server = await asyncio.start_unix_server(self._handle, addr)
+        else:
+            self._server = await asyncio.start_server(self._handle, *addr)
+        logger.info("backplane broker 已启动: %s", self.address)
+
+    async def _handle(self, reader, writer):
+        rooms = set()
+        self._handlers.add((asyncio.current_task(), writer))
+        try:
+            async for op, room, _, frame in _read_frames(reader):
+                if op == OP_PUBLISH:
+                    for member in self.rooms.get(room, ()):
+                        if member is writer:
+                            continue
+                        if member.transport.get_write_buffer_size() > self.write_limit:
+                            logger.warning("backplane 连接积压过多，断开")
+                            member.close()
+                            continue
+                        member.write(frame)
+                        self.forwarded += 1
+                elif op == OP_SUBSCRIBE:
+                    rooms.add(room)
+                    self.rooms.setdefault(room, set()).add(writer)
+                elif op == OP_UNSUBSCRIBE:
+                    rooms.discard(room)
+                    self._remove(room, writer)
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            for room in rooms:
+                self._remove(room, writer)
+            writer.close()
+            self._handlers.discard((asyncio.current_task(), writer))
+
+    def _remove(self, room, writer):
+        members = self.rooms.get(room)
+        if members is not None:
+            members.discard(writer)
+            if not members:
+                del self.rooms[room]
+
+    async def close(self):
+        if self._server is not None:
+            self._server.close()
+            # 关闭连接让处理协程读到 EOF 后自行结束，而不是被取消
+            handlers = list(self._handlers)
+            for _, writer in handlers:
+                writer.close()
+            if handlers:
+                await asyncio.wait([task for task, _ in handlers])
+            await self._server.wait_closed()
+
+
+class SocketBackplane:
+    """连接 BrokerServer 的客户端，每个 worker 一个"""
+
+    def __init__(self, address, connect_timeout=10.0):
+        self.address = address
+        self.connect_timeout = connect_timeout
+        self.published = 0
+        self._writer = None
+        self._reader_task = None
+
+    async def _connect(self):
+        family, addr = parse_address(self.address)
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.connect_timeout
+        while True:
+            try:
+                if family == "unix":
+                    return await asyncio.open_unix_connection(addr)
+                return await asyncio.open_connection(*addr)
+            except (FileNotFoundError, ConnectionError):
+                # worker 可能比 broker 先启动
+                if loop.time() >= deadline:
+                    raise
+                await asyncio.sleep(0.1)
+
+    async def start(self, on_message):
+        reader, self._writer = await self._connect()
+        self._reader_task = asyncio.ensure_future(self._read(reader, on_message))
+
+    async def _read(self, reader, on_message):
+        try:
+            async for op, room, data, _ in _read_frames(reader):
+                if op == OP_PUBLISH:
+                    on_message(room, data)
+        except (asyncio.IncompleteReadError, ConnectionError):
+            logger.error("backplane 连接已断开: %s", self.address)
+
+    def subscribe(self, room):
+        self._writer.write(_pack_frame(OP_SUBSCRIBE, room))
+
+    def unsubscribe(self, room):
+        self._writer.write(_pack_frame(OP_UNSUBSCRIBE, room))
+
+    def publish(self, room, data):
+        self.published += 1
+        self._writer.write(_pack_frame(OP_PUBLISH, room, data))
+
+    async def close(self):
+        if self._reader_task is not None:
+            self._reader_task.cancel()
+        if self._writer is not None:
+            self._writer.close()
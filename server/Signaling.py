@@ -0,0 +1,279 @@
+"""
+房间制信令转发：
+
+- 连接地址 ws://host:1111/rooms/<room>?peer=<id>&role=<python|browser|...>
+  旧客户端直接连 ws://host:1111 并以第一条消息 "python"/"browser" 作为身份，进入 default 房间
+- 默认路由：发给同房间内角色不同的所有对端（旧的 python <-> browser 转发规则），没有角色时发给房间内其他所有人
+- 定向发送：消息以 "@<peer>\\n" 开头时只发给该对端，前缀去掉后原样转发
+- 消息一律按原始帧转发，不做 json 解析和重新序列化
+- 每个连接一个有界发送队列 + 独立发送协程，慢连接不会拖住其他人；队列满时断开该连接（可重连），
+  信令消息（SDP/候选）不能悄悄丢弃
+- 队列为空且 socket 写缓冲未积压时直接同步写帧，不经过队列和发送协程（省一次任务切换）
+- 多 worker/多主机部署时，每个 hub 只登记本地对端，房间消息和上下线通知经 backplane（见 Backplane.py）
+  发给其他 worker，由它们投递给各自的本地对端；自动生成的 peer id 带 worker 前缀以保证全局唯一
+"""
+import asyncio
+import itertools
+import json
+import logging
+from urllib.parse import parse_qs, urlparse
+
+import websockets
+from websockets.frames import OP_BINARY, OP_TEXT
+try:
+    from websockets.protocol import State
+except ImportError:  # websockets < 11
+    from websockets.connection import State
+
+from Backplane import KIND_BINARY, KIND_PRESENCE, KIND_TEXT, pack_envelope, unpack_envelope
+
+logger = logging.getLogger("Signaling")
+
+DEFAULT_ROOM = "default"
+# 写缓冲超过该值后改走队列，由发送协程按 drain 节流
+WRITE_BUFFER_LIMIT = 64 * 1024
+TARGET_PREFIX = "@"
+
+
+
+class Peer:
+    """一个 websocket 连接及其发送队列"""
+
+    def __init__(self, websocket, room, peer_id, role, legacy, max_queue):
+        self.websocket = websocket
+        self.room = room
+        self.peer_id = peer_id
+        self.role = role
+        self.legacy = legacy
+        self.queue = asyncio.Queue(max_queue)
+        self.sent = 0
+        self.received = 0
+        self.overflowed = False
+
+    @staticmethod
+    def _frame(message):
+        if isinstance(message, str):
+            return OP_TEXT, message.encode()
+        return OP_BINARY, message
+
+    def enqueue(self, message):
+        """非阻塞投递，队列满返回 False"""
+        websocket = self.websocket
+        if (
+                self.queue.empty() and websocket.state is State.OPEN
+                and websocket.transport.get_write_buffer_size() < WRITE_BUFFER_LIMIT
+        ):
+            websocket.write_frame_sync(True, *self._frame(message))
+            self.sent += 1
+            return True
+        try:
+            self.queue.put_nowait(message)
+            return True
+        except asyncio.QueueFull:
+            return False
+
+    async def writer(self):
+        websocket = self.websocket
+        queue = self.queue
+        try:
+            while True:
+                message = await queue.get()
+                # 取出后立即写入，中间没有让出点，保证与 enqueue 直接写入的顺序一致
+                await websocket.write_frame(True, *self._frame(message))
+                self.sent += 1
+        except websockets.exceptions.ConnectionClosed:
+            pass
+
+
+class Room:
+    """房间内的对端登记：按 id 和按角色两级索引，定向投递 O(1)"""
+
+    def __init__(self, name):
+        self.name = name
+        self.peers = {}
+        self.by_role = {}
+
+    def add(self, peer):
+        self.peers[peer.peer_id] = peer
+        self.by_role.setdefault(peer.role, {})[peer.peer_id] = peer
+
+    def remove(self, peer):
+        if self.peers.get(peer.peer_id) is peer:
+            del self.peers[peer.peer_id]
+            role_peers = self.by_role.get(peer.role)
+            if role_peers is not None:
+                role_peers.pop(peer.peer_id, None)
+                if not role_peers:
+                    del self.by_role[peer.role]
+
+    def recipients(self, sender_role, sender_id=None):
+        """默认路由的接收方"""
+        if sender_role is None:
+            return [p for p in self.peers.values() if p.peer_id != sender_id]
+        result = []
+        for role, peers in self.by_role.items():
+            if role != sender_role:
+                result.extend(peers.values())
+        return result
+
+    def __len__(self):
+        return len(self.peers)
+
+
+class SignalingHub:
+    """所有房间的登记表和转发逻辑，与具体的 websocket 服务器无关"""
+
+    def __init__(self, max_queue=256, backplane=None, worker_id=None):
+        self.max_queue = max_queue
+        self.backplane = backplane
+        self.worker_id = worker_id
+        self.rooms = {}
+        self._ids = itertools.count(1)
+        self.forwarded = 0
+        self.undeliverable = 0
+        self.overflow_disconnects = 0
+        self.remote_received = 0
+
+    async def start(self):
+        if self.backplane is not None:
+            await self.backplane.start(self.on_remote)
+
+    async def close(self):
+        if self.backplane is not None:
+            await self.backplane.close()
+
+    @property
+    def peer_count(self):
+        return sum(len(room) for room in self.rooms.values())
+
+    def _join(self, websocket, room_name, peer_id, role, legacy):
+        room = self.rooms.get(room_name)
+        if room is None:
+            room = self.rooms[room_name] = Room(room_name)
+            if self.backplane is not None:
+                self.backplane.subscribe(room_name)
+        if peer_id is None or peer_id in room.peers:
+            # 其他 worker 上的同名对端无法在这里发现，自动生成的 id 带 worker 前缀避免冲突
+            prefix = f"{role or 'peer'}-{self.worker_id}" if self.worker_id is not None else role or "peer"
+            peer_id = f"{prefix}-{next(self._ids)}"
+        peer = Peer(websocket, room, peer_id, role, legacy, self.max_queue)
+        room.add(peer)
+        return peer
+
+    def _leave(self, peer):
+        room = peer.room
+        room.remove(peer)
+        if not room.peers:
+            del self.rooms[room.name]
+            if self.backplane is not None:
+                self.backplane.unsubscribe(room.name)
+
+    def _presence(self, peer, event):
+        """向房间内使用新协议的对端通知上下线（旧客户端不认识这类消息，不发送）"""
+        message = json.dumps({"type": event, "peer": peer.peer_id, "role": peer.role, "room": peer.room.name})
+        self._presence_local(peer.room, peer.peer_id, message)
+        if self.backplane is not None:
+            self.backplane.publish(peer.room.name, pack_envelope(KIND_PRESENCE, peer.peer_id, peer.role, None, message))
+
+    def _presence_local(self, room, peer_id, message):
+        for other in room.peers.values():
+            if other.peer_id != peer_id and not other.legacy:
+                self._deliver(other, message)
+
+    def _deliver(self, peer, message):
+        if peer.enqueue(message):
+            self.forwarded += 1
+            return
+        if not peer.overflowed:
+            peer.overflowed = True
+            self.overflow_disconnects += 1
+            logger.warning("连接 %s/%s 发送队列已满，断开", peer.room.name, peer.peer_id)
+            asyncio.ensure_future(peer.websocket.close(1013, "send queue overflow"))
+
+    def route(self, sender, message):
+        """转发一条原始消息（str 或 bytes）"""
+        room = sender.room
+        target = None
+        if isinstance(message, str) and message.startswith(TARGET_PREFIX):
+            head, sep, payload = message.partition("\n")
+            if sep:
+                target, message = head[1:], payload
+        delivered = self._route_local(room, sender.peer_id, sender.role, target, message)
+        if self.backplane is not None and (target is None or not delivered):
+            # 广播总是发往其他 worker；定向消息只在本地找不到目标时才发
+            kind = KIND_TEXT if isinstance(message, str) else KIND_BINARY
+            self.backplane.publish(room.name, pack_envelope(kind, sender.peer_id, sender.role, target, message))
+        elif not delivered:
+            self.undeliverable += 1
+
+    def _route_local(self, room, sender_id, sender_role, target, message):
+        """投递给本 worker 上的对端，返回是否有接收方"""
+        if target is not None:
+            peer = room.peers.get(target)
+            if peer is None:
+                return False
+            self._deliver(peer, message)
+            return True
+        recipients = room.recipients(sender_role, sender_id)
+        for peer in recipients:
+            self._deliver(peer, message)
+        return bool(recipients)
+
+    def on_remote(self, room_name, data):
+        """backplane 收到其他 worker 发布的消息"""
+        room = self.rooms.get(room_name)
+        if room is None:
+            return
+        self.remote_received += 1
+        kind, sender_id, sender_role, target, payload = unpack_envelope(data)
+        if kind == KIND_PRESENCE:
+            self._presence_local(room, sender_id, payload)
+        else:
+            self._route_local(room, sender_id, sender_role, target, payload)
+
+    async def handle(self, websocket, path=None):
+        """websockets 的连接处理函数"""
+        url = urlparse(path if path is not None else websocket.path)
+        query = parse_qs(url.query)
+        parts = [p for p in url.path.split("/") if p]
+        if len(parts) >= 2 and parts[0] == "rooms":
+            room_name = parts[1]
+            role = query.get("role", [None])[0]
+            peer_id = query.get("peer", [None])[0]
+            legacy = False
+        else:
+            # 旧协议：第一条消息为客户端类型（"python" 或 "browser"）
+            role = await websocket.recv()
+            room_name, peer_id, legacy = DEFAULT_ROOM, None, True
+
+        peer = self._join(websocket, room_name, peer_id, role, legacy)
+        logger.info("客户端已连接: %s/%s (%s)", room_name, peer.peer_id, role)
+        writer = asyncio.ensure_future(peer.writer())
+        if not legacy:
+            welcome = {"type": "welcome", "peer": peer.peer_id, "room": room_name}
+            if self.worker_id is not None:
+                welcome["worker"] = self.worker_id
+            self._deliver(peer, json.dumps(welcome))
+        self._presence(peer, "peer-joined")
+        try:
+            route = self.route
+            async for message in websocket:
+                peer.received += 1
+                route(peer, message)
+        except Exception as e:
+            logger.debug("连接 %s/%s 异常: %s", room_name, peer.peer_id, e)
+        finally:
+            writer.cancel()
+            self._leave(peer)
+            self._presence(peer, "peer-left")
+            logger.info("客户端断开连接: %s/%s", room_name, peer.peer_id)
+
+    def stats(self):
+        return {
+            "rooms": len(self.rooms),
+            "peers": self.peer_count,
+            "forwarded": self.forwarded,
+            "undeliverable": self.undeliverable,
+            "overflow_disconnects": self.overflow_disconnects,
+            "remote_received": self.remote_received,
+        }
@@ -1,37 +1,132 @@
+"""
+信令服务器入口：
+
+    python run.py                                  # 单进程
+    python run.py --workers 4                      # 4 个 worker 共用端口（SO_REUSEPORT），本机 unix socket broker
+    python run.py --workers 4 --broker-listen 0.0.0.0:7000   # 主机 A：同时对外提供 broker
+    python run.py --workers 4 --broker 10.0.0.1:7000         # 主机 B：接入主机 A 的 broker
+
+同一会话的两端可以落在不同 worker/主机上，房间消息经 backplane 转发。
+"""
+import argparse
 import asyncio
+import logging
+import multiprocessing
+import os
+import signal
+import tempfile
+
 import websockets
-import json
 
-clients = {}
+from Backplane import BrokerServer, SocketBackplane
+from Signaling import SignalingHub
+
+logger = logging.getLogger("Signaling")
+
+
+async def signal_server(host="0.0.0.0", port=1111, max_queue=256, stats_interval=0, broker=None, worker_id=None,
+                        reuse_port=False):
+    backplane = SocketBackplane(broker) if broker else None
+    hub = SignalingHub(max_queue=max_queue, backplane=backplane, worker_id=worker_id)
+    await hub.start()
+    # 信令消息很小，关闭 permessage-deflate 压缩以节省 CPU
+    async with websockets.serve(hub.handle, host, port, compression=None, max_queue=max_queue,
+                                reuse_port=reuse_port):
+        logger.info("信令服务器已启动，监听端口 %d (worker=%s)", port, worker_id)
+        try:
+            while True:
+                if stats_interval > 0:
+                    await asyncio.sleep(stats_interval)
+                    logger.info("信令统计 (worker=%s): %s", worker_id, hub.stats())
+                else:
+                    await asyncio.Future()
+        finally:
+            await hub.close()
+
+
+def _worker_main(worker_id, args, broker):
+    logging.basicConfig(level=args.log_level)
+    # Ctrl+C 由主进程统一处理
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    asyncio.run(signal_server(
+        args.host, args.port, args.max_queue, args.stats_interval, broker=broker, worker_id=worker_id,
+        reuse_port=True,
+    ))
+
 
-async def handle_client(websocket, path):
+async def _supervise(workers, listen=None):
+    """运行 broker（listen 不为空时）直到收到 SIGTERM 或有 worker 退出"""
+    stop = asyncio.Event()
+    asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, stop.set)
+    broker = None
+    if listen is not None:
+        broker = BrokerServer(listen)
+        await broker.start()
     try:
-        # 接收客户端类型（如 "python" 或 "browser"）
-        client_type = await websocket.recv()
-        print(f"客户端已连接: {client_type}")
-        clients[client_type] = websocket
-
-        async for message in websocket:
-            data = json.loads(message)
-            print(f"收到来自 {client_type} 的消息: {data}")
-
-            # 转发规则：Python → Browser，Browser → Python
-            target = "browser" if client_type == "python" else "python"
-            if target in clients:
-                await clients[target].send(json.dumps(data))
-                print(f"转发消息到 {target}: {data}")
-            else:
-                print(f"目标客户端 {target} 未连接")
-
-    except websockets.exceptions.ConnectionClosed:
-        print(f"客户端 {client_type} 断开连接")
-        if client_type in clients:
-            del clients[client_type]
-
-async def signal_server():
-    async with websockets.serve(handle_client, "0.0.0.0", 1111):
-        print("信令服务器已启动，监听端口 1111")
-        await asyncio.Future()
+        while not stop.is_set() and all(worker.is_alive() for worker in workers):
+            try:
+                await asyncio.wait_for(stop.wait(), 1.0)
+            except asyncio.TimeoutError:
+                pass
+    finally:
+        # 先停 worker 再关 broker，broker 上的连接随之正常结束
+        for worker in workers:
+            worker.terminate()
+        for worker in workers:
+            worker.join()
+        if broker is not None:
+            await broker.close()
+
+
+def run_workers(args):
+    """启动 N 个 worker 进程，未指定 --broker 时在本进程运行 broker（本机 unix socket 或 --broker-listen）"""
+    broker_address = args.broker
+    socket_dir = None
+    if broker_address is None:
+        if args.broker_listen:
+            broker_address = args.broker_listen
+        else:
+            socket_dir = tempfile.mkdtemp(prefix="signaling-")
+            broker_address = "unix:" + os.path.join(socket_dir, "backplane.sock")
+
+    workers = [
+        multiprocessing.Process(target=_worker_main, args=(i, args, broker_address), daemon=True)
+        for i in range(args.workers)
+    ]
+    for worker in workers:
+        worker.start()
+    try:
+        asyncio.run(_supervise(workers, broker_address if args.broker is None else None))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if socket_dir is not None:
+            try:
+                os.unlink(os.path.join(socket_dir, "backplane.sock"))
+            except FileNotFoundError:
+                pass
+            os.rmdir(socket_dir)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="房间制 WebRTC 信令服务器")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=1111)
+    parser.add_argument("--max-queue", type=int, default=256, help="每个连接的发送队列上限")
+    parser.add_argument("--stats-interval", type=float, default=0, help="定期输出统计的间隔（秒），0 为不输出")
+    parser.add_argument("--workers", type=int, default=1, help="worker 进程数，大于 1 时共用端口（SO_REUSEPORT）")
+    parser.add_argument("--broker", default=None, help="接入已有的 backplane broker（host:port 或 unix:/path）")
+    parser.add_argument("--broker-listen", default=None, help="在本机启动 broker 并监听该地址，供其他主机接入")
+    parser.add_argument("--log-level", default="INFO")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=args.log_level)
+    # 单 worker 且不接入其他主机时保持原来的单进程模式
+    if args.workers > 1 or args.broker or args.broker_listen:
+        run_workers(args)
+    else:
+        asyncio.run(signal_server(args.host, args.port, args.max_queue, args.stats_interval))
+
 
 if __name__ == "__main__":
-    asyncio.run(signal_server())
\ No newline at end of file
+    main()
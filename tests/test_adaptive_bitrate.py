@@ -0,0 +1,87 @@
+"""AdaptiveController 的离线回放测试：构造统计轨迹交给 replay_trace，检查档位决策"""
+from webrtc.AdaptiveBitrate import (
+    AdaptiveController, LadderRung, StatsSample, build_ladder, fit_ladder, match_rung, replay_trace,
+)
+
+LADDER = build_ladder(640, 480, 30)
+
+
+def make_trace(seconds, start=0.0, bitrate=1_000_000, fraction_lost=0.0, remb=None, state=None):
+    """每秒一个采样，发送码率恒定；state 在多段轨迹之间延续累计的字节/包数"""
+    state = state if state is not None else {"bytes": 0, "packets": 0}
+    samples = []
+    for i in range(seconds):
+        state["bytes"] += bitrate // 8
+        state["packets"] += 100
+        samples.append(StatsSample(
+            time=start + i, bytes_sent=state["bytes"], packets_sent=state["packets"],
+            fraction_lost=fraction_lost, rtt=0.05, remb=remb,
+        ))
+    return samples
+
+
+def test_ladder_follows_capture_size():
+    assert LADDER[0] == LadderRung(640, 480, 30, 1_000_000)
+    for rung in LADDER:
+        assert rung.width <= 640 and rung.height <= 480
+        assert abs(rung.width / rung.height - 4 / 3) < 0.02
+    assert [r.bitrate for r in LADDER] == sorted((r.bitrate for r in LADDER), reverse=True)
+    wide = build_ladder(1280, 720, 30)
+    assert (wide[0].width, wide[0].height, wide[0].fps) == (1280, 720, 30)
+    assert all(abs(r.width / r.height - 16 / 9) < 0.02 for r in wide)
+
+
+def test_fit_ladder_and_start_rung():
+    ladder = [LadderRung(1280, 720, 30, 2_500_000), LadderRung(640, 360, 25, 600_000)]
+    assert fit_ladder(ladder, 640, 480) == [LadderRung(640, 360, 25, 600_000)]
+    assert fit_ladder(ladder, 320, 240) is None
+    assert match_rung(LADDER, 640, 480, 30) == 0
+    rung = LADDER[match_rung(LADDER, 320, 240, 25)]
+    assert (rung.width, rung.height, rung.fps) == (320, 240, 25)
+    # 没有完全一致的档位时取不超过配置输出的最高档
+    assert match_rung(LADDER, 400, 300, 30) == 2
+
+
+def test_starts_at_configured_output_without_switching():
+    controller = AdaptiveController(LADDER, start_index=match_rung(LADDER, 640, 480, 30))
+    assert replay_trace(make_trace(20), controller) == []
+    assert controller.rung == LADDER[0]
+
+
+def test_loss_steps_down_immediately():
+    controller = AdaptiveController(LADDER)
+    state = {"bytes": 0, "packets": 0}
+    trace = make_trace(3, state=state) + make_trace(3, start=3, fraction_lost=0.3, state=state)
+    decisions = replay_trace(trace, controller)
+    assert decisions
+    assert decisions[0].index > 0
+    assert "丢包" in decisions[0].reason
+    # 第一个丢包采样就降档，不等待
+    assert decisions[0].time == 3
+
+
+def test_recovery_steps_up_one_rung_at_a_time():
+    controller = AdaptiveController(LADDER)
+    state = {"bytes": 0, "packets": 0}
+    lossy = make_trace(4, fraction_lost=0.3, state=state)
+    replay_trace(lossy, controller)
+    lowest = controller.index
+    assert lowest > 0
+    decisions = replay_trace(make_trace(60, start=4, bitrate=300_000, state=state), controller)
+    ups = [d for d in decisions if d.reason == "网络良好"]
+    assert ups
+    indices = [lowest] + [d.index for d in ups]
+    assert all(a - b == 1 for a, b in zip(indices, indices[1:]))
+    # 每次升档之间至少间隔 hold_up 秒
+    assert all(b.time - a.time >= controller.hold_up for a, b in zip(ups, ups[1:]))
+    assert controller.index == 0
+
+
+def test_remb_caps_estimate_after_grace():
+    controller = AdaptiveController(LADDER, remb_grace=5.0)
+    decisions = replay_trace(make_trace(10, remb=300_000), controller)
+    assert decisions
+    # 宽限期内不采用 REMB
+    assert decisions[0].time >= 5
+    assert decisions[-1].rung.bitrate <= 300_000 * controller.headroom
+    assert "REMB" in decisions[0].reason
@@ -0,0 +1,93 @@
+"""FramePacer / MediaClock / IntervalHistogram 的测试，时钟全部注入，不依赖真实的 sleep"""
+import time
+from fractions import Fraction
+
+from webrtc.FramePacer import FramePacer, IntervalHistogram, MediaClock
+
+
+class FakeClock:
+    def __init__(self, now=0.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+    def advance(self, seconds):
+        self.now += seconds
+
+
+def run_frames(pacer, clock, count, work=0.0):
+    """按 recv 的方式取 count 帧：等节拍、记下发送时刻、再花 work 秒处理"""
+    sent = []
+    for _ in range(count):
+        pacer.wait_blocking()
+        sent.append(clock())
+        pacer.record_send()
+        clock.advance(work)
+    return sent
+
+
+def test_deadlines_are_absolute(monkeypatch):
+    clock = FakeClock()
+    # 每次 sleep 都多睡 5ms（定时器精度），处理每帧再花 40ms
+    monkeypatch.setattr(time, "sleep", lambda seconds: clock.advance(seconds + 0.005))
+    pacer = FramePacer(8, clock=clock)
+    sent = run_frames(pacer, clock, 40, work=0.04)
+    # 第 n 帧在 n * interval 之后 5ms 内发出，误差不随帧数累积
+    for n, t in enumerate(sent):
+        assert n * 0.125 <= t <= n * 0.125 + 0.005 + 1e-9
+    assert pacer.skipped == 0
+    assert pacer.stats()["count"] == 39
+
+
+def test_stall_skips_instead_of_bursting(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(time, "sleep", clock.advance)
+    pacer = FramePacer(8, clock=clock)
+    assert run_frames(pacer, clock, 3) == [0.0, 0.125, 0.25]
+
+    # 卡住 0.6s：错过 0.375、0.5、0.625 三个节拍
+    clock.advance(0.6)
+    after = run_frames(pacer, clock, 3)
+    assert pacer.skipped == 3
+    # 卡住后的第一帧立即发出，之后回到原来的节拍，不连续补发
+    assert after == [0.85, 0.875, 1.0]
+
+
+def test_set_fps_restarts_grid(monkeypatch):
+    clock = FakeClock(10.0)
+    monkeypatch.setattr(time, "sleep", clock.advance)
+    pacer = FramePacer(8, clock=clock)
+    run_frames(pacer, clock, 2)
+    clock.advance(0.01)
+    pacer.set_fps(4)
+    assert run_frames(pacer, clock, 3) == [10.135, 10.385, 10.635]
+    assert pacer.stats()["target_ms"] == 250
+
+
+def test_media_clock_pts_is_90khz():
+    clock = FakeClock(100.0)
+    media = MediaClock(clock=clock)
+    assert media.time_base == Fraction(1, 90000)
+    assert media.pts(100.0) == 0
+    assert media.pts(100.5) == 45000
+    # 一帧 30fps 的间隔正好 3000 个时钟周期
+    assert media.pts(100.0 + 1 / 30) == 3000
+    # 音频轨道共用同一起点，按自己的采样率换算
+    assert media.pts(101.0, clock_rate=48000) == 48000
+    clock.advance(2.0)
+    assert media.pts(media.now()) == 180000
+
+
+def test_interval_histogram():
+    histogram = IntervalHistogram((10, 20, 50))
+    for value in (5, 12, 15, 18, 40, 80):
+        histogram.observe(value)
+    stats = histogram.to_dict()
+    assert stats["buckets"] == {"<=10": 1, "<=20": 3, "<=50": 1, ">50": 1}
+    assert stats["count"] == 6
+    assert stats["min_ms"] == 5 and stats["max_ms"] == 80
+    assert stats["p50_ms"] == 20.0
+    # 超出最后一个桶时用实际最大值
+    assert stats["p99_ms"] == 80.0
+    assert IntervalHistogram().to_dict()["p50_ms"] == 0.0
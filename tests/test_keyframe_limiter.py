@@ -0,0 +1,224 @@
+"""KeyframeLimiter 的测试：假的 sender、事件循环和时钟，覆盖合并、推迟、周期关键帧取消推迟和 FIR 去重"""
+import asyncio
+import struct
+
+import pytest
+from aiortc.rtp import RTCP_PSFB_PLI, RtcpPsfbPacket
+
+import webrtc.KeyframeLimiter as keyframe_limiter
+from webrtc.KeyframeLimiter import RTCP_PSFB_FIR, KeyframeLimiter, parse_fir
+
+SSRC = 1234
+
+
+class FakeClock:
+    def __init__(self, now=100.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+class FakeTimer:
+    def __init__(self, loop, when, callback):
+        self.loop = loop
+        self.when = when
+        self.callback = callback
+        self.cancelled = False
+
+    def cancel(self):
+        self.cancelled = True
+
+
+class FakeLoop:
+    """只实现 KeyframeLimiter 用到的部分：call_later 由测试推进时钟后手动触发"""
+
+    def __init__(self, clock):
+        self.clock = clock
+        self.timers = []
+
+    def call_later(self, delay, callback):
+        timer = FakeTimer(self, self.clock() + delay, callback)
+        self.timers.append(timer)
+        return timer
+
+    def call_soon_threadsafe(self, callback, *args):
+        callback(*args)
+
+    def is_closed(self):
+        return False
+
+    def advance(self, seconds):
+        self.clock.now += seconds
+        for timer in list(self.timers):
+            if not timer.cancelled and timer.when <= self.clock.now:
+                self.timers.remove(timer)
+                timer.callback()
+
+    @property
+    def pending(self):
+        return [timer for timer in self.timers if not timer.cancelled]
+
+
+class FakeRouter:
+    def __init__(self):
+        self.senders = {}
+
+    def route_rtcp(self, packet):
+        return {self.senders[packet.media_ssrc]} if packet.media_ssrc in self.senders else set()
+
+
+class FakeTransport:
+    def __init__(self):
+        self._rtp_router = FakeRouter()
+
+
+class FakeSender:
+    """模仿 RTCRtpSender：PLI 由 _handle_rtcp_packet 转成 _send_keyframe，编码出的帧交给 tee 回调"""
+
+    def __init__(self):
+        self._ssrc = SSRC
+        self.transport = FakeTransport()
+        self.transport._rtp_router.senders[SSRC] = self
+        self.forced = 0
+        self.tee = []
+
+    def _send_keyframe(self):
+        self.forced += 1
+
+    async def _handle_rtcp_packet(self, packet):
+        if isinstance(packet, RtcpPsfbPacket) and packet.fmt == RTCP_PSFB_PLI:
+            self._send_keyframe()
+
+    def receive(self, packet):
+        # 假的处理函数里没有 await，协程第一次 send 就会结束
+        with pytest.raises(StopIteration):
+            self._handle_rtcp_packet(packet).send(None)
+
+    def encode(self, keyframe):
+        for callback in self.tee:
+            callback("h264", b"", 0, keyframe, None)
+
+
+def pli():
+    return RtcpPsfbPacket(fmt=RTCP_PSFB_PLI, ssrc=1, media_ssrc=SSRC)
+
+
+def fir(seq, ssrc=SSRC):
+    return RtcpPsfbPacket(fmt=RTCP_PSFB_FIR, ssrc=1, media_ssrc=0, fci=struct.pack("!IB3x", ssrc, seq))
+
+
+@pytest.fixture
+def setup(monkeypatch):
+    clock = FakeClock()
+    loop = FakeLoop(clock)
+    monkeypatch.setattr(asyncio, "get_running_loop", lambda: loop)
+    monkeypatch.setattr(keyframe_limiter, "tee_encoded", lambda sender, callback: sender.tee.append(callback))
+    sender = FakeSender()
+    limiter = KeyframeLimiter(min_interval=1.0, timeout=2.0, clock=clock)
+    limiter.attach(sender)
+    return limiter, sender, loop
+
+
+def test_request_after_min_interval_is_forwarded(setup):
+    limiter, sender, loop = setup
+    loop.advance(1.5)
+    sender.receive(pli())
+    assert sender.forced == 1
+    assert limiter.stats()["requests"]["pli"] == 1
+    assert limiter.deferred == 0 and not loop.pending
+
+
+def test_requests_before_keyframe_are_coalesced(setup):
+    limiter, sender, loop = setup
+    loop.advance(1.5)
+    sender.receive(pli())
+    loop.advance(0.05)
+    sender.receive(pli())
+    limiter.request()
+    assert sender.forced == 1
+    assert limiter.coalesced == 2
+
+    loop.advance(0.05)
+    sender.encode(keyframe=True)
+    assert limiter.keyframes == 1
+    # 三个请求都由这一个关键帧满足，等待时间分别为 100、50、50ms
+    latency = limiter.latency.to_dict()
+    assert latency["count"] == 3
+    assert latency["max_ms"] == pytest.approx(100)
+    assert latency["min_ms"] == pytest.approx(50)
+
+
+def test_request_within_min_interval_is_deferred(setup):
+    limiter, sender, loop = setup
+    loop.advance(0.3)
+    sender.receive(pli())
+    assert sender.forced == 0
+    assert limiter.deferred == 1
+    # 推迟到上一个关键帧（attach 时）之后满 min_interval
+    assert [timer.when for timer in loop.pending] == [pytest.approx(101.0)]
+
+    loop.advance(0.2)
+    sender.receive(pli())
+    assert limiter.coalesced == 1
+    loop.advance(0.5)
+    assert sender.forced == 1
+    assert not loop.pending
+
+
+def test_periodic_keyframe_cancels_deferred_request(setup):
+    limiter, sender, loop = setup
+    loop.advance(0.3)
+    limiter.request()
+    assert loop.pending
+
+    # GOP 周期关键帧先到，推迟中的请求已被满足
+    loop.advance(0.2)
+    sender.encode(keyframe=True)
+    assert not loop.pending
+    loop.advance(2.0)
+    assert sender.forced == 0
+    assert limiter.latency.count == 1
+
+    # 非关键帧不影响计时
+    sender.encode(keyframe=False)
+    assert limiter.keyframes == 1
+
+
+def test_lost_keyframe_allows_new_forward_after_timeout(setup):
+    limiter, sender, loop = setup
+    loop.advance(1.5)
+    limiter.request()
+    loop.advance(1.0)
+    limiter.request()
+    assert sender.forced == 1
+    loop.advance(1.5)
+    limiter.request()
+    assert sender.forced == 2
+
+
+def test_fir_is_routed_and_deduplicated(setup):
+    limiter, sender, loop = setup
+    router = sender.transport._rtp_router
+    # route_fir 让 media_ssrc 为 0 的 FIR 按 FCI 中的 SSRC 分给 sender
+    assert router.route_rtcp(fir(1)) == {sender}
+    assert router.route_rtcp(fir(1, ssrc=999)) == set()
+
+    loop.advance(1.5)
+    sender.receive(fir(1))
+    sender.receive(fir(1))
+    assert limiter.requests["fir"] == 1
+    assert sender.forced == 1
+
+    sender.receive(fir(2))
+    assert limiter.requests["fir"] == 2
+    assert limiter.coalesced == 1
+    # 发给其他 SSRC 的 FIR 不计入
+    sender.receive(fir(3, ssrc=999))
+    assert limiter.requests["fir"] == 2
+
+
+def test_parse_fir():
+    assert parse_fir(fir(7), SSRC) == 7
+    assert parse_fir(fir(7), 999) is None
+    assert parse_fir(pli(), SSRC) is None
@@ -0,0 +1,136 @@
+"""TrickleIce 对本地 WhipStandIn 的测试：PATCH 补发候选、服务器拒绝 PATCH，以及推流时改用完整收集的回退"""
+import asyncio
+import socket
+
+from aiortc import RTCConfiguration, RTCIceServer, RTCPeerConnection, RTCSessionDescription, VideoStreamTrack
+
+import webrtc.WHIP_WebRTC as whip_webrtc
+from webrtc.PublishSupervisor import wait_connected
+from webrtc.TrickleIce import TrickleGatherer, build_sdpfrag, mark_trickle_offer, parse_sdpfrag
+from webrtc.WhipClient import WhipClient, create_http_session
+from webrtc.WhipStandIn import WhipStandIn
+
+
+def free_port(kind=socket.SOCK_STREAM):
+    with socket.socket(socket.AF_INET, kind) as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def candidate_types(sdp):
+    return {line.split(" typ ")[1].split()[0] for line in sdp.splitlines() if line.startswith("a=candidate:")}
+
+
+async def start_stand_in(trickle):
+    server = WhipStandIn(port=free_port(), trickle=trickle, stun_port=free_port(socket.SOCK_DGRAM))
+    await server.start()
+    return server
+
+
+def stun_servers(server):
+    return [RTCIceServer(urls=f"stun:127.0.0.1:{server.stun_port}")]
+
+
+async def trickle_publish(trickle_enabled):
+    """按 TrickleGatherer 文档中的顺序推一路流，返回 (连上与否, PATCH 结果, 发送的候选数, 服务端会话, 服务端)"""
+    server = await start_stand_in(trickle_enabled)
+    http_session = create_http_session()
+    pc = RTCPeerConnection(RTCConfiguration(iceServers=stun_servers(server)))
+    try:
+        pc.addTransceiver(VideoStreamTrack(), direction="sendonly")
+        trickle = TrickleGatherer(pc)
+        assert trickle.has_late_candidates
+        await pc.setLocalDescription(await pc.createOffer())
+        offer = trickle.offer_sdp()
+        # offer 只带 host 候选，STUN 候选留给 PATCH
+        assert "a=ice-options:trickle" in offer
+        assert candidate_types(offer) == {"host"}
+
+        client = WhipClient(server.url, http_session)
+        whip_session = await client.publish("trickle", offer)
+        await pc.setRemoteDescription(RTCSessionDescription(sdp=whip_session.answer_sdp, type="answer"))
+        supported = await trickle.trickle(client, whip_session)
+        connected = await wait_connected(pc, 10)
+        return connected, supported, trickle.candidates_sent, server.sessions[whip_session.session_id], server
+    finally:
+        await pc.close()
+        await http_session.close()
+        await server.stop()
+
+
+def test_sdpfrag_round_trip():
+    body = build_sdpfrag("ufrag", "pwd", [("0", []), ("1", [])], end_of_candidates=True)
+    assert parse_sdpfrag(body) == ("ufrag", "pwd", [("0", None), ("1", None)])
+
+
+def test_mark_trickle_offer():
+    sdp = "v=0\r\no=- 1 1 IN IP4 0.0.0.0\r\ns=-\r\nt=0 0\r\nm=video 9 UDP/TLS/RTP/SAVPF 96\r\na=end-of-candidates\r\n"
+    marked = mark_trickle_offer(sdp)
+    assert "a=end-of-candidates" not in marked
+    assert marked.splitlines()[4] == "a=ice-options:trickle"
+
+
+def test_trickle_sends_late_candidates_with_patch():
+    connected, supported, sent, session, server = asyncio.run(trickle_publish(True))
+    assert supported is True
+    assert server.patches == 1
+    # STUN 应答器返回的 srflx 候选经 PATCH 到达服务端
+    assert sent >= 1
+    assert session.candidates == sent
+    assert server.stun.requests >= 1
+    assert connected
+
+
+def test_trickle_rejected_keeps_host_candidates():
+    connected, supported, sent, session, server = asyncio.run(trickle_publish(False))
+    assert supported is False
+    assert server.patches == 0
+    assert sent == 0
+    assert session.candidates == 0
+    # 本机推流仅凭 host 候选就能连通
+    assert connected
+
+
+def test_publish_falls_back_to_full_gathering(monkeypatch):
+    async def never_connected(pc, timeout):
+        return False
+
+    # 模拟仅凭 host 候选连不通，强制走改用完整收集的回退
+    monkeypatch.setattr(whip_webrtc, "wait_connected", never_connected)
+
+    async def run():
+        server = await start_stand_in(False)
+        # 按顺序记下服务端收到的推流会话（回退在第一次 POST 后几十毫秒内就完成）
+        published = []
+        answer = server._answer
+
+        async def record(session, offer):
+            published.append(session)
+            return await answer(session, offer)
+
+        server._answer = record
+        publish = asyncio.ensure_future(whip_webrtc.whip_publish_webrtc(
+            server.url, "fallback", camera_index="synthetic", width=320, height=240, fps=15,
+            ice_servers=stun_servers(server), trickle=True, reconnect=False,
+        ))
+        try:
+            loop = asyncio.get_running_loop()
+            deadline = loop.time() + 20
+            while loop.time() < deadline and not (
+                    len(published) >= 2 and published[1].pc.connectionState == "connected"):
+                await asyncio.sleep(0.1)
+            assert len(published) == 2
+            first, publisher = published
+            assert publisher.pc.connectionState == "connected"
+            # 第一次的会话已 DELETE，第二次的 offer 带有完整收集的 srflx 候选
+            assert first.session_id not in server.sessions
+            assert list(server.sessions) == [publisher.session_id]
+            assert candidate_types(first.pc.remoteDescription.sdp) == {"host"}
+            assert "srflx" in candidate_types(publisher.pc.remoteDescription.sdp)
+            assert server.patches == 0
+        finally:
+            publish.cancel()
+            await asyncio.gather(publish, return_exceptions=True)
+            await server.stop()
+
+    asyncio.run(run())
@@ -0,0 +1,316 @@
+"""
+根据 RTCP 反馈自适应调整码率/分辨率/帧率。
+
+控制逻辑（AdaptiveController）只依赖统计样本，与网络无关，
+可以用 replay_trace 离线回放录制的统计轨迹做确定性测试：
+
+    python -m webrtc.AdaptiveBitrate trace.jsonl
+"""
+import argparse
+import asyncio
+import json
+import logging
+from dataclasses import asdict, dataclass
+from typing import Optional
+
+from .SenderHooks import on_rtcp_packet, parse_remb, set_encoder_bitrate
+
+logger = logging.getLogger("WHIP_Publisher")
+
+
+@dataclass(frozen=True)
+class LadderRung:
+    width: int
+    height: int
+    fps: int
+    bitrate: int
+
+
+# 由采集分辨率推导码率阶梯：(缩放比例, 帧率上限)，从高到低
+LADDER_STEPS = ((1.0, None), (0.75, None), (0.5, 25), (0.375, 20), (0.25, 15))
+# 640x480@30 的参考码率，其他分辨率/帧率按像素率的 0.75 次方缩放（低档每像素需要更多比特）
+REFERENCE_BITRATE = 1_000_000
+REFERENCE_PIXEL_RATE = 640 * 480 * 30
+
+
+def _even(value):
+    return max(2, int(round(value / 2)) * 2)
+
+
+def _ladder_bitrate(width, height, fps):
+    bitrate = REFERENCE_BITRATE * (width * height * fps / REFERENCE_PIXEL_RATE) ** 0.75
+    return max(50_000, int(round(bitrate, -4)))
+
+
+def build_ladder(width, height, fps):
+    """
+    按采集分辨率推导码率阶梯：最高档即采集分辨率和帧率，其余各档保持相同宽高比缩小，不会高于采集分辨率
+    （set_output 只缩小不放大，也不拉伸画面）
+    """
+    ladder = []
+    for scale, fps_cap in LADDER_STEPS:
+        rung_fps = min(fps, fps_cap) if fps_cap else fps
+        rung = LadderRung(_even(width * scale), _even(height * scale), rung_fps,
+                          _ladder_bitrate(width * scale, height * scale, rung_fps))
+        if rung not in ladder:
+            ladder.append(rung)
+    return tuple(ladder)
+
+
+def fit_ladder(ladder, width, height):
+    """去掉高于采集分辨率的档位；一档都不剩时按采集分辨率推导"""
+    fitted = [rung for rung in ladder if rung.width <= width and rung.height <= height]
+    return fitted or None
+
+
+def match_rung(ladder, width, height, fps):
+    """与配置的输出（width x height@fps）一致的档位，没有时取不超过它的最高档"""
+    for i, rung in enumerate(ladder):
+        if (rung.width, rung.height, rung.fps) == (width, height, fps):
+            return i
+    for i, rung in enumerate(ladder):
+        if rung.width * rung.height * rung.fps <= width * height * fps:
+            return i
+    return len(ladder) - 1
+
+
+# 默认采集 640x480@30 的阶梯，从高到低排列
+DEFAULT_LADDER = build_ladder(640, 480, 30)
+
+
+@dataclass
+class StatsSample:
+    """一次统计采样（字段均可缺省，对应 getStats 和 RTCP 中能拿到的数据）"""
+    time: float
+    bytes_sent: int = 0
+    packets_sent: int = 0
+    packets_lost: Optional[int] = None
+    fraction_lost: Optional[float] = None  # 0~1
+    rtt: Optional[float] = None  # 秒
+    remb: Optional[int] = None  # bps
+
+
+@dataclass
+class Decision:
+    time: float
+    index: int
+    rung: LadderRung
+    reason: str
+
+
+class AdaptiveController:
+    """
+    基于丢包率 + RTT + REMB 的码率估计，从码率阶梯中选择档位：
+    - 丢包超过 high_loss 或 RTT 明显上升时按丢包比例降低估计码率，并立即降档
+    - 丢包低于 low_loss 时缓慢上探，估计码率稳定超过上一档 hold_up 秒后才升档
+    - REMB 作为估计码率上限（接收端的带宽估计起步较保守，前 remb_grace 秒不采用）
+    start_index 为起始档位，默认为最高档（即配置的输出，见 build_ladder/match_rung）
+    """
+
+    def __init__(self, ladder=DEFAULT_LADDER, start_index=None, high_loss=0.10, low_loss=0.02,
+                 rtt_increase=1.5, increase_factor=1.08, hold_up=8.0, headroom=0.9, remb_grace=5.0):
+        self.ladder = list(ladder)
+        self.index = 0 if start_index is None else start_index
+        self.high_loss = high_loss
+        self.low_loss = low_loss
+        self.rtt_increase = rtt_increase
+        self.increase_factor = increase_factor
+        self.hold_up = hold_up
+        self.headroom = headroom
+        self.remb_grace = remb_grace
+
+        self.estimate = self.ladder[self.index].bitrate / headroom
+        self.min_rtt = None
+        self._last = None
+        self._first_time = None
+        self._upgrade_since = None
+
+    @property
+    def rung(self):
+        return self.ladder[self.index]
+
+    def update(self, sample):
+        """输入一次采样，档位变化时返回 Decision，否则返回 None"""
+        last, self._last = self._last, sample
+        if last is None:
+            self._first_time = sample.time
+            return None
+        elapsed = sample.time - last.time
+        if elapsed <= 0:
+            return None
+
+        send_rate = (sample.bytes_sent - last.bytes_sent) * 8 / elapsed
+        loss = self._loss(last, sample)
+        if sample.rtt is not None:
+            self.min_rtt = sample.rtt if self.min_rtt is None else min(self.min_rtt, sample.rtt)
+        congested_rtt = (
+            sample.rtt is not None and self.min_rtt and sample.rtt > self.min_rtt * self.rtt_increase
+            and sample.rtt - self.min_rtt > 0.05
+        )
+
+        if loss is not None and loss > self.high_loss:
+            base = send_rate if send_rate > 0 else self.estimate
+            self.estimate = base * (1 - 0.5 * loss)
+            reason = f"丢包 {loss:.0%}"
+        elif congested_rtt:
+            self.estimate = min(self.estimate, send_rate or self.estimate) * 0.85
+            reason = f"RTT 上升 {sample.rtt * 1000:.0f}ms"
+        elif loss is None or loss < self.low_loss:
+            self.estimate *= self.increase_factor ** elapsed
+            reason = "网络良好"
+        else:
+            reason = "保持"
+
+        if sample.remb and sample.time - self._first_time >= self.remb_grace and sample.remb < self.estimate:
+            self.estimate = sample.remb
+            reason = f"REMB {sample.remb // 1000}kbps"
+        self.estimate = max(self.estimate, self.ladder[-1].bitrate)
+        self.estimate = min(self.estimate, self.ladder[0].bitrate / self.headroom)
+
+        return self._choose(sample.time, reason)
+
+    def _loss(self, last, sample):
+        if sample.packets_lost is not None and last.packets_lost is not None:
+            sent = sample.packets_sent - last.packets_sent
+            lost = sample.packets_lost - last.packets_lost
+            if sent > 0:
+                return max(0.0, min(1.0, lost / sent))
+        return sample.fraction_lost
+
+    def _choose(self, now, reason):
+        # 取整避免浮点误差：起步时 estimate = 起始档码率 / headroom，不应因此立刻降档
+        budget = round(self.estimate * self.headroom)
+        target = len(self.ladder) - 1
+        for i, rung in enumerate(self.ladder):
+            if rung.bitrate <= budget:
+                target = i
+                break
+
+        if target > self.index:
+            # 降档立即执行
+            self._upgrade_since = None
+            self.index = target
+            return Decision(now, target, self.rung, reason)
+        if target < self.index:
+            # 升档需要持续稳定，且每次只升一档
+            if self._upgrade_since is None:
+                self._upgrade_since = now
+            elif now - self._upgrade_since >= self.hold_up:
+                self._upgrade_since = None
+                self.index -= 1
+                return Decision(now, self.index, self.rung, reason)
+        else:
+            self._upgrade_since = None
+        return None
+
+
+class StatsProbe:
+    """从 RTCPeerConnection.getStats() 和 RTCP（REMB）采集 StatsSample"""
+
+    def __init__(self, sender):
+        self.sender = sender
+        self.remb = None
+        on_rtcp_packet(sender, self._on_rtcp)
+
+    def _on_rtcp(self, packet):
+        bitrate = parse_remb(packet, self.sender._ssrc)
+        if bitrate is not None:
+            self.remb = bitrate
+
+    async def sample(self, now):
+        report = await self.sender.getStats()
+        sample = StatsSample(time=now, remb=self.remb)
+        for stats in report.values():
+            if stats.type == "outbound-rtp":
+                sample.bytes_sent += stats.bytesSent
+                sample.packets_sent += stats.packetsSent
+            elif stats.type == "remote-inbound-rtp":
+                sample.packets_lost = stats.packetsLost
+                sample.fraction_lost = stats.fractionLost / 256
+                sample.rtt = stats.roundTripTime
+        return sample
+
+
+class AdaptiveBitrateRunner:
+    """
+    在线运行控制器：定期采样、决策，并把档位应用到轨道（set_output）和编码器码率，
+    分辨率变化时编码器随帧尺寸重建，不需要重新协商。
+    trace_path 不为空时把每次采样追加写入 JSONL，供 replay_trace 回放。
+    """
+
+    def __init__(self, sender, track, controller=None, interval=1.0, trace_path=None):
+        self.sender = sender
+        self.track = track
+        self.controller = controller or AdaptiveController()
+        self.interval = interval
+        self.trace_path = trace_path
+        self.probe = StatsProbe(sender)
+        self.decisions = []
+
+    def apply(self, rung):
+        if hasattr(self.track, "set_output"):
+            self.track.set_output(rung.width, rung.height, rung.fps)
+        set_encoder_bitrate(self.sender, self.track, rung.bitrate)
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        self.apply(self.controller.rung)
+        trace = open(self.trace_path, "a", encoding="utf-8") if self.trace_path else None
+        try:
+            while True:
+                await asyncio.sleep(self.interval)
+                sample = await self.probe.sample(loop.time())
+                if trace is not None:
+                    trace.write(json.dumps(asdict(sample)) + "\n")
+                decision = self.controller.update(sample)
+                if decision is not None:
+                    logger.info(
+                        "自适应切换到 %dx%d@%d %dkbps（%s）",
+                        decision.rung.width, decision.rung.height, decision.rung.fps,
+                        decision.rung.bitrate // 1000, decision.reason,
+                    )
+                    self.decisions.append(decision)
+                    self.apply(decision.rung)
+                else:
+                    # 编码器在第一帧时才创建，且 aiortc 收到 REMB 会直接改写其码率，每个周期按当前档位重新限制
+                    bitrate = self.controller.rung.bitrate
+                    if self.probe.remb is not None:
+                        bitrate = min(bitrate, self.probe.remb)
+                    set_encoder_bitrate(self.sender, self.track, bitrate)
+        finally:
+            if trace is not None:
+                trace.close()
+
+
+def load_trace(path):
+    with open(path, encoding="utf-8") as f:
+        return [StatsSample(**json.loads(line)) for line in f if line.strip()]
+
+
+def replay_trace(samples, controller=None):
+    """离线回放统计轨迹，返回控制器做出的所有决策（确定性，可直接用于单元测试）"""
+    controller = controller or AdaptiveController()
+    decisions = []
+    for sample in samples:
+        decision = controller.update(sample)
+        if decision is not None:
+            decisions.append(decision)
+    return decisions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="回放统计轨迹，输出自适应决策")
+    parser.add_argument("trace", help="AdaptiveBitrateRunner 录制的 JSONL 文件")
+    parser.add_argument("--width", type=int, default=640, help="采集分辨率，用于推导码率阶梯")
+    parser.add_argument("--height", type=int, default=480)
+    parser.add_argument("--fps", type=int, default=30)
+    parser.add_argument("--start-index", type=int, default=None)
+    args = parser.parse_args()
+
+    controller = AdaptiveController(build_ladder(args.width, args.height, args.fps), start_index=args.start_index)
+    for d in replay_trace(load_trace(args.trace), controller):
+        print(f"{d.time:10.2f}s  -> {d.rung.width}x{d.rung.height}@{d.rung.fps} {d.rung.bitrate // 1000}kbps  {d.reason}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,273 @@
+"""
+音频源：与视频的 FrameSource 对应，按配置打开采集后端，统一成 read(samples) -> (int16 数组, 首个样本的采集时刻) 的接口，
+输出固定为 48kHz s16（Opus 在 WebRTC 中的采样率），形状为 (samples, channels)。
+
+    "tone"、"tone:880"               合成音：每秒整点（墙上时钟）一声 beep，用于测量音频端到端延迟
+    "alsa"、"alsa:hw:1,0"            ALSA 设备（arecord 子进程）
+    "pulse"、"pulse:<source名>"      PulseAudio/PipeWire（parec 子进程）
+    "file:voice.wav"                 循环播放的音频文件（PyAV 解码，wav/mp3/ogg 等均可）
+
+也可以写成字典：{"type": "alsa", "device": "hw:1,0"}、{"type": "file", "path": "a.wav", "loop": False}。
+pip 安装的 PyAV 通常不带 alsa/pulse 输入设备，因此设备采集走系统自带的 arecord/parec，
+它们按 10ms 的周期把原始 PCM 写进管道，不经过事件循环。
+
+合成音的 beep 从墙上时钟的整秒开始，接收端解码后用 BeepDetector 找到 beep 的起点，
+当前时间减去该整秒即为音频的端到端延迟（与 SyntheticSource 的视频条码同一思路）。
+"""
+import logging
+import math
+import shlex
+import shutil
+import subprocess
+import time
+
+import av
+import numpy as np
+
+logger = logging.getLogger("WHIP_Publisher")
+
+SAMPLE_RATE = 48000
+TONE_SOURCE = "tone"
+BEEP_PERIOD = 1.0
+BEEP_DURATION = 0.04
+BEEP_LEVEL = 0.5
+
+
+class PacedAudioCapture:
+    """
+    非设备音频源的公共部分：样本按单调时钟的绝对时刻出现，read 阻塞到这段样本“采集完”的时刻，
+    与真实设备的节奏一致。落后超过 max_lag 秒（如进程被挂起）时跳到当前时刻，跳过的样本数计入 skipped
+    """
+
+    def __init__(self, channels=1, max_lag=0.2):
+        self.channels = channels
+        self.sample_rate = SAMPLE_RATE
+        self.max_lag = max_lag
+        self.skipped = 0
+        self._start = None
+        self._wall_start = None
+        self._position = 0
+        self._opened = True
+
+    def isOpened(self):
+        return self._opened
+
+    def _next_block(self, samples):
+        """等到 samples 个样本就绪，返回 (起始样本序号, 首个样本的采集时刻)"""
+        if self._start is None:
+            self._start, self._wall_start = time.monotonic(), time.time()
+        now = time.monotonic()
+        behind = now - (self._start + self._position / self.sample_rate)
+        if behind > self.max_lag:
+            skip = int(behind * self.sample_rate)
+            self._position += skip
+            self.skipped += skip
+        end = self._start + (self._position + samples) / self.sample_rate
+        if end > now:
+            time.sleep(end - now)
+        position = self._position
+        self._position += samples
+        return position, self._start + position / self.sample_rate
+
+    def release(self):
+        self._opened = False
+
+
+class ToneCapture(PacedAudioCapture):
+    """合成音：静音中每 period 秒（从墙上时钟的整秒开始）一声 frequency Hz、duration 秒的 beep"""
+
+    def __init__(self, frequency=1000, channels=1, period=BEEP_PERIOD, duration=BEEP_DURATION, level=BEEP_LEVEL):
+        super().__init__(channels)
+        self.frequency = float(frequency)
+        self.period = period
+        self.duration = duration
+        self.amplitude = level * 32767
+
+    def read(self, samples):
+        position, capture_time = self._next_block(samples)
+        wall = self._wall_start + (position + np.arange(samples)) / self.sample_rate
+        phase = np.mod(wall, self.period)
+        tone = np.sin(2 * math.pi * self.frequency * phase) * self.amplitude * (phase < self.duration)
+        block = np.repeat(tone.astype(np.int16)[:, None], self.channels, axis=1)
+        return block, capture_time
+
+
+class FileAudioCapture(PacedAudioCapture):
+    """音频文件：PyAV 解码并重采样为 48kHz s16，到结尾时 seek 回开头（loop=False 时 read 返回 None）"""
+
+    def __init__(self, path, loop=True, channels=1):
+        super().__init__(channels)
+        self.path = path
+        self.loop = loop
+        self.loops = 0
+        self._container = av.open(path)
+        self._stream = self._container.streams.audio[0]
+        self._frames = self._container.decode(self._stream)
+        self._resampler = av.AudioResampler(
+            format="s16", layout="mono" if channels == 1 else "stereo", rate=SAMPLE_RATE
+        )
+        self._buffer = np.empty((0, channels), np.int16)
+
+    def _fill(self, samples):
+        chunks = [self._buffer]
+        buffered = len(self._buffer)
+        while buffered < samples:
+            frame = next(self._frames, None)
+            if frame is None:
+                if not self.loop:
+                    return False
+                self._container.seek(0)
+                self._frames = self._container.decode(self._stream)
+                self.loops += 1
+                continue
+            for out in self._resampler.resample(frame):
+                # packed s16 的 to_ndarray 形状为 (1, samples * channels)
+                chunk = out.to_ndarray().reshape(-1, self.channels)
+                chunks.append(chunk)
+                buffered += len(chunk)
+        self._buffer = np.concatenate(chunks)
+        return True
+
+    def read(self, samples):
+        if not self._opened or not self._fill(samples):
+            return None, None
+        _, capture_time = self._next_block(samples)
+        block, self._buffer = self._buffer[:samples], self._buffer[samples:]
+        return block, capture_time
+
+    def release(self):
+        if self._opened:
+            super().release()
+            self._container.close()
+
+
+class DeviceAudioCapture:
+    """
+    声卡采集：arecord（ALSA）或 parec（PulseAudio）子进程按 10ms 周期输出 48kHz s16 原始 PCM，
+    read 直接从管道读满 samples 个样本；采集时刻按读完的时刻倒推一段时长
+    """
+
+    COMMANDS = {
+        "alsa": (
+            "arecord",
+            "arecord -q -t raw -f S16_LE -r {rate} -c {channels} --period-time=10000 --buffer-time=40000{device}",
+            " -D {}",
+        ),
+        "pulse": (
+            "parec",
+            "parec --raw --format=s16le --rate={rate} --channels={channels} --latency-msec=10{device}",
+            " --device={}",
+        ),
+    }
+
+    def __init__(self, backend="alsa", device=None, channels=1):
+        tool, command, device_option = self.COMMANDS[backend]
+        self.backend = backend
+        self.device = device
+        self.channels = channels
+        self.sample_rate = SAMPLE_RATE
+        self.skipped = 0
+        self.process = None
+        if shutil.which(tool) is None:
+            logger.error("找不到 %s，无法采集 %s 音频", tool, backend)
+            return
+        command = command.format(
+            rate=SAMPLE_RATE, channels=channels,
+            device=device_option.format(shlex.quote(device)) if device else "",
+        )
+        self.process = subprocess.Popen(shlex.split(command), stdout=subprocess.PIPE, bufsize=0)
+        logger.info("音频采集已启动: %s", command)
+
+    def isOpened(self):
+        return self.process is not None and self.process.poll() is None
+
+    def read(self, samples):
+        if self.process is None:
+            return None, None
+        block = np.empty((samples, self.channels), np.int16)
+        view = memoryview(block).cast("B")
+        received = 0
+        while received < len(view):
+            n = self.process.stdout.readinto(view[received:])
+            if not n:
+                return None, None
+            received += n
+        return block, time.monotonic() - samples / self.sample_rate
+
+    def release(self):
+        if self.process is not None:
+            self.process.kill()
+            self.process.wait()
+            self.process = None
+
+
+def open_tone(frequency=1000, channels=1):
+    return ToneCapture(frequency, channels)
+
+
+def open_alsa(device=None, channels=1):
+    return DeviceAudioCapture("alsa", device or None, channels)
+
+
+def open_pulse(device=None, channels=1):
+    return DeviceAudioCapture("pulse", device or None, channels)
+
+
+AUDIO_BACKENDS = {
+    TONE_SOURCE: open_tone,
+    "alsa": open_alsa,
+    "pulse": open_pulse,
+    "file": FileAudioCapture,
+}
+
+# 字符串写法 "<前缀>:<值>" 中的值对应的参数名
+AUDIO_PREFIX_ARGUMENTS = {
+    TONE_SOURCE: "frequency",
+    "alsa": "device",
+    "pulse": "device",
+    "file": "path",
+}
+
+
+def parse_audio_source(source):
+    """把配置中的音频源解析为 (后端名, 参数字典)"""
+    if isinstance(source, dict):
+        options = dict(source)
+        kind = options.pop("type", TONE_SOURCE)
+    else:
+        kind, sep, value = source.partition(":")
+        options = {AUDIO_PREFIX_ARGUMENTS[kind]: value} if sep and kind in AUDIO_PREFIX_ARGUMENTS else {}
+    if kind not in AUDIO_BACKENDS:
+        raise ValueError(f"未知的音频源: {source}（可选: {', '.join(AUDIO_BACKENDS)}）")
+    return kind, options
+
+
+def open_audio(source, channels=1):
+    """按配置打开音频源（写法见模块说明）"""
+    kind, options = parse_audio_source(source)
+    return AUDIO_BACKENDS[kind](channels=channels, **options)
+
+
+class BeepDetector:
+    """
+    接收端找出合成音 beep 的起点：静音之后第一个超过 threshold（满幅的比例）的样本。
+    feed 传入一段解码后的 PCM 及其到达时刻（墙上时钟），检测到起点时返回端到端延迟（ms）：
+    到达时刻减去 beep 开始的整秒，包含采集分块、编码、打包、网络和解码
+    """
+
+    def __init__(self, period=BEEP_PERIOD, threshold=0.1):
+        self.period = period
+        self.threshold = threshold * 32767
+        self._last_onset = None
+
+    def feed(self, samples, arrival_time=None):
+        arrival_time = time.time() if arrival_time is None else arrival_time
+        loud = np.flatnonzero(np.abs(samples.reshape(len(samples), -1).astype(np.int32)).max(axis=1) > self.threshold)
+        if not len(loud):
+            return None
+        # 同一声 beep 跨多个包，半个周期内只认第一次
+        if self._last_onset is not None and arrival_time - self._last_onset < self.period / 2:
+            return None
+        self._last_onset = arrival_time
+        boundary = math.floor(arrival_time / self.period) * self.period
+        return round((arrival_time - boundary) * 1000, 1)
@@ -1,9 +1,20 @@
 import asyncio
 import json
+import os
+import sys
 import websockets
 from aiortc import VideoStreamTrack,RTCPeerConnection, RTCSessionDescription, RTCIceCandidate
 from av import VideoFrame
-import cv2
+
+if not __package__:
+    # 作为脚本直接运行（python webrtc/Client.py）时按包导入，兄弟模块都只用相对导入
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    __package__ = "webrtc"
+
+from .FrameSource import open_capture
+
+# 视频源配置，写法见 FrameSource，如 0、"gst:udpsrc ... ! avdec_h264"、"file:clip.mp4"
+SOURCE = 0
 
 class OpenCVCaptureTrack(VideoStreamTrack):
     def __init__(self, cap):
@@ -14,15 +25,12 @@ class OpenCVCaptureTrack(VideoStreamTrack):
         ret, frame = self.cap.read()
         if not ret:
             raise Exception("无法读取帧")
-        print(f"成功读取视频帧，尺寸：{frame.shape}")  # 添加日志
         return VideoFrame.from_ndarray(frame, format="bgr24")
 
 async def run_webrtc():
     pc = RTCPeerConnection()
-    # import cv2
-    # gstreamer_str = "udpsrc address=230.1.1.1 port=1720 multicast-iface=eno0 ! application/x-rtp, media=video, encoding-name=H264 ! rtph264depay ! h264parse ! avdec_h264 ! videoconvert ! video/x-raw,width=1280,height=720,format=BGR ! appsink drop=1"
-    # cap = cv2.VideoCapture(gstreamer_str, cv2.CAP_GSTREAMER)
-    cap = cv2.VideoCapture(0)
+    # SOURCE = "gst:udpsrc address=230.1.1.1 port=1720 multicast-iface=eno0 ! application/x-rtp, media=video, encoding-name=H264 ! rtph264depay ! h264parse ! avdec_h264"
+    cap = open_capture(SOURCE)
     if not cap.isOpened():
         print("错误：无法打开摄像头")
         return
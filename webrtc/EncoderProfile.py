@@ -0,0 +1,213 @@
+"""
+编码器配置档（profile）：编码协商优先级、x264 preset/tune、关键帧间隔（GOP）、编码线程数和初始码率。
+
+aiortc 默认按 VP8、H264 的顺序协商，H264 使用 libx264 的默认 preset（medium），
+没有硬件编码器的机器上这两点都很贵。配置档按名称选择，也可以用字典在某个内置档上覆盖个别字段：
+
+    get_profile("low-latency")
+    get_profile({"base": "balanced", "gop": 60, "threads": 2})
+
+inline 模式下通过 add_profiled_track 在第一帧之前换上按配置档创建的 aiortc 编码器，
+进程编码模式下由 ProcessEncoder.create_encoder 应用到子进程的编码器上下文。
+"""
+import dataclasses
+import fractions
+import logging
+from dataclasses import dataclass
+from typing import Optional, Tuple
+
+import av
+from aiortc.codecs import get_encoder, h264, vpx
+from aiortc.codecs.h264 import MAX_FRAME_RATE, H264Encoder
+from aiortc.codecs.vpx import Vp8Encoder, _vpx_assert, ffi, lib
+
+from .SenderHooks import install_encoder
+
+logger = logging.getLogger("WHIP_Publisher")
+
+
+@dataclass(frozen=True)
+class EncoderProfile:
+    """
+    codecs 为协商优先级（不排他，对端不支持时仍可落到其他编码），为空时保持 aiortc 的默认顺序。
+    其余字段为 None 时保持编码器默认值：x264 preset 为 medium、GOP 为 250 帧；aiortc 的 VP8 GOP 为 3000 帧、cpu_used 为 -6。
+    cpu_used 只作用于 VP8（-16~16，绝对值越大越快，负数为实时模式）。
+    min_bitrate/max_bitrate 替换 aiortc 的码率上下限（H264 0.5~3Mbps、VP8 0.25~1.5Mbps），
+    低分辨率的 simulcast 层需要低于 aiortc 下限的码率
+    """
+    name: str = "custom"
+    codecs: Tuple[str, ...] = ()
+    preset: Optional[str] = None
+    tune: str = "zerolatency"
+    gop: Optional[int] = None
+    threads: Optional[int] = None
+    cpu_used: Optional[int] = None
+    bitrate: Optional[int] = None
+    min_bitrate: Optional[int] = None
+    max_bitrate: Optional[int] = None
+
+    def clamp_bitrate(self, bitrate, minimum, maximum):
+        """按配置档（未设置时按 aiortc）的上下限限制码率"""
+        minimum = minimum if self.min_bitrate is None else self.min_bitrate
+        maximum = maximum if self.max_bitrate is None else self.max_bitrate
+        return max(minimum, min(bitrate, maximum))
+
+    def x264_options(self):
+        """libx264 的私有选项，在 aiortc 默认值（level 3.1、zerolatency）的基础上加上 preset"""
+        options = {"level": "31", "tune": self.tune}
+        if self.preset is not None:
+            options["preset"] = self.preset
+        return options
+
+    def apply(self, context, codec):
+        """把配置档应用到尚未 open 的 PyAV 编码器上下文，codec 为 "h264" 或 "vp8" """
+        if codec == "h264":
+            context.options = {**context.options, **self.x264_options()}
+        elif self.cpu_used is not None:
+            context.options = {**context.options, "cpu-used": str(self.cpu_used)}
+        if self.gop is not None:
+            context.gop_size = self.gop
+        if self.threads is not None:
+            context.thread_count = self.threads
+
+
+PROFILES = {
+    # 不做任何改动，与未使用配置档时一致
+    "aiortc": EncoderProfile("aiortc"),
+    # 优先 H264，最快的 preset，2 秒一个关键帧
+    "low-latency": EncoderProfile("low-latency", ("video/H264", "video/VP8"), preset="ultrafast", gop=60),
+    "balanced": EncoderProfile("balanced", ("video/H264", "video/VP8"), preset="veryfast", gop=120),
+    "quality": EncoderProfile("quality", ("video/H264", "video/VP8"), preset="faster", gop=250),
+    # 单机多路：每路单线程编码，避免线程数超过核数后互相抢占
+    "multistream": EncoderProfile("multistream", ("video/H264", "video/VP8"), preset="ultrafast", gop=60, threads=1),
+    "vp8": EncoderProfile("vp8", ("video/VP8", "video/H264"), gop=120, cpu_used=-12),
+}
+
+
+def _mime_type(codec):
+    """"h264" -> "video/H264"，已是 mimeType 的原样返回"""
+    return codec if "/" in codec else f"video/{codec.upper()}"
+
+
+def get_profile(profile):
+    """
+    profile 可以是 None（不使用配置档）、内置配置档名称、EncoderProfile，
+    或字典（"base" 为基础配置档名称，默认 "aiortc"，其余键覆盖同名字段）
+    """
+    if profile is None or isinstance(profile, EncoderProfile):
+        return profile
+    if isinstance(profile, str):
+        if profile not in PROFILES:
+            raise ValueError(f"未知的编码配置档: {profile}（可选: {', '.join(PROFILES)}）")
+        return PROFILES[profile]
+    overrides = dict(profile)
+    base = get_profile(overrides.pop("base", "aiortc"))
+    unknown = set(overrides) - {f.name for f in dataclasses.fields(EncoderProfile)}
+    if unknown:
+        raise ValueError(f"未知的编码配置项: {', '.join(sorted(unknown))}")
+    if "codecs" in overrides:
+        overrides["codecs"] = tuple(_mime_type(c) for c in overrides["codecs"])
+    overrides.setdefault("name", base.name + "*")
+    return dataclasses.replace(base, **overrides)
+
+
+class ProfiledH264Encoder(H264Encoder):
+    """按配置档创建 libx264 上下文的 aiortc H264 编码器，其余（分包、码率调整）沿用 aiortc"""
+
+    def __init__(self, profile):
+        super().__init__()
+        self.profile = profile
+        if profile.bitrate is not None:
+            self.target_bitrate = profile.bitrate
+
+    @property
+    def target_bitrate(self):
+        return self._H264Encoder__target_bitrate
+
+    @target_bitrate.setter
+    def target_bitrate(self, bitrate):
+        # aiortc 的 setter 固定限制在 0.5~3Mbps
+        self._H264Encoder__target_bitrate = self.profile.clamp_bitrate(bitrate, h264.MIN_BITRATE, h264.MAX_BITRATE)
+
+    def _create_context(self, width, height):
+        # 与 aiortc 的 create_encoder_context 相同，open 之前应用配置档
+        codec = av.CodecContext.create("libx264", "w")
+        codec.width = width
+        codec.height = height
+        codec.bit_rate = self.target_bitrate
+        codec.pix_fmt = "yuv420p"
+        codec.framerate = fractions.Fraction(MAX_FRAME_RATE, 1)
+        codec.time_base = fractions.Fraction(1, MAX_FRAME_RATE)
+        codec.options = {}
+        codec.profile = "Baseline"
+        self.profile.apply(codec, "h264")
+        codec.open()
+        return codec
+
+    def _encode_frame(self, frame, force_keyframe):
+        # 需要（重新）创建上下文时先按配置档创建好，父类的检查随后会直接沿用它
+        if self.codec is None or (
+            frame.width != self.codec.width
+            or frame.height != self.codec.height
+            or abs(self.target_bitrate - self.codec.bit_rate) / self.codec.bit_rate > 0.1
+        ):
+            self.buffer_data = b""
+            self.buffer_pts = None
+            self.codec = self._create_context(frame.width, frame.height)
+        yield from super()._encode_frame(frame, force_keyframe)
+
+
+class ProfiledVp8Encoder(Vp8Encoder):
+    """aiortc 的 VP8 编码器在创建 libvpx 上下文之后，再按配置档调整 GOP、线程数和速度档位"""
+
+    def __init__(self, profile):
+        super().__init__()
+        self.profile = profile
+        if profile.bitrate is not None:
+            self.target_bitrate = profile.bitrate
+
+    @property
+    def target_bitrate(self):
+        return self._Vp8Encoder__target_bitrate
+
+    @target_bitrate.setter
+    def target_bitrate(self, bitrate):
+        self._Vp8Encoder__target_bitrate = self.profile.clamp_bitrate(bitrate, vpx.MIN_BITRATE, vpx.MAX_BITRATE)
+
+    def encode(self, frame, force_keyframe=False):
+        created = not self.codec or frame.width != self.cfg.g_w or frame.height != self.cfg.g_h
+        result = super().encode(frame, force_keyframe)
+        if created:
+            # 新上下文的第一帧总是关键帧，之后的配置从下一帧起生效
+            if self.profile.gop is not None or self.profile.threads is not None:
+                if self.profile.gop is not None:
+                    self.cfg.kf_max_dist = self.profile.gop
+                if self.profile.threads is not None:
+                    self.cfg.g_threads = self.profile.threads
+                _vpx_assert(lib.vpx_codec_enc_config_set(self.codec, self.cfg))
+            if self.profile.cpu_used is not None:
+                lib.vpx_codec_control_(self.codec, lib.VP8E_SET_CPUUSED, ffi.cast("int", self.profile.cpu_used))
+        return result
+
+
+def create_profiled_encoder(codec, profile):
+    """按协商出的编码（RTCRtpCodecParameters）创建 aiortc 编码器，profile 为 None 或不支持的编码时使用 aiortc 默认"""
+    mime_type = codec.mimeType.lower()
+    if profile is not None:
+        if mime_type == "video/h264":
+            return ProfiledH264Encoder(profile)
+        if mime_type == "video/vp8":
+            return ProfiledVp8Encoder(profile)
+    return get_encoder(codec)
+
+
+def add_profiled_track(pc, track, profile):
+    """
+    inline 模式加入轨道：aiortc 在第一帧时创建编码器，此时编码已协商完成，
+    按协商结果换成配置档对应的编码器。编码偏好需要在 createOffer 之前设置（见 PeerConnectionPool 的 codecs）
+    """
+    sender = pc.addTrack(track)
+    if profile is not None:
+        install_encoder(sender, lambda codec: create_profiled_encoder(codec, profile))
+    return sender
+
@@ -0,0 +1,130 @@
+import cv2
+import numpy as np
+from av import VideoFrame
+
+
+def even_size(width, height):
+    """I420 要求宽高为偶数"""
+    return int(width) // 2 * 2, int(height) // 2 * 2
+
+
+class LegacyConverter:
+    """
+    原有的转换方式：每帧 read() 新分配 BGR 数组，cvtColor 再分配一次，
+    from_ndarray 再拷贝一次到 VideoFrame
+    """
+
+    COLOR_CODES = {
+        "rgb24": cv2.COLOR_BGR2RGB,
+        "yuv420p": cv2.COLOR_BGR2YUV_I420,
+    }
+
+    def __init__(self, format="yuv420p"):
+        if format not in self.COLOR_CODES:
+            raise ValueError(f"不支持的像素格式: {format}")
+        self.format = format
+        self.code = self.COLOR_CODES[format]
+        self.output_size = None
+
+    def set_output_size(self, width, height):
+        """设置输出分辨率（None 表示保持采集分辨率），可在采集过程中随时调整"""
+        self.output_size = None if width is None else even_size(width, height)
+
+    def read(self, capture):
+        return capture.read()
+
+    def convert(self, frame):
+        size = self.output_size
+        if size is not None and size != (frame.shape[1], frame.shape[0]):
+            frame = cv2.resize(frame, size, interpolation=cv2.INTER_AREA)
+        frame = cv2.cvtColor(frame, self.code)
+        return VideoFrame.from_ndarray(frame, format=self.format)
+
+
+class ZeroCopyI420Converter:
+    """
+    预分配缓冲区的 BGR->I420 转换：
+    read(image=...) 复用同一块采集缓冲区，cvtColor 写入预分配的 I420 缓冲区，
+    最后只做一次平面拷贝到 VideoFrame（交给编码器的帧必须是独立的内存）
+    """
+
+    format = "yuv420p"
+
+    def __init__(self):
+        self._bgr = None
+        self._i420 = None
+        self.width = 0
+        self.height = 0
+        self.output_size = None
+        self._scaled = None
+        self._scaled_i420 = None
+
+    def set_output_size(self, width, height):
+        """设置输出分辨率（None 表示保持采集分辨率），可在采集过程中随时调整"""
+        self.output_size = None if width is None else even_size(width, height)
+
+    def _allocate(self, frame):
+        height, width = frame.shape[:2]
+        if width % 2 or height % 2:
+            raise RuntimeError(f"I420 需要偶数分辨率: {width}x{height}")
+        self._bgr = frame
+        self._i420 = np.empty((height * 3 // 2, width), dtype=np.uint8)
+        self.width = width
+        self.height = height
+
+    def read(self, capture):
+        if self._bgr is None:
+            ret, frame = capture.read()
+        else:
+            ret, frame = capture.read(image=self._bgr)
+        if not ret:
+            return False, None
+
+        # 第一帧或分辨率变化时重新分配缓冲区
+        if frame is not self._bgr:
+            self._allocate(frame)
+        return True, frame
+
+    def convert(self, frame):
+        size = self.output_size
+        if size is not None and size != (self.width, self.height):
+            # 缩放同样写入预分配的缓冲区
+            width, height = size
+            if self._scaled is None or self._scaled.shape[:2] != (height, width):
+                self._scaled = np.empty((height, width, 3), dtype=np.uint8)
+                self._scaled_i420 = np.empty((height * 3 // 2, width), dtype=np.uint8)
+            cv2.resize(frame, size, dst=self._scaled, interpolation=cv2.INTER_AREA)
+            cv2.cvtColor(self._scaled, cv2.COLOR_BGR2YUV_I420, dst=self._scaled_i420)
+            return self.to_video_frame(self._scaled_i420, width, height)
+
+        cv2.cvtColor(frame, cv2.COLOR_BGR2YUV_I420, dst=self._i420)
+        return self.to_video_frame(self._i420, self.width, self.height)
+
+    @staticmethod
+    def to_video_frame(i420, width, height):
+        """把连续的 I420 缓冲区直接拷贝进 VideoFrame 的各个平面"""
+        frame = VideoFrame(width, height, "yuv420p")
+        y_size = width * height
+        c_size = y_size // 4
+        planes = (
+            i420.reshape(-1)[:y_size].reshape(height, width),
+            i420.reshape(-1)[y_size:y_size + c_size].reshape(height // 2, width // 2),
+            i420.reshape(-1)[y_size + c_size:].reshape(height // 2, width // 2),
+        )
+        for plane, src in zip(frame.planes, planes):
+            dst = np.frombuffer(plane, dtype=np.uint8).reshape(plane.height, plane.line_size)
+            np.copyto(dst[:, :plane.width], src)
+        return frame
+
+
+def create_converter(conversion="zerocopy", format="yuv420p"):
+    """
+    按名称创建转换器：zerocopy（预分配缓冲区，仅支持 yuv420p）或 legacy
+    """
+    if conversion == "zerocopy":
+        if format != "yuv420p":
+            raise ValueError("zerocopy 转换只支持 yuv420p")
+        return ZeroCopyI420Converter()
+    if conversion == "legacy":
+        return LegacyConverter(format)
+    raise ValueError(f"未知的转换方式: {conversion}")
@@ -0,0 +1,393 @@
+"""
+一份采集供多路推流使用：同一个摄像头同时推 1080p 高清和 360p 低码率两路时，
+不再需要两个 CameraStreamTrack 各自打开设备（通常第二个打不开，打得开也是双倍的采集和转换开销）。
+
+    fanout = FrameFanOut(0, 1920, 1080, 30)
+    high = fanout.track()                # 采集分辨率
+    low = fanout.track(640, 360, fps=15)
+    pc_high.addTrack(high); pc_low.addTrack(low)
+
+每帧只读取和 BGR->I420 转换一次，随后在采集线程中按面积从大到小逐级缩小到各个输出尺寸
+（每级从已算出的最小的、不小于目标的那一级缩小，三个平面各一次 cv2.resize，直接写进输出帧）。
+每个尺寸有 slots 个预分配的 VideoFrame 轮流使用，轨道直接把环里的帧交给编码器，不再逐路拷贝；
+交出的帧在该轨道下一次 recv 前（aiortc 编码完上一帧才会再取帧）标记为占用，采集线程跳过占用的帧，
+编码器卡住时也不会改写它正在读的数据；
+只有多条轨道使用同一尺寸时才各拷贝一份，因为 aiortc 编码时会改写帧的 pict_type。
+export 不为空时同时把 BGR 画面写进同名的 SharedFrameRing，进程编码模式或其他本机进程用 "shm:<name>" 读取。
+暂停（pause）的轨道不参与缩放，也不再拿帧，直到 resume（simulcast 中没有订阅者的层）。
+"""
+import asyncio
+
+import logging
+import threading
+import time
+
+import cv2
+import numpy as np
+from aiortc import VideoStreamTrack
+from aiortc.mediastreams import MediaStreamError
+from av import VideoFrame
+
+from .FrameConverter import even_size
+from .FrameGrabber import LatestFrameSlot, ThreadedFrameGrabber
+from .FramePacer import FramePacer, MediaClock
+from .FrameSource import describe_source, open_capture
+from .SharedFrameRing import SharedFrameRing
+
+logger = logging.getLogger("WHIP_Publisher")
+
+
+def _plane_views(frame):
+    """VideoFrame 三个平面的可写 numpy 视图（去掉行尾对齐的填充）"""
+    return tuple(
+        np.frombuffer(plane, np.uint8).reshape(plane.height, plane.line_size)[:, :plane.width]
+        for plane in frame.planes
+    )
+
+
+def copy_frame(frame):
+    """拷贝一份 I420 VideoFrame 的画面"""
+    copy = VideoFrame(frame.width, frame.height, "yuv420p")
+    for dst, src in zip(_plane_views(copy), _plane_views(frame)):
+        np.copyto(dst, src)
+    return copy
+
+
+class FanOutConverter:
+    """
+    ThreadedFrameGrabber 使用的转换器：read 复用同一块 BGR 缓冲区，
+    convert 做一次 I420 转换后逐级缩小到 sizes 中的各个尺寸，返回 {(宽, 高): VideoFrame}
+    """
+
+    format = "yuv420p"
+
+    def __init__(self, slots=4, export=None):
+        self.slots = slots
+        self.export = export
+        self.export_ring = None
+        # 由事件循环线程整体替换，采集线程每帧读取一次
+        self.sizes = ()
+        self._rings = {}
+        self._index = 0
+        # 已交给编码器、还没用完的帧，由事件循环线程 hold/release，采集线程跳过
+        self._held = set()
+        self._held_lock = threading.Lock()
+        self.busy_skips = 0
+        self._bgr = None
+        self._size = None
+        self._i420 = None
+        self.scale_time_total = 0.0
+        self.frames = 0
+
+    def set_sizes(self, sizes):
+        """设置输出尺寸，下一帧起生效"""
+        self.sizes = tuple(sorted(set(sizes), key=lambda size: size[0] * size[1], reverse=True))
+
+    def read(self, capture):
+        ret, frame = capture.read() if self._bgr is None else capture.read(image=self._bgr)
+        if not ret:
+            return False, None
+        if frame is not self._bgr:
+            height, width = frame.shape[:2]
+            self._size = even_size(width, height)
+            if self._size != (width, height):
+                # I420 要求偶数宽高，裁掉最后一行/列，不在采集线程里报错
+                logger.warning("采集分辨率 %dx%d 不是偶数，按 %dx%d 输出", width, height, *self._size)
+            self._bgr = frame
+            self._i420 = np.empty((self._size[1] * 3 // 2, self._size[0]), dtype=np.uint8)
+        width, height = self._size
+        return True, frame[:height, :width]
+
+    def _ring(self, size):
+        ring = self._rings.get(size)
+        if ring is None:
+            frames = [VideoFrame(size[0], size[1], "yuv420p") for _ in range(self.slots)]
+            ring = self._rings[size] = [(frame, _plane_views(frame)) for frame in frames]
+        return ring
+
+    def hold(self, frame):
+        with self._held_lock:
+            self._held.add(frame)
+
+    def release(self, frame):
+        with self._held_lock:
+            self._held.discard(frame)
+
+    def _free_slot(self, size, start):
+        """从 start 开始找环里第一个未被占用的帧；全部占用时（编码器长时间卡住）临时新建一个"""
+        ring = self._ring(size)
+        with self._held_lock:
+            for i in range(self.slots):
+                frame, planes = ring[(start + i) % self.slots]
+                if frame not in self._held:
+                    if i:
+                        self.busy_skips += 1
+                    return frame, planes
+        self.busy_skips += 1
+        frame = VideoFrame(size[0], size[1], "yuv420p")
+        return frame, _plane_views(frame)
+
+    def _export(self, bgr):
+        if self.export_ring is None:
+            height, width = bgr.shape[:2]
+            self.export_ring = SharedFrameRing.create(self.export, width, height)
+        self.export_ring.write(bgr)
+
+    def convert(self, bgr):
+        height, width = bgr.shape[:2]
+        cv2.cvtColor(bgr, cv2.COLOR_BGR2YUV_I420, dst=self._i420)
+        if self.export is not None:
+            self._export(bgr)
+
+        t0 = time.perf_counter()
+        flat = self._i420.reshape(-1)
+        y_size, c_size = width * height, width * height // 4
+        levels = [((width, height), (
+            flat[:y_size].reshape(height, width),
+            flat[y_size:y_size + c_size].reshape(height // 2, width // 2),
+            flat[y_size + c_size:].reshape(height // 2, width // 2),
+        ))]
+        slot = self._index % self.slots
+        self._index += 1
+        sizes = self.sizes
+        frames = {}
+        for size in sizes:
+            frame, planes = self._free_slot(size, slot)
+            # 从不小于目标的最小一级缩小；目标比采集分辨率还大时从原图放大
+            candidates = [level for level in levels if level[0][0] >= size[0] and level[0][1] >= size[1]]
+            source = candidates[-1][1] if candidates else levels[0][1]
+            if size == (width, height):
+                for dst, src in zip(planes, source):
+                    np.copyto(dst, src)
+            else:
+                for dst, src in zip(planes, source):
+                    cv2.resize(src, (dst.shape[1], dst.shape[0]), dst=dst, interpolation=cv2.INTER_AREA)
+                levels.append((size, planes))
+            frames[size] = frame
+        for size in set(self._rings) - set(sizes):
+            del self._rings[size]
+        self.scale_time_total += time.perf_counter() - t0
+        self.frames += 1
+        return frames
+
+    def close(self):
+        if self.export_ring is not None:
+            self.export_ring.close()
+            self.export_ring = None
+
+
+class BroadcastSlot:
+    """ThreadedFrameGrabber 的帧去处：每帧放进所有订阅者各自的 LatestFrameSlot"""
+
+    def __init__(self):
+        self.subscribers = ()
+        self.put_count = 0
+
+    def put(self, item):
+        self.put_count += 1
+        for slot in self.subscribers:
+            slot.put(item)
+
+    # 以下汇总各订阅者，供 ThreadedFrameGrabber.stats 使用
+
+    @property
+    def get_count(self):
+        return sum(slot.get_count for slot in self.subscribers)
+
+    @property
+    def drop_count(self):
+        return sum(slot.drop_count for slot in self.subscribers)
+
+    @property
+    def wait_time_total(self):
+        return sum(slot.wait_time_total for slot in self.subscribers)
+
+    @property
+    def wait_time_max(self):
+        return max((slot.wait_time_max for slot in self.subscribers), default=0.0)
+
+
+class FrameFanOut:
+    """
+    打开一个视频源，按各轨道需要的尺寸输出。width/height/fps 为采集参数；
+    最后一个轨道 stop 后自动关闭采集（closed 为 True），之后不能再创建轨道
+    """
+
+    def __init__(self, source=0, width=640, height=480, fps=30, slots=4, clock=None, export=None):
+        self.source = source
+        self.fps = fps
+        self.capture = open_capture(source)
+        if not self.capture.isOpened():
+            raise RuntimeError(f"视频源 {describe_source(source)} 打开失败")
+        self.capture.set(cv2.CAP_PROP_FRAME_WIDTH, width)
+        self.capture.set(cv2.CAP_PROP_FRAME_HEIGHT, height)
+        self.capture.set(cv2.CAP_PROP_FPS, fps)
+        self.size = even_size(width, height)
+        self.clock = clock or MediaClock()
+        self.converter = FanOutConverter(slots, export)
+        self.broadcast = BroadcastSlot()
+        self.grabber = ThreadedFrameGrabber(
+            self.capture, converter=self.converter, name=f"fanout-{describe_source(source)}", slot=self.broadcast
+        )
+        self.tracks = []
+        self.closed = False
+        self._lock = threading.Lock()
+
+    def track(self, width=None, height=None, fps=None):
+        """新建一条输出轨道，尺寸默认为采集分辨率，fps 默认为采集帧率"""
+        if self.closed:
+            raise RuntimeError("FrameFanOut 已关闭")
+        size = self.size if width is None else even_size(width, height)
+        track = FanOutTrack(self, size, fps or self.fps)
+        with self._lock:
+            self.tracks.append(track)
+            self._update()
+        self.grabber.start()
+        return track
+
+    def _update(self):
+        # 调用方持有 self._lock
+        active = [track for track in self.tracks if not track.paused]
+        self.converter.set_sizes(track.size for track in active)
+        self.broadcast.subscribers = tuple(track.slot for track in active)
+
+    def _resize(self, track, size):
+        with self._lock:
+            track.size = size
+            self._update()
+
+    def _set_paused(self, track, paused):
+        with self._lock:
+            track.paused = paused
+            self._update()
+
+    def _remove(self, track):
+        with self._lock:
+            if track not in self.tracks:
+                return
+            self.tracks.remove(track)
+            self._update()
+            last = not self.tracks
+        if last:
+            self.close()
+
+    def shares_size(self, track):
+        """是否有其他轨道使用同样的尺寸（这些轨道拿到的是同一个帧对象）"""
+        return sum(1 for other in self.tracks if other.size == track.size and not other.paused) > 1
+
+    def stats(self):
+        """采集统计，scale_avg_ms 为每帧缩放到全部输出尺寸的总耗时"""
+        stats = self.grabber.stats()
+        frames = self.converter.frames
+        stats["outputs"] = [f"{w}x{h}" for w, h in self.converter.sizes]
+        stats["tracks"] = len(self.tracks)
+        stats["scale_avg_ms"] = self.converter.scale_time_total / frames * 1000 if frames else 0.0
+        stats["busy_skips"] = self.converter.busy_skips
+        return stats
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        self.grabber.stop()
+        if self.capture.isOpened():
+            self.capture.release()
+        self.converter.close()
+        logger.info("共享采集已关闭: %s", describe_source(self.source))
+
+
+class FanOutTrack(VideoStreamTrack):
+    """
+    FrameFanOut 的一路输出，接口与 CameraStreamTrack 相同（stats、pacing_stats、set_output、grabber）。
+    fps 低于采集帧率时按自己的 FramePacer 取最新帧；stats 中的 captured 和 cpu_s 是整个共享采集的值
+    """
+
+    def __init__(self, fanout, size, fps):
+        super().__init__()
+        self.fanout = fanout
+        self.size = size
+        self.fps = fps
+        self.clock = fanout.clock
+        self.grabber = fanout.grabber
+        self.pacer = FramePacer(fps)
+        self.slot = LatestFrameSlot()
+        self.paused = False
+        self._resumed = asyncio.Event()
+        self._resumed.set()
+        # 上一次交给编码器的环内帧
+        self._held = None
+
+    def _release(self):
+        if self._held is not None:
+            self.fanout.converter.release(self._held)
+            self._held = None
+
+    async def recv(self):
+        # 再次取帧说明编码器已用完上一帧
+        self._release()
+        if self.readyState != "live":
+            raise MediaStreamError
+
+        if self.paused:
+            await self._resumed.wait()
+            if self.readyState != "live":
+                raise MediaStreamError
+        await self.pacer.wait()
+        while True:
+            item = await self.slot.get()
+            if isinstance(item, Exception):
+                raise item
+            frames, capture_time = item
+            # 刚调整过尺寸时，已在途的帧里还没有新尺寸
+            frame = frames.get(self.size)
+            if frame is not None:
+                break
+
+        if self.fanout.shares_size(self):
+            # 同尺寸的轨道共用帧对象，aiortc 编码时会改写 pict_type，各自拷贝一份
+            frame = copy_frame(frame)
+        else:
+            self._held = frame
+            self.fanout.converter.hold(frame)
+        frame.pts = self.clock.pts(capture_time)
+        frame.time_base = self.clock.time_base
+        self.pacer.record_send()
+        return frame
+
+    def set_output(self, width=None, height=None, fps=None):
+        """运行中调整这一路的分辨率和帧率，不影响共享同一采集的其他轨道"""
+        if width is not None:
+            self.fanout._resize(self, even_size(width, height))
+        if fps is not None and fps != self.fps:
+            self.fps = fps
+            self.pacer.set_fps(fps)
+
+    def pause(self):
+        """暂停这一路：采集线程不再缩放到它的尺寸，recv 阻塞到 resume"""
+        if not self.paused:
+            self._resumed.clear()
+            self.fanout._set_paused(self, True)
+
+    def resume(self):
+        if self.paused:
+            self.slot.clear()
+            self.fanout._set_paused(self, False)
+            self._resumed.set()
+
+    def stats(self):
+        stats = self.fanout.grabber.stats()
+        stats["delivered"] = self.slot.get_count
+        stats["dropped"] = self.slot.drop_count
+        stats["queue_wait_avg_ms"] = self.slot.wait_time_total / self.slot.get_count * 1000 if self.slot.get_count else 0.0
+        stats["queue_wait_max_ms"] = self.slot.wait_time_max * 1000
+        stats["paused"] = self.paused
+        return stats
+
+    def pacing_stats(self):
+        return self.pacer.stats()
+
+    def stop(self):
+        super().stop()
+        self._release()
+        self._resumed.set()
+        self.fanout._remove(self)
@@ -0,0 +1,194 @@
+import asyncio
+import logging
+import threading
+import time
+
+logger = logging.getLogger("WHIP_Publisher")
+
+
+class LatestFrameSlot:
+    """
+    线程安全的“最新帧”槽位：生产者线程只保留最新一帧，旧帧直接丢弃而不是排队，
+    消费者在 asyncio 事件循环上等待最新帧。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._item = None
+        self._has_item = False
+        self._waiter = None
+        self._loop = None
+
+        # 统计计数
+        self.put_count = 0
+        self.drop_count = 0
+        self.get_count = 0
+        self.wait_time_total = 0.0
+        self.wait_time_max = 0.0
+
+    def put(self, item):
+        """生产者调用（任意线程），覆盖尚未被取走的旧帧"""
+        with self._lock:
+            if self._has_item:
+                self.drop_count += 1
+            self._item = item
+            self._has_item = True
+            self.put_count += 1
+            waiter, self._waiter = self._waiter, None
+            loop = self._loop
+
+        if waiter is not None:
+            try:
+                loop.call_soon_threadsafe(self._wake, waiter)
+            except RuntimeError:
+                # 事件循环已关闭
+                pass
+
+    def clear(self):
+        """丢弃尚未取走的帧（消费者暂停后恢复时，不再送出暂停前的旧帧）"""
+        with self._lock:
+            if self._has_item:
+                self.drop_count += 1
+            self._item, self._has_item = None, False
+
+    @staticmethod
+    def _wake(waiter):
+        if not waiter.done():
+            waiter.set_result(None)
+
+    async def get(self):
+        """消费者调用（事件循环中），返回最新的一帧"""
+        start = time.perf_counter()
+        while True:
+            with self._lock:
+                if self._has_item:
+                    item, self._item, self._has_item = self._item, None, False
+                    self.get_count += 1
+                    break
+                if self._loop is None:
+                    self._loop = asyncio.get_running_loop()
+                waiter = self._waiter = self._loop.create_future()
+            try:
+                await waiter
+            finally:
+                with self._lock:
+                    if self._waiter is waiter:
+                        self._waiter = None
+
+        waited = time.perf_counter() - start
+        self.wait_time_total += waited
+        if waited > self.wait_time_max:
+            self.wait_time_max = waited
+        return item
+
+
+class ThreadedFrameGrabber:
+    """
+    在独立线程中预读摄像头帧（capture-ahead），避免 cv2 的阻塞读取和颜色转换占用事件循环。
+    converter 为可选的转换器（见 FrameConverter），其 read/convert 同样在采集线程中执行。
+    timing_callbacks 中的回调在采集线程中每帧调用一次：callback(读取墙钟, 转换墙钟, 读取CPU, 转换CPU)，单位秒
+    （见 Metrics、Profiler）。
+    slot 为帧的去处，默认是单个消费者的 LatestFrameSlot（一份采集分发给多个消费者见 FrameFanOut）。
+    """
+
+    MAX_READ_FAILURES = 30
+
+    def __init__(self, capture, converter=None, name="camera", slot=None):
+        self.capture = capture
+        self.converter = converter
+        self.name = name
+        self.slot = slot if slot is not None else LatestFrameSlot()
+        self.read_failures = 0
+        self.capture_time_total = 0.0
+        self.convert_time_total = 0.0
+        self.cpu_time = 0.0
+        self.timing_callbacks = []
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(
+            target=self._run, name=f"FrameGrabber-{self.name}", daemon=True
+        )
+        self._thread.start()
+        logger.info("采集线程已启动: %s", self.name)
+
+    def stop(self, timeout=1.0):
+        self._stop_event.set()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join(timeout)
+        self._thread = None
+
+    def _run(self):
+        try:
+            self._capture_loop()
+        except Exception as e:
+            # 读取、转换或计时回调出错时线程会退出，把异常交给消费者抛出，避免 recv 一直等下去
+            logger.exception("采集线程 %s 异常退出: %s", self.name, e)
+            self.slot.put(e)
+
+    def _capture_loop(self):
+        failures = 0
+        while not self._stop_event.is_set():
+            t0, c0 = time.perf_counter(), time.thread_time()
+            if self.converter is not None:
+                ret, frame = self.converter.read(self.capture)
+            else:
+                ret, frame = self.capture.read()
+            t1, c1 = time.perf_counter(), time.thread_time()
+            capture_time = time.monotonic()
+            if not ret:
+                self.read_failures += 1
+                failures += 1
+                if failures >= self.MAX_READ_FAILURES:
+                    # 连续读取失败，把异常交给消费者抛出
+                    self.slot.put(RuntimeError(f"无法从 {self.name} 读取帧"))
+                    return
+                time.sleep(0.01)
+                continue
+            failures = 0
+
+            if self.converter is not None:
+                frame = self.converter.convert(frame)
+            t2, c2 = time.perf_counter(), time.thread_time()
+
+            self.capture_time_total += t1 - t0
+            self.convert_time_total += t2 - t1
+            self.cpu_time = c2
+            if self.timing_callbacks:
+                for callback in tuple(self.timing_callbacks):
+                    callback(t1 - t0, t2 - t1, c1 - c0, c2 - c1)
+            self.slot.put((frame, capture_time))
+
+    async def read(self):
+        """等待并返回最新的一帧（已转换）"""
+        frame, _ = await self.read_timed()
+        return frame
+
+    async def read_timed(self):
+        """等待并返回 (最新的一帧, 采集时刻 time.monotonic())"""
+        item = await self.slot.get()
+        if isinstance(item, Exception):
+            raise item
+        return item
+
+    def stats(self):
+        """
+        采集统计：dropped 高说明编码/发送跟不上采集，queue_wait 高说明采集是瓶颈
+        """
+        slot = self.slot
+        captured = slot.put_count
+        delivered = slot.get_count
+        return {
+            "captured": captured,
+            "delivered": delivered,
+            "dropped": slot.drop_count,
+            "read_failures": self.read_failures,
+            "queue_wait_avg_ms": slot.wait_time_total / delivered * 1000 if delivered else 0.0,
+            "queue_wait_max_ms": slot.wait_time_max * 1000,
+            "capture_avg_ms": self.capture_time_total / captured * 1000 if captured else 0.0,
+            "convert_avg_ms": self.convert_time_total / captured * 1000 if captured else 0.0,
+            "cpu_s": self.cpu_time,
+        }
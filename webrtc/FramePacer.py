@@ -0,0 +1,129 @@
+import asyncio
+import bisect
+import time
+from fractions import Fraction
+
+VIDEO_CLOCK_RATE = 90000
+VIDEO_TIME_BASE = Fraction(1, VIDEO_CLOCK_RATE)
+
+
+class MediaClock:
+    """
+    以单调时钟为基准的媒体时钟：pts 由采集时刻换算成 90kHz，不受 NTP 校时影响。
+    同一个 MediaClock 可供多条轨道共用，保证音视频时间戳同源。
+    """
+
+    def __init__(self, clock_rate=VIDEO_CLOCK_RATE, clock=time.monotonic):
+        self.clock = clock
+        self.clock_rate = clock_rate
+        self.time_base = Fraction(1, clock_rate)
+        self.epoch = clock()
+
+    def now(self):
+        return self.clock()
+
+    def pts(self, capture_time, clock_rate=None):
+        return int(round((capture_time - self.epoch) * (clock_rate or self.clock_rate)))
+
+
+class IntervalHistogram:
+    """相邻两帧发送间隔的直方图（毫秒）"""
+
+    DEFAULT_BUCKETS = (5, 10, 20, 25, 30, 33, 35, 40, 50, 66, 100, 200, 500)
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = None
+
+    def observe(self, value_ms):
+        self.counts[bisect.bisect_left(self.buckets, value_ms)] += 1
+        self.count += 1
+        self.total += value_ms
+        self.min = value_ms if self.min is None else min(self.min, value_ms)
+        self.max = value_ms if self.max is None else max(self.max, value_ms)
+
+    def percentile(self, q):
+        """按桶上界估算分位数"""
+        if not self.count:
+            return 0.0
+        target = q * self.count
+        seen = 0
+        for bound, count in zip(self.buckets + (self.max,), self.counts):
+            seen += count
+            if seen >= target:
+                return float(bound)
+        return float(self.max)
+
+    def to_dict(self):
+        labels = [f"<={b}" for b in self.buckets] + [f">{self.buckets[-1]}"]
+        return {
+            "count": self.count,
+            "avg_ms": self.total / self.count if self.count else 0.0,
+            "min_ms": self.min or 0.0,
+            "max_ms": self.max or 0.0,
+            "p50_ms": self.percentile(0.5),
+            "p99_ms": self.percentile(0.99),
+            "buckets": dict(zip(labels, self.counts)),
+        }
+
+
+class FramePacer:
+    """
+    单调时钟 + 绝对截止时间的帧节拍器：
+    第 n 帧的截止时间是 start + n * interval，sleep 超时不会累积成帧率漂移；
+    落后超过一帧时直接跳过错过的节拍，而不是连续突发补发。
+    """
+
+    def __init__(self, fps, clock=time.monotonic):
+        self.clock = clock
+        self.histogram = IntervalHistogram()
+        self.skipped = 0
+        self._last_send = None
+        self.set_fps(fps)
+
+    def set_fps(self, fps):
+        """修改帧率时以当前时刻为新的节拍起点"""
+        self.fps = fps
+        self.interval = 1.0 / fps
+        self._start = self.clock()
+        self._index = 0
+
+    def _next_delay(self):
+        now = self.clock()
+        deadline = self._start + self._index * self.interval
+        if now - deadline >= self.interval:
+            # 落后一帧以上：跳到当前时刻之后的最近一个节拍
+            behind = int((now - self._start) / self.interval)
+            self.skipped += behind - self._index
+            self._index = behind
+            deadline = self._start + self._index * self.interval
+        self._index += 1
+        return deadline - now
+
+    async def wait(self):
+        delay = self._next_delay()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    def wait_blocking(self):
+        """线程/子进程中使用的阻塞版本"""
+        delay = self._next_delay()
+        if delay > 0:
+            time.sleep(delay)
+
+    def record_send(self):
+        """记录一次发送，更新发送间隔直方图"""
+        now = self.clock()
+        if self._last_send is not None:
+            self.histogram.observe((now - self._last_send) * 1000)
+        self._last_send = now
+
+    def stats(self):
+        stats = self.histogram.to_dict()
+        stats["skipped"] = self.skipped
+        stats["target_ms"] = self.interval * 1000
+        return stats
@@ -0,0 +1,311 @@
+"""
+视频源：按配置选择采集后端，统一成 cv2.VideoCapture 的接口（isOpened/set/get/read(image=...)/release），
+CameraStreamTrack、ProcessEncodedTrack 和 StreamSpec 都通过 open_capture 打开，换源只改配置不改代码。
+
+    0、"0"                          摄像头索引（cv2 自动选择后端）
+    "v4l2:/dev/video2"、"v4l2:2"     指定走 V4L2
+    "gst:<pipeline>"                GStreamer 管道，结尾没有 appsink 时自动补上 BGR 输出
+    "file:clip.mp4"                 循环播放的视频文件（mmap 映射后由 PyAV 解码，按 fps 出帧）
+    "synthetic"                     带时间戳条码的合成画面（见 SyntheticSource）
+    "shm:<name>"                    本机其他进程写入的共享内存环形缓冲（见 SharedFrameRing）
+    其他字符串                        原样交给 cv2.VideoCapture（rtsp://、http://、只播放一遍的文件等）
+
+也可以写成字典，"type" 为上面的前缀，其余键为对应后端的参数：
+{"type": "file", "path": "clip.mp4", "loop": False}、{"type": "shm", "name": "robot-cam", "timeout": 5}。
+
+把任意视频源写进共享内存（调试 shm 源，或让其他程序读取同一路采集）：
+python -m webrtc.FrameSource --feed robot-cam --source file:clip.mp4
+"""
+import logging
+import mmap
+import shlex
+import shutil
+import subprocess
+
+import av
+import cv2
+import numpy as np
+
+from .FramePacer import FramePacer
+from .SharedFrameRing import SharedFrameRing, SharedMemoryCapture
+from .SyntheticSource import SYNTHETIC_SOURCE, SyntheticCapture
+
+logger = logging.getLogger("WHIP_Publisher")
+
+GST_APPSINK = "videoconvert ! video/x-raw,format=BGR ! appsink drop=1 max-buffers=1"
+
+
+class VideoFileCapture:
+    """
+    循环播放视频文件：文件整体 mmap 映射后交给 PyAV 解码（读取不经过 read 系统调用，多路共用同一份页缓存），
+    到结尾时 seek 回开头；read 按 fps（默认取文件帧率）的绝对节拍阻塞，和摄像头一样实时出帧。
+    set 宽高后输出缩放到该尺寸
+    """
+
+    def __init__(self, path, loop=True, fps=None):
+        self.path = path
+        self.loop = loop
+        self.loops = 0
+        self._file = open(path, "rb")
+        self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        self._container = av.open(self._mmap)
+        self._stream = self._container.streams.video[0]
+        self._stream.thread_type = "AUTO"
+        self._frames = self._container.decode(self._stream)
+        self.width = self._stream.codec_context.width
+        self.height = self._stream.codec_context.height
+        self.fps = fps or float(self._stream.average_rate or 30)
+        self._pacer = FramePacer(self.fps)
+        self._opened = True
+
+    def isOpened(self):
+        return self._opened
+
+    def set(self, prop, value):
+        if prop == cv2.CAP_PROP_FRAME_WIDTH:
+            self.width = int(value)
+        elif prop == cv2.CAP_PROP_FRAME_HEIGHT:
+            self.height = int(value)
+        elif prop == cv2.CAP_PROP_FPS:
+            self.fps = value
+            self._pacer.set_fps(value)
+        else:
+            return False
+        return True
+
+    def get(self, prop):
+        return {
+            cv2.CAP_PROP_FRAME_WIDTH: self.width,
+            cv2.CAP_PROP_FRAME_HEIGHT: self.height,
+            cv2.CAP_PROP_FPS: self.fps,
+            cv2.CAP_PROP_FRAME_COUNT: self._stream.frames,
+        }.get(prop, 0)
+
+    def _next_frame(self):
+        try:
+            return next(self._frames)
+        except StopIteration:
+            if not self.loop:
+                return None
+        self._container.seek(0)
+        self._frames = self._container.decode(self._stream)
+        self.loops += 1
+        return next(self._frames, None)
+
+    def read(self, image=None):
+        if not self._opened:
+            return False, None
+        self._pacer.wait_blocking()
+        frame = self._next_frame()
+        if frame is None:
+            return False, None
+        bgr = frame.to_ndarray(format="bgr24", width=self.width, height=self.height)
+        if image is not None and image.shape == bgr.shape:
+            np.copyto(image, bgr)
+            return True, image
+        return True, bgr
+
+    def release(self):
+        if not self._opened:
+            return
+        self._opened = False
+        self._frames = None
+        self._container.close()
+        self._mmap.close()
+        self._file.close()
+
+
+class GstLaunchCapture:
+    """
+    pip 安装的 opencv 不带 GStreamer 支持时的替代：用 gst-launch-1.0 子进程运行管道，
+    经 fdsink 把固定尺寸的 BGR 原始帧写到 stdout，read 直接读进调用方的缓冲区。
+    管道在第一次 read 时启动，输出尺寸取 set 的宽高（默认 640x480）
+    """
+
+    def __init__(self, pipeline):
+        self.pipeline = pipeline
+        self.width = 640
+        self.height = 480
+        self.fps = 0
+        self.process = None
+        self._opened = shutil.which("gst-launch-1.0") is not None
+
+    def isOpened(self):
+        return self._opened
+
+    def set(self, prop, value):
+        if self.process is not None:
+            return False
+        if prop == cv2.CAP_PROP_FRAME_WIDTH:
+            self.width = int(value)
+        elif prop == cv2.CAP_PROP_FRAME_HEIGHT:
+            self.height = int(value)
+        elif prop == cv2.CAP_PROP_FPS:
+            self.fps = value
+        else:
+            return False
+        return True
+
+    def get(self, prop):
+        return {
+            cv2.CAP_PROP_FRAME_WIDTH: self.width,
+            cv2.CAP_PROP_FRAME_HEIGHT: self.height,
+            cv2.CAP_PROP_FPS: self.fps,
+        }.get(prop, 0)
+
+    def _start(self):
+        command = (
+            f"gst-launch-1.0 -q {self.pipeline} ! videoconvert ! videoscale ! "
+            f"video/x-raw,format=BGR,width={self.width},height={self.height} ! fdsink fd=1"
+        )
+        self.process = subprocess.Popen(shlex.split(command), stdout=subprocess.PIPE, bufsize=0)
+        logger.info("GStreamer 管道已启动: %s", self.pipeline)
+
+    def read(self, image=None):
+        if not self._opened:
+            return False, None
+        if self.process is None:
+            self._start()
+        shape = (self.height, self.width, 3)
+        if image is None or image.shape != shape:
+            image = np.empty(shape, np.uint8)
+        view = memoryview(image).cast("B")
+        received = 0
+        while received < len(view):
+            n = self.process.stdout.readinto(view[received:])
+            if not n:
+                self._opened = False
+                return False, None
+            received += n
+        return True, image
+
+    def release(self):
+        self._opened = False
+        if self.process is not None:
+            self.process.kill()
+            self.process.wait()
+            self.process = None
+
+
+def _cv2_has_gstreamer():
+    for line in cv2.getBuildInformation().splitlines():
+        if line.strip().startswith("GStreamer:"):
+            return "YES" in line
+    return False
+
+
+def open_gstreamer(pipeline):
+    """GStreamer 管道：opencv 带 GStreamer 时走 cv2.CAP_GSTREAMER，否则用 gst-launch-1.0 子进程"""
+    elements = [element.strip() for element in pipeline.split("!")]
+    if _cv2_has_gstreamer():
+        if not elements[-1].startswith("appsink"):
+            pipeline = f"{pipeline} ! {GST_APPSINK}"
+        return cv2.VideoCapture(pipeline, cv2.CAP_GSTREAMER)
+    if elements[-1].startswith("appsink"):
+        # 为 cv2 写的管道：去掉 appsink，改由 fdsink 输出
+        elements.pop()
+    logger.info("opencv 不支持 GStreamer，改用 gst-launch-1.0 子进程")
+    return GstLaunchCapture(" ! ".join(elements))
+
+
+def open_camera(index=0, backend=None):
+    """摄像头：index 为索引或设备路径，backend 为 cv2.CAP_* 常量"""
+    return cv2.VideoCapture(index, backend if backend is not None else cv2.CAP_ANY)
+
+
+def open_v4l2(device=0):
+    if isinstance(device, str) and device.isdigit():
+        device = int(device)
+    return open_camera(device, cv2.CAP_V4L2)
+
+
+BACKENDS = {
+    "camera": open_camera,
+    "v4l2": open_v4l2,
+    "gst": open_gstreamer,
+    "file": VideoFileCapture,
+    SYNTHETIC_SOURCE: SyntheticCapture,
+    "shm": SharedMemoryCapture,
+}
+
+# 字符串写法 "<前缀>:<值>" 中的值对应的参数名
+PREFIX_ARGUMENTS = {
+    "v4l2": "device",
+    "gst": "pipeline",
+    "file": "path",
+    "shm": "name",
+}
+
+
+def parse_source(source):
+    """把配置中的视频源解析为 (后端名, 参数字典)，后端名为 None 时原样交给 cv2.VideoCapture"""
+    if isinstance(source, dict):
+        options = dict(source)
+        kind = options.pop("type", "camera")
+        if kind not in BACKENDS:
+            raise ValueError(f"未知的视频源类型: {kind}（可选: {', '.join(BACKENDS)}）")
+        return kind, options
+    if isinstance(source, int) or (isinstance(source, str) and source.isdigit()):
+        return "camera", {"index": int(source)}
+    if source == SYNTHETIC_SOURCE:
+        return SYNTHETIC_SOURCE, {}
+    prefix, sep, value = source.partition(":")
+    if sep and prefix in PREFIX_ARGUMENTS:
+        return prefix, {PREFIX_ARGUMENTS[prefix]: value}
+    return None, {"source": source}
+
+
+def open_capture(source):
+    """按配置打开视频源（写法见模块说明），返回 cv2.VideoCapture 或接口相同的对象"""
+    kind, options = parse_source(source)
+    if kind is None:
+        return cv2.VideoCapture(options["source"])
+    return BACKENDS[kind](**options)
+
+
+def describe_source(source):
+    """日志和线程名中使用的简短描述"""
+    kind, options = parse_source(source)
+    if kind is None:
+        return str(options["source"])
+    values = [str(value) for value in options.values()]
+    return kind if not values else f"{kind}:{values[0][:40]}"
+
+
+def feed(source, name, width=640, height=480, fps=30):
+    """把 source 的画面按 fps 写入名为 name 的共享内存环形缓冲，直到源结束或 Ctrl+C"""
+    capture = open_capture(source)
+    if not capture.isOpened():
+        raise RuntimeError(f"视频源 {source} 打开失败")
+    capture.set(cv2.CAP_PROP_FRAME_WIDTH, width)
+    capture.set(cv2.CAP_PROP_FRAME_HEIGHT, height)
+    capture.set(cv2.CAP_PROP_FPS, fps)
+    ring = SharedFrameRing.create(name, width, height)
+    pacer = FramePacer(fps)
+    image = None
+    try:
+        while True:
+            pacer.wait_blocking()
+            ret, image = capture.read(image=image)
+            if not ret:
+                break
+            ring.write(image)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        capture.release()
+        ring.close()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="把视频源写入共享内存帧缓冲，供 shm:<name> 读取")
+    parser.add_argument("--feed", required=True, metavar="NAME", help="共享内存名称")
+    parser.add_argument("--source", default=SYNTHETIC_SOURCE, help="视频源，写法同 open_capture")
+    parser.add_argument("--width", type=int, default=640)
+    parser.add_argument("--height", type=int, default=480)
+    parser.add_argument("--fps", type=int, default=30)
+    args = parser.parse_args()
+    feed(args.source, args.feed, args.width, args.height, args.fps)
@@ -0,0 +1,305 @@
+import asyncio
+import logging
+import random
+import socket
+import struct
+from fractions import Fraction
+from urllib.parse import parse_qs, urlparse
+
+import av
+from aiortc.mediastreams import MediaStreamError, MediaStreamTrack
+from aiortc.rtp import RTCP_PSFB_PLI, RtcpPsfbPacket, RtpPacket
+
+from .ProcessEncoder import EncodedPacketQueue
+from .SenderHooks import on_keyframe_request, prefer_codec
+
+logger = logging.getLogger("WHIP_Publisher")
+
+VIDEO_TIME_BASE = Fraction(1, 90000)
+START_CODE = b"\x00\x00\x00\x01"
+
+NAL_IDR = 5
+NAL_SPS = 7
+NAL_PPS = 8
+NAL_STAP_A = 24
+NAL_FU_A = 28
+
+
+class H264Depacketizer:
+    """
+    RFC 6184 H264 RTP 解包：支持单 NAL、STAP-A、FU-A，
+    按 RTP 时间戳/marker 位组装成 Annex B 格式的访问单元（一帧）
+    """
+
+    def __init__(self):
+        self._nals = []
+        self._fu = None
+        self._timestamp = None
+        self._expected_seq = None
+        self._broken = False
+        self.lost = 0
+
+    def push(self, packet):
+        """输入一个 RTP 包，返回已完成的访问单元列表 [(timestamp, [nal, ...])]"""
+        done = []
+
+        gap = self._expected_seq is not None and packet.sequence_number != self._expected_seq
+        if gap:
+            # 丢包：当前帧已不完整
+            self.lost += (packet.sequence_number - self._expected_seq) & 0xFFFF
+            self._broken = True
+            self._fu = None
+        self._expected_seq = (packet.sequence_number + 1) & 0xFFFF
+
+        if self._timestamp is not None and packet.timestamp != self._timestamp and (self._nals or not gap):
+            # 上一帧还没输出：缺口可能在它的结尾，也可能在新一帧的开头，两帧都按不完整处理；
+            # 上一帧已随 marker 输出时缺口只属于新一帧，_broken 保持不变
+            done += self._flush()
+            self._broken = gap
+        self._timestamp = packet.timestamp
+
+        payload = packet.payload
+        if payload:
+            self._depayload(payload)
+
+        if packet.marker:
+            done += self._flush()
+        return done
+
+    def _depayload(self, payload):
+        nal_type = payload[0] & 0x1F
+        if 1 <= nal_type <= 23:
+            self._nals.append(payload)
+        elif nal_type == NAL_STAP_A:
+            pos = 1
+            while pos + 2 <= len(payload):
+                size = struct.unpack("!H", payload[pos:pos + 2])[0]
+                pos += 2
+                self._nals.append(payload[pos:pos + size])
+                pos += size
+        elif nal_type == NAL_FU_A and len(payload) > 2:
+            fu_header = payload[1]
+            if fu_header & 0x80:
+                self._fu = bytearray([(payload[0] & 0xE0) | (fu_header & 0x1F)])
+            if self._fu is None:
+                # 丢失了分片起始包
+                self._broken = True
+                return
+            self._fu += payload[2:]
+            if fu_header & 0x40:
+                self._nals.append(bytes(self._fu))
+                self._fu = None
+
+    def _flush(self):
+        nals, self._nals = self._nals, []
+        broken, self._broken = self._broken, False
+        self._fu = None
+        if not nals or broken:
+            return [] if not broken else [(self._timestamp, None)]
+        return [(self._timestamp, nals)]
+
+
+class MulticastRtpProtocol(asyncio.DatagramProtocol):
+    def __init__(self, on_packet):
+        self.on_packet = on_packet
+        self.transport = None
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def datagram_received(self, data, addr):
+        try:
+            packet = RtpPacket.parse(data)
+        except ValueError:
+            return
+        self.on_packet(packet, addr)
+
+
+def open_multicast_socket(group, port, iface_address="0.0.0.0"):
+    """加入组播组并绑定端口（相当于 gstreamer 的 udpsrc address=... port=...）"""
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_UDP)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4 * 1024 * 1024)
+    sock.bind(("", port))
+    membership = socket.inet_aton(group) + socket.inet_aton(iface_address)
+    sock.setsockopt(socket.IPPROTO_IP, socket.IP_ADD_MEMBERSHIP, membership)
+    sock.setblocking(False)
+    return sock
+
+
+def parse_multicast_source(source):
+    """
+    解析组播源地址，例如 udp://230.1.1.1:1720?iface=192.168.1.10&rtcp=192.168.1.20:1721
+    rtcp 为上游 RTCP 地址，配置后关键帧请求会以 PLI 转发给上游
+    """
+    url = urlparse(source)
+    query = parse_qs(url.query)
+    rtcp = None
+    if "rtcp" in query:
+        host, _, port = query["rtcp"][0].rpartition(":")
+        rtcp = (host, int(port))
+    return {
+        "group": url.hostname,
+        "port": url.port,
+        "iface_address": query.get("iface", ["0.0.0.0"])[0],
+        "upstream_rtcp": rtcp,
+    }
+
+
+class H264PassthroughTrack(MediaStreamTrack):
+    """
+    直接转发组播 RTP 中的 H264 数据，不解码也不重新编码：
+    解包成访问单元后以 av.Packet 交给 aiortc，aiortc 只负责重新打包发送。
+    关键帧请求只转发给上游（PLI）：live777 把这一路码流转发给所有观众，插入缓存的旧 IDR 后，
+    上游随后的 P 帧参考的是编码器当前的画面而不是它，所有观众都会先跳回旧画面、再花屏到下一个真正的 IDR。
+    丢包导致帧不完整时同样向上游请求关键帧，并丢弃之后的帧直到关键帧到达。
+    """
+
+    kind = "video"
+    mime_type = "video/H264"
+
+    def __init__(self, group="230.1.1.1", port=1720, iface_address="0.0.0.0",
+                 upstream_rtcp=None, max_queue=30):
+        super().__init__()
+        self.group = group
+        self.port = port
+        self.iface_address = iface_address
+        self.upstream_rtcp = upstream_rtcp
+
+        self.depacketizer = H264Depacketizer()
+        self.queue = EncodedPacketQueue(max_queue, on_overflow=self.request_keyframe, wait_keyframe=True)
+        self._transport = None
+        self._source_ssrc = 0
+        self._source_addr = None
+        self._ssrc = random.randint(1, 0xFFFFFFFF)
+
+        # 时间戳展开（RTP 时间戳 32 位回绕）
+        self._ts_base = None
+        self._ts_last = None
+        self._ts_offset = 0
+        self._last_pts = 0
+
+        # 参数集缓存
+        self._sps = None
+        self._pps = None
+
+        # 统计
+        self.access_units = 0
+        self.bytes_forwarded = 0
+        self.keyframe_requests = 0
+        self.upstream_plis = 0
+        self.broken_frames = 0
+
+    async def start(self):
+        if self._transport is not None:
+            return
+        loop = asyncio.get_running_loop()
+        sock = open_multicast_socket(self.group, self.port, self.iface_address)
+        self._transport, _ = await loop.create_datagram_endpoint(
+            lambda: MulticastRtpProtocol(self._on_rtp), sock=sock
+        )
+        logger.info("已加入组播 %s:%d，H264 直通转发", self.group, self.port)
+        # 中途接入，尽快拿到一个关键帧
+        self._request_upstream_keyframe()
+
+    def _on_rtp(self, packet, addr):
+        self._source_ssrc = packet.ssrc
+        self._source_addr = addr
+        for timestamp, nals in self.depacketizer.push(packet):
+            if nals is None:
+                # 帧不完整，之后的 P 帧都参考不到它：丢到下一个关键帧，并向上游请求关键帧以尽快恢复
+                self.broken_frames += 1
+                self.queue.wait_keyframe()
+                self._request_upstream_keyframe()
+                continue
+            self._on_access_unit(timestamp, nals)
+
+    def _unwrap(self, timestamp):
+        if self._ts_base is None:
+            self._ts_base = timestamp
+        elif timestamp < self._ts_last and self._ts_last - timestamp > 0x80000000:
+            self._ts_offset += 1 << 32
+        self._ts_last = timestamp
+        return timestamp + self._ts_offset - self._ts_base
+
+    def _on_access_unit(self, timestamp, nals):
+        types = {nal[0] & 0x1F for nal in nals}
+        for nal in nals:
+            nal_type = nal[0] & 0x1F
+            if nal_type == NAL_SPS:
+                self._sps = nal
+            elif nal_type == NAL_PPS:
+                self._pps = nal
+
+        is_keyframe = NAL_IDR in types
+        if is_keyframe and NAL_SPS not in types and self._sps and self._pps:
+            # 带内没有参数集时补上缓存的 SPS/PPS，保证新观众可以直接解码
+            nals = [self._sps, self._pps] + nals
+
+        data = START_CODE + START_CODE.join(nals)
+        self._last_pts = self._unwrap(timestamp)
+        self.access_units += 1
+        self.bytes_forwarded += len(data)
+        self.queue.put(self._make_packet(data, self._last_pts), is_keyframe)
+
+    @staticmethod
+    def _make_packet(data, pts):
+        packet = av.Packet(data)
+        packet.pts = pts
+        packet.time_base = VIDEO_TIME_BASE
+        return packet
+
+    def _request_upstream_keyframe(self):
+        if self.upstream_rtcp is None or self._transport is None:
+            return False
+        pli = RtcpPsfbPacket(fmt=RTCP_PSFB_PLI, ssrc=self._ssrc, media_ssrc=self._source_ssrc)
+        self._transport.sendto(bytes(pli), self.upstream_rtcp)
+        self.upstream_plis += 1
+        return True
+
+    def request_keyframe(self):
+        """响应 live777 的 PLI：转发给上游，关键帧由上游编码器产生"""
+        self.keyframe_requests += 1
+        self._request_upstream_keyframe()
+
+    async def recv(self):
+        if self.readyState != "live":
+            raise MediaStreamError
+        if self._transport is None:
+            await self.start()
+        item = await self.queue.get()
+        if isinstance(item, Exception):
+            raise item
+        return item
+
+    def stats(self):
+        return {
+            "delivered": self.access_units,
+            "dropped": self.queue.dropped,
+            "lost_packets": self.depacketizer.lost,
+            "bytes_forwarded": self.bytes_forwarded,
+            "keyframe_requests": self.keyframe_requests,
+            "upstream_plis": self.upstream_plis,
+            "broken_frames": self.broken_frames,
+            "cpu_s": 0.0,
+        }
+
+    def stop(self):
+        super().stop()
+        if self._transport is not None:
+            self._transport.close()
+            self._transport = None
+
+
+def create_passthrough_track(source, **kwargs):
+    """从 udp://group:port?... 形式的地址创建直通轨道"""
+    return H264PassthroughTrack(**parse_multicast_source(source), **kwargs)
+
+
+def add_passthrough_track(pc, track):
+    """加入直通轨道：只协商 H264，并把 PLI 交给轨道处理"""
+    sender = pc.addTrack(track)
+    transceiver = next(t for t in pc.getTransceivers() if t.sender is sender)
+    prefer_codec(transceiver, track.mime_type, exclusive=True)
+    on_keyframe_request(sender, track.request_keyframe)
+    return sender
@@ -0,0 +1,188 @@
+"""
+关键帧请求限流：观众中途进入 live777 的房间时，SFU 向推流端发 PLI（或 FIR），观众要等到下一个关键帧才能出画面。
+aiortc 只处理 PLI，而且每个请求都让下一帧编成 IDR；一批观众同时进入时会连续产生多个 IDR，码率瞬间冲高。
+
+KeyframeLimiter 挂在 sender 的关键帧请求入口上：
+- 距上一个关键帧（含 GOP 周期关键帧）超过 min_interval 的请求立即转给编码器，下一帧即为 IDR；
+- 间隔内的请求推迟到满 min_interval 时合并为一次，推迟期间周期关键帧先出来时直接取消；
+- 已转发、关键帧还没发出的请求直接合并（超过 timeout 仍未见关键帧时视为丢失，允许再次转发）；
+- FIR（RFC 5104）aiortc 既不分发给 sender 也不处理，这里补上按 FCI 中的 SSRC 分发，按序号去重后同样处理。
+发出的关键帧由 tee_encoded 从码流中识别，每个请求从收到到关键帧编码完成的等待时间计入 time_to_keyframe。
+请求只能由编码器产生新的 IDR 来满足：缓存的旧 IDR 不能插进正在发送的码流（之后的 P 帧参考的是编码器当前的画面），
+组播直通轨道同样只把请求转发给上游（见 H264Passthrough）。
+
+    limiter = KeyframeLimiter(min_interval=1.0)
+    limiter.attach(sender)    # 每次（重新）连接后调用，应在 on_keyframe_request 之后，保证限流在最外层
+"""
+import asyncio
+import logging
+import struct
+import time
+
+from aiortc.rtp import RTCP_PSFB_PLI, RtcpPsfbPacket
+
+from .FramePacer import IntervalHistogram
+from .SenderHooks import on_rtcp_packet, tee_encoded
+
+logger = logging.getLogger("WHIP_Publisher")
+
+RTCP_PSFB_FIR = 4
+# 请求到关键帧的等待时间分桶（毫秒）
+LATENCY_BUCKETS = (20, 50, 100, 200, 300, 500, 750, 1000, 1500, 2000, 5000)
+REQUEST_KINDS = ("pli", "fir", "local")
+
+
+def _fir_entries(packet):
+    """FIR 的 FCI 为若干个 (SSRC, 序号, 3 字节保留)"""
+    for offset in range(0, len(packet.fci) - 7, 8):
+        yield struct.unpack_from("!IB", packet.fci, offset)
+
+
+def parse_fir(packet, ssrc):
+    """从 RTCP 包中取出发给 ssrc 的 FIR 序号，不是 FIR 或不是发给 ssrc 时返回 None"""
+    if not isinstance(packet, RtcpPsfbPacket) or packet.fmt != RTCP_PSFB_FIR:
+        return None
+    for target, seq in _fir_entries(packet):
+        if target == ssrc:
+            return seq
+    return None
+
+
+def route_fir(transport):
+    """
+    aiortc 按 media_ssrc 把 PSFB 包分发给 sender，而 FIR 的 media_ssrc 为 0、目标 SSRC 写在 FCI 中，
+    不补上的话 FIR 永远到不了 sender。transport 为 sender.transport，同一个 transport 只挂一次
+    """
+    router = transport._rtp_router
+    if getattr(router, "fir_routed", False):
+        return
+    original = router.route_rtcp
+
+    def route_rtcp(packet):
+        recipients = original(packet)
+        if isinstance(packet, RtcpPsfbPacket) and packet.fmt == RTCP_PSFB_FIR:
+            for target, _ in _fir_entries(packet):
+                sender = router.senders.get(target)
+                if sender is not None:
+                    recipients.add(sender)
+        return recipients
+
+    router.route_rtcp = route_rtcp
+    router.fir_routed = True
+
+
+class KeyframeLimiter:
+    """
+    一路视频的关键帧请求限流和统计，重连后对新的 sender 再调用 attach，统计继续累计。
+    min_interval 为两个关键帧之间的最小间隔（秒），0 时只合并未完成的请求、不推迟。
+    requests 按来源计数：pli、fir，local 为本进程内部的请求（simulcast 层恢复、录像重新同步等）。
+    clock 为单调时钟，可注入以便测试
+    """
+
+    def __init__(self, min_interval=1.0, timeout=2.0, clock=time.monotonic):
+        self.min_interval = min_interval
+        self.timeout = timeout
+        self.clock = clock
+        self._sender = None
+        self._send_keyframe = None
+        self._loop = None
+        self._next_kind = "local"
+        self._fir_seq = None
+        self._last_keyframe = None
+        self._forwarded_at = None
+        self._deferred = None
+        self._waiting = []
+
+        # 统计
+        self.requests = dict.fromkeys(REQUEST_KINDS, 0)
+        self.forced = 0
+        self.deferred = 0
+        self.coalesced = 0
+        self.keyframes = 0
+        self.latency = IntervalHistogram(LATENCY_BUCKETS)
+
+    def attach(self, sender):
+        """接管 sender 的关键帧请求；新连接的第一帧就是关键帧，从这里开始计算间隔"""
+        self._cancel_deferred()
+        self._sender = sender
+        self._loop = asyncio.get_running_loop()
+        self._send_keyframe = sender._send_keyframe
+        self._fir_seq = None
+        self._forwarded_at = None
+        self._waiting.clear()
+        self._last_keyframe = self.clock()
+        sender._send_keyframe = self._on_send_keyframe
+        on_rtcp_packet(sender, self._on_rtcp)
+        route_fir(sender.transport)
+        tee_encoded(sender, self._on_encoded)
+
+    def _on_rtcp(self, packet):
+        # 在 aiortc 处理之前调用：PLI 随后由 aiortc 调用 _send_keyframe，这里只记下来源
+        if isinstance(packet, RtcpPsfbPacket) and packet.fmt == RTCP_PSFB_PLI:
+            self._next_kind = "pli"
+            return
+        seq = parse_fir(packet, self._sender._ssrc)
+        if seq is not None and seq != self._fir_seq:
+            # 序号相同的 FIR 是重传，不是新的请求
+            self._fir_seq = seq
+            self.request("fir")
+
+    def _on_send_keyframe(self):
+        kind, self._next_kind = self._next_kind, "local"
+        self.request(kind)
+
+    def request(self, kind="local"):
+        """收到一个关键帧请求：立即转发、推迟或与未完成的请求合并"""
+        now = self.clock()
+        self.requests[kind] += 1
+        self._waiting.append(now)
+        if self._deferred is not None or (
+                self._forwarded_at is not None and now - self._forwarded_at < self.timeout):
+            self.coalesced += 1
+            return
+        wait = self._last_keyframe + self.min_interval - now if self._last_keyframe is not None else 0
+        if wait > 0:
+            self.deferred += 1
+            logger.debug("关键帧请求（%s）推迟 %.0fms", kind, wait * 1000)
+            self._deferred = self._loop.call_later(wait, self._force)
+        else:
+            self._force()
+
+    def _force(self):
+        self._deferred = None
+        self._forwarded_at = self.clock()
+        self.forced += 1
+        try:
+            self._send_keyframe()
+        except Exception as e:
+            logger.error("转发关键帧请求失败: %s", e)
+
+    def _cancel_deferred(self):
+        if self._deferred is not None:
+            self._deferred.cancel()
+            self._deferred = None
+
+    def _on_encoded(self, codec, data, timestamp, keyframe, size=None):
+        # tee_encoded 的回调，在编码线程中调用，只把关键帧转回事件循环
+        if keyframe and self._loop is not None and not self._loop.is_closed():
+            self._loop.call_soon_threadsafe(self._on_keyframe, self.clock())
+
+    def _on_keyframe(self, now):
+        self.keyframes += 1
+        self._last_keyframe = now
+        self._forwarded_at = None
+        # 推迟中的请求已被这个关键帧（如 GOP 周期关键帧）满足
+        self._cancel_deferred()
+        for requested in self._waiting:
+            self.latency.observe((now - requested) * 1000)
+        self._waiting.clear()
+
+    def stats(self):
+        return {
+            "requests": dict(self.requests),
+            "forced": self.forced,
+            "deferred": self.deferred,
+            "coalesced": self.coalesced,
+            "keyframes": self.keyframes,
+            "time_to_keyframe": self.latency.to_dict(),
+        }
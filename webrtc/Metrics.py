@@ -0,0 +1,430 @@
+"""
+推流端指标：Prometheus 文本格式的计数器、仪表和直方图，以及可选的 HTTP /metrics 端点，
+用于批量部署的推流端在压测或线上运行时统一采集，而不是靠逐帧打日志：
+
+    metrics = PublisherMetrics()
+    await metrics.serve(port=9108)
+    metrics.watch(stream_id, pc, sender, track)   # 每次（重新）连接后调用，track 为真正的采集/编码轨道
+    ...
+    await metrics.close()
+
+每帧的采集、转换、编码计时只做一次二分查找和几次加法；getStats() 每 interval 秒采样一次，
+采集线程和节拍器已有的累计统计在抓取 /metrics 时才读取。
+"""
+import asyncio
+import bisect
+import logging
+import time
+
+from aiohttp import web
+
+from .FramePacer import IntervalHistogram
+from .KeyframeLimiter import LATENCY_BUCKETS
+from .SenderHooks import time_encoder
+
+logger = logging.getLogger("WHIP_Publisher")
+
+# 每帧耗时（秒）的默认分桶：0.5ms ~ 250ms
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.002, 0.005, 0.01, 0.02, 0.033, 0.05, 0.1, 0.25)
+CONTENT_TYPE = "text/plain; version=0.0.4"
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(names, values, extra=()):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    pairs += [f'{name}="{value}"' for name, value in extra]
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Value:
+    """计数器/仪表的一个标签组合"""
+
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0
+
+    def inc(self, amount=1):
+        self.value += amount
+
+    def set(self, value):
+        self.value = value
+
+
+class _HistogramValue:
+    """直方图的一个标签组合，counts 为各桶（不累计）的计数，最后一个为 +Inf 桶"""
+
+    __slots__ = ("bounds", "counts", "sum", "count")
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Metric:
+    """一个指标族：name、help 和标签名，labels(*values) 取对应标签组合的值对象"""
+
+    type = None
+
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+
+    def _new_value(self):
+        return _Value()
+
+    def labels(self, *values):
+        values = tuple(str(v) for v in values)
+        value = self._values.get(values)
+        if value is None:
+            if len(values) != len(self.labelnames):
+                raise ValueError(f"{self.name} 需要标签 {self.labelnames}")
+            value = self._values[values] = self._new_value()
+        return value
+
+    def remove(self, *values):
+        """删除以 values 开头的所有标签组合（如某一路流的全部 kind）"""
+        values = tuple(str(v) for v in values)
+        for key in [k for k in self._values if k[:len(values)] == values]:
+            del self._values[key]
+
+    def _samples(self, values, value):
+        yield self.name, _format_labels(self.labelnames, values), value.value
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.type}"]
+        for values, value in list(self._values.items()):
+            for name, labels, sample in self._samples(values, value):
+                lines.append(f"{name}{labels} {_format_value(sample)}")
+        return lines
+
+
+class Counter(Metric):
+    """单调递增的计数；set() 用于镜像外部已有的累计值（如 getStats 的 bytesSent）"""
+
+    type = "counter"
+
+
+class Gauge(Metric):
+    type = "gauge"
+
+
+class Histogram(Metric):
+    type = "histogram"
+
+    def __init__(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(buckets)
+
+    def _new_value(self):
+        return _HistogramValue(self.buckets)
+
+    def _samples(self, values, value):
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float("inf"),), list(value.counts)):
+            cumulative += count
+            labels = _format_labels(self.labelnames, values, (("le", _format_value(bound)),))
+            yield f"{self.name}_bucket", labels, cumulative
+        labels = _format_labels(self.labelnames, values)
+        yield f"{self.name}_sum", labels, value.sum
+        yield f"{self.name}_count", labels, cumulative
+
+
+class MetricsRegistry:
+    """指标注册表；collector 在每次 render 之前调用，用于把外部的累计统计同步到指标中"""
+
+    def __init__(self):
+        self.metrics = {}
+        self.collectors = []
+
+    def _register(self, metric):
+        if metric.name in self.metrics:
+            raise ValueError(f"指标已存在: {metric.name}")
+        self.metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, help, labelnames=()):
+        return self._register(Counter(name, help, labelnames))
+
+    def gauge(self, name, help, labelnames=()):
+        return self._register(Gauge(name, help, labelnames))
+
+    def histogram(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self._register(Histogram(name, help, labelnames, buckets))
+
+    def add_collector(self, collector):
+        self.collectors.append(collector)
+
+    def render(self):
+        for collector in self.collectors:
+            try:
+                collector()
+            except Exception as e:
+                logger.error("指标采集失败: %s", e)
+        lines = []
+        for metric in self.metrics.values():
+            lines += metric.render()
+        return "\n".join(lines) + "\n"
+
+
+class MetricsServer:
+    """只提供 GET /metrics 的 HTTP 服务"""
+
+    def __init__(self, registry, host="0.0.0.0", port=9108):
+        self.registry = registry
+        self.host = host
+        self.port = port
+        self._runner = None
+
+    async def _handle_metrics(self, request):
+        return web.Response(body=self.registry.render().encode(), headers={"Content-Type": CONTENT_TYPE})
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_get("/metrics", self._handle_metrics)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, self.host, self.port).start()
+        logger.info("指标端点已启动: http://%s:%d/metrics", self.host, self.port)
+
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+
+class _WatchedStream:
+    """一路被监控的推流；getStats 的累计值在重连（新 PeerConnection）后从 0 重新开始，这里按增量累加"""
+
+    def __init__(self, stream_id, pc, sender, track, keyframes=None):
+        self.stream_id = stream_id
+        self.pc = pc
+        self.sender = sender
+        self.track = track
+        self.keyframes = keyframes
+        self.encoder_timed = False
+        # (回调列表, 回调)：停止监控时从轨道上摘除
+        self.hooks = []
+        self.last = {}
+        self.last_time = None
+
+    def delta(self, key, value):
+        last = self.last.get(key, 0)
+        self.last[key] = value
+        return value - last if value >= last else value
+
+
+class PublisherMetrics:
+    """
+    推流端的指标集合，按 stream 标签区分各路流：
+    - 每帧计时：采集、BGR->I420 转换（采集线程）和编码（aiortc 编码器或编码子进程）
+    - getStats 采样：发送字节/包数、远端报告的丢包、RTT、抖动和发送码率
+    - 抓取时读取：采集/送出/丢弃帧数、采集线程 CPU、节拍器跳帧数和发送间隔直方图，
+      以及关键帧请求数（按 pli/fir/local）、限流情况和请求到关键帧的等待时间（见 KeyframeLimiter）
+    """
+
+    def __init__(self, registry=None, interval=5.0):
+        self.registry = registry or MetricsRegistry()
+        self.interval = interval
+        self.streams = {}
+        self._server = None
+        self._sample_task = None
+
+        r = self.registry
+        labels = ("stream",)
+        self.capture_seconds = r.histogram("whip_capture_seconds", "每帧从视频源读取的耗时", labels)
+        self.convert_seconds = r.histogram("whip_convert_seconds", "每帧颜色转换的耗时", labels)
+        self.encode_seconds = r.histogram("whip_encode_seconds", "每帧编码的耗时", labels)
+        self.send_interval_seconds = r.histogram(
+            "whip_send_interval_seconds", "相邻两帧交给编码器的间隔", labels,
+            buckets=tuple(b / 1000 for b in IntervalHistogram.DEFAULT_BUCKETS),
+        )
+        self.frames_captured = r.counter("whip_frames_captured_total", "从视频源读到的帧数", labels)
+        self.frames_delivered = r.counter("whip_frames_delivered_total", "交给 aiortc 发送的帧数", labels)
+        self.frames_dropped = r.counter("whip_frames_dropped_total", "来不及发送而丢弃的帧数", labels)
+        self.pacer_skipped = r.counter("whip_pacer_skipped_total", "节拍器落后时跳过的节拍数", labels)
+        self.source_cpu = r.counter("whip_source_cpu_seconds_total", "采集线程（或编码子进程）的 CPU 时间", labels)
+        self.bytes_sent = r.counter("whip_rtp_bytes_sent_total", "发送的 RTP 字节数", labels)
+        self.packets_sent = r.counter("whip_rtp_packets_sent_total", "发送的 RTP 包数", labels)
+        self.packets_lost = r.counter("whip_remote_packets_lost_total", "远端接收报告中的累计丢包数", labels)
+        self.connections = r.counter("whip_connections_total", "建立（含重连）的连接数", labels)
+        self.send_bitrate = r.gauge("whip_send_bitrate_bps", "最近一个采样周期的发送码率", labels)
+        self.round_trip = r.gauge("whip_round_trip_seconds", "远端接收报告计算出的 RTT", labels)
+        self.fraction_lost = r.gauge("whip_fraction_lost", "远端接收报告中的丢包率（0~1）", labels)
+        self.jitter = r.gauge("whip_remote_jitter_seconds", "远端接收报告中的到达抖动", labels)
+        self.connected = r.gauge("whip_connected", "连接状态为 connected 时为 1", labels)
+        self.keyframe_requests = r.counter(
+            "whip_keyframe_requests_total", "收到的关键帧请求数（pli、fir，local 为本进程内部请求）", ("stream", "kind"),
+        )
+        self.keyframes_forced = r.counter("whip_keyframes_forced_total", "转给编码器的关键帧请求数（限流后）", labels)
+        self.keyframe_requests_deferred = r.counter(
+            "whip_keyframe_requests_deferred_total", "距上一个关键帧太近而推迟的请求数", labels,
+        )
+        self.keyframe_requests_coalesced = r.counter(
+            "whip_keyframe_requests_coalesced_total", "与未完成的请求合并的请求数", labels,
+        )
+        self.keyframes_sent = r.counter("whip_keyframes_sent_total", "发出的关键帧数（含 GOP 周期关键帧）", labels)
+        self.time_to_keyframe = r.histogram(
+            "whip_time_to_keyframe_seconds", "每个关键帧请求从收到到关键帧编码完成的等待时间", labels,
+            buckets=tuple(b / 1000 for b in LATENCY_BUCKETS),
+        )
+        r.add_collector(self._collect_tracks)
+
+    def watch(self, stream_id, pc, sender, track, keyframes=None):
+        """
+        开始（或在重连后重新）监控一路流，track 为采集/编码轨道本身而不是 SessionTrack 代理，
+        keyframes 为这一路的 KeyframeLimiter（跨重连保留，统计持续累计）
+        """
+        previous = self.streams.get(stream_id)
+        stream = _WatchedStream(stream_id, pc, sender, track, keyframes)
+        if previous is not None:
+            stream.last = previous.last
+            # 新连接的 getStats 从 0 开始，只保留轨道侧的累计值
+            for key in ("bytes_sent", "packets_sent", "packets_lost"):
+                stream.last.pop(key, None)
+        self.streams[stream_id] = stream
+        self.connections.labels(stream_id).inc()
+
+        if previous is not None:
+            self._unhook(previous)
+        grabber = getattr(track, "grabber", None)
+        if grabber is not None:
+            capture = self.capture_seconds.labels(stream_id)
+            convert = self.convert_seconds.labels(stream_id)
+
+            def on_timing(capture_s, convert_s, capture_cpu, convert_cpu):
+                capture.observe(capture_s)
+                convert.observe(convert_s)
+
+            stream.hooks.append((grabber.timing_callbacks, on_timing))
+        if hasattr(track, "encode_callbacks"):
+            # 编码在子进程中，耗时随编码包一起送回
+            stream.hooks.append((track.encode_callbacks, self.encode_seconds.labels(stream_id).observe))
+            stream.encoder_timed = True
+        for callbacks, callback in stream.hooks:
+            callbacks.append(callback)
+
+    @staticmethod
+    def _unhook(stream):
+        for callbacks, callback in stream.hooks:
+            if callback in callbacks:
+                callbacks.remove(callback)
+        stream.hooks.clear()
+
+    def unwatch(self, stream_id):
+        stream = self.streams.pop(stream_id, None)
+        if stream is None:
+            return
+        self._unhook(stream)
+        for metric in self.registry.metrics.values():
+            metric.remove(stream_id)
+
+    def _collect_tracks(self):
+        for stream_id, stream in self.streams.items():
+            stats = stream.track.stats()
+            for key, metric in (
+                ("captured", self.frames_captured),
+                ("delivered", self.frames_delivered),
+                ("dropped", self.frames_dropped),
+                ("cpu_s", self.source_cpu),
+            ):
+                if key in stats:
+                    metric.labels(stream_id).inc(stream.delta(key, stats[key]))
+            pacer = getattr(stream.track, "pacer", None)
+            if pacer is not None:
+                self.pacer_skipped.labels(stream_id).inc(stream.delta("skipped", pacer.skipped))
+                value = self.send_interval_seconds.labels(stream_id)
+                value.counts = list(pacer.histogram.counts)
+                value.sum = pacer.histogram.total / 1000
+                value.count = pacer.histogram.count
+            if stream.keyframes is not None:
+                self._collect_keyframes(stream_id, stream.keyframes)
+
+    def _collect_keyframes(self, stream_id, limiter):
+        for kind, count in limiter.requests.items():
+            self.keyframe_requests.labels(stream_id, kind).set(count)
+        self.keyframes_forced.labels(stream_id).set(limiter.forced)
+        self.keyframe_requests_deferred.labels(stream_id).set(limiter.deferred)
+        self.keyframe_requests_coalesced.labels(stream_id).set(limiter.coalesced)
+        self.keyframes_sent.labels(stream_id).set(limiter.keyframes)
+        value = self.time_to_keyframe.labels(stream_id)
+        value.counts = list(limiter.latency.counts)
+        value.sum = limiter.latency.total / 1000
+        value.count = limiter.latency.count
+
+    async def _sample(self, stream, now):
+        stream_id = stream.stream_id
+        if not stream.encoder_timed:
+            # aiortc 的编码器在第一帧时才创建
+            stream.encoder_timed = time_encoder(stream.sender, self.encode_seconds.labels(stream_id).observe)
+        self.connected.labels(stream_id).set(1 if stream.pc.connectionState == "connected" else 0)
+
+        report = await stream.sender.getStats()
+        bytes_sent = packets_sent = 0
+        for stats in report.values():
+            if stats.type == "outbound-rtp":
+                bytes_sent += stats.bytesSent
+                packets_sent += stats.packetsSent
+            elif stats.type == "remote-inbound-rtp":
+                self.packets_lost.labels(stream_id).inc(stream.delta("packets_lost", stats.packetsLost))
+                self.round_trip.labels(stream_id).set(stats.roundTripTime)
+                self.fraction_lost.labels(stream_id).set(stats.fractionLost / 256)
+                self.jitter.labels(stream_id).set(stats.jitter / 90000)
+        sent = stream.delta("bytes_sent", bytes_sent)
+        self.bytes_sent.labels(stream_id).inc(sent)
+        self.packets_sent.labels(stream_id).inc(stream.delta("packets_sent", packets_sent))
+        if stream.last_time is not None:
+            self.send_bitrate.labels(stream_id).set(sent * 8 / max(now - stream.last_time, 1e-6))
+        stream.last_time = now
+
+    async def _sample_loop(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            now = time.monotonic()
+            for stream in list(self.streams.values()):
+                try:
+                    await self._sample(stream, now)
+                except Exception as e:
+                    logger.debug("[%s] getStats 采样失败: %s", stream.stream_id, e)
+
+    def start(self):
+        if self._sample_task is None:
+            self._sample_task = asyncio.ensure_future(self._sample_loop())
+
+    async def serve(self, host="0.0.0.0", port=9108):
+        """启动 getStats 采样和 /metrics 端点"""
+        self.start()
+        if self._server is None:
+            self._server = MetricsServer(self.registry, host, port)
+            await self._server.start()
+
+    def render(self):
+        return self.registry.render()
+
+    async def close(self):
+        if self._sample_task is not None:
+            self._sample_task.cancel()
+            self._sample_task = None
+        if self._server is not None:
+            await self._server.stop()
+            self._server = None
+        for stream_id in list(self.streams):
+            self.unwatch(stream_id)
@@ -0,0 +1,207 @@
+"""
+运动门控：固定机位的摄像头大部分时间画面不变，但默认每帧都要编码、打包、加密和发送。
+MotionGate 在轨道送帧给编码器之前，把亮度平面隔行缩小到 analysis_width 宽（cv2 INTER_AREA 的块均值压掉传感器噪声，
+640x480 约 0.1ms；legacy 转换输出的 rgb24/bgr24 帧先缩小再转灰度），与上一次送出的帧逐像素求差，变化超过 pixel_threshold 的像素占比达到 area_threshold 即认为有运动。
+
+连续 hold 秒没有运动后进入静止状态，只按 idle_fps 送帧，其余帧在编码之前丢弃；
+GOP 按帧数计算，帧率降下来关键帧间隔按时间也随之拉长（low-latency 档 60 帧，1fps 时 60 秒一个关键帧）。
+静止时仍按原帧率分析每一帧，一旦有运动当前这一帧立即送出并恢复原帧率；收到关键帧请求时下一帧同样立即送出。
+与上一次送出的帧比较，缓慢的变化（光线）累积到阈值时也会被送出。
+
+roi 为只分析的区域列表，ignore 为不分析的区域列表（如画面上的时间水印、摇动的树），
+区域写作 (x, y, w, h) 或 "x,y,w,h"，取值为占画面宽高的比例：
+
+    MotionGate(idle_fps=1, ignore=[(0, 0, 1, 0.1)])
+"""
+import logging
+import time
+
+import cv2
+import numpy as np
+
+from .SyntheticSource import frame_luma
+
+logger = logging.getLogger("WHIP_Publisher")
+
+# 打包 RGB 帧格式 -> 转灰度的 cv2 代码
+RGB_TO_GRAY = {"rgb24": cv2.COLOR_RGB2GRAY, "bgr24": cv2.COLOR_BGR2GRAY}
+
+
+def parse_region(text):
+    """命令行的 "x,y,w,h"（画面比例）-> 元组"""
+    try:
+        values = tuple(float(v) for v in text.split(","))
+    except ValueError:
+        values = ()
+    return _check_region(values, text)
+
+
+def _check_region(values, original):
+    if len(values) != 4 or any(v < 0 or v > 1 for v in values):
+        raise ValueError(f"区域应写作 x,y,w,h（0~1 的画面比例）: {original}")
+    return values
+
+
+def _region(region):
+    if isinstance(region, str):
+        return parse_region(region)
+    try:
+        values = tuple(float(v) for v in region)
+    except (TypeError, ValueError):
+        values = ()
+    return _check_region(values, region)
+
+
+def _region_slices(region, width, height):
+    x, y, w, h = region
+    return (
+        slice(int(y * height), int(np.ceil((y + h) * height))),
+        slice(int(x * width), int(np.ceil((x + w) * width))),
+    )
+
+
+class MotionGate:
+    """
+    admit(frame, now) 对每个采集到的帧调用一次，返回是否送给编码器；now 为采集时刻（time.monotonic()）。
+    stats() 中 level 为最近一帧的变化像素占比，static_s 为累计处于静止状态的秒数
+    """
+
+    def __init__(self, idle_fps=1.0, hold=2.0, pixel_threshold=12, area_threshold=0.002, analysis_width=80,
+                 roi=None, ignore=()):
+        if not idle_fps > 0:
+            raise ValueError(f"idle_fps 必须大于 0: {idle_fps}")
+        if not hold >= 0:
+            raise ValueError(f"hold 不能小于 0: {hold}")
+        if not 0 <= pixel_threshold < 255:
+            raise ValueError(f"pixel_threshold 应在 0~254 之间: {pixel_threshold}")
+        if not 0 < area_threshold <= 1:
+            raise ValueError(f"area_threshold 应在 (0, 1] 之间: {area_threshold}")
+        if int(analysis_width) != analysis_width or analysis_width < 1:
+            raise ValueError(f"analysis_width 应为正整数: {analysis_width}")
+        self.idle_fps = idle_fps
+        self.idle_interval = 1.0 / idle_fps
+        self.hold = hold
+        self.pixel_threshold = pixel_threshold
+        self.area_threshold = area_threshold
+        self.analysis_width = analysis_width
+        self.roi = [_region(r) for r in roi] if roi else None
+        self.ignore = [_region(r) for r in ignore]
+        self.static = False
+        self.level = 0.0
+        self._reference = None
+        self._mask = None
+        self._mask_count = 1
+        self._last_motion = None
+        self._last_sent = None
+        self._last_analyzed = None
+        self._wake = False
+
+        # 统计
+        self.analyzed = 0
+        self.sent = 0
+        self.skipped = 0
+        self.wakeups = 0
+        self.static_seconds = 0.0
+        self.analysis_time_total = 0.0
+
+    def _downscale(self, frame):
+        # 只取偶数行，块均值仍足以压掉噪声，缩小的耗时减半
+        fmt = frame.format.name
+        if fmt in RGB_TO_GRAY:
+            # 打包的 RGB：平面 0 每行 3*width 字节，先缩小再转灰度
+            plane = frame.planes[0]
+            data = np.frombuffer(plane, np.uint8).reshape(plane.height, plane.line_size)
+            image = data[::2, :frame.width * 3].reshape(-1, frame.width, 3)
+        elif fmt in ("yuv420p", "yuvj420p", "gray"):
+            image = frame_luma(frame)[::2]
+        else:
+            image = frame.to_ndarray(format="gray")[::2]
+        height, width = image.shape[:2]
+        height *= 2
+        small_width = min(self.analysis_width, width)
+        small_height = max(1, round(height * small_width / width))
+        small = cv2.resize(image, (small_width, small_height), interpolation=cv2.INTER_AREA)
+        if fmt in RGB_TO_GRAY:
+            small = cv2.cvtColor(small, RGB_TO_GRAY[fmt])
+        return small
+
+    def _build_mask(self, shape):
+        height, width = shape
+        mask = np.zeros(shape, bool) if self.roi else np.ones(shape, bool)
+        for region in self.roi or ():
+            mask[_region_slices(region, width, height)] = True
+        for region in self.ignore:
+            mask[_region_slices(region, width, height)] = False
+        self._mask = mask
+        self._mask_count = max(int(np.count_nonzero(mask)), 1)
+
+    def _measure(self, small):
+        """与参考帧相比变化的像素占比（只统计掩码内的像素）"""
+        changed = cv2.absdiff(small, self._reference) > self.pixel_threshold
+        return np.count_nonzero(changed & self._mask) / self._mask_count
+
+    def wake(self):
+        """下一帧无论是否静止都送出（收到关键帧请求时调用，新的订阅者不用等到下一个 idle 节拍）"""
+        self._wake = True
+
+    def admit(self, frame, now=None, force=False):
+        now = time.monotonic() if now is None else now
+        start = time.perf_counter()
+        small = self._downscale(frame)
+        if self._reference is None or self._reference.shape != small.shape:
+            # 第一帧或分辨率变化：没有可比较的参考帧，按有运动处理
+            self._build_mask(small.shape)
+            self.level = 1.0
+        else:
+            self.level = self._measure(small)
+        self.analysis_time_total += time.perf_counter() - start
+        self.analyzed += 1
+
+        if self.level >= self.area_threshold or self._last_motion is None:
+            self._last_motion = now
+        if self.static and self._last_analyzed is not None:
+            self.static_seconds += now - self._last_analyzed
+        self._last_analyzed = now
+
+        # 本帧有运动时不算静止（hold=0 时一没有运动就降帧率）
+        static = self.level < self.area_threshold and now - self._last_motion >= self.hold
+        if static != self.static:
+            if static:
+                logger.debug("画面静止，帧率降到 %sfps", self.idle_fps)
+            else:
+                self.wakeups += 1
+                logger.debug("检测到运动（%.2f%%），恢复原帧率", self.level * 100)
+            self.static = static
+
+        if (force or self._wake or not static or self._last_sent is None
+                or now - self._last_sent >= self.idle_interval):
+            self._reference = small
+            self._last_sent = now
+            self._wake = False
+            self.sent += 1
+            return True
+        self.skipped += 1
+        return False
+
+    def stats(self):
+        return {
+            "static": self.static,
+            "level": round(self.level, 4),
+            "analyzed": self.analyzed,
+            "sent": self.sent,
+            "skipped": self.skipped,
+            "wakeups": self.wakeups,
+            "static_s": round(self.static_seconds, 1),
+            "analysis_avg_ms": self.analysis_time_total / self.analyzed * 1000 if self.analyzed else 0.0,
+        }
+
+
+def create_motion_gate(motion):
+    """motion 可以是 None（不启用）、True（默认参数）、MotionGate 或 MotionGate 参数的字典"""
+    if motion is None or motion is False:
+        return None
+    if isinstance(motion, MotionGate):
+        return motion
+    if motion is True:
+        return MotionGate()
+    return MotionGate(**motion)
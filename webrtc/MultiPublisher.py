@@ -0,0 +1,338 @@
+import asyncio
+import functools
+import logging
+import random
+import time
+from dataclasses import dataclass, field
+from typing import Optional, Union
+
+from aiortc import MediaStreamTrack, RTCPeerConnection, RTCSessionDescription
+
+from .EncoderProfile import add_profiled_track, get_profile
+from .FrameFanOut import FrameFanOut
+from .H264Passthrough import add_passthrough_track, create_passthrough_track
+from .Metrics import PublisherMetrics
+from .ProcessEncoder import CODECS, ProcessEncodedTrack, add_process_encoded_track
+from .WarmPool import PeerConnectionPool, SetupTimer, track_connection_phases
+from .WHIP_WebRTC import CameraStreamTrack
+from .WhipClient import WhipClient, create_http_session
+
+logger = logging.getLogger("WHIP_Publisher")
+
+
+@dataclass
+class StreamSpec:
+    """
+    一路推流的配置：source 为视频源配置（摄像头索引、"file:..."、"gst:..."、"shm:..." 或字典，见 FrameSource）；
+    encode_mode 为 "inline"（aiortc 在本进程编码）、"process"（子进程采集+编码）
+    或 "passthrough"（source 为 udp://组播地址，直接转发其中的 H264，不解码不编码）；
+    encoder_profile 为编码配置档（名称或字典，见 EncoderProfile.get_profile），passthrough 模式不使用；
+    share_capture 为 True 的 inline 流按 source 共用一份采集（见 FrameFanOut），
+    采集分辨率和帧率取同一 source 各路的最大值，每路再缩小到自己的 width/height
+    """
+    source: Union[int, str, dict] = 0
+    width: int = 640
+    height: int = 480
+    fps: int = 30
+    stream_id: Optional[str] = None
+    conversion: str = "zerocopy"
+    encode_mode: str = "inline"
+    codec: str = "h264"
+    bitrate: int = 1_000_000
+    encoder_profile: Optional[Union[str, dict]] = None
+    share_capture: bool = False
+
+    @property
+    def mime_type(self):
+        """需要限定协商的编码，inline 模式由 aiortc 自行协商返回 None"""
+        if self.encode_mode == "process":
+            return CODECS[self.codec][1]
+        if self.encode_mode == "passthrough":
+            return "video/H264"
+        return None
+
+    @property
+    def codec_preferences(self):
+        """inline 模式按配置档设置的编码偏好，其余模式由 mime_type 限定"""
+        profile = get_profile(self.encoder_profile)
+        if self.encode_mode != "inline" or profile is None:
+            return ()
+        return profile.codecs
+
+
+@dataclass
+class PublishedStream:
+    """运行中的一路推流"""
+    spec: StreamSpec
+    stream_id: str
+    pc: RTCPeerConnection
+    track: MediaStreamTrack
+    whip_session: object = None
+    started_at: float = field(default_factory=time.monotonic)
+    setup: Optional[SetupTimer] = None
+
+    # 上一次统计采样
+    last_sample_time: float = 0.0
+    last_bytes_sent: int = 0
+    last_frames: int = 0
+    last_cpu: float = 0.0
+
+
+class MultiStreamPublisher:
+    """
+    在一个事件循环里同时推多路流：每路一个 RTCPeerConnection + CameraStreamTrack，
+    所有 WHIP POST/DELETE 共用一个带连接池的 ClientSession，支持运行时增删流。
+    warm_connections > 0 时按每种编码预热若干个已完成 ICE 收集的 PeerConnection，运行时新增流可以直接使用。
+    metrics_port 不为空时在该端口提供所有流的 /metrics（见 Metrics），stream 标签为 stream id。
+    """
+
+    def __init__(self, live777_base_url, specs=(), ice_servers=None, stats_interval=10, warm_connections=0,
+                 metrics_port=None):
+        self.live777_base_url = live777_base_url
+        self.specs = list(specs)
+        self.ice_servers = ice_servers or []
+        self.stats_interval = stats_interval
+        self.warm_connections = warm_connections
+        self.metrics_port = metrics_port
+        self.metrics = PublisherMetrics() if metrics_port is not None else None
+        self.streams = {}
+        # 正在启动、还没放进 streams 的 stream id，防止并发的 add_stream 重复推同一路
+        self._starting = set()
+        self._pools = {}
+        self._fanouts = {}
+        self._http_session = None
+        self._whip_client = None
+        self._lock = asyncio.Lock()
+        self._last_process_cpu = None
+        self._last_process_time = None
+
+    async def start(self):
+        self._http_session = create_http_session()
+        self._whip_client = WhipClient(self.live777_base_url, self._http_session)
+        await self._whip_client.warm_up()
+        if self.metrics is not None:
+            await self.metrics.serve(port=self.metrics_port)
+        if self.warm_connections > 0:
+            for key in {(spec.mime_type, spec.codec_preferences) for spec in self.specs}:
+                self._pools[key] = PeerConnectionPool(self.ice_servers, self.warm_connections, key[0], codecs=key[1])
+            await asyncio.gather(*(pool.start() for pool in self._pools.values()))
+        results = await asyncio.gather(
+            *(self.add_stream(spec) for spec in self.specs), return_exceptions=True
+        )
+        for spec, result in zip(self.specs, results):
+            if isinstance(result, Exception):
+                logger.error("推流启动失败 %s: %s", spec, result)
+
+    def _pool_for(self, spec):
+        # 按协商限制区分连接池：限定的编码 + 编码偏好
+        key = (spec.mime_type, spec.codec_preferences)
+        if key not in self._pools:
+            # 未预热的编码：现场收集
+            self._pools[key] = PeerConnectionPool(self.ice_servers, 0, key[0], codecs=key[1])
+        return self._pools[key]
+
+    async def _open_track(self, spec):
+        # 打开摄像头是阻塞调用，放到线程池里避免卡住其他流
+        loop = asyncio.get_running_loop()
+        if spec.encode_mode == "process":
+            return await loop.run_in_executor(
+                None, functools.partial(
+                    ProcessEncodedTrack, spec.source, spec.width, spec.height, spec.fps, spec.codec, spec.bitrate,
+                    profile=spec.encoder_profile,
+                )
+            )
+        if spec.encode_mode == "passthrough":
+            return create_passthrough_track(spec.source)
+        if spec.share_capture:
+            fanout = await self._shared_capture(spec)
+            return fanout.track(spec.width, spec.height, spec.fps)
+        return await loop.run_in_executor(
+            None, CameraStreamTrack, spec.source, spec.width, spec.height, spec.fps, spec.conversion
+        )
+
+    async def _shared_capture(self, spec):
+        """取得 spec.source 的共享采集，不存在（或上一份已随最后一路关闭）时打开"""
+        key = repr(spec.source)
+        task = self._fanouts.get(key)
+        if task is None or (task.done() and (task.cancelled() or task.exception() or task.result().closed)):
+            group = [s for s in self.specs + [spec] if s.share_capture and repr(s.source) == key]
+            task = self._fanouts[key] = asyncio.ensure_future(asyncio.get_running_loop().run_in_executor(
+                None, FrameFanOut, spec.source,
+                max(s.width for s in group), max(s.height for s in group), max(s.fps for s in group),
+            ))
+        return await asyncio.shield(task)
+
+    async def add_stream(self, spec):
+        """启动一路新的推流，返回 stream id"""
+        stream_id = spec.stream_id or str(random.randint(100000000, 999999999))
+        # 检查和占用之间没有 await，并发的同名请求只有一个能通过
+        if stream_id in self.streams or stream_id in self._starting:
+            raise ValueError(f"Stream ID 已存在: {stream_id}")
+        self._starting.add(stream_id)
+        try:
+            return await self._start_stream(spec, stream_id)
+        finally:
+            self._starting.discard(stream_id)
+
+    async def _start_stream(self, spec, stream_id):
+        profile = get_profile(spec.encoder_profile)
+        timer = SetupTimer()
+        pool = self._pool_for(spec)
+
+        async def open_track():
+            async with timer.phase("camera_open"):
+                return await self._open_track(spec)
+
+        async def acquire_pc():
+            async with timer.phase("gather"):
+                warm = await pool.acquire()
+            if warm.warm:
+                timer.record("gather", 0.0)
+            return warm
+
+        pc = None
+        track = None
+        try:
+            # 打开摄像头与 ICE 收集并行
+            results = await asyncio.gather(open_track(), acquire_pc(), return_exceptions=True)
+            track, warm = (None if isinstance(r, BaseException) else r for r in results)
+            pc = warm.pc if warm is not None else None
+            for result in results:
+                if isinstance(result, BaseException):
+                    raise result
+
+            if spec.encode_mode == "process":
+                sender = add_process_encoded_track(pc, track)
+            elif spec.encode_mode == "passthrough":
+                sender = add_passthrough_track(pc, track)
+            else:
+                sender = add_profiled_track(pc, track, profile)
+
+            @pc.on("iceconnectionstatechange")
+            async def on_ice_change():
+                logger.info("[%s] ICE状态变化: %s", stream_id, pc.iceConnectionState)
+
+            async with timer.phase("post"):
+                whip_session = await self._whip_client.publish(stream_id, warm.offer_sdp)
+            track_connection_phases(
+                pc, sender, timer, on_done=lambda t: logger.info("[%s] 首帧耗时(ms): %s", stream_id, t.to_dict())
+            )
+            await pc.setRemoteDescription(
+                RTCSessionDescription(sdp=whip_session.answer_sdp, type="answer")
+            )
+        except Exception:
+            if pc is not None:
+                await pc.close()
+            if track is not None:
+                track.stop()
+            raise
+
+        stream = PublishedStream(spec, whip_session.stream_id or stream_id, pc, track, whip_session, setup=timer)
+        stream.last_sample_time = time.monotonic()
+        async with self._lock:
+            self.streams[stream.stream_id] = stream
+        if self.metrics is not None:
+            self.metrics.watch(stream.stream_id, pc, sender, track)
+        logger.info("推流已启动: %s (%dx%d @%dfps)", stream.stream_id, spec.width, spec.height, spec.fps)
+        return stream.stream_id
+
+    async def remove_stream(self, stream_id):
+        """停止一路推流并通知服务器结束会话"""
+        async with self._lock:
+            stream = self.streams.pop(stream_id, None)
+        if stream is None:
+            return False
+        if self.metrics is not None:
+            self.metrics.unwatch(stream_id)
+        await stream.pc.close()
+        stream.track.stop()
+        await self._whip_client.delete(stream.whip_session)
+        logger.info("推流已停止: %s", stream_id)
+        return True
+
+    async def collect_stats(self):
+        """
+        每路流及汇总的 fps、码率和 CPU：
+        fps 取轨道实际送出的帧数，码率取 outbound-rtp 的 bytesSent 差值，
+        每路 CPU 为其采集线程（进程编码模式下为编码子进程）的 CPU 时间，
+        汇总 CPU 为主进程（含 aiortc 编码线程）
+        """
+        now = time.monotonic()
+        per_stream = {}
+        for stream_id, stream in list(self.streams.items()):
+            report = await stream.pc.getStats()
+            bytes_sent = sum(
+                s.bytesSent for s in report.values() if s.type == "outbound-rtp"
+            )
+            track_stats = stream.track.stats()
+            frames = track_stats["delivered"]
+            cpu = track_stats["cpu_s"]
+            elapsed = max(now - stream.last_sample_time, 1e-6)
+            per_stream[stream_id] = {
+                "fps": (frames - stream.last_frames) / elapsed,
+                "bitrate_kbps": (bytes_sent - stream.last_bytes_sent) * 8 / elapsed / 1000,
+                "source_cpu_pct": (cpu - stream.last_cpu) / elapsed * 100,
+                "dropped": track_stats["dropped"],
+                "ice": stream.pc.iceConnectionState,
+            }
+            stream.last_sample_time = now
+            stream.last_bytes_sent = bytes_sent
+            stream.last_frames = frames
+            stream.last_cpu = cpu
+
+        process_cpu = time.process_time()
+        if self._last_process_cpu is None:
+            process_cpu_pct = 0.0
+        else:
+            process_cpu_pct = (process_cpu - self._last_process_cpu) / max(now - self._last_process_time, 1e-6) * 100
+        self._last_process_cpu = process_cpu
+        self._last_process_time = now
+
+        aggregate = {
+            "streams": len(per_stream),
+            "fps": sum(s["fps"] for s in per_stream.values()),
+            "bitrate_kbps": sum(s["bitrate_kbps"] for s in per_stream.values()),
+            "process_cpu_pct": process_cpu_pct,
+        }
+        return {"streams": per_stream, "aggregate": aggregate}
+
+    async def close(self):
+        await asyncio.gather(
+            *(self.remove_stream(stream_id) for stream_id in list(self.streams)),
+            return_exceptions=True,
+        )
+        for pool in self._pools.values():
+            await pool.close()
+        self._pools.clear()
+        # 共享采集随最后一路的 track.stop() 关闭
+        self._fanouts.clear()
+        if self.metrics is not None:
+            await self.metrics.close()
+        if self._http_session is not None:
+            await self._http_session.close()
+            self._http_session = None
+
+    async def run(self):
+        """启动所有流并定期输出统计，直到被取消"""
+        await self.start()
+        try:
+            while True:
+                await asyncio.sleep(self.stats_interval)
+                stats = await self.collect_stats()
+                for stream_id, s in stats["streams"].items():
+                    logger.info(
+                        "[%s] %.1f fps, %.0f kbps, 采集CPU %.1f%%, 丢帧 %d, ICE %s",
+                        stream_id, s["fps"], s["bitrate_kbps"], s["source_cpu_pct"], s["dropped"], s["ice"],
+                    )
+                agg = stats["aggregate"]
+                logger.info(
+                    "汇总: %d 路, %.1f fps, %.0f kbps, 进程CPU %.1f%%",
+                    agg["streams"], agg["fps"], agg["bitrate_kbps"], agg["process_cpu_pct"],
+                )
+        finally:
+            await self.close()
+
+
+def run_multi(live777Url, specs):
+    """多路推流入口，例如 run_multi("http://localhost:7777", [StreamSpec(0), StreamSpec(2)])"""
+    asyncio.run(MultiStreamPublisher(live777Url, specs).run())
@@ -0,0 +1,476 @@
+import asyncio
+import collections
+import logging
+import multiprocessing
+import threading
+import time
+from fractions import Fraction
+from multiprocessing import shared_memory
+
+import av
+from aiortc.mediastreams import MediaStreamError, MediaStreamTrack
+
+from .EncoderProfile import get_profile
+from .FramePacer import VIDEO_TIME_BASE, FramePacer, MediaClock
+from .MotionGate import create_motion_gate
+from .SenderHooks import on_keyframe_request, prefer_codec
+
+logger = logging.getLogger("WHIP_Publisher")
+
+# 编码名 -> (PyAV 编码器, SDP mimeType)
+CODECS = {
+    "h264": ("libx264", "video/H264"),
+    "vp8": ("libvpx", "video/VP8"),
+}
+
+SHM_SLOTS = 8
+# 子进程回报运动门控统计的间隔（秒）
+MOTION_REPORT_INTERVAL = 1.0
+
+
+def create_encoder(codec, width, height, fps, bitrate, profile=None):
+    """
+    创建与 aiortc 默认参数一致的编码器上下文（H264 Baseline / VP8 实时模式），
+    profile（EncoderProfile）不为空时在此基础上应用其 preset、GOP 和线程数
+    """
+    encoder = av.CodecContext.create(CODECS[codec][0], "w")
+    encoder.width = width
+    encoder.height = height
+    encoder.bit_rate = bitrate
+    encoder.pix_fmt = "yuv420p"
+    encoder.framerate = Fraction(fps, 1)
+    encoder.time_base = VIDEO_TIME_BASE
+    if codec == "h264":
+        encoder.options = {"level": "31", "tune": "zerolatency"}
+        encoder.profile = "Baseline"
+    else:
+        encoder.options = {"deadline": "realtime", "cpu-used": "8", "lag-in-frames": "0"}
+    if profile is not None:
+        profile.apply(encoder, codec)
+    encoder.open()
+    return encoder
+
+
+def slot_size_for(width, height):
+    """每个槽位按原始 I420 帧大小分配，足够容纳该分辨率下的任意压缩帧"""
+    return width * height * 3 // 2
+
+
+def _encode_worker(source, width, height, fps, codec, bitrate, profile, shm_name, slot_size, data_conn, control_conn,
+                   free_slots, epoch=None, motion=None):
+    """
+    编码子进程：采集 + 颜色转换 + 编码都在这里完成，
+    编码结果写入共享内存环形槽位，元数据通过管道送回主进程。
+    free_slots 为空闲槽位的信号量：写入前取一个，主进程拷出后归还；没有空闲槽位（主进程读取落后）时
+    这一包改走管道，不覆盖还没读走的槽位。槽位按顺序分配、主进程按顺序拷出，因此取到信号量时下一个槽位一定已空闲。
+    输出分辨率变化使槽位大小不合适时向主进程申请新的共享内存（"resize"），收到 "shm" 后改用新的一块，
+    每个包带上所在共享内存的编号。
+    epoch 为主进程 MediaClock 的起点（单调时钟在进程间通用），使 pts 与主进程中的其他轨道同源。
+    motion 为 MotionGate 的参数（见 create_motion_gate），静止时跳过的帧不编码，统计定期送回主进程
+    """
+    import cv2
+
+    from .FrameConverter import ZeroCopyI420Converter
+    from .FrameSource import open_capture
+
+    shm = shared_memory.SharedMemory(name=shm_name)
+    capture = open_capture(source)
+    if not capture.isOpened():
+        data_conn.send(("error", f"视频源 {source} 打开失败"))
+        return
+    capture.set(cv2.CAP_PROP_FRAME_WIDTH, width)
+    capture.set(cv2.CAP_PROP_FRAME_HEIGHT, height)
+    capture.set(cv2.CAP_PROP_FPS, fps)
+
+    converter = ZeroCopyI420Converter()
+    encoder = None
+    force_keyframe = False
+    slot_seq = 0
+    segment = 0
+    requested_size = slot_size
+    clock = MediaClock()
+    if epoch is not None:
+        clock.epoch = epoch
+    pacer = FramePacer(fps)
+    gate = create_motion_gate(motion)
+    reported = time.monotonic()
+
+    try:
+        while True:
+            # 处理主进程发来的控制消息
+            while control_conn.poll():
+                message = control_conn.recv()
+                if message[0] == "stop":
+                    return
+                if message[0] == "keyframe":
+                    force_keyframe = True
+                elif message[0] == "bitrate":
+                    bitrate = message[1]
+                    encoder = None
+                elif message[0] == "motion":
+                    # 主进程已检查过参数，这里出错也只保持原门控，不让子进程退出
+                    try:
+                        gate = create_motion_gate(message[1])
+                    except (TypeError, ValueError):
+                        pass
+                elif message[0] == "shm":
+                    _, segment, shm_name, slot_size = message
+                    shm.close()
+                    shm = shared_memory.SharedMemory(name=shm_name)
+                elif message[0] == "output":
+                    _, out_width, out_height, out_fps = message
+                    if out_width is not None:
+                        converter.set_output_size(out_width, out_height)
+                    if out_fps is not None and out_fps != fps:
+                        fps = out_fps
+                        pacer.set_fps(fps)
+
+            # 按单调时钟的绝对时刻节拍采集，避免视频文件等源读得过快
+            pacer.wait_blocking()
+
+            ret, bgr = converter.read(capture)
+            if not ret:
+                data_conn.send(("error", f"无法从 {source} 读取帧"))
+                return
+            capture_time = time.monotonic()
+            frame = converter.convert(bgr)
+
+            if gate is not None:
+                if capture_time - reported >= MOTION_REPORT_INTERVAL:
+                    data_conn.send(("motion", gate.stats()))
+                    reported = capture_time
+                # 需要关键帧（新的订阅者、编码器重建）时不等 idle 节拍
+                if not gate.admit(frame, capture_time, force=force_keyframe or encoder is None):
+                    continue
+
+            if encoder is None or encoder.width != frame.width or encoder.height != frame.height:
+                encoder = create_encoder(codec, frame.width, frame.height, fps, bitrate, profile)
+                force_keyframe = True
+                needed = slot_size_for(frame.width, frame.height)
+                if needed != requested_size:
+                    # 新的共享内存到位之前放不下的包走管道
+                    data_conn.send(("resize", needed))
+                    requested_size = needed
+
+            frame.pts = clock.pts(capture_time)
+            frame.time_base = VIDEO_TIME_BASE
+            frame.pict_type = av.video.frame.PictureType.I if force_keyframe else av.video.frame.PictureType.NONE
+            force_keyframe = False
+
+            t0 = time.perf_counter()
+            packets = encoder.encode(frame)
+            encode_time = time.perf_counter() - t0
+            for packet in packets:
+                data = bytes(packet)
+                slot = None
+                inline = data
+                # 超出槽位大小或没有空闲槽位的帧直接走管道
+                if len(data) <= slot_size and free_slots.acquire(block=False):
+                    slot = slot_seq % SHM_SLOTS
+                    slot_seq += 1
+                    shm.buf[slot * slot_size:slot * slot_size + len(data)] = data
+                    inline = None
+                data_conn.send((
+                    "packet", segment, slot, len(data), packet.pts, packet.is_keyframe,
+                    capture_time, encode_time, time.process_time(), inline,
+                ))
+    finally:
+        capture.release()
+        shm.close()
+
+
+class EncodedPacketQueue:
+    """
+    线程安全的编码包队列：生产者为任意线程，消费者在事件循环上等待。
+    编码数据不能随意丢帧（后续帧依赖前面的帧），积压超过上限时清空队列并丢弃到下一个关键帧。
+    """
+
+    def __init__(self, max_size=30, on_overflow=None, wait_keyframe=False):
+        self.max_size = max_size
+        self.on_overflow = on_overflow
+        self._lock = threading.Lock()
+        self._items = collections.deque()
+        self._waiter = None
+        self._loop = None
+        # wait_keyframe=True 时从第一个关键帧开始输出（中途接入的码流）
+        self._waiting_keyframe = wait_keyframe
+        self.dropped = 0
+        self.keyframes = 0
+
+    def put(self, item, is_keyframe=False):
+        overflow = False
+        with self._lock:
+            if is_keyframe:
+                self._waiting_keyframe = False
+                self.keyframes += 1
+            elif self._waiting_keyframe:
+                self.dropped += 1
+                return
+            if len(self._items) >= self.max_size:
+                self.dropped += len(self._items)
+                self._items.clear()
+                overflow = True
+                if not is_keyframe:
+                    self._waiting_keyframe = True
+                    self.dropped += 1
+            if not self._waiting_keyframe:
+                self._items.append(item)
+            waiter, self._waiter = self._waiter, None
+            loop = self._loop
+
+        if overflow and self.on_overflow is not None:
+            self.on_overflow()
+        self._notify(waiter, loop)
+
+    def wait_keyframe(self):
+        """码流出现缺口（如丢包）后丢弃后续帧，直到下一个关键帧"""
+        with self._lock:
+            self._waiting_keyframe = True
+
+    def put_error(self, error):
+        """把异常放到队尾，由消费者抛出"""
+        with self._lock:
+            self._items.append(error)
+            waiter, self._waiter = self._waiter, None
+            loop = self._loop
+        self._notify(waiter, loop)
+
+    def _notify(self, waiter, loop):
+        if waiter is not None:
+            try:
+                loop.call_soon_threadsafe(self._wake, waiter)
+            except RuntimeError:
+                # 事件循环已关闭
+                pass
+
+    @staticmethod
+    def _wake(waiter):
+        if not waiter.done():
+            waiter.set_result(None)
+
+    async def get(self):
+        while True:
+            with self._lock:
+                if self._items:
+                    return self._items.popleft()
+                if self._loop is None:
+                    self._loop = asyncio.get_running_loop()
+                waiter = self._waiter = self._loop.create_future()
+            try:
+                await waiter
+            finally:
+                with self._lock:
+                    if self._waiter is waiter:
+                        self._waiter = None
+
+    def __len__(self):
+        return len(self._items)
+
+
+class ProcessEncodedTrack(MediaStreamTrack):
+    """
+    进程池编码模式的视频轨道：子进程完成采集/转换/编码，
+    本轨道只把编码好的数据包交给 aiortc 打包、加密和发送，
+    因此每路流的编码不再受主进程 GIL 限制，可随 CPU 核数线性扩展。
+    profile 为编码配置档（名称、字典或 EncoderProfile，见 get_profile），codec 仍由 codec 参数决定。
+    clock 为与其他轨道（如音频）共用的 MediaClock，子进程按它的起点计算 pts。
+    motion 为运动门控参数（True 或 MotionGate 参数的字典），在子进程中按画面是否在动决定是否编码。
+    """
+
+    kind = "video"
+
+    def __init__(self, source=0, width=640, height=480, fps=30, codec="h264", bitrate=1_000_000, max_queue=30,
+                 profile=None, clock=None, motion=None):
+        super().__init__()
+        if codec not in CODECS:
+            raise ValueError(f"不支持的编码: {codec}")
+        self.codec = codec
+        self.profile = get_profile(profile)
+        self.mime_type = CODECS[codec][1]
+        self.source = source
+
+        # 共享内存按编号保存 (SharedMemory, 槽位大小)：换分辨率后新的包写到新的一块，旧的一块在其中的包都读完后释放
+        slot_size = slot_size_for(width, height)
+        self._segments = {0: (shared_memory.SharedMemory(create=True, size=slot_size * SHM_SLOTS), slot_size)}
+        self._next_segment = 1
+        # 读取线程和 stop 都可能释放共享内存
+        self._segments_lock = threading.Lock()
+        self._stopped = False
+
+        ctx = multiprocessing.get_context("spawn")
+        self._free_slots = ctx.Semaphore(SHM_SLOTS)
+        self._data_recv, data_send = ctx.Pipe(duplex=False)
+        control_recv, self._control_send = ctx.Pipe(duplex=False)
+        # 控制消息由事件循环和读取线程两边发送
+        self._control_lock = threading.Lock()
+        self.process = ctx.Process(
+            target=_encode_worker,
+            args=(
+                source, width, height, fps, codec, bitrate, self.profile,
+                self._segments[0][0].name, slot_size, data_send, control_recv, self._free_slots,
+                clock.epoch if clock is not None else None, motion,
+            ),
+            name=f"Encoder-{source}",
+            daemon=True,
+        )
+        self.process.start()
+        data_send.close()
+        control_recv.close()
+
+        self.queue = EncodedPacketQueue(max_queue, on_overflow=self.request_keyframe)
+
+        # 统计
+        self.packets = 0
+        self.encode_time_total = 0.0
+        self.encoded_count = 0
+        self.worker_cpu = 0.0
+        self.motion_stats = None
+        # 没有空闲槽位或超出槽位大小而走管道的包数
+        self.inline_packets = 0
+        # encode_callbacks 中的回调在读取线程中每个编码包调用一次，参数为子进程中的编码耗时（秒）
+        self.encode_callbacks = []
+
+        # 读取线程拷出一个槽位后才归还给子进程，读取落后时子进程改走管道，不会覆盖未读的槽位
+        self._reader = threading.Thread(target=self._read_packets, name=f"EncoderReader-{source}", daemon=True)
+        self._reader.start()
+        logger.info("编码子进程已启动: %s (%s %dx%d @%dfps)", source, codec, width, height, fps)
+
+    def _send_control(self, *message):
+        try:
+            with self._control_lock:
+                self._control_send.send(message)
+        except (OSError, ValueError):
+            pass
+
+    def _resize_segment(self, slot_size):
+        """子进程的输出分辨率变了：按新的槽位大小分配一块共享内存交给它"""
+        segment = self._next_segment
+        self._next_segment += 1
+        shm = shared_memory.SharedMemory(create=True, size=slot_size * SHM_SLOTS)
+        with self._segments_lock:
+            self._segments[segment] = (shm, slot_size)
+        self._send_control("shm", segment, shm.name, slot_size)
+
+    def _release_segments(self, current):
+        # 管道按顺序送达，出现新编号的包时更早的共享内存中已没有未读的包
+        with self._segments_lock:
+            released = [self._segments.pop(s) for s in [s for s in self._segments if s < current]]
+        for shm, _ in released:
+            shm.close()
+            shm.unlink()
+
+    def _read_packets(self):
+        """读取线程：从管道拿到元数据后立即把数据拷出共享内存槽位，并归还槽位"""
+        try:
+            self._read_loop()
+        finally:
+            # stop 时读取线程没能及时退出，由它自己在退出时释放共享内存
+            if self._stopped:
+                self._release_segments(self._next_segment)
+
+    def _read_loop(self):
+        while True:
+            try:
+                message = self._data_recv.recv()
+            except (EOFError, OSError):
+                message = ("error", "编码子进程已退出")
+
+            if message[0] == "error":
+                self.queue.put_error(RuntimeError(message[1]))
+                return
+            if message[0] == "motion":
+                self.motion_stats = message[1]
+                continue
+            if message[0] == "resize":
+                self._resize_segment(message[1])
+                continue
+
+            _, segment, slot, size, pts, is_keyframe, capture_time, encode_time, cpu, inline = message
+            if segment != min(self._segments):
+                self._release_segments(segment)
+            if inline is None:
+                shm, slot_size = self._segments[segment]
+                inline = bytes(shm.buf[slot * slot_size:slot * slot_size + size])
+                self._free_slots.release()
+            else:
+                self.inline_packets += 1
+            packet = av.Packet(inline)
+            packet.pts = pts
+            packet.time_base = VIDEO_TIME_BASE
+
+            self.encode_time_total += encode_time
+            self.encoded_count += 1
+            self.worker_cpu = cpu
+            if self.encode_callbacks:
+                for callback in tuple(self.encode_callbacks):
+                    callback(encode_time)
+            self.queue.put(packet, is_keyframe)
+
+    async def recv(self):
+        if self.readyState != "live":
+            raise MediaStreamError
+        item = await self.queue.get()
+        if isinstance(item, Exception):
+            raise item
+        self.packets += 1
+        return item
+
+    def request_keyframe(self):
+        """通知编码子进程下一帧输出关键帧"""
+        self._send_control("keyframe")
+
+    def set_bitrate(self, bitrate):
+        """调整编码子进程的目标码率"""
+        self._send_control("bitrate", int(bitrate))
+
+    def set_output(self, width=None, height=None, fps=None):
+        """调整编码子进程的输出分辨率和帧率"""
+        self._send_control("output", width, height, fps)
+
+    def set_motion(self, motion):
+        """更换（motion 为 None 时关闭）编码子进程中的运动门控；参数无效时在这里抛出 ValueError，子进程保持原门控"""
+        create_motion_gate(motion)
+        self._send_control("motion", motion)
+        if motion is None:
+            self.motion_stats = None
+
+    def stats(self):
+        stats = {
+            "delivered": self.packets,
+            "dropped": self.queue.dropped,
+            "keyframes": self.queue.keyframes,
+            "encode_avg_ms": self.encode_time_total / self.encoded_count * 1000 if self.encoded_count else 0.0,
+            "cpu_s": self.worker_cpu,
+            "inline_packets": self.inline_packets,
+        }
+        if self.motion_stats is not None:
+            stats["motion"] = self.motion_stats
+        return stats
+
+    def stop(self):
+        super().stop()
+        if self.process is None:
+            return
+        self._send_control("stop")
+        self.process.join(timeout=2)
+        if self.process.is_alive():
+            self.process.terminate()
+        self.process = None
+        self._control_send.close()
+        # 子进程退出后读取线程会收到 EOF；只有确认它已退出才释放共享内存，
+        # 否则它可能还在读某个槽位，由它退出时自己释放
+        self._stopped = True
+        self._reader.join(timeout=1)
+        if self._reader.is_alive():
+            logger.warning("编码读取线程未退出，共享内存在它退出后释放: %s", self.source)
+        else:
+            self._release_segments(self._next_segment)
+
+
+def add_process_encoded_track(pc, track):
+    """把进程编码轨道加入 PeerConnection：限定协商对应编码，并把 PLI 转发给编码子进程"""
+    sender = pc.addTrack(track)
+    transceiver = next(t for t in pc.getTransceivers() if t.sender is sender)
+    prefer_codec(transceiver, track.mime_type, exclusive=True)
+    on_keyframe_request(sender, track.request_keyframe)
+    return sender
@@ -0,0 +1,285 @@
+"""
+媒体热路径的剖析模式：推流跑不满帧率时，定位瓶颈在读取视频源、颜色转换、编码还是 SRTP 加密发送。
+
+    profiler = HotPathProfiler("profile-out", sample_interval=0.01)
+    profiler.start()
+    profiler.attach(sender, track)       # 每次（重新）连接后调用
+    ...
+    await profiler.stop()                # 写出 summary.txt、frames.csv 和 stacks.folded
+
+记录内容：
+- 各阶段每帧（发送为每包）的墙钟和 CPU 时间：read / convert（采集线程）、encode（编码线程或子进程）、send（SRTP 加密 + 发送）
+- 事件循环延迟：定时 sleep 的实际唤醒比预期晚多少
+- GIL 争用：后台线程定时 sleep，唤醒后重新拿到 GIL 的延迟（含操作系统调度）
+- 可选的采样剖析：每 sample_interval 秒抓取一次所有线程的调用栈，
+  输出 flamegraph.pl / speedscope 可直接读取的折叠栈格式
+
+每帧只多几次计时调用，样本存放在固定长度的环形缓冲里；采样剖析默认关闭，开启时 100Hz 约占一个核的 1~2%，
+可以在线上排查时开着运行。
+"""
+import asyncio
+import collections
+import logging
+import os
+import sys
+import threading
+import time
+
+from .SenderHooks import get_encoder
+
+logger = logging.getLogger("WHIP_Publisher")
+
+STAGES = ("read", "convert", "encode", "send")
+
+
+def _percentile(values, q):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+class StageStats:
+    """一个阶段的耗时：累计值覆盖全程，最近 max_samples 个样本（墙钟, CPU）用于分位数和逐帧明细"""
+
+    def __init__(self, max_samples=36000):
+        self.samples = collections.deque(maxlen=max_samples)
+        self.count = 0
+        self.wall_total = 0.0
+        self.cpu_total = 0.0
+        self.wall_max = 0.0
+
+    def record(self, wall, cpu=None):
+        self.samples.append((wall, cpu))
+        self.count += 1
+        self.wall_total += wall
+        if cpu is not None:
+            self.cpu_total += cpu
+        if wall > self.wall_max:
+            self.wall_max = wall
+
+    def summary(self):
+        walls = [wall for wall, _ in self.samples]
+        has_cpu = any(cpu is not None for _, cpu in self.samples)
+        return {
+            "count": self.count,
+            "wall_avg_ms": self.wall_total / self.count * 1000 if self.count else 0.0,
+            "wall_p50_ms": _percentile(walls, 0.5) * 1000,
+            "wall_p95_ms": _percentile(walls, 0.95) * 1000,
+            "wall_p99_ms": _percentile(walls, 0.99) * 1000,
+            "wall_max_ms": self.wall_max * 1000,
+            "cpu_avg_ms": self.cpu_total / self.count * 1000 if self.count and has_cpu else None,
+        }
+
+
+class StackSampler(threading.Thread):
+    """定时抓取所有线程的调用栈，按折叠栈（线程名;外层函数;...;内层函数）计数"""
+
+    def __init__(self, interval=0.01):
+        super().__init__(name="StackSampler", daemon=True)
+        self.interval = interval
+        self.stacks = collections.Counter()
+        self.samples = 0
+        self._stop_event = threading.Event()
+
+    @staticmethod
+    def _frame_name(code):
+        return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+    def run(self):
+        me = threading.get_ident()
+        while not self._stop_event.wait(self.interval):
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == me:
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append(self._frame_name(frame.f_code))
+                    frame = frame.f_back
+                stack.append(names.get(ident, str(ident)))
+                self.stacks[";".join(reversed(stack))] += 1
+            self.samples += 1
+
+    def stop(self):
+        self._stop_event.set()
+        if self.is_alive():
+            self.join(timeout=1)
+
+    def write_folded(self, path):
+        with open(path, "w", encoding="utf-8") as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+
+
+class GilMonitor(threading.Thread):
+    """
+    每 interval 秒 sleep 一次，记录实际唤醒比预期晚的时间：线程醒来后要先拿到 GIL 才能继续，
+    其他线程长时间持有 GIL（纯 Python 的计算、未释放 GIL 的 C 扩展）时这个延迟会明显变大
+    """
+
+    def __init__(self, stats, interval=0.005):
+        super().__init__(name="GilMonitor", daemon=True)
+        self.stats = stats
+        self.interval = interval
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.is_set():
+            start = time.perf_counter()
+            time.sleep(self.interval)
+            self.stats.record(max(time.perf_counter() - start - self.interval, 0.0))
+
+    def stop(self):
+        self._stop_event.set()
+        if self.is_alive():
+            self.join(timeout=1)
+
+
+class HotPathProfiler:
+    """
+    output_dir 为退出时写出结果的目录；sample_interval 不为空时开启采样剖析。
+    attach 可以对多路流、多次重连重复调用，同一轨道/编码器/传输只挂一次钩子
+    """
+
+    def __init__(self, output_dir="profile", sample_interval=None, loop_interval=0.05, max_samples=36000):
+        self.output_dir = output_dir
+        self.loop_interval = loop_interval
+        self.stages = {stage: StageStats(max_samples) for stage in STAGES}
+        self.loop_lag = StageStats(max_samples)
+        self.gil_wait = StageStats(max_samples)
+        self.sampler = StackSampler(sample_interval) if sample_interval else None
+        self._gil_monitor = GilMonitor(self.gil_wait)
+        self._loop_task = None
+        self._pending = []
+        self._started_at = None
+        self._cpu_at_start = None
+
+    def start(self):
+        self._started_at = time.monotonic()
+        self._cpu_at_start = time.process_time()
+        self._loop_task = asyncio.ensure_future(self._watch_loop())
+        self._gil_monitor.start()
+        if self.sampler is not None:
+            self.sampler.start()
+        logger.info("剖析模式已开启，结果将写入 %s", os.path.abspath(self.output_dir))
+
+    async def _watch_loop(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            start = loop.time()
+            await asyncio.sleep(self.loop_interval)
+            self.loop_lag.record(max(loop.time() - start - self.loop_interval, 0.0))
+            # aiortc 的编码器在第一帧时才创建，创建后再挂钩子
+            self._pending = [sender for sender in self._pending if not self._hook_encoder(sender)]
+
+    @staticmethod
+    def _hook_once(obj):
+        if getattr(obj, "_profiled", False):
+            return False
+        obj._profiled = True
+        return True
+
+    def attach(self, sender, track):
+        """挂上各阶段的计时：track 为采集/编码轨道本身（不是 SessionTrack 代理）"""
+        grabber = getattr(track, "grabber", None)
+        if grabber is not None and self._hook_once(grabber):
+            grabber.timing_callbacks.append(self._on_grab)
+        if hasattr(track, "encode_callbacks"):
+            # 编码在子进程中，只有墙钟时间
+            if self._hook_once(track):
+                track.encode_callbacks.append(self.stages["encode"].record)
+        elif not self._hook_encoder(sender):
+            self._pending.append(sender)
+        transport = sender.transport
+        if transport is not None and self._hook_once(transport):
+            self._hook_send(transport)
+
+    def _on_grab(self, read_wall, convert_wall, read_cpu, convert_cpu):
+        self.stages["read"].record(read_wall, read_cpu)
+        self.stages["convert"].record(convert_wall, convert_cpu)
+
+    def _hook_encoder(self, sender):
+        encoder = get_encoder(sender)
+        if encoder is None:
+            return False
+        if not self._hook_once(encoder):
+            return True
+        original = encoder.encode
+        stats = self.stages["encode"]
+
+        def encode(*args, **kwargs):
+            # 在 aiortc 的编码线程中执行，thread_time 即本次编码的 CPU 时间
+            wall, cpu = time.perf_counter(), time.thread_time()
+            try:
+                return original(*args, **kwargs)
+            finally:
+                stats.record(time.perf_counter() - wall, time.thread_time() - cpu)
+
+        encoder.encode = encode
+        return True
+
+    def _hook_send(self, transport):
+        original = transport._send_rtp
+        stats = self.stages["send"]
+
+        async def _send_rtp(data):
+            # SRTP 加密和 sendto 都是同步完成的，这段时间内事件循环不会切换到其他协程
+            wall, cpu = time.perf_counter(), time.thread_time()
+            try:
+                await original(data)
+            finally:
+                stats.record(time.perf_counter() - wall, time.thread_time() - cpu)
+
+        transport._send_rtp = _send_rtp
+
+    def summary_table(self):
+        elapsed = time.monotonic() - self._started_at if self._started_at is not None else 0.0
+        cpu = time.process_time() - self._cpu_at_start if self._cpu_at_start is not None else 0.0
+        lines = [
+            f"运行 {elapsed:.1f}s，进程 CPU {cpu:.1f}s（{cpu / elapsed * 100 if elapsed else 0.0:.0f}%）",
+            f"{'阶段':<10}{'次数':>8}{'平均ms':>9}{'p50':>8}{'p95':>8}{'p99':>8}{'max':>8}{'CPU ms':>9}",
+        ]
+        rows = [(stage, self.stages[stage]) for stage in STAGES]
+        rows += [("loop_lag", self.loop_lag), ("gil_wait", self.gil_wait)]
+        for name, stats in rows:
+            s = stats.summary()
+            cpu_avg = "-" if s["cpu_avg_ms"] is None else f"{s['cpu_avg_ms']:.2f}"
+            lines.append(
+                f"{name:<10}{s['count']:>8}{s['wall_avg_ms']:>9.2f}{s['wall_p50_ms']:>8.2f}{s['wall_p95_ms']:>8.2f}"
+                f"{s['wall_p99_ms']:>8.2f}{s['wall_max_ms']:>8.2f}{cpu_avg:>9}"
+            )
+        lines.append("read 含等待视频源出帧的时间（CPU 远小于墙钟属正常）；send 为每个 RTP 包；")
+        lines.append("encode 的 CPU 只含调用线程，x264/libvpx 自己的工作线程不计入（对比进程 CPU 判断）；")
+        lines.append("loop_lag 为事件循环延迟，gil_wait 为后台线程拿回 GIL 的等待（含操作系统调度）")
+        if self.sampler is not None:
+            lines.append(f"采样剖析: {self.sampler.samples} 次，见 stacks.folded（flamegraph.pl / speedscope）")
+        return "\n".join(lines)
+
+    def write(self):
+        """写出 summary.txt、frames.csv（各阶段最近的逐帧样本）和 stacks.folded，返回摘要表"""
+        os.makedirs(self.output_dir, exist_ok=True)
+        table = self.summary_table()
+        with open(os.path.join(self.output_dir, "summary.txt"), "w", encoding="utf-8") as f:
+            f.write(table + "\n")
+        with open(os.path.join(self.output_dir, "frames.csv"), "w", encoding="utf-8") as f:
+            f.write("stage,index,wall_ms,cpu_ms\n")
+            for stage, stats in list(self.stages.items()) + [("loop_lag", self.loop_lag), ("gil_wait", self.gil_wait)]:
+                first = stats.count - len(stats.samples)
+                for i, (wall, cpu) in enumerate(list(stats.samples)):
+                    f.write(f"{stage},{first + i},{wall * 1000:.3f},{'' if cpu is None else f'{cpu * 1000:.3f}'}\n")
+        if self.sampler is not None:
+            self.sampler.write_folded(os.path.join(self.output_dir, "stacks.folded"))
+        return table
+
+    async def stop(self):
+        """停止监测并写出结果"""
+        if self._loop_task is not None:
+            self._loop_task.cancel()
+            self._loop_task = None
+        self._gil_monitor.stop()
+        if self.sampler is not None:
+            self.sampler.stop()
+        table = self.write()
+        logger.info("剖析结果（%s）:\n%s", os.path.abspath(self.output_dir), table)
+        return table
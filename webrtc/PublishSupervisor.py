@@ -0,0 +1,235 @@
+"""
+推流守护：检测连接失效后用同一个 stream id 重新 WHIP 推流，采集和编码在重连期间保持运行。
+
+aiortc 不支持 ICE restart（createOffer 没有 iceRestart，aioice 也不能更换 ufrag/pwd），
+因此恢复方式是新建 PeerConnection 并重新 POST；备用连接提前完成 ICE 收集，
+轨道（摄像头、编码子进程）直接挂到新连接上，恢复时间只包含 POST 和 ICE/DTLS 握手。
+"""
+import asyncio
+import logging
+import random
+import time
+
+from aiortc import RTCSessionDescription
+from aiortc.mediastreams import MediaStreamError, MediaStreamTrack
+
+from .SenderHooks import on_rtcp_packet
+from .WarmPool import PeerConnectionPool, SetupTimer, track_connection_phases
+
+logger = logging.getLogger("WHIP_Publisher")
+
+
+class Backoff:
+    """指数退避：initial, initial*factor, ... 直到 maximum，带随机抖动"""
+
+    def __init__(self, initial=0.2, maximum=10.0, factor=2.0, jitter=0.1):
+        self.initial = initial
+        self.maximum = maximum
+        self.factor = factor
+        self.jitter = jitter
+        self.attempts = 0
+
+    def next(self):
+        delay = min(self.initial * self.factor ** self.attempts, self.maximum)
+        self.attempts += 1
+        return delay * (1 + random.uniform(-self.jitter, self.jitter))
+
+    def reset(self):
+        self.attempts = 0
+
+
+class SessionTrack(MediaStreamTrack):
+    """
+    每个连接使用的轨道代理：aiortc 的 sender 退出时会 stop() 它的轨道，
+    代理只结束自己，真正的采集/编码轨道在重连期间保持运行。其余属性（mime_type、request_keyframe 等）透传给源轨道。
+    """
+
+    def __init__(self, source):
+        super().__init__()
+        self.kind = source.kind
+        self.source = source
+
+    async def recv(self):
+        if self.readyState != "live" or self.source.readyState != "live":
+            raise MediaStreamError
+        return await self.source.recv()
+
+    def __getattr__(self, name):
+        return getattr(self.source, name)
+
+
+async def wait_connected(pc, timeout):
+    """等待 PeerConnection 进入 connected，超时或失败返回 False"""
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    while pc.connectionState != "connected":
+        if pc.connectionState in ("failed", "closed") or loop.time() >= deadline:
+            return False
+        await asyncio.sleep(0.05)
+    return True
+
+
+class PublishSupervisor:
+    """
+    守护一路推流：
+    - 连接状态变为 failed/closed，或连续 rtcp_timeout 秒收不到服务器的 RTCP（接收报告），视为连接失效
+    - 失效后关闭旧连接、尽力 DELETE 旧会话，再用同一个 stream id 重新 POST，失败按指数退避重试
+    - 连接稳定超过 stable_after 秒后才重置退避，避免反复抖动时频繁重连
+    attach(pc, track) 负责把轨道加入 PeerConnection 并返回 sender（默认 pc.addTrack），
+    on_connected(sender) 在每次（重新）连上后调用，用于重新绑定自适应码率等依赖 sender 的组件。
+    mime_type、codecs、audio 与 PeerConnectionPool 相同，用于备用连接的编码协商（音频轨道由 attach 一并挂上）。
+    munge_offer(sdp) 在 POST 之前改写 offer，on_answer(answer_sdp) 在 setRemoteDescription 之前查看 answer（见 Simulcast）。
+    """
+
+    def __init__(self, whip_client, track, stream_id, ice_servers=None, mime_type=None, attach=None,
+                 on_connected=None, backoff=None, connect_timeout=10.0, rtcp_timeout=4.0, stable_after=10.0,
+                 standby=True, codecs=(), munge_offer=None, on_answer=None, audio=False):
+        self.whip_client = whip_client
+        self.track = track
+        self.stream_id = stream_id
+        self.attach = attach or (lambda pc, track: pc.addTrack(track))
+        self.on_connected = on_connected
+        self.munge_offer = munge_offer
+        self.on_answer = on_answer
+        self.backoff = backoff or Backoff()
+        self.connect_timeout = connect_timeout
+        self.rtcp_timeout = rtcp_timeout
+        self.stable_after = stable_after
+        self.pool = PeerConnectionPool(ice_servers, size=1 if standby else 0, mime_type=mime_type, codecs=codecs,
+                                        audio=audio)
+
+        self.pc = None
+        self.sender = None
+        self.whip_session = None
+        self.connected_at = None
+        self.reconnects = 0
+        self.recovery_ms = []
+        self._failed = None
+        self._last_rtcp = None
+
+    def adopt(self, pc, sender, whip_session):
+        """
+        接管已经建立好的连接（首次连接由调用方完成时使用）。
+        该连接的 sender 应使用 SessionTrack(track)，否则连接断开时源轨道会被 aiortc 停掉
+        """
+        self.pc = pc
+        self.sender = sender
+        self.whip_session = whip_session
+        self._watch()
+
+    def _watch(self):
+        pc = self.pc
+        failed = self._failed = asyncio.Event()
+        self._last_rtcp = None
+
+        @pc.on("connectionstatechange")
+        def on_connection_state():
+            logger.info("[%s] 连接状态变化: %s", self.stream_id, pc.connectionState)
+            if pc is self.pc and pc.connectionState in ("failed", "closed"):
+                failed.set()
+
+        def on_rtcp(packet):
+            self._last_rtcp = time.monotonic()
+
+        on_rtcp_packet(self.sender, on_rtcp)
+
+    async def _wait_failure(self):
+        """阻塞直到当前连接失效，返回原因"""
+        while True:
+            try:
+                await asyncio.wait_for(self._failed.wait(), 0.5)
+                return f"连接状态 {self.pc.connectionState}"
+            except asyncio.TimeoutError:
+                pass
+            if self.pc.connectionState != "connected":
+                continue
+            if self.connected_at is None:
+                self.connected_at = time.monotonic()
+            # 服务器从未发过 RTCP 时不做这项检查
+            if self._last_rtcp is not None and time.monotonic() - self._last_rtcp > self.rtcp_timeout:
+                return f"{self.rtcp_timeout:.0f}s 未收到 RTCP"
+
+    async def connect(self):
+        """取一个已收集好候选的连接，挂上轨道并 POST（同一个 stream id）"""
+        timer = SetupTimer()
+        warm = await self.pool.acquire()
+        pc = warm.pc
+        try:
+            sender = self.attach(pc, SessionTrack(self.track))
+            offer_sdp = warm.offer_sdp if self.munge_offer is None else self.munge_offer(warm.offer_sdp)
+            async with timer.phase("post"):
+                whip_session = await self.whip_client.publish(self.stream_id, offer_sdp)
+            if self.on_answer is not None:
+                self.on_answer(whip_session.answer_sdp)
+            track_connection_phases(pc, sender, timer)
+            await pc.setRemoteDescription(RTCSessionDescription(sdp=whip_session.answer_sdp, type="answer"))
+            self.pc, self.sender, self.whip_session = pc, sender, whip_session
+            self.connected_at = None
+            self._watch()
+            if not await wait_connected(pc, self.connect_timeout):
+                raise ConnectionError(f"{self.connect_timeout:.0f}s 内未能连通")
+        except Exception:
+            if pc is not self.pc:
+                await pc.close()
+            raise
+
+        # 新连接的接收端需要从关键帧开始解码
+        if hasattr(self.track, "request_keyframe"):
+            self.track.request_keyframe()
+        if self.on_connected is not None:
+            self.on_connected(self.sender)
+        return timer
+
+    async def _teardown(self):
+        pc, whip_session = self.pc, self.whip_session
+        self.pc = self.sender = self.whip_session = None
+        if pc is not None:
+            await pc.close()
+        if whip_session is not None:
+            # 服务器可能已经不可达，DELETE 只尽力而为，避免拖慢重连
+            try:
+                await asyncio.wait_for(self.whip_client.delete(whip_session), 1.0)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _reconnect(self):
+        while True:
+            try:
+                return await self.connect()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                await self._teardown()
+                delay = self.backoff.next()
+                logger.warning("重新推流失败（第 %d 次）: %s，%.1fs 后重试", self.backoff.attempts, e, delay)
+                await asyncio.sleep(delay)
+
+    async def run(self):
+        """守护循环，直到被取消"""
+        await self.pool.start()
+        if self.pc is None:
+            await self._reconnect()
+            self.backoff.reset()
+        while True:
+            reason = await self._wait_failure()
+            failed_at = time.monotonic()
+            if self.connected_at is not None and failed_at - self.connected_at >= self.stable_after:
+                self.backoff.reset()
+            logger.warning("推流连接失效（%s），开始重连", reason)
+            await self._teardown()
+            timer = await self._reconnect()
+            self.reconnects += 1
+            recovery = (time.monotonic() - failed_at) * 1000
+            self.recovery_ms.append(recovery)
+            logger.info("重连成功（第 %d 次），恢复耗时 %.0fms，阶段: %s", self.reconnects, recovery, timer.to_dict())
+
+    async def close(self):
+        await self._teardown()
+        await self.pool.close()
+
+    def stats(self):
+        return {
+            "reconnects": self.reconnects,
+            "recovery_ms": [round(r, 1) for r in self.recovery_ms],
+            "connection": self.pc.connectionState if self.pc is not None else "closed",
+        }
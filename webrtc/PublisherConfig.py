@@ -0,0 +1,624 @@
+"""
+推流配置文件和命令行入口：一个 TOML 文件（或 YAML，需要 PyYAML；或 JSON）描述所有与性能相关的参数，
+命令行参数覆盖配置文件中的同名项，未给出的项取下面各 dataclass 的默认值。
+
+    url = "http://live777.example:7777"
+    stream_id = "lobby"
+
+    [video]
+    source = "v4l2:/dev/video0"
+    width = 1280
+    height = 720
+    fps = 30
+    capture_threads = 2
+
+    [encoder]
+    mode = "inline"
+    profile = "low-latency"
+    bitrate = 1500000
+
+    [[ice.servers]]
+    urls = "turn:turn.example:3478"
+    username = "live777"
+    credential = "live777"
+
+    [reconnect]
+    initial = 0.5
+    maximum = 30
+
+    # 机群共用一个文件：按主机名（或 --host）取 hosts 下的同名表覆盖上面的配置
+    [hosts.cam-gate.video]
+    source = 2
+
+本模块只依赖标准库，解析配置、--help 和 --print-config 都不会导入 cv2/av/aiortc；
+开始推流时才导入 WHIP_WebRTC，其中音频、录像、simulcast、指标等可选功能也只在启用时才导入。
+
+热加载：收到 SIGHUP 或配置文件被修改后重新读取，RELOADABLE 中的项（输出分辨率和帧率、码率、关键帧最小间隔、
+运动门控、快照时长、日志级别）不断流直接生效，其余项的变化只记录警告，重启后才生效。
+
+    python main.py --config publisher.toml
+    python main.py --config fleet.toml --host cam-gate --print-config
+"""
+import argparse
+import dataclasses
+import json
+import logging
+import os
+import socket
+import tomllib
+from dataclasses import dataclass, field
+from typing import List, Optional, Union, get_args, get_origin
+
+logger = logging.getLogger("WHIP_Publisher")
+
+# 不断流即可生效的配置项（点号路径），"motion." 开头的项都可以
+RELOADABLE = {
+    "video.width", "video.height", "video.fps", "encoder.bitrate", "encoder.keyframe_min_interval",
+    "record.snapshot_seconds", "log.level",
+}
+RELOADABLE_PREFIXES = ("motion.",)
+
+
+@dataclass
+class VideoConfig:
+    """
+    source 为视频源（写法见 FrameSource），width/height/fps 为采集和输出的分辨率、帧率（帧率即发送节拍）；
+    capture_threads 为 OpenCV 颜色转换和缩放使用的线程数（cv2.setNumThreads），None 保持 OpenCV 默认（按核数）
+    """
+    source: Union[int, str, dict] = 0
+    width: int = 640
+    height: int = 480
+    fps: int = 30
+    conversion: str = "zerocopy"
+    capture_threads: Optional[int] = None
+
+
+@dataclass
+class EncoderConfig:
+    """
+    mode 为 "inline"（aiortc 在本进程编码）或 "process"（子进程采集和编码）；
+    profile 为内置编码配置档名称（见 EncoderProfile），其余字段不为空时覆盖配置档的同名字段，
+    都为空时不使用配置档（aiortc 默认）。bitrate 为初始码率；
+    keyframe_min_interval 为响应 PLI/FIR 强制关键帧的最小间隔（秒，0 为不推迟，见 KeyframeLimiter）
+    """
+    mode: str = "inline"
+    profile: Optional[str] = None
+    codecs: Optional[List[str]] = None
+    preset: Optional[str] = None
+    gop: Optional[int] = None
+    threads: Optional[int] = None
+    bitrate: Optional[int] = None
+    min_bitrate: Optional[int] = None
+    max_bitrate: Optional[int] = None
+    keyframe_min_interval: float = 1.0
+
+    def encoder_profile(self):
+        """转换为 get_profile 接受的配置档（名称、字典或 None）"""
+        overrides = {
+            f.name: getattr(self, f.name) for f in dataclasses.fields(self)
+            if f.name not in ("mode", "profile", "keyframe_min_interval") and getattr(self, f.name) is not None
+        }
+        if not overrides:
+            return self.profile
+        return {"base": self.profile or "aiortc", **overrides}
+
+
+@dataclass
+class AdaptiveConfig:
+    """enabled 时按 RTCP 反馈在码率阶梯中选档；ladder 为从高到低的 {width, height, fps, bitrate} 列表，为空时按采集分辨率推导"""
+    enabled: bool = False
+    ladder: Optional[List[dict]] = None
+    interval: float = 1.0
+
+
+@dataclass
+class SimulcastConfig:
+    """enabled 时同一会话发送 h/m/l 三层（只支持 inline），demand 时暂停没有人订阅的层"""
+    enabled: bool = False
+    demand: bool = False
+
+
+@dataclass
+class IceConfig:
+    """servers 为 STUN/TURN 服务器列表（{urls, username, credential}），为空时使用 aiortc 默认；trickle 见 TrickleIce"""
+    servers: Optional[List[dict]] = None
+    trickle: bool = False
+    fallback_timeout: float = 5.0
+
+
+@dataclass
+class ReconnectConfig:
+    """
+    连接失效后用同一个 stream id 重新推流（见 PublishSupervisor）：失败按 initial 起、factor 倍增、
+    最多 maximum 秒退避重试；rtcp_timeout 秒收不到 RTCP 视为失效，连接稳定 stable_after 秒后才重置退避
+    """
+    enabled: bool = True
+    initial: float = 0.2
+    maximum: float = 10.0
+    factor: float = 2.0
+    connect_timeout: float = 10.0
+    rtcp_timeout: float = 4.0
+    stable_after: float = 10.0
+
+
+@dataclass
+class MetricsConfig:
+    """port 不为空时在该端口提供 Prometheus 格式的 /metrics"""
+    port: Optional[int] = None
+
+
+@dataclass
+class AudioConfig:
+    """source 不为空时同时推送 Opus 音频（写法见 AudioSource），frame_ms 为 10 或 20"""
+    source: Optional[Union[str, dict]] = None
+    frame_ms: int = 20
+
+
+@dataclass
+class RecordConfig:
+    """dir 不为空时环形录像（见 RingRecorder），收到 SIGUSR1 时保存最近 snapshot_seconds 秒"""
+    dir: Optional[str] = None
+    format: str = "ts"
+    minutes: float = 5.0
+    max_mb: Optional[float] = None
+    snapshot_seconds: float = 60.0
+
+
+@dataclass
+class MotionConfig:
+    """enabled 时画面静止期间降低送编码器的帧率，其余字段为 MotionGate 的参数"""
+    enabled: bool = False
+    idle_fps: float = 1.0
+    hold: float = 2.0
+    pixel_threshold: int = 12
+    area_threshold: float = 0.002
+    ignore: List[Union[str, List[float]]] = field(default_factory=list)
+    roi: Optional[List[Union[str, List[float]]]] = None
+
+    def gate_options(self):
+        """MotionGate 的参数字典，未启用时为 None"""
+        if not self.enabled:
+            return None
+        options = dataclasses.asdict(self)
+        del options["enabled"]
+        return options
+
+    def validate(self):
+        """启用时按这组参数构造一次 MotionGate（区域写法、阈值范围等由它检查），只在启用时才导入 MotionGate"""
+        if not self.enabled:
+            return
+        from .MotionGate import MotionGate
+        try:
+            MotionGate(**self.gate_options())
+        except (TypeError, ValueError) as e:
+            raise ValueError(f"motion 配置无效: {e}") from None
+
+
+@dataclass
+class ProfilerConfig:
+    """dir 不为空时开启剖析模式，sample 为采样调用栈的间隔（秒）"""
+    dir: Optional[str] = None
+    sample: Optional[float] = None
+
+
+@dataclass
+class LogConfig:
+    level: str = "INFO"
+
+
+@dataclass
+class PublisherConfig:
+    url: Optional[str] = None
+    stream_id: Optional[str] = None
+    video: VideoConfig = field(default_factory=VideoConfig)
+    encoder: EncoderConfig = field(default_factory=EncoderConfig)
+    adaptive: AdaptiveConfig = field(default_factory=AdaptiveConfig)
+    simulcast: SimulcastConfig = field(default_factory=SimulcastConfig)
+    ice: IceConfig = field(default_factory=IceConfig)
+    reconnect: ReconnectConfig = field(default_factory=ReconnectConfig)
+    metrics: MetricsConfig = field(default_factory=MetricsConfig)
+    audio: AudioConfig = field(default_factory=AudioConfig)
+    record: RecordConfig = field(default_factory=RecordConfig)
+    motion: MotionConfig = field(default_factory=MotionConfig)
+    profiler: ProfilerConfig = field(default_factory=ProfilerConfig)
+    log: LogConfig = field(default_factory=LogConfig)
+
+    def to_dict(self):
+        return dataclasses.asdict(self)
+
+    def runtime_settings(self):
+        """可热更新的设置，按 whip_publish_webrtc 的 reload 约定分组"""
+        return {
+            "output": {"width": self.video.width, "height": self.video.height, "fps": self.video.fps},
+            "bitrate": self.encoder.bitrate,
+            "motion": self.motion.gate_options(),
+            "snapshot_seconds": self.record.snapshot_seconds,
+            "keyframe_min_interval": self.encoder.keyframe_min_interval,
+        }
+
+    def run_kwargs(self):
+        """WHIP_WebRTC.run 的参数（推流服务器地址除外）"""
+        record = self.record
+        reconnect = self.reconnect
+        adaptive = self.adaptive
+        return {
+            "profile_dir": self.profiler.dir,
+            "profile_sample_interval": self.profiler.sample,
+            "record_dir": record.dir,
+            "record_options": {
+                "format": record.format,
+                "max_seconds": record.minutes * 60,
+                "max_bytes": int(record.max_mb * 1024 * 1024) if record.max_mb else None,
+            },
+            "snapshot_seconds": record.snapshot_seconds,
+            "live_stream_id": self.stream_id,
+            "camera_index": self.video.source,
+            "width": self.video.width,
+            "height": self.video.height,
+            "fps": self.video.fps,
+            "conversion": self.video.conversion,
+            "capture_threads": self.video.capture_threads,
+            "encode_mode": self.encoder.mode,
+            "encoder_profile": self.encoder.encoder_profile(),
+            "keyframe_min_interval": self.encoder.keyframe_min_interval,
+            "adaptive": (
+                {"ladder": adaptive.ladder, "interval": adaptive.interval} if adaptive.enabled else False
+            ),
+            "simulcast": self.simulcast.enabled or None,
+            "simulcast_demand": self.simulcast.demand,
+            "ice_servers": self.ice.servers,
+            "trickle": self.ice.trickle,
+            "trickle_fallback_timeout": self.ice.fallback_timeout,
+            "reconnect": {
+                "backoff": {"initial": reconnect.initial, "maximum": reconnect.maximum, "factor": reconnect.factor},
+                "connect_timeout": reconnect.connect_timeout,
+                "rtcp_timeout": reconnect.rtcp_timeout,
+                "stable_after": reconnect.stable_after,
+            } if reconnect.enabled else False,
+            "metrics_port": self.metrics.port,
+            "audio": self.audio.source,
+            "audio_frame_ms": self.audio.frame_ms,
+            "motion": self.motion.gate_options(),
+        }
+
+
+# 取值受限的配置项
+CHOICES = {
+    "video.conversion": ("zerocopy", "legacy"),
+    "encoder.mode": ("inline", "process"),
+    "audio.frame_ms": (10, 20),
+    "record.format": ("ts", "fmp4", "mkv"),
+    "log.level": ("DEBUG", "INFO", "WARNING", "ERROR"),
+}
+
+# 数值配置项的下限 (下限, 是否可以等于下限)；motion 的取值范围由 MotionGate 检查
+MINIMUMS = {
+    "video.width": (1, True),
+    "video.height": (1, True),
+    "video.fps": (0, False),
+    "video.capture_threads": (1, True),
+    "encoder.gop": (1, True),
+    "encoder.threads": (0, True),
+    "encoder.bitrate": (1, True),
+    "encoder.min_bitrate": (1, True),
+    "encoder.max_bitrate": (1, True),
+    "encoder.keyframe_min_interval": (0, True),
+    "adaptive.interval": (0, False),
+    "ice.fallback_timeout": (0, False),
+    "reconnect.initial": (0, False),
+    "reconnect.maximum": (0, False),
+    "reconnect.factor": (1, True),
+    "reconnect.connect_timeout": (0, False),
+    "reconnect.rtcp_timeout": (0, False),
+    "reconnect.stable_after": (0, True),
+    "metrics.port": (1, True),
+    "record.minutes": (0, False),
+    "record.max_mb": (0, False),
+    "record.snapshot_seconds": (0, False),
+    "profiler.sample": (0, False),
+}
+
+
+def _type_matches(value, annotation):
+    """按 dataclass 字段的类型注解检查配置值；int 可以用于 float，bool 不算数值"""
+    origin = get_origin(annotation)
+    if origin is Union:
+        return any(_type_matches(value, arg) for arg in get_args(annotation))
+    if origin is list:
+        return isinstance(value, list) and all(_type_matches(v, get_args(annotation)[0]) for v in value)
+    if annotation is type(None):
+        return value is None
+    if annotation is bool:
+        return isinstance(value, bool)
+    if isinstance(value, bool):
+        return False
+    if annotation is float:
+        return isinstance(value, (int, float))
+    return isinstance(value, annotation)
+
+
+def _type_name(annotation):
+    if get_origin(annotation) is Union:
+        return " 或 ".join(_type_name(arg) for arg in get_args(annotation) if arg is not type(None))
+    if get_origin(annotation) is list:
+        return f"列表[{_type_name(get_args(annotation)[0])}]"
+    return annotation.__name__
+
+
+def _build(cls, data, path=""):
+    """字典 -> dataclass，嵌套的表递归构造，未知的键报错"""
+    if not isinstance(data, dict):
+        raise ValueError(f"配置项 {path.rstrip('.')} 应为表")
+    fields = {f.name: f for f in dataclasses.fields(cls)}
+    unknown = set(data) - set(fields)
+    if unknown:
+        raise ValueError(f"未知的配置项: {', '.join(path + k for k in sorted(unknown))}")
+    values = {}
+    for name, value in data.items():
+        default = fields[name].default_factory if fields[name].default_factory is not dataclasses.MISSING else None
+        if dataclasses.is_dataclass(default):
+            value = _build(default, value, f"{path}{name}.")
+        elif path + name in CHOICES and value not in CHOICES[path + name]:
+            raise ValueError(f"{path}{name} 只能是 {', '.join(map(str, CHOICES[path + name]))} 之一: {value!r}")
+        elif not _type_matches(value, fields[name].type):
+            raise ValueError(f"{path}{name} 应为 {_type_name(fields[name].type)}: {value!r}")
+        elif value is not None and path + name in MINIMUMS:
+            minimum, inclusive = MINIMUMS[path + name]
+            if value < minimum or (value == minimum and not inclusive):
+                raise ValueError(f"{path}{name} 应{'不小于' if inclusive else '大于'} {minimum}: {value!r}")
+        values[name] = value
+    return cls(**values)
+
+
+def merge(base, override):
+    """递归合并两个配置字典，override 优先"""
+    merged = dict(base)
+    for key, value in override.items():
+        if isinstance(value, dict) and isinstance(merged.get(key), dict):
+            merged[key] = merge(merged[key], value)
+        else:
+            merged[key] = value
+    return merged
+
+
+def _nest(dotted):
+    """{"video.fps": 15} -> {"video": {"fps": 15}}"""
+    nested = {}
+    for key, value in dotted.items():
+        *parents, name = key.split(".")
+        node = nested
+        for parent in parents:
+            node = node.setdefault(parent, {})
+        node[name] = value
+    return nested
+
+
+def flatten(data, prefix=""):
+    """{"video": {"fps": 15}} -> {"video.fps": 15}"""
+    flat = {}
+    for key, value in data.items():
+        if isinstance(value, dict) and key not in ("source",):
+            flat.update(flatten(value, f"{prefix}{key}."))
+        else:
+            flat[prefix + key] = value
+    return flat
+
+
+def read_config_file(path):
+    """按扩展名读取 .toml/.yaml/.yml/.json 配置文件，返回字典"""
+    extension = os.path.splitext(path)[1].lower()
+    if extension in (".yaml", ".yml"):
+        try:
+            import yaml
+        except ImportError:
+            raise ValueError("读取 YAML 配置需要 PyYAML（pip install pyyaml），或改用 TOML") from None
+        with open(path, encoding="utf-8") as f:
+            return yaml.safe_load(f) or {}
+    if extension == ".json":
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    with open(path, "rb") as f:
+        try:
+            return tomllib.load(f)
+        except tomllib.TOMLDecodeError as e:
+            raise ValueError(f"{path}: {e}") from None
+
+
+def load_config(path=None, host=None, overrides=None):
+    """
+    读取配置文件（可以为空），合并 hosts 下 host（默认本机主机名）的覆盖项，再合并命令行覆盖项
+    （点号路径的字典，如 {"video.fps": 15}），返回 PublisherConfig
+    """
+    data = read_config_file(path) if path else {}
+    hosts = data.pop("hosts", {}) or {}
+    host = host or socket.gethostname()
+    if host in hosts:
+        data = merge(data, hosts[host])
+    if overrides:
+        data = merge(data, _nest(overrides))
+    config = _build(PublisherConfig, data)
+    config.motion.validate()
+    return config
+
+
+def diff_config(old, new):
+    """返回 (可热更新的变化项, 需要重启的变化项)，均为点号路径列表"""
+    before, after = flatten(old.to_dict()), flatten(new.to_dict())
+    changed = sorted(k for k in before.keys() | after.keys() if before.get(k) != after.get(k))
+    runtime = [k for k in changed if k in RELOADABLE or k.startswith(RELOADABLE_PREFIXES)]
+    return runtime, [k for k in changed if k not in runtime]
+
+
+# 变化项 -> runtime_settings 中的分组
+RELOAD_GROUPS = {
+    "video.width": "output",
+    "video.height": "output",
+    "video.fps": "output",
+    "encoder.bitrate": "bitrate",
+    "encoder.keyframe_min_interval": "keyframe_min_interval",
+    "record.snapshot_seconds": "snapshot_seconds",
+}
+
+
+class ConfigWatcher:
+    """
+    热加载：updates() 是异步迭代器，收到 SIGHUP 或每 interval 秒检查到文件修改时重新读取配置，
+    有可热更新的变化时产出 {分组: 新值}（分组见 PublisherConfig.runtime_settings），交给 whip_publish_webrtc 的 reload。
+    日志级别在这里直接生效；读取或检查（类型、取值范围、运动门控参数）失败时保持原配置
+    """
+
+    def __init__(self, path, host=None, overrides=None, config=None, interval=2.0):
+        self.path = path
+        self.host = host
+        self.overrides = overrides or {}
+        self.config = config or load_config(path, host, overrides)
+        self.interval = interval
+        self.reloads = 0
+
+    def _mtime(self):
+        try:
+            return os.stat(self.path).st_mtime_ns
+        except OSError:
+            return None
+
+    def reload(self):
+        """重新读取配置，返回需要交给推流的更新（没有时为 None）"""
+        try:
+            config = load_config(self.path, self.host, self.overrides)
+        except (OSError, ValueError) as e:
+            logger.error("重新加载配置失败，保持原配置: %s", e)
+            return None
+        runtime, structural = diff_config(self.config, config)
+        self.config = config
+        self.reloads += 1
+        if structural:
+            logger.warning("以下配置需要重启推流才能生效: %s", ", ".join(structural))
+        if not runtime:
+            logger.info("配置已重新加载，没有可热更新的变化")
+            return None
+        logger.info("热更新配置: %s", ", ".join(runtime))
+        if "log.level" in runtime:
+            logging.getLogger().setLevel(config.log.level)
+        settings = config.runtime_settings()
+        groups = {RELOAD_GROUPS.get(k, "motion") for k in runtime if k != "log.level"}
+        return {group: settings[group] for group in groups} or None
+
+    async def updates(self):
+        import asyncio
+        import signal
+
+        loop = asyncio.get_running_loop()
+        signaled = asyncio.Event()
+        try:
+            loop.add_signal_handler(signal.SIGHUP, signaled.set)
+        except (AttributeError, NotImplementedError):
+            # Windows 没有 SIGHUP，只能靠检查文件修改时间
+            pass
+        mtime = self._mtime()
+        while True:
+            try:
+                await asyncio.wait_for(signaled.wait(), self.interval)
+            except asyncio.TimeoutError:
+                pass
+            current = self._mtime()
+            if not signaled.is_set() and current == mtime:
+                continue
+            signaled.clear()
+            mtime = current
+            update = self.reload()
+            if update:
+                yield update
+
+
+def _option(parser, flags, dest, **kwargs):
+    """命令行覆盖项：dest 为配置的点号路径，未给出时不覆盖配置文件"""
+    if kwargs.get("action") not in ("store_true", "store_false") and "choices" not in kwargs:
+        kwargs.setdefault("metavar", flags[0].lstrip("-").replace("-", "_").upper())
+    parser.add_argument(*flags, dest=dest, default=argparse.SUPPRESS, **kwargs)
+
+
+def _source(value):
+    return int(value) if value.isdigit() else value
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        description="WHIP 推流到 live777",
+        epilog="命令行参数覆盖配置文件中的同名项；修改配置文件或 kill -HUP <pid> 时热更新分辨率、帧率、码率和运动门控",
+    )
+    parser.add_argument("--config", default=None, metavar="FILE", help="配置文件（.toml，或 .yaml/.json）")
+    parser.add_argument("--host", default=None, help="取配置文件 hosts 下的哪一台主机（默认本机主机名）")
+    parser.add_argument("--print-config", action="store_true", help="输出合并后的配置（JSON）并退出，不开始推流")
+    _option(parser, ["--url"], "url", help="live777 推流服务器 http://ip:port")
+    _option(parser, ["--stream-id"], "stream_id", help="stream id（默认随机）")
+    _option(parser, ["--source"], "video.source", type=_source,
+            help="视频源：摄像头索引、v4l2:/dev/videoN、gst:<管道>、file:<循环播放的文件>、shm:<共享内存名> 或 synthetic")
+    _option(parser, ["--width"], "video.width", type=int)
+    _option(parser, ["--height"], "video.height", type=int)
+    _option(parser, ["--fps"], "video.fps", type=int)
+    _option(parser, ["--capture-threads"], "video.capture_threads", type=int, help="OpenCV 颜色转换/缩放线程数")
+    _option(parser, ["--encode-mode"], "encoder.mode", choices=CHOICES["encoder.mode"])
+    _option(parser, ["--encoder-profile"], "encoder.profile", help="编码配置档（low-latency、balanced、quality、vp8 等）")
+    _option(parser, ["--preset"], "encoder.preset", help="x264 preset，覆盖配置档")
+    _option(parser, ["--bitrate"], "encoder.bitrate", type=int, help="初始码率（bps）")
+    _option(parser, ["--keyframe-min-interval"], "encoder.keyframe_min_interval", type=float,
+            help="响应 PLI/FIR 强制关键帧的最小间隔（秒），0 为不推迟")
+    _option(parser, ["--adaptive"], "adaptive.enabled", action="store_true", help="按 RTCP 反馈自适应码率/分辨率")
+    _option(parser, ["--ice-server"], "ice.servers", action="append", type=lambda urls: {"urls": urls},
+            metavar="URL", help="STUN/TURN 服务器（带认证的写在配置文件中），可重复")
+    _option(parser, ["--trickle"], "ice.trickle", action="store_true", help="trickle ICE")
+    _option(parser, ["--no-reconnect"], "reconnect.enabled", action="store_false", help="连接失效后不重新推流")
+    _option(parser, ["--metrics-port"], "metrics.port", type=int, help="在该端口提供 Prometheus /metrics")
+    _option(parser, ["--log-level"], "log.level", choices=CHOICES["log.level"])
+    _option(parser, ["--profile"], "profiler.dir", nargs="?", const="profile", metavar="DIR",
+            help="剖析模式：记录各阶段每帧耗时、事件循环延迟和 GIL 争用，退出时写入 DIR（默认 ./profile）")
+    _option(parser, ["--profile-sample"], "profiler.sample", type=float, metavar="SECONDS",
+            help="剖析模式下同时按该间隔采样调用栈（如 0.01），输出 flamegraph 可用的折叠栈")
+    _option(parser, ["--simulcast"], "simulcast.enabled", action="store_true",
+            help="simulcast：同一会话发送 h/m/l 三层（1、1/2、1/4 分辨率），由 live777 按订阅者网络选择")
+    _option(parser, ["--simulcast-demand"], "simulcast.demand", action="store_true",
+            help="simulcast 时按服务器上的拉流会话暂停没有人订阅的层（最高层始终发送）")
+    _option(parser, ["--audio"], "audio.source", metavar="SOURCE",
+            help="同时推送 Opus 音频：tone（合成 beep）、alsa[:设备]、pulse[:source名] 或 file:<音频文件>")
+    _option(parser, ["--audio-frame-ms"], "audio.frame_ms", type=int, choices=CHOICES["audio.frame_ms"],
+            help="Opus 帧长（毫秒），10ms 延迟更低但包数翻倍")
+    _option(parser, ["--record"], "record.dir", metavar="DIR",
+            help="把发出的视频（不重新编码）环形录像到 DIR，kill -USR1 <pid> 保存最近一段为独立文件")
+    _option(parser, ["--record-format"], "record.format", choices=CHOICES["record.format"], help="录像分段格式")
+    _option(parser, ["--record-minutes"], "record.minutes", type=float, help="环形录像保留的分钟数（默认 5）")
+    _option(parser, ["--record-max-mb"], "record.max_mb", type=float, help="环形录像占用的磁盘上限（MB）")
+    _option(parser, ["--snapshot-seconds"], "record.snapshot_seconds", type=float, help="收到 SIGUSR1 时保存的秒数")
+    _option(parser, ["--motion"], "motion.enabled", action="store_true",
+            help="运动门控：画面静止时降低送编码器的帧率（关键帧间隔随之拉长），有运动时立即恢复")
+    _option(parser, ["--motion-idle-fps"], "motion.idle_fps", type=float, help="画面静止时的帧率（默认 1）")
+    _option(parser, ["--motion-ignore"], "motion.ignore", action="append", metavar="X,Y,W,H",
+            help="运动检测忽略的区域（画面比例，如时间水印 0,0,1,0.08），可重复")
+    return parser
+
+
+def main(argv=None):
+    parser = build_parser()
+    options = vars(parser.parse_args(argv))
+    path = options.pop("config")
+    host = options.pop("host")
+    print_config = options.pop("print_config")
+    try:
+        config = load_config(path, host, options)
+    except (OSError, ValueError) as e:
+        parser.error(str(e))
+    if print_config:
+        print(json.dumps(config.to_dict(), ensure_ascii=False, indent=2))
+        return
+    if not config.url:
+        parser.error("需要推流服务器地址：--url 或配置文件中的 url")
+
+    # 先于 WHIP_WebRTC 配置日志（它导入时的 basicConfig 不会覆盖已有配置）
+    logging.basicConfig(level=config.log.level)
+    watcher = ConfigWatcher(path, host, options, config) if path else None
+    from . import WHIP_WebRTC
+
+    WHIP_WebRTC.run(config.url, reload=watcher.updates() if watcher is not None else None, **config.run_kwargs())
+
+
+if __name__ == "__main__":
+    main()
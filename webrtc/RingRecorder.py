@@ -0,0 +1,442 @@
+"""
+本地环形录像（DVR）：把推流已经编码好的视频帧（不重新编码）写成磁盘上的一串分段文件，
+按总时长和/或总字节数淘汰最旧的分段，事故之后可以把最近 N 秒合成一个独立文件。
+
+    recorder = RingRecorder("dvr", format="ts", segment_seconds=2, max_seconds=300)
+    recorder.attach(sender)                 # 每次（重新）连接后对新的 sender 调用
+    path = await recorder.snapshot(60)      # 最近 60 秒 -> dvr/snapshot-20260101-120000.mp4
+
+编码线程只把帧放进有界队列，复用（mux）、写文件、fsync 和淘汰都在后台写线程中完成，不占用事件循环。
+fsync 按 fsync_interval 秒批量执行，掉电时最多丢失这段时间的数据；分段关闭时再 fsync 一次文件和目录。
+每个分段都从关键帧开始；队列满丢帧后会丢弃到下一个关键帧为止，并向编码器请求关键帧。
+
+格式："ts"（MPEG-TS，默认，写到一半的分段也能播放）、"fmp4"（分片 MP4）、"mkv"；VP8 只能写入 mkv。
+"""
+import asyncio
+import logging
+import os
+import queue
+import re
+import threading
+import time
+from fractions import Fraction
+
+import av
+from av.bitstream import BitStreamFilterContext
+
+from .SenderHooks import tee_encoded
+
+logger = logging.getLogger("WHIP_Publisher")
+
+RECORD_TIME_BASE = Fraction(1, 90000)
+H264_SPS, H264_PPS = 7, 8
+
+# 格式名 -> (PyAV 容器格式, 扩展名, 复用参数)
+FORMATS = {
+    "ts": ("mpegts", ".ts", {}),
+    "fmp4": ("mp4", ".mp4", {"movflags": "frag_keyframe+empty_moov+default_base_moof"}),
+    "mkv": ("matroska", ".mkv", {}),
+}
+# snapshot 输出文件的扩展名 -> (PyAV 容器格式, 复用参数)
+SNAPSHOT_FORMATS = {
+    ".mp4": ("mp4", {}),
+    ".ts": ("mpegts", {}),
+    ".mkv": ("matroska", {}),
+}
+SEGMENT_PATTERN = re.compile(r"^dvr-(\d+)-(\d+)\.(ts|mp4|mkv)$")
+
+
+def h264_parameter_sets(data):
+    """Annex-B 关键帧中的 SPS/PPS（作为 MP4/MKV 的 extradata）"""
+    nals = [nal for nal in data.split(b"\x00\x00\x01") if nal]
+    return b"".join(b"\x00\x00\x00\x01" + nal.rstrip(b"\x00") for nal in nals if nal[0] & 0x1F in (H264_SPS, H264_PPS))
+
+
+class Segment:
+    """
+    一个分段文件；start/end 为 90kHz 时间戳（相对录像开始）。
+    上一次运行留下的文件没有时间戳，时长按 nominal 秒估算（用于环的时长上限）
+    """
+
+    def __init__(self, path, start=None, size=0, nominal=0.0, codec=None):
+        self.path = path
+        self.codec = codec
+        self.start = start
+        self.end = start
+        self.size = size
+        self.nominal = nominal
+        self.frames = 0
+        self.pins = 0
+
+    @property
+    def duration(self):
+        return self.nominal if self.start is None else (self.end - self.start) / 90000
+
+    def to_dict(self):
+        return {"path": self.path, "seconds": round(self.duration, 3), "bytes": self.size, "frames": self.frames}
+
+
+class _SegmentWriter:
+    """写线程中正在写的分段（或 snapshot 的输出）：自己打开文件交给 PyAV，以便定期 fsync"""
+
+    def __init__(self, segment, container_format, options, codec, size, extradata):
+        self.segment = segment
+        self.codec = codec
+        self.size = size
+        self.file = open(segment.path, "wb")
+        self.container = av.open(self.file, "w", format=container_format, options=options)
+        self.stream = self.container.add_stream(codec)
+        self.stream.time_base = RECORD_TIME_BASE
+        if size is not None:
+            self.stream.width, self.stream.height = size
+        if extradata:
+            self.stream.codec_context.extradata = extradata
+
+    def write(self, data, pts, keyframe):
+        packet = av.Packet(data)
+        packet.pts = packet.dts = pts
+        packet.time_base = RECORD_TIME_BASE
+        packet.stream = self.stream
+        packet.is_keyframe = keyframe
+        self.container.mux(packet)
+        self.segment.end = pts
+        self.segment.frames += 1
+
+    def sync(self):
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self.segment.size = os.fstat(self.file.fileno()).st_size
+
+    def close(self):
+        self.container.close()
+        self.sync()
+        self.file.close()
+
+
+class RingRecorder:
+    """
+    directory 下的分段环形录像。segment_seconds 为每段的目标时长（在其后的第一个关键帧处切分，
+    因此实际时长不小于编码器的关键帧间隔），
+    max_seconds/max_bytes 为环的上限（任一超出即删除最旧的分段，上一次运行留下的分段最先删除）；
+    size 为 (宽, 高)，打包已编码数据（进程编码、H264 直通）时无法从帧上得到尺寸，用它填写容器参数
+    """
+
+    def __init__(self, directory="dvr", format="ts", segment_seconds=2.0, max_seconds=300.0, max_bytes=None,
+                 fsync_interval=1.0, size=None, max_queue=300):
+        if format not in FORMATS:
+            raise ValueError(f"不支持的录像格式: {format}（可选: {', '.join(FORMATS)}）")
+        self.directory = directory
+        self.format = format
+        self.segment_seconds = segment_seconds
+        self.max_seconds = max_seconds
+        self.max_bytes = max_bytes
+        self.fsync_interval = fsync_interval
+        self.size = size
+        os.makedirs(directory, exist_ok=True)
+
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._lock = threading.Lock()
+        self._segments = self._existing_segments()
+        self._writer = None
+        self._origin = None
+        self._sequence = 0
+        self._extradata = None
+        self._last_sync = 0.0
+        self._resync = True
+        self._sender = None
+        self._loop = None
+        self._closed = False
+
+        self.frames = 0
+        self.dropped = 0
+        self.skipped = 0
+        self.fsyncs = 0
+        self.deleted = 0
+        self.keyframe_requests = 0
+        self._thread = threading.Thread(target=self._run, name="RingRecorder", daemon=True)
+        self._thread.start()
+
+    def _existing_segments(self):
+        """
+        上一次运行留下的分段（如事故后重启）：留在环中并最先被淘汰，每个按 segment_seconds 计入时长；
+        时间戳与本次运行不连续，不参与 snapshot
+        """
+        found = []
+        for name in os.listdir(self.directory):
+            match = SEGMENT_PATTERN.match(name)
+            if match:
+                found.append((int(match.group(1)), int(match.group(2)), name))
+        segments = []
+        for _, _, name in sorted(found):
+            path = os.path.join(self.directory, name)
+            segments.append(Segment(path, size=os.path.getsize(path), nominal=self.segment_seconds))
+        if segments:
+            logger.info("录像目录中有 %d 个上次运行留下的分段", len(segments))
+        return segments
+
+    def attach(self, sender):
+        """转存 sender 发出的视频帧，重连后对新的 sender 再调用一次"""
+        self._sender = sender
+        self._loop = asyncio.get_running_loop()
+        tee_encoded(sender, self.write)
+        # 编码器第一帧之后才能挂上，需要一个新的关键帧作为起点
+        self._resync = True
+
+    def _request_keyframe(self):
+        if self._sender is not None:
+            self.keyframe_requests += 1
+            self._sender._send_keyframe()
+
+    def _ask_keyframe(self):
+        if self._loop is not None and not self._loop.is_closed():
+            self._loop.call_soon_threadsafe(self._request_keyframe)
+
+    def write(self, codec, data, timestamp, keyframe, size=None):
+        """tee_encoded 的回调（编码线程中调用）：只放进队列；丢帧后直到下一个关键帧之前的帧无法解码，一并丢弃"""
+        if self._closed:
+            return
+        if self._resync:
+            if not keyframe:
+                self.skipped += 1
+                if self.skipped % 30 == 1:
+                    self._ask_keyframe()
+                return
+            self._resync = False
+        try:
+            self._queue.put_nowait(("frame", codec, data, timestamp, keyframe, size or self.size))
+        except queue.Full:
+            self.dropped += 1
+            self._resync = True
+            self._ask_keyframe()
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                break
+            try:
+                if item[0] == "frame":
+                    self._write_frame(*item[1:])
+                else:
+                    # ("rotate", done)：关闭当前分段，snapshot 之前确保数据都在已关闭的分段里；
+                    # 下一个分段要从关键帧开始，立即请求一个，免得录像中断到下一个自然关键帧
+                    try:
+                        self._close_segment()
+                    finally:
+                        item[1]()
+                    self._ask_keyframe()
+            except Exception as e:
+                logger.error("录像写入失败: %s", e)
+                self._abort_segment()
+        self._close_segment()
+
+    def _write_frame(self, codec, data, timestamp, keyframe, size):
+        if self._origin is None:
+            self._origin = timestamp
+        pts = timestamp - self._origin
+        writer = self._writer
+        if keyframe:
+            if codec == "h264":
+                self._extradata = h264_parameter_sets(data) or self._extradata
+            # 到时长、编码或尺寸变了（自适应分辨率）时在关键帧处切分
+            if writer is not None and (
+                pts - writer.segment.start >= self.segment_seconds * 90000
+                or codec != writer.codec or size != writer.size
+            ):
+                self._close_segment()
+                writer = None
+        if writer is None:
+            if not keyframe:
+                self.skipped += 1
+                return
+            writer = self._open_segment(codec, pts, size)
+        writer.write(data, pts, keyframe)
+        self.frames += 1
+        now = time.monotonic()
+        if now - self._last_sync >= self.fsync_interval:
+            writer.sync()
+            self.fsyncs += 1
+            self._last_sync = now
+
+    def _open_segment(self, codec, pts, size):
+        format = self.format
+        if codec == "vp8" and format != "mkv":
+            format = "mkv"
+        self._sequence += 1
+        name = f"dvr-{int(time.time() * 1000)}-{self._sequence:06d}{FORMATS[format][1]}"
+        segment = Segment(os.path.join(self.directory, name), pts, codec=codec)
+        container_format, _, options = FORMATS[format]
+        self._writer = _SegmentWriter(
+            segment, container_format, options, codec, size, self._extradata if codec == "h264" else None
+        )
+        with self._lock:
+            self._segments.append(segment)
+        self._last_sync = time.monotonic()
+        return self._writer
+
+    def _close_segment(self):
+        writer, self._writer = self._writer, None
+        if writer is None:
+            return
+        try:
+            writer.close()
+        except Exception:
+            # 交给 _abort_segment 移出环
+            self._writer = writer
+            raise
+        self.fsyncs += 1
+        self._sync_directory()
+        self._evict()
+
+    def _abort_segment(self):
+        """写入出错的分段已不完整：移出环并删除文件，snapshot 不再复用它"""
+        writer, self._writer = self._writer, None
+        if writer is not None:
+            # 先关容器再关文件，否则 PyAV 回收容器时还会往已关闭的文件里写
+            for close in (writer.container.close, writer.file.close):
+                try:
+                    close()
+                except Exception:
+                    pass
+            with self._lock:
+                if writer.segment in self._segments:
+                    self._segments.remove(writer.segment)
+            try:
+                os.remove(writer.segment.path)
+            except OSError:
+                pass
+            self._resync = True
+
+    def _sync_directory(self):
+        # 新建、删除的目录项也要落盘；Windows 不能 open 目录，跳过
+        try:
+            fd = os.open(self.directory, os.O_RDONLY)
+        except OSError:
+            return
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+    def _evict(self):
+        """超出时长或字节上限时删除最旧的分段；最新的一段（正在写或刚关闭）和 snapshot 正在读的不删"""
+        with self._lock:
+            while True:
+                seconds = sum(s.duration for s in self._segments)
+                total = sum(s.size for s in self._segments)
+                if not (
+                    (self.max_seconds is not None and seconds > self.max_seconds)
+                    or (self.max_bytes is not None and total > self.max_bytes)
+                ):
+                    break
+                oldest = next((s for s in self._segments[:-1] if not s.pins), None)
+                if oldest is None:
+                    break
+                self._segments.remove(oldest)
+                try:
+                    os.remove(oldest.path)
+                    self.deleted += 1
+                except FileNotFoundError:
+                    pass
+        self._sync_directory()
+
+    def segments(self):
+        """当前环中的分段（最旧的在前）"""
+        with self._lock:
+            return [s.to_dict() for s in self._segments]
+
+    async def snapshot(self, seconds=60.0, path=None):
+        """
+        把最近 seconds 秒合成一个独立文件并返回路径：先关闭当前分段，再把覆盖这段时间的分段按原样复用到一起
+        （从分段开头的关键帧开始，因此可能比 seconds 多出不到一个分段）。
+        path 的扩展名决定格式（.mp4/.ts/.mkv），默认存到录像目录，H264 为 .mp4，VP8 为 .mkv
+        """
+        loop = asyncio.get_running_loop()
+        rotated = loop.create_future()
+        # 写线程跟不上（队列已满、磁盘慢）时 put 会阻塞，不能卡住事件循环上的推流
+        await loop.run_in_executor(
+            None, self._queue.put, ("rotate", lambda: loop.call_soon_threadsafe(rotated.set_result, None))
+        )
+        await rotated
+        with self._lock:
+            current = [s for s in self._segments if s.start is not None and s.frames]
+            if not current:
+                raise RuntimeError("还没有录到任何画面")
+            latest = current[-1].end
+            chosen = [s for s in current if s.end >= latest - seconds * 90000]
+            for segment in chosen:
+                segment.pins += 1
+        if path is None:
+            extension = ".mkv" if chosen[-1].codec == "vp8" else ".mp4"
+            path = os.path.join(self.directory, time.strftime("snapshot-%Y%m%d-%H%M%S") + extension)
+        try:
+            await loop.run_in_executor(None, self._remux, chosen, path)
+        finally:
+            with self._lock:
+                for segment in chosen:
+                    segment.pins -= 1
+        logger.info("已保存最近 %.0fs 的录像: %s（%d 个分段，%.1fs）", seconds, path, len(chosen),
+                    (chosen[-1].end - chosen[0].start) / 90000)
+        return path
+
+    @staticmethod
+    def _remux(segments, path):
+        """
+        逐段解复用后按写分段时相同的方式复用到 path（不解码）。mp4/mkv 分段中的 H264 是长度前缀格式，
+        先用 h264_mp4toannexb 转回 Annex-B；各格式可能把分段的时间戳平移到 0，按索引中的分段起点重新排到同一条时间线上
+        """
+        container_format, options = SNAPSHOT_FORMATS.get(os.path.splitext(path)[1].lower(), SNAPSHOT_FORMATS[".mp4"])
+        writer = None
+        origin = segments[0].start
+        try:
+            for segment in segments:
+                with av.open(segment.path) as source:
+                    stream = source.streams.video[0]
+                    codec = stream.codec_context.name
+                    extradata = stream.codec_context.extradata
+                    annexb = None
+                    if codec == "h264" and extradata and extradata[0] == 1:
+                        annexb = BitStreamFilterContext("h264_mp4toannexb", stream)
+                    first = None
+                    for packet in source.demux(stream):
+                        if packet.dts is None:
+                            continue
+                        dts = int(packet.dts * packet.time_base / RECORD_TIME_BASE)
+                        if first is None:
+                            first = dts
+                        data = b"".join(bytes(p) for p in annexb.filter(packet)) if annexb else bytes(packet)
+                        if writer is None:
+                            writer = _SegmentWriter(
+                                Segment(path, 0), container_format, options, codec, (stream.width, stream.height),
+                                h264_parameter_sets(data) if codec == "h264" else None,
+                            )
+                        writer.write(data, dts - first + segment.start - origin, packet.is_keyframe)
+        finally:
+            if writer is not None:
+                writer.close()
+
+    def stats(self):
+        with self._lock:
+            seconds = sum(s.duration for s in self._segments)
+            total = sum(s.size for s in self._segments)
+            count = len(self._segments)
+        return {
+            "segments": count,
+            "seconds": round(seconds, 1),
+            "bytes": total,
+            "frames": self.frames,
+            "dropped": self.dropped,
+            "skipped": self.skipped,
+            "queued": self._queue.qsize(),
+            "fsyncs": self.fsyncs,
+            "deleted": self.deleted,
+            "keyframe_requests": self.keyframe_requests,
+        }
+
+    def close(self):
+        """写完队列中的帧并关闭当前分段（阻塞，最多等几秒）"""
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put(None)
+        self._thread.join(timeout=5.0)
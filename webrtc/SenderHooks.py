@@ -0,0 +1,199 @@
+import logging
+import time
+
+from aiortc import RTCRtpSender
+from aiortc.codecs import h264, vpx
+from aiortc.rtp import RTCP_PSFB_APP, RtcpPsfbPacket, unpack_remb_fci
+
+logger = logging.getLogger("WHIP_Publisher")
+
+
+def on_keyframe_request(sender, callback):
+    """
+    拦截 RTCRtpSender 收到的关键帧请求（PLI）。
+    轨道返回已编码的 av.Packet 时 aiortc 不会自行处理关键帧请求，
+    需要把请求转交给真正的编码器/数据源。
+    """
+    original = sender._send_keyframe
+
+    def _send_keyframe():
+        original()
+        try:
+            callback()
+        except Exception as e:
+            logger.error("处理关键帧请求失败: %s", e)
+
+    sender._send_keyframe = _send_keyframe
+
+
+def prefer_codec(transceiver, mime_types, exclusive=False):
+    """
+    按给定顺序设置编码协商优先级（如 "video/H264" 或 ["video/H264", "video/VP8"]）。
+    exclusive=True 时只协商列出的编码，用于轨道直接输出某种编码数据的情况。
+    """
+    if isinstance(mime_types, str):
+        mime_types = [mime_types]
+    codecs = RTCRtpSender.getCapabilities(transceiver.kind).codecs
+    ordered = []
+    for mime_type in mime_types:
+        matched = [c for c in codecs if c.mimeType.lower() == mime_type.lower()]
+        if not matched:
+            raise ValueError(f"不支持的编码: {mime_type}")
+        ordered += matched
+    # 重传编码 rtx 紧随其后
+    ordered += [c for c in codecs if c.mimeType.lower().endswith("/rtx")]
+    if not exclusive:
+        ordered += [c for c in codecs if c not in ordered]
+    transceiver.setCodecPreferences(ordered)
+
+
+def on_rtcp_packet(sender, callback):
+    """在 aiortc 处理之前旁路观察 RTCRtpSender 收到的每个 RTCP 包"""
+    original = sender._handle_rtcp_packet
+
+    async def _handle_rtcp_packet(packet):
+        try:
+            callback(packet)
+        except Exception as e:
+            logger.error("处理RTCP包失败: %s", e)
+        await original(packet)
+
+    sender._handle_rtcp_packet = _handle_rtcp_packet
+
+
+def parse_remb(packet, ssrc):
+    """从 RTCP 包中解析发给指定 ssrc 的 REMB 估计码率（bps），不是 REMB 返回 None"""
+    if not isinstance(packet, RtcpPsfbPacket) or packet.fmt != RTCP_PSFB_APP:
+        return None
+    try:
+        bitrate, ssrcs = unpack_remb_fci(packet.fci)
+    except ValueError:
+        return None
+    return bitrate if ssrc in ssrcs else None
+
+
+def get_encoder(sender):
+    """取 aiortc 内部的编码器实例（第一帧之前为 None）"""
+    return getattr(sender, "_RTCRtpSender__encoder", None)
+
+
+def set_encoder_bitrate(sender, track, bitrate):
+    """
+    设置目标码率：轨道自带编码器（进程编码等）时交给轨道，
+    否则直接设置 aiortc 编码器的 target_bitrate
+    """
+    if hasattr(track, "set_bitrate"):
+        track.set_bitrate(bitrate)
+        return True
+    encoder = get_encoder(sender)
+    if encoder is not None and hasattr(encoder, "target_bitrate"):
+        encoder.target_bitrate = bitrate
+        return True
+    return False
+
+
+def time_encode(encoder, callback):
+    """给编码器的 encode 计时，callback(秒) 每帧调用一次；同一编码器可以挂多个 callback"""
+    callbacks = getattr(encoder, "_encode_callbacks", None)
+    if callbacks is None:
+        callbacks = encoder._encode_callbacks = []
+        original = encoder.encode
+
+        def encode(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return original(*args, **kwargs)
+            finally:
+                elapsed = time.perf_counter() - start
+                for cb in callbacks:
+                    cb(elapsed)
+
+        encoder.encode = encode
+    callbacks.append(callback)
+
+
+def time_encoder(sender, callback):
+    """
+    给 aiortc 内部编码器的 encode 计时，callback(秒) 每帧调用一次。
+    编码器在第一帧时才创建，尚未创建时返回 False，调用方稍后重试
+    """
+    encoder = get_encoder(sender)
+    if encoder is None:
+        return False
+    time_encode(encoder, callback)
+    return True
+
+
+def install_encoder(sender, factory):
+    """
+    替换 aiortc 在第一帧时创建的默认编码器：factory(codec) 收到协商出的 RTCRtpCodecParameters，返回编码器实例。
+    在 aiortc 自己创建之前检查，轨道输出已编码数据（av.Packet）时编码器只负责打包，同样适用
+    """
+    original = sender._next_encoded_frame
+
+    async def _next_encoded_frame(codec):
+        if get_encoder(sender) is None:
+            sender._RTCRtpSender__encoder = factory(codec)
+        return await original(codec)
+
+    sender._next_encoded_frame = _next_encoded_frame
+
+
+H264_START_CODE = b"\x00\x00\x00\x01"
+H264_IDR = 5
+
+
+def _tee_encoder(encoder, callback):
+    """挂在编码器的 _packetize 上取出本帧的完整码流，encode/pack 返回时连同时间戳交给 callback"""
+    codec = "h264" if isinstance(encoder, h264.H264Encoder) else "vp8"
+    packetize = encoder._packetize
+    pending = []
+
+    def _packetize(data, *args):
+        if codec == "h264":
+            nals = list(data)
+            if nals:
+                pending.append((H264_START_CODE + H264_START_CODE.join(nals), any(n[0] & 0x1F == H264_IDR for n in nals)))
+            return packetize(iter(nals), *args)
+        data = bytes(data)
+        if data:
+            # VP8 帧头第一个字节的最低位为 0 表示关键帧
+            pending.append((data, not data[0] & 0x01))
+        return packetize(data, *args)
+
+    def wrap(method, size_of):
+        def wrapped(data, *args, **kwargs):
+            payloads, timestamp = method(data, *args, **kwargs)
+            while pending:
+                bitstream, keyframe = pending.pop(0)
+                try:
+                    callback(codec, bitstream, timestamp, keyframe, size_of(data))
+                except Exception as e:
+                    logger.error("转存编码数据失败: %s", e)
+            return payloads, timestamp
+        return wrapped
+
+    encoder._packetize = _packetize
+    encoder.encode = wrap(encoder.encode, lambda frame: (frame.width, frame.height))
+    encoder.pack = wrap(encoder.pack, lambda packet: None)
+
+
+def tee_encoded(sender, callback):
+    """
+    把 sender 发出的每一帧视频码流（不重新编码）交给 callback(codec, data, timestamp, keyframe, size)：
+    codec 为 "h264"（data 为 Annex-B）或 "vp8"，timestamp 为 90kHz，size 为 (宽, 高)，打包已编码数据时为 None。
+    callback 在编码线程（或打包所在的事件循环）中调用，应尽快返回。
+    编码器在第一帧时才创建，因此从第二帧开始转存，调用方需要自己等待关键帧
+    """
+    original = sender._next_encoded_frame
+    teed = []
+
+    async def _next_encoded_frame(codec):
+        result = await original(codec)
+        encoder = get_encoder(sender)
+        if encoder is not None and encoder not in teed and isinstance(encoder, (h264.H264Encoder, vpx.Vp8Encoder)):
+            _tee_encoder(encoder, callback)
+            teed[:] = [encoder]
+        return result
+
+    sender._next_encoded_frame = _next_encoded_frame
@@ -0,0 +1,210 @@
+"""
+共享内存帧环形缓冲：本机其他进程（如视觉算法进程）把 BGR 帧直接写进共享内存，推流端按 "shm:<name>" 读取。
+
+写端（零拷贝：直接在共享内存的槽位上写，不经过设备或管道）：
+
+    ring = SharedFrameRing.create("robot-cam", 1280, 720)
+    buf = ring.acquire()                 # 下一个槽位的 numpy 视图
+    cv2.resize(image, (1280, 720), dst=buf)
+    ring.publish()
+
+读端只关心最新的一帧，落后时直接跳到最新帧。每个槽位带序号，写端开始写时先把槽位序号清零、写完再填上，
+读端拷贝前后各核对一次序号（seqlock），被写端追上覆盖的帧会丢弃重读，不会读到半帧。
+时间戳使用 time.monotonic_ns（同一台机器上各进程共用）。
+"""
+import logging
+import time
+from multiprocessing import resource_tracker, shared_memory
+
+import cv2
+import numpy as np
+
+logger = logging.getLogger("WHIP_Publisher")
+
+RING_MAGIC = 0x474E495246  # "FRING"
+# 头部 8 个 int64：魔数、宽、高、通道数、槽位数、最新序号、保留
+HEADER_FIELDS = 8
+MAGIC, WIDTH, HEIGHT, CHANNELS, SLOTS, WRITE_SEQ = range(6)
+# 每个槽位的元数据：序号、时间戳（ns）
+SLOT_FIELDS = 2
+ALIGN = 64
+
+
+def _align(size):
+    return (size + ALIGN - 1) // ALIGN * ALIGN
+
+
+class SharedFrameRing:
+    """slots 个同样大小的帧槽位，序号从 1 开始，第 n 帧写在 n % slots 号槽位"""
+
+    def __init__(self, shm, owner=False):
+        self.shm = shm
+        self.owner = owner
+        self._header = np.ndarray((HEADER_FIELDS,), np.int64, buffer=shm.buf)
+        if int(self._header[MAGIC]) != RING_MAGIC:
+            raise ValueError(f"共享内存 {shm.name} 不是帧环形缓冲")
+        self.width = int(self._header[WIDTH])
+        self.height = int(self._header[HEIGHT])
+        self.channels = int(self._header[CHANNELS])
+        self.slots = int(self._header[SLOTS])
+        self.shape = (self.height, self.width, self.channels)
+        self._meta = np.ndarray((self.slots, SLOT_FIELDS), np.int64, buffer=shm.buf, offset=HEADER_FIELDS * 8)
+        data_offset = _align((HEADER_FIELDS + self.slots * SLOT_FIELDS) * 8)
+        frame_size = self.width * self.height * self.channels
+        self._frames = [
+            np.ndarray(self.shape, np.uint8, buffer=shm.buf, offset=data_offset + i * _align(frame_size))
+            for i in range(self.slots)
+        ]
+        self._pending = None
+
+    @classmethod
+    def create(cls, name, width, height, channels=3, slots=4):
+        """写端创建环形缓冲，关闭时删除共享内存"""
+        frame_size = _align(width * height * channels)
+        size = _align((HEADER_FIELDS + slots * SLOT_FIELDS) * 8) + frame_size * slots
+        shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+        header = np.ndarray((HEADER_FIELDS,), np.int64, buffer=shm.buf)
+        header[:] = 0
+        header[WIDTH], header[HEIGHT], header[CHANNELS], header[SLOTS] = width, height, channels, slots
+        header[MAGIC] = RING_MAGIC
+        del header
+        logger.info("共享内存帧缓冲已创建: %s (%dx%dx%d, %d 槽位)", name, width, height, channels, slots)
+        return cls(shm, owner=True)
+
+    @classmethod
+    def attach(cls, name):
+        """读端按名称打开写端创建好的环形缓冲，不存在时抛出 FileNotFoundError"""
+        shm = shared_memory.SharedMemory(name=name)
+        # 只读端不负责删除：否则本进程退出时 resource_tracker 会把写端的共享内存一起删掉
+        resource_tracker.unregister(shm._name, "shared_memory")
+        return cls(shm)
+
+    @property
+    def name(self):
+        return self.shm.name
+
+    @property
+    def write_seq(self):
+        return int(self._header[WRITE_SEQ])
+
+    # 写端
+
+    def acquire(self):
+        """返回下一个槽位的可写视图，写完后调用 publish"""
+        seq = self.write_seq + 1
+        slot = seq % self.slots
+        # 先作废槽位序号，正在读这个槽位的读端会发现序号不一致而丢弃
+        self._meta[slot, 0] = 0
+        self._pending = seq
+        return self._frames[slot]
+
+    def publish(self, timestamp_ns=None):
+        """发布 acquire 得到的槽位，timestamp_ns 默认为当前 time.monotonic_ns()"""
+        seq, self._pending = self._pending, None
+        if seq is None:
+            raise RuntimeError("publish 之前需要先 acquire")
+        slot = seq % self.slots
+        self._meta[slot, 1] = time.monotonic_ns() if timestamp_ns is None else timestamp_ns
+        self._meta[slot, 0] = seq
+        self._header[WRITE_SEQ] = seq
+        return seq
+
+    def write(self, image, timestamp_ns=None):
+        """拷贝一帧进环形缓冲，尺寸不同时缩放"""
+        buf = self.acquire()
+        if image.shape == buf.shape:
+            np.copyto(buf, image)
+        else:
+            cv2.resize(image, (self.width, self.height), dst=buf, interpolation=cv2.INTER_AREA)
+        return self.publish(timestamp_ns)
+
+    # 读端
+
+    def read_latest(self, out, after=0):
+        """
+        把最新一帧拷贝到 out，返回 (序号, 时间戳 ns)；
+        没有比 after 更新的帧、或拷贝期间被写端覆盖时返回 (None, None)
+        """
+        seq = self.write_seq
+        if seq <= after:
+            return None, None
+        slot = seq % self.slots
+        meta = self._meta[slot]
+        if meta[0] != seq:
+            return None, None
+        timestamp = int(meta[1])
+        np.copyto(out, self._frames[slot])
+        if meta[0] != seq:
+            return None, None
+        return seq, timestamp
+
+    def close(self):
+        self._header = self._meta = None
+        self._frames = []
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+
+class SharedMemoryCapture:
+    """
+    cv2.VideoCapture 的替身，读取 SharedFrameRing：read 等待比上次更新的帧，拷贝一次到调用方的缓冲区
+    （与 cv2 读摄像头时的那次拷贝相当，之后的颜色转换与其他视频源一样）。
+    分辨率由写端决定，set 只记录请求值；timeout 秒内没有新帧时 read 返回失败
+    """
+
+    POLL_INTERVAL = 0.001
+
+    def __init__(self, name, timeout=2.0):
+        self.name = name
+        self.timeout = timeout
+        self.ring = None
+        self.fps = 0
+        self.last_seq = 0
+        self.last_timestamp_ns = None
+        self.skipped = 0
+        try:
+            self.ring = SharedFrameRing.attach(name)
+        except (FileNotFoundError, ValueError) as e:
+            logger.error("共享内存帧缓冲 %s 打开失败: %s", name, e)
+
+    def isOpened(self):
+        return self.ring is not None
+
+    def set(self, prop, value):
+        if prop == cv2.CAP_PROP_FPS:
+            self.fps = value
+            return True
+        return False
+
+    def get(self, prop):
+        if self.ring is None:
+            return 0
+        return {
+            cv2.CAP_PROP_FRAME_WIDTH: self.ring.width,
+            cv2.CAP_PROP_FRAME_HEIGHT: self.ring.height,
+            cv2.CAP_PROP_FPS: self.fps,
+        }.get(prop, 0)
+
+    def read(self, image=None):
+        if self.ring is None:
+            return False, None
+        if image is None or image.shape != self.ring.shape:
+            image = np.empty(self.ring.shape, np.uint8)
+        deadline = time.monotonic() + self.timeout
+        while True:
+            seq, timestamp = self.ring.read_latest(image, self.last_seq)
+            if seq is not None:
+                if self.last_seq:
+                    self.skipped += seq - self.last_seq - 1
+                self.last_seq = seq
+                self.last_timestamp_ns = timestamp
+                return True, image
+            if time.monotonic() >= deadline:
+                return False, None
+            time.sleep(self.POLL_INTERVAL)
+
+    def release(self):
+        if self.ring is not None:
+            self.ring.close()
+            self.ring = None
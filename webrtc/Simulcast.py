@@ -0,0 +1,416 @@
+"""
+Simulcast 推流：一次 WHIP 会话同时发送同一画面的多个分辨率/码率层（按 RID 区分，如 h/m/l），
+live777 按订阅者的网络情况转发其中一层，弱网订阅者拿到低层，推流端不必为每档画质各开一路会话。
+
+    simulcast = Simulcast(0, 1280, 720, 30, layers=[
+        {"rid": "h", "bitrate": 1_500_000},
+        {"rid": "m", "scale_down": 2, "bitrate": 500_000},
+        {"rid": "l", "scale_down": 4, "bitrate": 150_000, "fps": 15},
+    ])
+    sender = simulcast.attach(pc)                        # 在 createOffer/setLocalDescription 之后
+    session = await whip_client.publish(stream_id, simulcast.munge_offer(offer_sdp))
+    simulcast.accept_answer(session.answer_sdp)          # 在 setRemoteDescription 之前
+
+aiortc 不支持 simulcast（没有 sendEncodings，offer 里也不会出现 a=rid/a=simulcast），这里的做法：
+- 各层轨道来自同一个 FrameFanOut：采集和 I420 转换只做一次，再逐级缩小到各层尺寸
+- 第一层挂在已协商的收发器上，其余层是同一 DTLS 传输上额外的 RTCRtpSender（各自的 SSRC 和编码器），
+  随第一层一起启动，RTP 包都带上同一个 mid 和各自的 rtp-stream-id 头扩展
+- offer 中补上 rid 头扩展、a=rid 和 a=simulcast:send，去掉 a=ssrc（服务器按 mid+rid 识别各层）
+  和 RTX（aiortc 的 RTX 无法按层声明，丢包重传改为直接重发原包）
+- 各层码率固定为配置值：拥塞时由服务器给订阅者换到低层，而不是推流端降码率（不使用 AdaptiveBitrate）
+- 没有订阅者需要的层可以暂停：不再缩放、不再编码，恢复时先发关键帧
+"""
+import asyncio
+import dataclasses
+import logging
+import re
+import time
+from dataclasses import dataclass
+from typing import Optional
+
+from aiortc import RTCRtpSender
+from aiortc.rtp import HeaderExtensionsMap
+from aiortc.rtcrtpparameters import RTCRtpHeaderExtensionParameters, RTCRtpParameters
+
+from .EncoderProfile import EncoderProfile, create_profiled_encoder
+from .FrameFanOut import FrameFanOut
+from .PublishSupervisor import SessionTrack
+from .SenderHooks import install_encoder, time_encode
+
+logger = logging.getLogger("WHIP_Publisher")
+
+RID_URI = "urn:ietf:params:rtp-hdrext:sdes:rtp-stream-id"
+RID_PATTERN = re.compile(r"^[A-Za-z0-9_-]{1,16}$")
+
+
+@dataclass(frozen=True)
+class SimulcastLayer:
+    """
+    一层编码：scale_down 为相对采集分辨率的缩小倍数，bitrate 为固定的目标码率（bps），
+    fps 为空时与采集帧率相同
+    """
+    rid: str
+    scale_down: float = 1.0
+    bitrate: int = 1_000_000
+    fps: Optional[int] = None
+
+    def size(self, width, height):
+        return int(width / self.scale_down), int(height / self.scale_down)
+
+
+DEFAULT_LAYERS = (
+    SimulcastLayer("h", 1.0, 1_200_000),
+    SimulcastLayer("m", 2.0, 400_000),
+    SimulcastLayer("l", 4.0, 150_000, fps=15),
+)
+
+
+def parse_layers(layers):
+    """layers 为 None（DEFAULT_LAYERS），或 SimulcastLayer/字典（键同 SimulcastLayer 的字段）的列表，第一层为最高层"""
+    if layers is None:
+        return DEFAULT_LAYERS
+    parsed = []
+    fields = {f.name for f in dataclasses.fields(SimulcastLayer)}
+    for layer in layers:
+        if isinstance(layer, dict):
+            unknown = set(layer) - fields
+            if unknown:
+                raise ValueError(f"未知的 simulcast 配置项: {', '.join(sorted(unknown))}")
+            layer = SimulcastLayer(**layer)
+        if not RID_PATTERN.match(layer.rid):
+            raise ValueError(f"RID 只能包含字母、数字、- 和 _: {layer.rid!r}")
+        if layer.scale_down < 1:
+            raise ValueError(f"scale_down 不能小于 1: {layer.rid}")
+        parsed.append(layer)
+    rids = [layer.rid for layer in parsed]
+    if not parsed or len(set(rids)) != len(rids):
+        raise ValueError(f"simulcast 至少需要一层且 RID 不能重复: {rids}")
+    return tuple(parsed)
+
+
+def _split_sections(sdp):
+    """按 m= 行切分 SDP，返回行列表的列表（第一段为会话级）"""
+    sections = [[]]
+    for line in sdp.splitlines():
+        if line.startswith("m="):
+            sections.append([])
+        if line:
+            sections[-1].append(line)
+    return sections
+
+
+def _join_sections(sections):
+    return "".join(line + "\r\n" for section in sections for line in section)
+
+
+def _video_section(sections):
+    for section in sections[1:]:
+        if section[0].startswith("m=video"):
+            return section
+    raise ValueError("SDP 中没有视频 m= 段")
+
+
+def munge_offer(sdp, rids):
+    """给 aiortc 生成的 offer 的视频段加上 rid 头扩展、a=rid:<rid> send 和 a=simulcast:send，去掉 a=ssrc 和 RTX"""
+    sections = _split_sections(sdp)
+    section = _video_section(sections)
+    rtx = {
+        match.group(1) for match in (re.match(r"a=rtpmap:(\d+) rtx/", line) for line in section) if match
+    }
+    used = {int(match.group(1)) for match in (re.match(r"a=extmap:(\d+)", line) for line in section) if match}
+    rid_id = min(set(range(1, 15)) - used)
+
+    munged = []
+    for line in section:
+        if line.startswith("m=video"):
+            fields = line.split(" ")
+            line = " ".join(fields[:3] + [pt for pt in fields[3:] if pt not in rtx])
+        elif line.startswith(("a=ssrc:", "a=ssrc-group:")):
+            continue
+        elif any(line.startswith(f"{prefix}:{pt} ") for prefix in ("a=rtpmap", "a=fmtp", "a=rtcp-fb") for pt in rtx):
+            continue
+        munged.append(line)
+    # 头扩展放在已有 extmap 之后，rid/simulcast 放在段尾
+    last_extmap = max((i for i, line in enumerate(munged) if line.startswith("a=extmap:")), default=len(munged) - 1)
+    munged.insert(last_extmap + 1, f"a=extmap:{rid_id} {RID_URI}")
+    munged += [f"a=rid:{rid} send" for rid in rids]
+    munged.append(f"a=simulcast:send {';'.join(rids)}")
+    section[:] = munged
+    return _join_sections(sections)
+
+
+def parse_simulcast(sdp, direction):
+    """
+    读取视频段的 a=simulcast:<direction>（"send" 或 "recv"）和 rid 头扩展 id，返回 (rid 元组, 扩展 id)；
+    没有 simulcast 或没有 rid 头扩展时返回 ((), None)。暂停标记 "~" 和备选（逗号后）忽略
+    """
+    try:
+        section = _video_section(_split_sections(sdp))
+    except ValueError:
+        return (), None
+    rids, rid_id = (), None
+    for line in section:
+        match = re.match(r"a=extmap:(\d+)(?:/\w+)? (\S+)", line)
+        if match and match.group(2) == RID_URI:
+            rid_id = int(match.group(1))
+        elif line.startswith("a=simulcast:"):
+            fields = line[len("a=simulcast:"):].split()
+            for key, value in zip(fields[::2], fields[1::2]):
+                if key == direction:
+                    rids = tuple(item.split(",")[0].lstrip("~") for item in value.split(";"))
+    if not rids or rid_id is None:
+        return (), None
+    return rids, rid_id
+
+
+def munge_answer(sdp, rids, rid_id):
+    """服务端（WhipStandIn）接受 simulcast：在 answer 的视频段加上 rid 头扩展、a=rid:<rid> recv 和 a=simulcast:recv"""
+    sections = _split_sections(sdp)
+    section = _video_section(sections)
+    section.append(f"a=extmap:{rid_id} {RID_URI}")
+    section += [f"a=rid:{rid} recv" for rid in rids]
+    section.append(f"a=simulcast:recv {';'.join(rids)}")
+    return _join_sections(sections)
+
+
+def rid_extension(rid_id):
+    """只含 rid 头扩展的 RTCRtpParameters，用于配置 HeaderExtensionsMap"""
+    return RTCRtpParameters(headerExtensions=[RTCRtpHeaderExtensionParameters(id=rid_id, uri=RID_URI)])
+
+
+class RidHeaderExtensionsMap(HeaderExtensionsMap):
+    """aiortc 发送时只填 mid 和 abs-send-time，这里给 sender 的每个 RTP 包（含重传）再填上本层的 rtp-stream-id"""
+
+    def __init__(self, rid):
+        super().__init__()
+        self.rid = rid
+
+    def set(self, values):
+        values.rtp_stream_id = self.rid
+        return super().set(values)
+
+
+class LayerCounter:
+    """一层的编码计数，report 返回上次以来的帧数和编码耗时并清零"""
+
+    def __init__(self):
+        self.frames = 0
+        self.encode_time = 0.0
+
+    def record(self, seconds):
+        # 在 aiortc 的编码线程中调用，只做加法
+        self.frames += 1
+        self.encode_time += seconds
+
+    def report(self):
+        frames, encode_time = self.frames, self.encode_time
+        self.frames, self.encode_time = 0, 0.0
+        return frames, encode_time
+
+
+class Simulcast:
+    """
+    一份采集、多层编码。source/width/height/fps 为采集参数（同 CameraStreamTrack），layers 见 parse_layers；
+    profile 为各层共用的 EncoderProfile（码率按层覆盖），always_on 为始终发送、不随需求暂停的层（默认第一层）。
+    tracks 跨重连保持运行，senders 为当前连接上各层的 RTCRtpSender
+    """
+
+    def __init__(self, source=0, width=640, height=480, fps=30, layers=None, profile=None, always_on=None,
+                 clock=None):
+        self.layers = parse_layers(layers)
+        self.profile = profile
+        self.always_on = always_on or self.layers[0].rid
+        self.fanout = FrameFanOut(source, width, height, fps, clock=clock)
+        self.tracks = {}
+        try:
+            for layer in self.layers:
+                self.tracks[layer.rid] = self.fanout.track(*layer.size(width, height), fps=layer.fps or fps)
+        except Exception:
+            self.stop()
+            raise
+        self.senders = {}
+        self.negotiated = ()
+        self.demand = None
+        self._rid_id = None
+        self.counters = {layer.rid: LayerCounter() for layer in self.layers}
+        self._bytes = {}
+        self._stats_at = time.monotonic()
+        logger.info("simulcast 各层: %s", ", ".join(
+            f"{layer.rid} {track.size[0]}x{track.size[1]}@{track.fps} {layer.bitrate // 1000}kbps"
+            for layer, track in zip(self.layers, self.tracks.values())
+        ))
+
+    @property
+    def primary(self):
+        """第一层（最高层）的轨道，不带 RID 协商时只发送这一层"""
+        return self.tracks[self.layers[0].rid]
+
+    @property
+    def rids(self):
+        return tuple(layer.rid for layer in self.layers)
+
+    def layer_profile(self, layer):
+        """各层的编码配置档：码率固定为该层的 bitrate（上下限也设为它，REMB 不会改动）"""
+        base = self.profile or EncoderProfile("simulcast")
+        return dataclasses.replace(base, bitrate=layer.bitrate, min_bitrate=layer.bitrate, max_bitrate=layer.bitrate)
+
+    def _prepare(self, sender, layer):
+        counter = self.counters[layer.rid]
+        profile = self.layer_profile(layer)
+
+        def factory(codec):
+            encoder = create_profiled_encoder(codec, profile)
+            time_encode(encoder, counter.record)
+            return encoder
+
+        install_encoder(sender, factory)
+        sender._RTCRtpSender__rtp_header_extensions_map = RidHeaderExtensionsMap(layer.rid)
+
+    def attach(self, pc, track=None):
+        """
+        把各层加入已完成 setLocalDescription 的 pc，返回第一层的 sender（即收发器的 sender）。
+        track 为第一层轨道（重连时传入 SessionTrack 代理），其余层总是经 SessionTrack 加入，
+        连接关闭时不会停掉共享的采集
+        """
+        first = self.layers[0]
+        primary = pc.addTrack(track or SessionTrack(self.primary))
+        senders = {first.rid: primary}
+        for layer in self.layers[1:]:
+            senders[layer.rid] = RTCRtpSender(SessionTrack(self.tracks[layer.rid]), primary.transport)
+        for layer in self.layers:
+            self._prepare(senders[layer.rid], layer)
+        self.senders = senders
+        self.negotiated = ()
+
+        send, stop = primary.send, primary.stop
+
+        async def send_layers(parameters):
+            # aiortc 按协商结果启动第一层时，其余层用同样的编码和 mid 一起启动
+            rid_id = self._rid_id
+            for rid, sender in senders.items():
+                if rid_id is not None and rid in self.negotiated:
+                    sender._RTCRtpSender__rtp_header_extensions_map.configure(rid_extension(rid_id))
+            await send(parameters)
+            for rid, sender in senders.items():
+                if sender is not primary and rid in self.negotiated:
+                    await sender.send(parameters)
+
+        async def stop_layers():
+            for sender in senders.values():
+                if sender is not primary:
+                    await sender.stop()
+            await stop()
+
+        primary.send = send_layers
+        primary.stop = stop_layers
+        return primary
+
+    def munge_offer(self, sdp):
+        return munge_offer(sdp, self.rids)
+
+    def accept_answer(self, answer_sdp):
+        """按 answer 中服务器接受的 RID 决定实际发送的层，服务器不支持 simulcast 时只发送第一层"""
+        accepted, self._rid_id = parse_simulcast(answer_sdp, "recv")
+        self.negotiated = tuple(rid for rid in self.rids if rid in accepted)
+        if not self.negotiated:
+            logger.warning("服务器未接受 simulcast，只发送第一层（不带 RID）")
+        elif self.negotiated != self.rids:
+            logger.warning("服务器只接受了部分 simulcast 层: %s", ", ".join(self.negotiated))
+        # 未协商的层不发送，也不再为它缩放；重连后按最近一次的订阅需求恢复
+        sending = self.negotiated or self.rids[:1]
+        for rid, track in self.tracks.items():
+            if rid not in sending:
+                track.pause()
+            elif self.demand is None or rid in self.demand or rid == self.always_on:
+                track.resume()
+            else:
+                track.pause()
+        return self.negotiated
+
+    def set_active(self, rid, active):
+        """暂停或恢复一层，恢复时请求关键帧（接收端需要从关键帧开始解码这一层）"""
+        track = self.tracks[rid]
+        if active == (not track.paused):
+            return
+        if active:
+            track.resume()
+            sender = self.senders.get(rid)
+            if sender is not None:
+                sender._send_keyframe()
+        else:
+            track.pause()
+        logger.info("simulcast 层 %s 已%s", rid, "恢复" if active else "暂停")
+
+    def set_demand(self, rids):
+        """只发送有人订阅的层（rids）和 always_on 层，其余已协商的层暂停"""
+        self.demand = set(rids)
+        for rid in self.negotiated:
+            self.set_active(rid, rid in rids or rid == self.always_on)
+
+    async def watch_demand(self, fetch, interval=2.0):
+        """每 interval 秒调用 fetch() 取得订阅者需要的 RID 集合，据此暂停/恢复各层（返回 None 时不做改动）"""
+        while True:
+            try:
+                rids = await fetch()
+                if rids is not None:
+                    self.set_demand(rids)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.debug("获取 simulcast 订阅需求失败: %s", e)
+            await asyncio.sleep(interval)
+
+    async def stats(self):
+        """各层自上次调用以来的编码帧率、平均编码耗时（ms）和发送码率（kbps，getStats 的 bytesSent 增量）"""
+        now = time.monotonic()
+        elapsed = max(now - self._stats_at, 1e-6)
+        self._stats_at = now
+        result = {}
+        for layer in self.layers:
+            rid = layer.rid
+            track = self.tracks[rid]
+            frames, encode_time = self.counters[rid].report()
+            sender = self.senders.get(rid)
+            sent = 0
+            if sender is not None:
+                bytes_sent = sum(
+                    s.bytesSent for s in (await sender.getStats()).values() if s.type == "outbound-rtp"
+                )
+                last_sender, last_bytes = self._bytes.get(rid, (None, 0))
+                # 重连后是新的 sender，计数从 0 开始
+                sent = bytes_sent - last_bytes if last_sender is sender else bytes_sent
+                self._bytes[rid] = (sender, bytes_sent)
+            result[rid] = {
+                "size": f"{track.size[0]}x{track.size[1]}",
+                "active": not track.paused,
+                "fps": round(frames / elapsed, 1),
+                "encode_ms": round(encode_time / frames * 1000, 2) if frames else 0.0,
+                "kbps": round(sent * 8 / elapsed / 1000, 1),
+                "target_kbps": layer.bitrate // 1000,
+            }
+        return result
+
+    def stop(self):
+        for track in self.tracks.values():
+            track.stop()
+
+
+def subscriber_demand(whip_client, stream_id, rids):
+    """
+    watch_demand 的 fetch：从服务器的流列表读取 stream_id 的拉流会话，返回它们正在接收的层。
+    会话带 "layer" 字段（WhipStandIn）时按该字段；不带层信息时视为需要全部层；没有拉流会话时返回空集合
+    """
+    async def fetch():
+        for stream in await whip_client.streams():
+            if stream.get("id") != stream_id:
+                continue
+            wanted = set()
+            for session in stream.get("subscribe", {}).get("sessions", []):
+                layer = session.get("layer")
+                if layer is None:
+                    return set(rids)
+                wanted.add(layer)
+            return wanted
+        return None
+
+    return fetch
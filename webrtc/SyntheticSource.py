@@ -0,0 +1,153 @@
+"""
+合成视频源：不需要摄像头的 cv2.VideoCapture 替身，画面是缓慢平移的纹理，
+左上方嵌入采集时刻（墙上时钟毫秒）的条码。接收端解码后再解出条码，
+当前时间减去条码时间即为端到端（glass-to-glass）延迟；同一台机器上的多个进程共用墙上时钟。
+
+source 写作 "synthetic" 即可用于 CameraStreamTrack、ProcessEncodedTrack 和 StreamSpec（见 FrameSource）。
+"""
+import time
+
+import cv2
+import numpy as np
+
+from .FramePacer import FramePacer
+
+SYNTHETIC_SOURCE = "synthetic"
+
+# 40 位毫秒时间戳 + 8 位校验，排成 2 行 x 24 列的黑白块
+STAMP_BITS = 40
+STAMP_COLUMNS = 24
+STAMP_ROWS = 2
+STAMP_MASK = (1 << STAMP_BITS) - 1
+STAMP_BLACK = 16
+STAMP_WHITE = 235
+
+
+def _checksum(value):
+    return (sum(value.to_bytes(5, "big")) & 0xFF) ^ 0xA5
+
+
+def _stamp_geometry(width, height):
+    block_w = max(width // STAMP_COLUMNS, 4)
+    block_h = max(height // 24, 8)
+    return block_w, block_h
+
+
+def stamp_time(image, ms=None):
+    """在 BGR 图像顶部写入毫秒时间戳条码，ms 默认为当前墙上时钟"""
+    if ms is None:
+        ms = time.time_ns() // 1_000_000
+    value = ms & STAMP_MASK
+    bits = (value << 8) | _checksum(value)
+    height, width = image.shape[:2]
+    block_w, block_h = _stamp_geometry(width, height)
+    for i in range(STAMP_ROWS * STAMP_COLUMNS):
+        row, col = divmod(i, STAMP_COLUMNS)
+        bit = (bits >> (STAMP_ROWS * STAMP_COLUMNS - 1 - i)) & 1
+        image[row * block_h:(row + 1) * block_h, col * block_w:(col + 1) * block_w] = (
+            STAMP_WHITE if bit else STAMP_BLACK
+        )
+    return ms
+
+
+def read_stamp(luma):
+    """
+    从亮度平面（二维数组，解码后 I420 的 Y 平面即可）读出时间戳，
+    返回 40 位毫秒值，校验失败（没有条码或压缩损坏）返回 None
+    """
+    height, width = luma.shape[:2]
+    block_w, block_h = _stamp_geometry(width, height)
+    # 每块只取中心区域，避开块边缘的压缩振铃
+    y0, y1 = block_h // 4, block_h - block_h // 4
+    x0, x1 = block_w // 4, block_w - block_w // 4
+    bits = 0
+    for i in range(STAMP_ROWS * STAMP_COLUMNS):
+        row, col = divmod(i, STAMP_COLUMNS)
+        block = luma[row * block_h + y0:row * block_h + y1, col * block_w + x0:col * block_w + x1]
+        bits = (bits << 1) | (1 if block.mean() > 128 else 0)
+    value, check = bits >> 8, bits & 0xFF
+    if _checksum(value) != check:
+        return None
+    return value
+
+
+def stamp_latency_ms(stamp, now_ms=None):
+    """条码时间戳到现在的毫秒数（处理 40 位回绕）"""
+    if now_ms is None:
+        now_ms = time.time_ns() // 1_000_000
+    return (now_ms - stamp) & STAMP_MASK
+
+
+def frame_luma(frame):
+    """av.VideoFrame（yuv420p）的 Y 平面视图，不拷贝"""
+    plane = frame.planes[0]
+    data = np.frombuffer(plane, np.uint8).reshape(plane.height, plane.line_size)
+    return data[:, :frame.width]
+
+
+class SyntheticCapture:
+    """
+    cv2.VideoCapture 的替身：支持 isOpened/set/get/read(image=...)/release，
+    read 按 fps 的绝对节拍阻塞（模拟摄像头），返回带时间戳条码的 BGR 帧
+    """
+
+    def __init__(self, width=640, height=480, fps=30, seed=0):
+        self.width = width
+        self.height = height
+        self.fps = fps
+        self.seed = seed
+        self.frame_index = 0
+        self.last_stamp = None
+        self._pacer = FramePacer(fps)
+        self._texture = None
+        self._opened = True
+
+    def _build_texture(self):
+        # 模糊噪声纹理，宽度是画面的两倍，逐帧平移产生运动
+        rng = np.random.default_rng(self.seed)
+        noise = rng.integers(0, 256, (self.height, self.width * 2, 3), dtype=np.uint8)
+        self._texture = cv2.GaussianBlur(noise, (0, 0), 3)
+
+    def isOpened(self):
+        return self._opened
+
+    def set(self, prop, value):
+        if prop == cv2.CAP_PROP_FRAME_WIDTH:
+            self.width = int(value)
+        elif prop == cv2.CAP_PROP_FRAME_HEIGHT:
+            self.height = int(value)
+        elif prop == cv2.CAP_PROP_FPS:
+            self.fps = value
+            self._pacer.set_fps(value)
+        else:
+            return False
+        self._texture = None
+        return True
+
+    def get(self, prop):
+        return {
+            cv2.CAP_PROP_FRAME_WIDTH: self.width,
+            cv2.CAP_PROP_FRAME_HEIGHT: self.height,
+            cv2.CAP_PROP_FPS: self.fps,
+        }.get(prop, 0)
+
+    def read(self, image=None):
+        if not self._opened:
+            return False, None
+        if self._texture is None or self._texture.shape[0] != self.height:
+            self._build_texture()
+        self._pacer.wait_blocking()
+
+        offset = (self.frame_index * 4) % self.width
+        view = self._texture[:, offset:offset + self.width]
+        if image is None or image.shape != view.shape:
+            image = view.copy()
+        else:
+            np.copyto(image, view)
+        self.frame_index += 1
+        self.last_stamp = stamp_time(image)
+        return True, image
+
+    def release(self):
+        self._opened = False
+
@@ -0,0 +1,206 @@
+"""
+WHIP trickle ICE（RFC 8840 / WHIP PATCH）：
+offer 只带 host 候选立即 POST，STUN/TURN 候选收集完成后再用 PATCH 发到会话 Location。
+
+aiortc/aioice 没有 trickle 接口，这里在 setLocalDescription 之前临时摘掉 ICE 连接上的
+STUN/TURN 配置，让 aiortc 只收集 host 候选；之后用 aioice 的同一套函数补收集，
+把新候选登记到 aioice 连接中（relay 候选会和已知的远端候选配对参与连通性检查）。
+"""
+import asyncio
+import logging
+import time
+
+from aioice import turn
+from aioice.candidate import Candidate, candidate_foundation, candidate_priority
+from aioice.ice import CandidatePair, StunProtocol, server_reflexive_candidate
+from aiortc.rtcicetransport import candidate_from_aioice
+from aiortc.sdp import candidate_to_sdp
+
+logger = logging.getLogger("WHIP_Publisher")
+
+TRICKLE_CONTENT_TYPE = "application/trickle-ice-sdpfrag"
+
+
+def build_sdpfrag(ice_ufrag, ice_pwd, media, end_of_candidates=False):
+    """
+    生成 trickle-ice-sdpfrag 正文，media 为 [(mid, [RTCIceCandidate, ...]), ...]，
+    m 行按 RFC 8840 使用占位值，只用 a=mid 标识对应的媒体
+    """
+    lines = [f"a=ice-ufrag:{ice_ufrag}", f"a=ice-pwd:{ice_pwd}"]
+    for mid, candidates in media:
+        lines.append("m=audio 9 RTP/AVP 0")
+        lines.append(f"a=mid:{mid}")
+        lines += [f"a=candidate:{candidate_to_sdp(c)}" for c in candidates]
+        if end_of_candidates:
+            lines.append("a=end-of-candidates")
+    return "\r\n".join(lines) + "\r\n"
+
+
+def parse_sdpfrag(body):
+    """解析 sdpfrag，返回 (ufrag, pwd, [(mid, candidate_sdp 或 None 表示结束), ...])"""
+    ufrag = pwd = None
+    mid = None
+    entries = []
+    for line in body.splitlines():
+        line = line.strip()
+        if line.startswith("a=ice-ufrag:"):
+            ufrag = line.split(":", 1)[1]
+        elif line.startswith("a=ice-pwd:"):
+            pwd = line.split(":", 1)[1]
+        elif line.startswith("a=mid:"):
+            mid = line.split(":", 1)[1]
+        elif line.startswith("a=candidate:"):
+            entries.append((mid, line.split(":", 1)[1]))
+        elif line == "a=end-of-candidates":
+            entries.append((mid, None))
+    return ufrag, pwd, entries
+
+
+def mark_trickle_offer(sdp):
+    """offer 中去掉 end-of-candidates，并声明 ice-options:trickle"""
+    lines = [line for line in sdp.splitlines() if line != "a=end-of-candidates"]
+    for i, line in enumerate(lines):
+        if line.startswith("t="):
+            lines.insert(i + 1, "a=ice-options:trickle")
+            break
+    return "\r\n".join(lines) + "\r\n"
+
+
+class _IceServers:
+    """从 aioice 连接上摘下来的 STUN/TURN 配置"""
+
+    FIELDS = ("stun_server", "turn_server", "turn_username", "turn_password", "turn_ssl", "turn_transport")
+
+    def __init__(self, connection):
+        for name in self.FIELDS:
+            setattr(self, name, getattr(connection, name, None))
+        connection.stun_server = None
+        connection.turn_server = None
+
+    def __bool__(self):
+        return bool(self.stun_server or self.turn_server)
+
+
+class TrickleGatherer:
+    """
+    一个 PeerConnection 的 trickle 收集器。用法：
+
+        trickle = TrickleGatherer(pc)          # 在 setLocalDescription 之前
+        await pc.setLocalDescription(await pc.createOffer())
+        session = await whip_client.publish(stream_id, trickle.offer_sdp())
+        await pc.setRemoteDescription(...)
+        await trickle.trickle(whip_client, session)
+    """
+
+    def __init__(self, pc, timeout=5):
+        self.pc = pc
+        self.timeout = timeout
+        self.candidates_sent = 0
+        self.gather_ms = None
+        self.supported = None
+        self._gatherers = []
+        seen = set()
+        for transceiver in pc.getTransceivers():
+            gatherer = transceiver.sender.transport.transport.iceGatherer
+            if id(gatherer) in seen:
+                continue
+            seen.add(id(gatherer))
+            self._gatherers.append((transceiver, gatherer, _IceServers(gatherer._connection)))
+
+    @property
+    def has_late_candidates(self):
+        return any(servers for _, _, servers in self._gatherers)
+
+    def offer_sdp(self):
+        return mark_trickle_offer(self.pc.localDescription.sdp)
+
+    async def _gather_srflx(self, connection, servers):
+        protocols = [
+            p for p in connection._protocols
+            if p.local_candidate.type == "host" and ":" not in p.local_candidate.host
+        ]
+        tasks = [
+            asyncio.ensure_future(server_reflexive_candidate(p, servers.stun_server)) for p in protocols
+        ]
+        if not tasks:
+            return []
+        done, pending = await asyncio.wait(tasks, timeout=self.timeout)
+        for task in pending:
+            task.cancel()
+        return [task.result() for task in done if task.exception() is None]
+
+    async def _gather_relay(self, connection, servers, component=1):
+        _, protocol = await asyncio.wait_for(
+            turn.create_turn_endpoint(
+                lambda: StunProtocol(connection),
+                server_addr=servers.turn_server,
+                username=servers.turn_username,
+                password=servers.turn_password,
+                ssl=servers.turn_ssl,
+                transport=servers.turn_transport,
+            ),
+            self.timeout,
+        )
+        address = protocol.transport.get_extra_info("sockname")
+        related = protocol.transport.get_extra_info("related_address")
+        protocol.local_candidate = Candidate(
+            foundation=candidate_foundation("relay", "udp", address[0]),
+            component=component,
+            transport="udp",
+            priority=candidate_priority(component, "relay"),
+            host=address[0],
+            port=address[1],
+            type="relay",
+            related_address=related[0],
+            related_port=related[1],
+        )
+        # 新的本地通道与已知远端候选配对，加入连通性检查
+        connection._protocols.append(protocol)
+        for remote in connection._remote_candidates:
+            if protocol.local_candidate.can_pair_with(remote) and not connection._find_pair(protocol, remote):
+                connection._check_list.append(CandidatePair(protocol, remote))
+        connection.sort_check_list()
+        return [protocol.local_candidate]
+
+    async def gather(self):
+        """补收集 srflx/relay 候选，返回 [(mid, [RTCIceCandidate, ...]), ...]"""
+        start = time.monotonic()
+        media = []
+        for transceiver, gatherer, servers in self._gatherers:
+            connection = gatherer._connection
+            coros = []
+            if servers.stun_server:
+                coros.append(self._gather_srflx(connection, servers))
+            if servers.turn_server:
+                coros.append(self._gather_relay(connection, servers))
+            found = []
+            for result in await asyncio.gather(*coros, return_exceptions=True):
+                if isinstance(result, Exception):
+                    logger.warning("ICE候选收集失败: %s", result)
+                else:
+                    found += result
+            connection._local_candidates += found
+            candidates = [candidate_from_aioice(c) for c in found]
+            for candidate in candidates:
+                candidate.sdpMid = transceiver.mid
+            media.append((transceiver.mid, candidates))
+        self.gather_ms = (time.monotonic() - start) * 1000
+        return media
+
+    async def trickle(self, whip_client, whip_session):
+        """
+        收集并通过 PATCH 发送候选。服务器不支持 trickle（405/501 等）时返回 False，
+        此时连接只能依靠 offer 中的 host 候选（以及 peer-reflexive 候选）建立。
+        """
+        if not self._gatherers:
+            return True
+        media = await self.gather()
+        params = self._gatherers[0][1].getLocalParameters()
+        body = build_sdpfrag(params.usernameFragment, params.password, media, end_of_candidates=True)
+        self.supported = await whip_client.patch(whip_session, body)
+        if self.supported:
+            self.candidates_sent = sum(len(c) for _, c in media)
+            logger.info("已通过 PATCH 发送 %d 个 ICE 候选 (收集 %.0fms)", self.candidates_sent, self.gather_ms)
+        else:
+            logger.warning("服务器不支持 trickle ICE，仅使用 offer 中的 host 候选")
+        return self.supported
@@ -1,152 +1,558 @@
 import asyncio
+import importlib
 import random
 import logging
+import os
+import signal
+import sys
 import cv2
-from aiohttp import ClientSession
-from aiortc import RTCPeerConnection, VideoStreamTrack, RTCSessionDescription
+from aiortc import RTCIceServer, VideoStreamTrack, RTCSessionDescription
+from aiortc.mediastreams import MediaStreamError
 from aiortc.contrib.media import MediaBlackhole
-from av import VideoFrame
-import re
+
+if not __package__:
+    # 作为脚本直接运行（python webrtc/WHIP_WebRTC.py）时按包导入，兄弟模块都只用相对导入
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    __package__ = "webrtc"
+
+from .FrameGrabber import ThreadedFrameGrabber
+from .FrameConverter import create_converter
+from .WhipClient import WhipClient, create_http_session
+from .FramePacer import FramePacer, MediaClock
+from .WarmPool import PeerConnectionPool, SetupTimer, track_connection_phases
+from .PublishSupervisor import Backoff, PublishSupervisor, SessionTrack, wait_connected
+from .FrameSource import describe_source, open_capture
+from .EncoderProfile import add_profiled_track, get_profile
+from .SenderHooks import on_keyframe_request, set_encoder_bitrate
+from .KeyframeLimiter import KeyframeLimiter
+
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger("WHIP_Publisher")
 
 
+def _feature(module):
+    """
+    按需导入可选功能的模块（进程编码、自适应码率、指标、剖析、simulcast、音频、录像、运动门控），
+    没有启用的功能不付出导入开销
+    """
+    return importlib.import_module(f".{module}", __package__)
+
+
 class CameraStreamTrack(VideoStreamTrack):
     """
-    自定义视频流轨道，直接从摄像头获取帧
+    自定义视频流轨道，由独立采集线程预读摄像头帧，recv 只等待最新就绪的帧
+    conversion: "zerocopy"（预分配缓冲区直接转 I420）或 "legacy"（原有的 RGB 转换）
+    帧率由单调时钟的 FramePacer 控制，pts 取采集时刻（90kHz），clock 可与其他轨道共用
+    camera_index 为视频源配置：摄像头索引、"file:..."、"gst:..."、"shm:..."、"synthetic" 等（见 FrameSource）
+    motion 不为空时按画面是否在动决定每帧是否送给编码器（True 或 MotionGate 参数的字典，见 MotionGate）
     """
 
-    def __init__(self, camera_index=0, width=640, height=480, fps=30):
+    def __init__(self, camera_index=0, width=640, height=480, fps=30, conversion="zerocopy", clock=None,
+                 motion=None):
         super().__init__()
-        self.camera = cv2.VideoCapture(camera_index)
+        self.camera = open_capture(camera_index)
         if not self.camera.isOpened():
-            raise RuntimeError(f"摄像头 {camera_index} 打开失败")
+            raise RuntimeError(f"视频源 {describe_source(camera_index)} 打开失败")
 
         self.camera.set(cv2.CAP_PROP_FRAME_WIDTH, width)
         self.camera.set(cv2.CAP_PROP_FRAME_HEIGHT, height)
         self.camera.set(cv2.CAP_PROP_FPS, fps)
         self.fps = fps
-        self.frame_interval = 1.0 / fps
-        self.last_frame_time = 0
+        self.clock = clock or MediaClock()
+        self.pacer = FramePacer(fps)
+        self.motion = None
+        self.set_motion(motion)
+
+        # 采集和颜色转换都在采集线程中完成，不阻塞事件循环
+        self.converter = create_converter(conversion, "yuv420p" if conversion == "zerocopy" else "rgb24")
+        self.grabber = ThreadedFrameGrabber(self.camera, converter=self.converter, name=describe_source(camera_index))
+        self.grabber.start()
         logger.info("摄像头已就绪 (%dx%d @%dfps)", width, height, fps)
 
     async def recv(self):
-        pts, time_base = await self.next_timestamp()
-
-        # 控制帧率
-        now = asyncio.get_event_loop().time()
-        elapsed = now - self.last_frame_time
-        if elapsed < self.frame_interval:
-            await asyncio.sleep(self.frame_interval - elapsed)
-        self.last_frame_time = now
+        if self.readyState != "live":
+            raise MediaStreamError
 
-        ret, frame = self.camera.read()
-        if not ret:
-            raise RuntimeError("无法从摄像头读取帧")
+        while True:
+            # 按绝对截止时间控制帧率，落后时跳帧而不是突发
+            await self.pacer.wait()
 
-        # 转换颜色空间从BGR到RGB
-        frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-        av_frame = VideoFrame.from_ndarray(frame, format="rgb24")
-        av_frame.pts = pts
-        av_frame.time_base = time_base
+            # 等待采集线程送来的最新帧（已转换为VideoFrame）
+            av_frame, capture_time = await self.grabber.read_timed()
+            # 画面静止时只按 idle 帧率送出，其余帧不进编码器
+            if self.motion is None or self.motion.admit(av_frame, capture_time):
+                break
+        av_frame.pts = self.clock.pts(capture_time)
+        av_frame.time_base = self.clock.time_base
+        self.pacer.record_send()
 
         return av_frame
 
+    def set_output(self, width=None, height=None, fps=None):
+        """运行中调整输出分辨率和帧率，编码器会随帧尺寸自动重建，无需重新协商"""
+        if width is not None:
+            self.converter.set_output_size(width, height)
+        if fps is not None and fps != self.fps:
+            self.fps = fps
+            self.pacer.set_fps(fps)
+
+    def set_motion(self, motion):
+        """更换运动门控（motion 为 None 时关闭），新的门控从下一帧开始生效"""
+        self.motion = _feature("MotionGate").create_motion_gate(motion) if motion else None
+
+    def request_keyframe(self):
+        """关键帧由 aiortc 的编码器处理，这里只让运动门控立即放行下一帧，新的订阅者不用等 idle 节拍"""
+        if self.motion is not None:
+            self.motion.wake()
+
+    def stats(self):
+        """采集统计（丢帧数、队列等待时间等），启用运动门控时 motion 为其统计"""
+        stats = self.grabber.stats()
+        if self.motion is not None:
+            stats["motion"] = self.motion.stats()
+        return stats
+
+    def pacing_stats(self):
+        """发送间隔直方图及跳帧数"""
+        return self.pacer.stats()
+
+    def stop(self):
+        super().stop()
+        self.grabber.stop()
+        if self.camera.isOpened():
+            self.camera.release()
+
     def __del__(self):
         if self.camera.isOpened():
             self.camera.release()
 
 
+async def connect_whip(whip_client, warm, video_track, live_stream_id, encode_mode, timer, profile=None,
+                       simulcast=None, audio_track=None):
+    """
+    把轨道挂到已完成收集的收发器上，POST offer 并设置 answer，返回 (sender, whip_session)。
+    simulcast 为 Simulcast 时挂上各层，video_track 为其第一层轨道（或代理），返回的是第一层的 sender；
+    audio_track 不为空时一并挂到预建的音频收发器上
+    """
+    pc = warm.pc
+    offer_sdp = warm.offer_sdp
+    if simulcast is not None:
+        sender = simulcast.attach(pc, video_track)
+        offer_sdp = simulcast.munge_offer(offer_sdp)
+    elif encode_mode == "process":
+        sender = _feature("ProcessEncoder").add_process_encoded_track(pc, video_track)
+    else:
+        sender = add_profiled_track(pc, video_track, profile)
+    if audio_track is not None:
+        _feature("AudioTrack").add_audio_track(pc, audio_track)
+
+    # 发送WHIP请求
+    async with timer.phase("post"):
+        whip_session = await whip_client.publish(live_stream_id, offer_sdp)
+    if simulcast is not None:
+        simulcast.accept_answer(whip_session.answer_sdp)
+
+    # 设置远程描述
+    track_connection_phases(
+        pc, sender, timer, on_done=lambda t: logger.info("首帧耗时(ms): %s", t.to_dict())
+    )
+    answer = RTCSessionDescription(sdp=whip_session.answer_sdp, type="answer")
+    await pc.setRemoteDescription(answer)
+    return sender, whip_session
+
+
 async def whip_publish_webrtc(
         live777_base_url="http://huai-xhy.site:7777",
         live_stream_id=None,
         camera_index=0,
         width=640,
         height=480,
-        fps=30
+        fps=30,
+        conversion="zerocopy",
+        encode_mode="inline",
+        adaptive=False,
+        pool=None,
+        ice_servers=None,
+        trickle=False,
+        trickle_fallback_timeout=5.0,
+        reconnect=True,
+        encoder_profile=None,
+        metrics_port=None,
+        profiler=None,
+        simulcast=None,
+        simulcast_demand=False,
+        audio=None,
+        audio_frame_ms=20,
+        recorder=None,
+        snapshot_seconds=60.0,
+        motion=None,
+        capture_threads=None,
+        keyframe_min_interval=1.0,
+        reload=None,
 ):
+    """
+    encode_mode="process" 时采集、转换和编码都在子进程中完成（H264），主进程只负责打包和网络
+    adaptive=True 时根据 RTCP 反馈自动调整分辨率/帧率/码率，也可以是字典：ladder 为码率阶梯（{width, height, fps, bitrate}
+    的列表，从高到低，高于采集分辨率的档位会被去掉；不给时按 width/height/fps 推导，见 build_ladder），
+    interval 为采样间隔；从与 width/height/fps 一致的档位起步
+    pool 为预热的 PeerConnectionPool（已完成 ICE 收集），不传时现场收集，但与打开摄像头并行进行
+    trickle=True 时 offer 只带 host 候选立即 POST，STUN/TURN 候选随后通过 PATCH 发送；
+    服务器拒绝 PATCH 且 trickle_fallback_timeout 秒内未连通时，改用完整收集重新推流
+    reconnect=True 时连接失效后自动用同一个 stream id 重新推流，摄像头和编码器保持运行；
+    也可以是 PublishSupervisor 参数的字典（connect_timeout、rtcp_timeout、stable_after，backoff 为 Backoff 参数的字典）
+    encoder_profile 为编码配置档（如 "low-latency"，见 EncoderProfile），不传时使用 aiortc 默认的协商顺序和编码参数
+    metrics_port 不为空时在该端口提供 Prometheus 格式的 /metrics（每帧耗时、getStats 采样等，见 Metrics）
+    profiler 为 HotPathProfiler 时记录热路径各阶段耗时，退出时写出摘要和折叠栈（见 Profiler）
+    simulcast 不为空时同一会话发送多层（True 为默认的 h/m/l 三层，或 SimulcastLayer/字典的列表，见 Simulcast），
+    只支持 inline 编码，各层码率固定、不使用 adaptive；simulcast_demand=True 时按服务器上的拉流会话暂停没人订阅的层
+    audio 不为空时同一会话再发送一路 Opus 音频（"tone"、"alsa:hw:1,0"、"pulse"、"file:a.wav" 等，见 AudioSource），
+    audio_frame_ms 为 Opus 帧长（10/20ms）；音视频轨道共用一个 MediaClock，pts 都由采集时刻换算
+    recorder 为 RingRecorder 时把发出的视频码流（simulcast 时为第一层）转存为本地环形录像，不重新编码；
+    收到 SIGUSR1 时把最近 snapshot_seconds 秒保存为独立文件（见 RingRecorder）
+    motion 不为空时画面静止期间降低送编码器的帧率，有运动时立即恢复（True 或 MotionGate 参数的字典，见 MotionGate），
+    不支持 simulcast
+    capture_threads 为 OpenCV 颜色转换和缩放的线程数（cv2.setNumThreads），None 保持默认
+    keyframe_min_interval 为响应 PLI/FIR 强制关键帧的最小间隔（秒），间隔内的请求合并推迟，避免观众集中进入时
+    连续产生 IDR；请求数和请求到关键帧的等待时间计入指标（见 KeyframeLimiter），None 时按 aiortc 默认逐个响应
+    reload 为异步迭代器，每次产出一组需要不断流生效的设置（见 PublisherConfig.ConfigWatcher）：
+    output（width/height/fps，交给轨道的 set_output）、bitrate、motion（新的门控参数或 None）、snapshot_seconds、
+    keyframe_min_interval；
+    自适应码率开启时 output 和 bitrate 会被它的下一次决策覆盖，simulcast 各层不热更新；
+    某一项应用失败时只记录错误、保持原设置，不中断推流
+    """
+    if simulcast and encode_mode == "process":
+        raise ValueError("simulcast 只支持 inline 编码模式")
+    if simulcast and adaptive:
+        logger.warning("simulcast 各层码率固定，不使用自适应码率")
+        adaptive = False
+    if simulcast and motion:
+        logger.warning("simulcast 不支持运动门控，忽略 motion")
+        motion = None
+    if capture_threads is not None:
+        cv2.setNumThreads(capture_threads)
+    if ice_servers:
+        # 配置文件中的 {urls, username, credential}
+        ice_servers = [RTCIceServer(**server) if isinstance(server, dict) else server for server in ice_servers]
+
     pc = None
-    session_id = None
+    whip_session = None
+    video_track = None
+    audio_track = None
+    layered = None
+    demand_task = None
+    adaptive_task = None
+    reload_task = None
+    supervisor = None
+    supervisor_task = None
+    metrics = None
+    # 按流名（simulcast 时每层一个）保留，重连后统计继续累计
+    keyframe_limiters = {}
+    timer = SetupTimer()
+    loop = asyncio.get_running_loop()
+    clock = MediaClock()
+    if profiler is not None:
+        profiler.start()
+    if recorder is not None and recorder.size is None:
+        recorder.size = (width, height)
 
     # 如果没有提供stream_id，生成一个随机ID
     if live_stream_id is None:
         live_stream_id = str(random.randint(100000000, 999999999))
 
-    whip_url = f"{live777_base_url}/whip/{live_stream_id}"
-    logger.info("WHIP URL: %s", whip_url)
+    http_session = create_http_session()
+    whip_client = WhipClient(live777_base_url, http_session)
+    logger.info("WHIP URL: %s", whip_client.whip_url(live_stream_id))
+
+    profile = get_profile(encoder_profile)
+    mime_type = _feature("ProcessEncoder").CODECS["h264"][1] if encode_mode == "process" else None
+    codecs = profile.codecs if profile is not None and encode_mode != "process" else ()
+    if pool is None:
+        pool = PeerConnectionPool(
+            ice_servers, size=0, mime_type=mime_type, trickle=trickle, codecs=codecs, audio=audio is not None
+        )
+
+    async def open_track():
+        # 打开摄像头是阻塞调用，放到线程池中与 ICE 收集、HTTP 预连接并行
+        async with timer.phase("camera_open"):
+            if simulcast:
+                layers = None if simulcast is True else simulcast
+                Simulcast = _feature("Simulcast").Simulcast
+                return await loop.run_in_executor(
+                    None,
+                    lambda: Simulcast(camera_index, width, height, fps, layers=layers, profile=profile, clock=clock),
+                )
+            if encode_mode == "process":
+                ProcessEncodedTrack = _feature("ProcessEncoder").ProcessEncodedTrack
+                return await loop.run_in_executor(
+                    None,
+                    lambda: ProcessEncodedTrack(
+                        camera_index, width, height, fps, profile=profile, clock=clock, motion=motion
+                    ),
+                )
+            return await loop.run_in_executor(
+                None, CameraStreamTrack, camera_index, width, height, fps, conversion, clock, motion
+            )
+
+    async def open_audio_track():
+        if audio is None:
+            return None
+        AudioCaptureTrack = _feature("AudioTrack").AudioCaptureTrack
+        return await loop.run_in_executor(
+            None, lambda: AudioCaptureTrack(audio, frame_ms=audio_frame_ms, clock=clock)
+        )
+
+    async def acquire_pc():
+        async with timer.phase("gather"):
+            warm = await pool.acquire()
+        if warm.warm:
+            timer.record("gather", 0.0)
+        return warm
+
+    def create_adaptive_runner(sender):
+        adaptive_module = _feature("AdaptiveBitrate")
+        options = adaptive if isinstance(adaptive, dict) else {}
+        # 阶梯不高于采集分辨率，从与配置输出一致的档位起步
+        ladder = None
+        if options.get("ladder"):
+            ladder = adaptive_module.fit_ladder(
+                [adaptive_module.LadderRung(**rung) for rung in options["ladder"]], width, height
+            )
+            if ladder is None:
+                logger.warning("码率阶梯的各档都高于采集分辨率 %dx%d，改用按采集分辨率推导的阶梯", width, height)
+        ladder = ladder or adaptive_module.build_ladder(width, height, fps)
+        controller = adaptive_module.AdaptiveController(
+            ladder, start_index=adaptive_module.match_rung(ladder, width, height, fps)
+        )
+        return adaptive_module.AdaptiveBitrateRunner(
+            sender, video_track, controller=controller, interval=options.get("interval") or 1.0
+        )
+
+    def apply_update(group, value):
+        nonlocal snapshot_seconds
+        if group in ("output", "bitrate") and layered is not None:
+            logger.warning("simulcast 各层的分辨率和码率不支持热更新")
+        elif group == "output" and hasattr(video_track, "set_output"):
+            video_track.set_output(**value)
+        elif group == "bitrate" and value:
+            current = supervisor.sender if supervisor is not None else sender
+            set_encoder_bitrate(current, video_track, value)
+        elif group == "motion" and hasattr(video_track, "set_motion"):
+            video_track.set_motion(value)
+        elif group == "snapshot_seconds":
+            snapshot_seconds = value
+        elif group == "keyframe_min_interval" and value is not None:
+            for limiter in keyframe_limiters.values():
+                limiter.min_interval = value
+
+    async def apply_updates():
+        # 热更新：只改运行中的轨道、编码器和参数，不重新协商；任何一项失败都只记录错误、保持原设置，不影响推流
+        try:
+            async for update in reload:
+                for group, value in update.items():
+                    try:
+                        apply_update(group, value)
+                    except Exception as e:
+                        logger.error("热更新 %s 失败，保持原设置: %s", group, e)
+                    else:
+                        logger.info("已热更新 %s: %s", group, value)
+        except Exception as e:
+            logger.error("读取配置更新失败，停止热更新（推流继续）: %s", e)
 
     try:
-        # 创建WebRTC连接
-        pc = RTCPeerConnection()
-
-        # 添加摄像头视频轨道
-        video_track = CameraStreamTrack(camera_index, width, height, fps)
-        pc.addTrack(video_track)
-
-        # 创建offer
-        offer = await pc.createOffer()
-        await pc.setLocalDescription(offer)
-
-        # 发送WHIP请求
-        async with ClientSession() as session:
-            async with session.post(
-                    whip_url,
-                    data=pc.localDescription.sdp,
-                    headers={"Content-Type": "application/sdp"}
-            ) as response:
-                if response.status != 201:
-                    error_detail = await response.text()
-                    logger.error("WHIP 失败: HTTP %d - %s", response.status, error_detail)
-                    raise RuntimeError(f"WHIP 失败: HTTP {response.status}")
-
-                # 处理响应
-                location_header = response.headers.get('Location', '')
-                logger.info("Location header: %s", location_header)
-
-                # 解析session_id
-                match = re.search(r'/session/([^/]+)/([^/]+)$', location_header)
-                if match:
-                    live_stream_id = match.group(1)
-                    session_id = match.group(2)
-                    logger.info("解析到 Stream ID: %s, Session ID: %s", live_stream_id, session_id)
-                else:
-                    logger.warning("无法从Location解析Session ID: %s", location_header)
-
-                answer_sdp = await response.text()
-
-        # 设置远程描述
-        answer = RTCSessionDescription(sdp=answer_sdp, type="answer")
-        await pc.setRemoteDescription(answer)
+        track_result, audio_result, warm, _ = await asyncio.gather(
+            open_track(), open_audio_track(), acquire_pc(), whip_client.warm_up(), return_exceptions=True
+        )
+        # 任一失败时，先记下已成功的部分以便 finally 中清理
+        if simulcast and not isinstance(track_result, BaseException):
+            layered, video_track = track_result, track_result.primary
+        elif not isinstance(track_result, BaseException):
+            video_track = track_result
+        if not isinstance(audio_result, BaseException):
+            audio_track = audio_result
+        if not isinstance(warm, BaseException):
+            pc = warm.pc
+        for result in (track_result, audio_result, warm):
+            if isinstance(result, BaseException):
+                raise result
+
+        # 需要重连时连接使用轨道代理，断线时 aiortc 只会停掉代理，摄像头和编码器保持运行
+        publish_track = SessionTrack(video_track) if reconnect else video_track
+        publish_audio = SessionTrack(audio_track) if reconnect and audio_track is not None else audio_track
+        sender, whip_session = await connect_whip(
+            whip_client, warm, publish_track, live_stream_id, encode_mode, timer, profile, layered, publish_audio
+        )
+        live_stream_id = whip_session.stream_id
+
+        if warm.trickle is not None:
+            supported = await warm.trickle.trickle(whip_client, whip_session)
+            if not supported and not await wait_connected(pc, trickle_fallback_timeout):
+                logger.warning("服务器不支持 trickle 且仅凭 host 候选无法连通，改用完整收集重新推流")
+                await pc.close()
+                await whip_client.delete(whip_session)
+                whip_session = None
+                warm = await PeerConnectionPool(
+                    ice_servers, size=0, mime_type=mime_type, codecs=codecs, audio=audio_track is not None
+                ).acquire()
+                pc = warm.pc
+                publish_track = SessionTrack(video_track) if reconnect else video_track
+                publish_audio = SessionTrack(audio_track) if reconnect and audio_track is not None else audio_track
+                sender, whip_session = await connect_whip(
+                    whip_client, warm, publish_track, live_stream_id, encode_mode, timer, profile, layered,
+                    publish_audio,
+                )
 
         logger.info("WebRTC推流成功！Stream ID: %s", live_stream_id)
 
-        # 保持连接
+        if metrics_port is not None:
+            metrics = _feature("Metrics").PublisherMetrics()
+            await metrics.serve(port=metrics_port)
+
+        def on_connected(sender):
+            # 每次（重新）连上后按新的 sender 重新启动自适应码率、重新绑定指标
+            nonlocal adaptive_task
+            if adaptive:
+                if adaptive_task is not None:
+                    adaptive_task.cancel()
+                adaptive_task = asyncio.ensure_future(create_adaptive_runner(sender).run())
+            # simulcast 时每层一个 sender，指标按 "<stream>/<rid>" 分开
+            if layered is not None:
+                watched = [(f"{live_stream_id}/{rid}", s, layered.tracks[rid]) for rid, s in layered.senders.items()]
+            else:
+                watched = [(live_stream_id, sender, video_track)]
+            # 进程编码模式由子进程在强制关键帧时放行运动门控，这里只处理 inline 轨道
+            if isinstance(video_track, CameraStreamTrack):
+                on_keyframe_request(sender, video_track.request_keyframe)
+            for name, watched_sender, watched_track in watched:
+                limiter = None
+                if keyframe_min_interval is not None:
+                    # 在 on_keyframe_request 之后挂上，限流之后的请求才转给轨道
+                    limiter = keyframe_limiters.get(name)
+                    if limiter is None:
+                        limiter = keyframe_limiters[name] = KeyframeLimiter(keyframe_min_interval)
+                    limiter.attach(watched_sender)
+                if metrics is not None:
+                    metrics.watch(
+                        name, supervisor.pc if supervisor is not None else pc, watched_sender, watched_track, limiter
+                    )
+                if profiler is not None:
+                    profiler.attach(watched_sender, watched_track)
+            if recorder is not None:
+                recorder.attach(sender)
+
+        on_connected(sender)
+
+        if recorder is not None:
+            async def save_snapshot():
+                try:
+                    await recorder.snapshot(snapshot_seconds)
+                except Exception as e:
+                    logger.error("保存录像失败: %s", e)
+
+            try:
+                loop.add_signal_handler(signal.SIGUSR1, lambda: asyncio.ensure_future(save_snapshot()))
+            except (AttributeError, NotImplementedError):
+                # Windows 没有 SIGUSR1，只能通过 recorder.snapshot() 保存
+                pass
+
+        if layered is not None and simulcast_demand:
+            subscriber_demand = _feature("Simulcast").subscriber_demand
+            demand_task = asyncio.ensure_future(
+                layered.watch_demand(subscriber_demand(whip_client, live_stream_id, layered.rids))
+            )
+
+        if reload is not None:
+            reload_task = asyncio.ensure_future(apply_updates())
+
+        if reconnect:
+            attach_video = (
+                layered.attach if layered is not None
+                else _feature("ProcessEncoder").add_process_encoded_track if encode_mode == "process"
+                else lambda pc, track: add_profiled_track(pc, track, profile)
+            )
+
+            def attach(pc, track):
+                sender = attach_video(pc, track)
+                if audio_track is not None:
+                    _feature("AudioTrack").add_audio_track(pc, SessionTrack(audio_track))
+                return sender
+
+            policy = dict(reconnect) if isinstance(reconnect, dict) else {}
+            if "backoff" in policy:
+                policy["backoff"] = Backoff(**policy["backoff"])
+            supervisor = PublishSupervisor(
+                whip_client, video_track, live_stream_id, ice_servers=ice_servers, mime_type=mime_type, codecs=codecs,
+                attach=attach, audio=audio_track is not None,
+                on_connected=on_connected,
+                munge_offer=layered.munge_offer if layered is not None else None,
+                on_answer=layered.accept_answer if layered is not None else None,
+                **policy,
+            )
+            supervisor.adopt(pc, sender, whip_session)
+            supervisor_task = asyncio.ensure_future(supervisor.run())
+
+        # 保持连接，定期输出采集统计
+        ticks = 0
         while True:
             await asyncio.sleep(1)
+            ticks += 1
+            if supervisor_task is not None and supervisor_task.done():
+                supervisor_task.result()
+            if ticks % 10 == 0:
+                logger.debug("采集统计: %s", video_track.stats())
+                if layered is not None:
+                    logger.info("simulcast 各层: %s", await layered.stats())
+                if audio_track is not None:
+                    logger.debug("音频采集: %s", audio_track.stats())
+                if recorder is not None:
+                    logger.debug("录像: %s", recorder.stats())
 
     except Exception as e:
         logger.error("发生异常: %s", str(e), exc_info=True)
     finally:
         logger.info("开始清理资源...")
 
-        # 关闭WebRTC连接
+        if adaptive_task is not None:
+            adaptive_task.cancel()
+        if reload_task is not None:
+            reload_task.cancel()
+        if demand_task is not None:
+            demand_task.cancel()
+        if metrics is not None:
+            await metrics.close()
+
+        # 关闭WebRTC连接（由守护接管时连接和会话以守护中的为准）
+        if supervisor is not None:
+            if supervisor_task is not None:
+                supervisor_task.cancel()
+            logger.info("重连统计: %s", supervisor.stats())
+            await supervisor.close()
+            pc = whip_session = None
         if pc is not None:
             await pc.close()
             logger.info("WebRTC连接已关闭")
 
+        # 停止采集线程
+        if video_track is not None:
+            logger.info("采集统计: %s", video_track.stats())
+            if hasattr(video_track, "pacing_stats"):
+                logger.info("发送节拍: %s", video_track.pacing_stats())
+            video_track.stop()
+        if layered is not None:
+            layered.stop()
+        if audio_track is not None:
+            logger.info("音频采集: %s", audio_track.stats())
+            audio_track.stop()
+
         # 发送DELETE请求通知服务器
-        if session_id and live_stream_id:
-            delete_url = f"{live777_base_url}/session/{live_stream_id}/{session_id}"
-            logger.info("发送DELETE请求到: %s", delete_url)
-            try:
-                async with ClientSession() as session:
-                    async with session.delete(delete_url) as resp:
-                        if resp.status == 204:
-                            logger.info("成功终止服务器端会话")
-                        else:
-                            logger.error("DELETE请求失败: HTTP %d", resp.status)
-            except Exception as e:
-                logger.error("发送DELETE请求时出错: %s", str(e))
+        await whip_client.delete(whip_session)
+        await http_session.close()
+
+        if recorder is not None:
+            await loop.run_in_executor(None, recorder.close)
+            logger.info("录像: %s", recorder.stats())
+
+        if profiler is not None:
+            await profiler.stop()
 
 
 if __name__ == "__main__":
@@ -155,5 +561,16 @@ if __name__ == "__main__":
     # asyncio.run(whip_publish_webrtc(live777_base_url="http://localhost:7777"))
     asyncio.run(whip_publish_webrtc())
 
-def run (live777Url:str = "http://huai-xhy.site:7777"): # 我的live777部署位置
-    asyncio.run(whip_publish_webrtc(live777_base_url=live777Url))
+def run (live777Url:str = "http://huai-xhy.site:7777", profile_dir=None, profile_sample_interval=None, record_dir=None,
+         record_options=None, **kwargs): # 我的live777部署位置
+    """
+    profile_dir 不为空时开启剖析模式，退出时结果写入该目录；profile_sample_interval（秒）开启采样剖析
+    record_dir 不为空时在该目录下环形录像，record_options 为 RingRecorder 的其他参数（format、max_seconds 等）
+    """
+    profiler = _feature("Profiler").HotPathProfiler(profile_dir, profile_sample_interval) if profile_dir else None
+    recorder = _feature("RingRecorder").RingRecorder(record_dir, **(record_options or {})) if record_dir else None
+    try:
+        asyncio.run(whip_publish_webrtc(live777_base_url=live777Url, profiler=profiler, recorder=recorder, **kwargs))
+    except KeyboardInterrupt:
+        # Ctrl+C 时资源清理和剖析结果已在 whip_publish_webrtc 中完成
+        pass
@@ -0,0 +1,222 @@
+import asyncio
+import logging
+import time
+
+from aiortc import RTCConfiguration, RTCPeerConnection
+
+from .SenderHooks import prefer_codec
+from .TrickleIce import TrickleGatherer
+
+logger = logging.getLogger("WHIP_Publisher")
+
+# 推流建立的各个阶段，按发生顺序
+SETUP_PHASES = ("camera_open", "gather", "post", "dtls", "first_rtp")
+
+
+class SetupTimer:
+    """
+    记录一次推流从开始到第一个 RTP 包发出的分阶段耗时（毫秒）。
+    各阶段可以并行（如打开摄像头和 ICE 收集），每个阶段单独计时，total 为总的墙钟时间。
+    """
+
+    def __init__(self, clock=time.monotonic):
+        self.clock = clock
+        self.start_time = clock()
+        self.phases = {}
+        self.time_to_first_frame = None
+        self._started = {}
+
+    def begin(self, phase):
+        self._started[phase] = self.clock()
+
+    def end(self, phase):
+        started = self._started.pop(phase, self.start_time)
+        self.phases[phase] = (self.clock() - started) * 1000
+
+    def record(self, phase, value_ms):
+        """直接记录某阶段耗时（如预热连接池中已提前完成的收集）"""
+        self.phases[phase] = value_ms
+
+    def phase(self, name):
+        """async with timer.phase("post"): ..."""
+        return _PhaseContext(self, name)
+
+    def total(self):
+        return (self.clock() - self.start_time) * 1000
+
+    def finish(self):
+        """记录首帧时间（从开始到第一个 RTP 包发出）"""
+        self.time_to_first_frame = self.total()
+
+    def to_dict(self):
+        result = {phase: round(self.phases[phase], 1) for phase in SETUP_PHASES if phase in self.phases}
+        result["total"] = round(self.time_to_first_frame if self.time_to_first_frame is not None else self.total(), 1)
+        return result
+
+
+class _PhaseContext:
+    def __init__(self, timer, name):
+        self.timer = timer
+        self.name = name
+
+    async def __aenter__(self):
+        self.timer.begin(self.name)
+        return self
+
+    async def __aexit__(self, *exc):
+        self.timer.end(self.name)
+        return False
+
+
+class WarmPeerConnection:
+    """已完成 ICE 收集、本地 offer 已就绪的 PeerConnection，拿到后只需加入轨道并 POST"""
+
+    def __init__(self, pc, transceiver, gather_ms, warm, trickle=None):
+        self.pc = pc
+        self.transceiver = transceiver
+        self.gather_ms = gather_ms
+        self.warm = warm
+        self.trickle = trickle
+        self.created_at = time.monotonic()
+
+    @property
+    def offer_sdp(self):
+        if self.trickle is not None:
+            return self.trickle.offer_sdp()
+        return self.pc.localDescription.sdp
+
+    def age(self):
+        return time.monotonic() - self.created_at
+
+
+class PeerConnectionPool:
+    """
+    预热的 PeerConnection 池：提前创建 sendonly 视频收发器并完成 setLocalDescription（即 ICE 收集），
+    推流时取出一个现成的连接，用 addTrack 把轨道挂到已协商的收发器上，省掉收集候选地址的时间。
+    mime_type 不为空时只协商该编码（进程编码、直通模式需要），否则按 codecs 的顺序设置编码偏好（不排他）。
+    收集到的 srflx 候选在 NAT 上的映射会过期，超过 max_age 秒的连接会被丢弃并重新预热。
+    size=0 时不预热，acquire 直接现场创建（仍可与打开摄像头并行）。
+    trickle=True 时 offer 只收集 host 候选，STUN/TURN 候选在 POST 之后通过 entry.trickle 发送。
+    ice_servers 为 None 时使用 aiortc 的默认 STUN 服务器。
+    audio=True 时再预建一个 sendonly 音频收发器（Opus 优先），音频轨道同样用 addTrack 挂上。
+    """
+
+    def __init__(self, ice_servers=None, size=1, mime_type=None, max_age=20.0, trickle=False, codecs=(), audio=False):
+        self.ice_servers = ice_servers
+        self.audio = audio
+        self.size = size
+        self.mime_type = mime_type
+        self.codecs = codecs
+        self.max_age = max_age
+        self.trickle = trickle
+        self._ready = []
+        self._filling = 0
+        self._refresh_task = None
+        self._closed = False
+
+    async def _create(self, warm):
+        pc = RTCPeerConnection(configuration=RTCConfiguration(iceServers=self.ice_servers))
+        try:
+            transceiver = pc.addTransceiver("video", direction="sendonly")
+            if self.mime_type is not None:
+                prefer_codec(transceiver, self.mime_type, exclusive=True)
+            elif self.codecs:
+                prefer_codec(transceiver, self.codecs)
+            if self.audio:
+                prefer_codec(pc.addTransceiver("audio", direction="sendonly"), "audio/opus")
+            trickle = TrickleGatherer(pc) if self.trickle else None
+            start = time.monotonic()
+            await pc.setLocalDescription(await pc.createOffer())
+            gather_ms = (time.monotonic() - start) * 1000
+        except Exception:
+            await pc.close()
+            raise
+        return WarmPeerConnection(pc, transceiver, gather_ms, warm, trickle)
+
+    async def _fill(self):
+        missing = self.size - len(self._ready) - self._filling
+        if missing <= 0 or self._closed:
+            return
+        self._filling += missing
+        try:
+            results = await asyncio.gather(*(self._create(True) for _ in range(missing)), return_exceptions=True)
+        finally:
+            self._filling -= missing
+        for result in results:
+            if isinstance(result, Exception):
+                logger.warning("预热PeerConnection失败: %s", result)
+            elif self._closed:
+                await result.pc.close()
+            else:
+                self._ready.append(result)
+
+    async def _refresh(self):
+        """定期淘汰过期的连接并补足池子"""
+        while True:
+            await asyncio.sleep(max(self.max_age / 2, 1.0))
+            await self._discard_stale()
+            await self._fill()
+
+    async def _discard_stale(self):
+        stale = [entry for entry in self._ready if entry.age() > self.max_age]
+        for entry in stale:
+            self._ready.remove(entry)
+            await entry.pc.close()
+
+    async def start(self):
+        """预热 size 个连接，并启动后台刷新"""
+        await self._fill()
+        if self.size > 0 and self._refresh_task is None:
+            self._refresh_task = asyncio.ensure_future(self._refresh())
+
+    async def acquire(self):
+        """取出一个已收集好候选地址的连接，池子为空时现场创建，取走后在后台补充"""
+        await self._discard_stale()
+        if self._ready:
+            entry = self._ready.pop(0)
+        else:
+            entry = await self._create(False)
+        if self.size > 0 and not self._closed:
+            asyncio.ensure_future(self._fill())
+        return entry
+
+    async def close(self):
+        self._closed = True
+        if self._refresh_task is not None:
+            self._refresh_task.cancel()
+            self._refresh_task = None
+        ready, self._ready = self._ready, []
+        for entry in ready:
+            await entry.pc.close()
+
+    def __len__(self):
+        return len(self._ready)
+
+
+def track_connection_phases(pc, sender, timer, on_done=None):
+    """
+    在 setRemoteDescription 之前调用：dtls 为 ICE+DTLS 建立耗时，
+    first_rtp 为连接建立后到第一个 RTP 包发出的耗时，on_done 在第一个 RTP 包发出后调用
+    """
+    timer.begin("dtls")
+
+    @pc.on("connectionstatechange")
+    def on_connection_state():
+        if pc.connectionState == "connected" and "dtls" not in timer.phases:
+            timer.end("dtls")
+            timer.begin("first_rtp")
+
+    original = sender._next_encoded_frame
+
+    async def _next_encoded_frame(codec):
+        frame = await original(codec)
+        if frame is not None:
+            # 编码好的第一帧随即被打包发送
+            sender._next_encoded_frame = original
+            timer.end("first_rtp")
+            timer.finish()
+            if on_done is not None:
+                on_done(timer)
+        return frame
+
+    sender._next_encoded_frame = _next_encoded_frame
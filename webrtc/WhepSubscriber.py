@@ -0,0 +1,323 @@
+"""
+WHEP 拉流端，与 whip_publish_webrtc 对应，用于在 Python 中消费 live777 上的流（录制、视觉处理等）：
+
+    async with WhepSubscriber(whip_client, "123456") as sub:
+        async for frame in sub.frames():          # 解码后的 av.VideoFrame
+            ...
+        image = sub.latest_array()                # 或者随时取最新一帧的 numpy 数组
+
+mode="encoded" 时不解码，packets() 直接给出重组好的编码帧（H264 Annex-B / VP8），适合转存或自行解码。
+jitter_frames 控制抖动缓冲：None 为 aiortc 默认（下一帧的首包到达后才输出上一帧，约多一帧间隔），
+0 为收到帧的最后一个包（RTP marker）立即输出，N > 0 为攒够 N 帧再输出以平滑网络抖动。
+多路拉流传入同一个 WhipClient，共用其 HTTP 连接池。
+"""
+import asyncio
+import logging
+import queue
+import time
+
+from aiortc import RTCConfiguration, RTCPeerConnection, RTCSessionDescription
+from aiortc.jitterbuffer import JitterBuffer, JitterFrame
+from aiortc.mediastreams import MediaStreamError
+
+from .WhipClient import WhipClient, create_http_session
+
+logger = logging.getLogger("WHIP_Publisher")
+
+H264_IDR = 5
+H264_SPS = 7
+
+
+class EncodedFrame:
+    """一帧重组好的编码数据，timestamp 为 90kHz 媒体时间（从 0 开始），arrival 为到达时刻 time.monotonic()"""
+
+    __slots__ = ("data", "timestamp", "mime_type", "arrival")
+
+    def __init__(self, data, timestamp, mime_type, arrival):
+        self.data = data
+        self.timestamp = timestamp
+        self.mime_type = mime_type
+        self.arrival = arrival
+
+    @property
+    def is_keyframe(self):
+        return is_keyframe(self.mime_type, self.data)
+
+    def __repr__(self):
+        return f"EncodedFrame({self.mime_type}, {len(self.data)} bytes, ts={self.timestamp})"
+
+
+def is_keyframe(mime_type, data):
+    """判断编码帧是否为关键帧：H264 含 IDR/SPS，VP8 帧头 P 位为 0"""
+    mime_type = mime_type.lower()
+    if mime_type == "video/h264":
+        i = data.find(b"\x00\x00\x01")
+        while i != -1 and i + 3 < len(data):
+            if data[i + 3] & 0x1F in (H264_IDR, H264_SPS):
+                return True
+            i = data.find(b"\x00\x00\x01", i + 3)
+        return False
+    if mime_type == "video/vp8":
+        return bool(data) and not data[0] & 0x01
+    return False
+
+
+class LowLatencyJitterBuffer(JitterBuffer):
+    """
+    aiortc 的视频抖动缓冲要等到下一帧的包到达才确认上一帧完整；
+    这里额外检查 RTP marker（帧的最后一个包），连续收齐后立即输出
+    """
+
+    def _remove_frame(self, sequence_number):
+        frame = super()._remove_frame(sequence_number)
+        if frame is not None:
+            return frame
+        packets = []
+        for count in range(self.capacity):
+            packet = self._packets[(self._origin + count) % self._capacity]
+            if packet is None or (packets and packet.timestamp != packets[0].timestamp):
+                return None
+            packets.append(packet)
+            if packet.marker:
+                self.remove(count + 1)
+                return JitterFrame(data=b"".join(p._data for p in packets), timestamp=packet.timestamp)
+        return None
+
+
+def set_jitter_frames(receiver, frames):
+    """替换接收端的抖动缓冲，需在 setRemoteDescription 之前调用"""
+    if frames is None:
+        return
+    if frames == 0:
+        buffer = LowLatencyJitterBuffer(capacity=128, is_video=True)
+    else:
+        buffer = JitterBuffer(capacity=512, prefetch=frames, is_video=True)
+    receiver._RTCRtpReceiver__jitter_buffer = buffer
+
+
+class _EncodedTap(queue.Queue):
+    """
+    顶替接收端的解码队列：编码帧交给 callback（在事件循环中调用），不再送去解码；
+    结束标记 None 照常入队，让 aiortc 的解码线程退出
+    """
+
+    def __init__(self, callback):
+        super().__init__()
+        self.callback = callback
+
+    def put(self, item, block=True, timeout=None):
+        if item is None:
+            super().put(item, block, timeout)
+            return
+        codec, encoded_frame = item
+        self.callback(codec, encoded_frame)
+
+
+def tap_encoded_frames(receiver, callback):
+    """callback(codec, JitterFrame) 接收重组好的编码帧并跳过解码，需在 setRemoteDescription 之前调用"""
+    receiver._RTCRtpReceiver__decoder_queue = _EncodedTap(callback)
+
+
+class WhepSubscriber:
+    """
+    一路 WHEP 拉流。max_queue 为未取走帧的上限，满了丢弃最旧的一帧，
+    latest_only=True 时 frames()/packets() 每次只给出当前最新的一帧（解码模式下旧帧直接跳过）。
+    编码模式下跳帧会导致花屏，packets() 不做跳帧，消费者来不及时依靠 max_queue 丢帧并自动请求关键帧。
+    """
+
+    def __init__(self, whip_client, stream_id, mode="decoded", jitter_frames=0, ice_servers=None,
+                 max_queue=30, latest_only=True):
+        if mode not in ("decoded", "encoded"):
+            raise ValueError(f"不支持的模式: {mode}")
+        self.whip_client = whip_client
+        self.stream_id = stream_id
+        self.mode = mode
+        self.jitter_frames = jitter_frames
+        self.ice_servers = ice_servers
+        self.latest_only = latest_only
+        self.pc = None
+        self.receiver = None
+        self.whip_session = None
+        self.queue = asyncio.Queue(max_queue)
+        self.connected = asyncio.Event()
+
+        self._latest = None
+        self._latest_array = None
+        self._latest_seq = 0
+        self._new_frame = asyncio.Event()
+        self._pump_task = None
+        self._started_at = None
+        self._closed = False
+
+        # 统计
+        self.received = 0
+        self.dropped = 0
+        self.skipped = 0
+        self.keyframe_requests = 0
+        self.first_frame_ms = None
+
+    async def start(self):
+        self._started_at = time.monotonic()
+        self.pc = RTCPeerConnection(configuration=RTCConfiguration(iceServers=self.ice_servers))
+        transceiver = self.pc.addTransceiver("video", direction="recvonly")
+        self.receiver = transceiver.receiver
+        set_jitter_frames(self.receiver, self.jitter_frames)
+        if self.mode == "encoded":
+            tap_encoded_frames(self.receiver, self._on_encoded)
+
+        @self.pc.on("track")
+        def on_track(track):
+            if self.mode == "decoded":
+                self._pump_task = asyncio.ensure_future(self._pump(track))
+
+        @self.pc.on("connectionstatechange")
+        def on_connection_state():
+            logger.info("[WHEP %s] 连接状态变化: %s", self.stream_id, self.pc.connectionState)
+            if self.pc.connectionState == "connected":
+                self.connected.set()
+            elif self.pc.connectionState in ("failed", "closed"):
+                self._put(None)
+
+        await self.pc.setLocalDescription(await self.pc.createOffer())
+        self.whip_session = await self.whip_client.subscribe(self.stream_id, self.pc.localDescription.sdp)
+        await self.pc.setRemoteDescription(RTCSessionDescription(sdp=self.whip_session.answer_sdp, type="answer"))
+        return self
+
+    def _put(self, item):
+        if self.queue.full():
+            self.queue.get_nowait()
+            self.dropped += 1
+            if self.mode == "encoded":
+                # 丢了编码帧之后只能从下一个关键帧恢复
+                self.request_keyframe()
+        self.queue.put_nowait(item)
+
+    def _on_frame(self, frame):
+        self.received += 1
+        if self.first_frame_ms is None:
+            self.first_frame_ms = (time.monotonic() - self._started_at) * 1000
+            logger.info("[WHEP %s] 首帧耗时 %.0fms", self.stream_id, self.first_frame_ms)
+        self._latest = frame
+        self._latest_array = None
+        self._latest_seq += 1
+        self._new_frame.set()
+        self._put(frame)
+
+    def _on_encoded(self, codec, encoded_frame):
+        self._on_frame(EncodedFrame(encoded_frame.data, encoded_frame.timestamp, codec.mimeType, time.monotonic()))
+
+    async def _pump(self, track):
+        try:
+            while True:
+                self._on_frame(await track.recv())
+        except MediaStreamError:
+            self._put(None)
+
+    async def _next(self, skip_stale):
+        item = await self.queue.get()
+        if skip_stale:
+            while item is not None and not self.queue.empty():
+                item = self.queue.get_nowait()
+                self.skipped += 1
+        return item
+
+    async def frames(self):
+        """解码后的 av.VideoFrame，连接结束时迭代结束"""
+        if self.mode != "decoded":
+            raise RuntimeError("frames() 需要 mode='decoded'")
+        while True:
+            frame = await self._next(self.latest_only)
+            if frame is None:
+                return
+            yield frame
+
+    async def packets(self):
+        """重组好的 EncodedFrame，按到达顺序给出"""
+        if self.mode != "encoded":
+            raise RuntimeError("packets() 需要 mode='encoded'")
+        while True:
+            frame = await self._next(False)
+            if frame is None:
+                return
+            yield frame
+
+    def latest(self):
+        """最新收到的一帧（VideoFrame 或 EncodedFrame），还没有帧时为 None"""
+        return self._latest
+
+    def latest_array(self, format="bgr24"):
+        """最新一帧转成 numpy 数组，同一帧多次调用只转换一次；还没有帧时为 None"""
+        if self._latest is None or self.mode != "decoded":
+            return None
+        if self._latest_array is None or self._latest_array[0] != format:
+            self._latest_array = (format, self._latest.to_ndarray(format=format))
+        return self._latest_array[1]
+
+    async def wait_latest(self, timeout=None):
+        """等待比上次调用更新的一帧并返回它"""
+        seq = self._latest_seq
+        while self._latest_seq == seq:
+            self._new_frame.clear()
+            await asyncio.wait_for(self._new_frame.wait(), timeout)
+        return self._latest
+
+    def request_keyframe(self):
+        """向发送端请求关键帧（PLI）"""
+        if self.receiver is None:
+            return
+        streams = getattr(self.receiver, "_RTCRtpReceiver__remote_streams", {})
+        for ssrc in streams:
+            self.keyframe_requests += 1
+            asyncio.ensure_future(self.receiver._send_rtcp_pli(ssrc))
+
+    def stats(self):
+        return {
+            "received": self.received,
+            "dropped": self.dropped,
+            "skipped": self.skipped,
+            "queued": self.queue.qsize(),
+            "keyframe_requests": self.keyframe_requests,
+            "first_frame_ms": self.first_frame_ms,
+            "connection": self.pc.connectionState if self.pc is not None else "new",
+        }
+
+    async def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        if self._pump_task is not None:
+            self._pump_task.cancel()
+        if self.pc is not None:
+            await self.pc.close()
+        await self.whip_client.delete(self.whip_session)
+        self.whip_session = None
+
+    async def __aenter__(self):
+        return await self.start()
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+
+async def whep_subscribe(live777_base_url, stream_id, **kwargs):
+    """
+    单路拉流的便捷入口，自带 HTTP 会话，close() 时一并关闭：
+
+        sub = await whep_subscribe("http://localhost:7777", "123456", jitter_frames=0)
+    """
+    http_session = create_http_session()
+    subscriber = WhepSubscriber(WhipClient(live777_base_url, http_session), stream_id, **kwargs)
+    close = subscriber.close
+
+    async def close_with_session():
+        try:
+            await close()
+        finally:
+            await http_session.close()
+
+    subscriber.close = close_with_session
+    try:
+        return await subscriber.start()
+    except Exception:
+        await subscriber.close()
+        raise
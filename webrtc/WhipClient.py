@@ -0,0 +1,146 @@
+import logging
+import re
+from urllib.parse import urljoin
+
+from aiohttp import ClientSession, TCPConnector
+
+logger = logging.getLogger("WHIP_Publisher")
+
+LOCATION_PATTERN = re.compile(r'/session/([^/]+)/([^/]+)$')
+
+
+def create_http_session(limit=64, keepalive_timeout=60):
+    """
+    创建共享的 HTTP 会话：连接池复用到 live777 的 TCP 连接，供多路推流共用
+    """
+    connector = TCPConnector(limit=limit, keepalive_timeout=keepalive_timeout)
+    return ClientSession(connector=connector)
+
+
+class WhipSession:
+    """一次 WHIP 推流会话（POST 成功后得到的 Location 信息）"""
+
+    def __init__(self, stream_id, session_id, location, answer_sdp):
+        self.stream_id = stream_id
+        self.session_id = session_id
+        self.location = location
+        self.answer_sdp = answer_sdp
+
+    def __repr__(self):
+        return f"WhipSession(stream_id={self.stream_id!r}, session_id={self.session_id!r})"
+
+
+class WhipClient:
+    """
+    WHIP/WHEP 协议的 HTTP 部分：POST offer、解析 Location、DELETE 结束会话。
+    session 由调用方传入以便多路推流、拉流共用同一个连接池。
+    """
+
+    def __init__(self, live777_base_url, session):
+        self.base_url = live777_base_url.rstrip("/")
+        self.session = session
+        # 服务器拒绝过 PATCH 后置为 False，之后的推流不再使用 trickle
+        self.trickle_supported = None
+
+    def whip_url(self, stream_id):
+        return f"{self.base_url}/whip/{stream_id}"
+
+    def whep_url(self, stream_id):
+        return f"{self.base_url}/whep/{stream_id}"
+
+    def session_url(self, whip_session):
+        return f"{self.base_url}/session/{whip_session.stream_id}/{whip_session.session_id}"
+
+    async def warm_up(self):
+        """
+        提前建立到 live777 的 TCP 连接（WHIP 允许 OPTIONS 预检），
+        连接留在连接池中，随后的 POST 不再需要握手。失败时返回 False，不影响推流。
+        """
+        try:
+            async with self.session.options(f"{self.base_url}/whip/") as response:
+                await response.read()
+            return True
+        except Exception as e:
+            logger.debug("HTTP 预连接失败: %s", e)
+            return False
+
+    async def publish(self, stream_id, offer_sdp):
+        """发送 offer，返回 WhipSession（包含 answer SDP）"""
+        return await self._post_offer(self.whip_url(stream_id), stream_id, offer_sdp, "WHIP")
+
+    async def subscribe(self, stream_id, offer_sdp):
+        """WHEP 拉流：发送 recvonly offer，返回 WhipSession，结束时同样用 delete()"""
+        return await self._post_offer(self.whep_url(stream_id), stream_id, offer_sdp, "WHEP")
+
+    async def _post_offer(self, url, stream_id, offer_sdp, protocol):
+        async with self.session.post(
+                url,
+                data=offer_sdp,
+                headers={"Content-Type": "application/sdp"}
+        ) as response:
+            if response.status != 201:
+                error_detail = await response.text()
+                logger.error("%s 失败: HTTP %d - %s", protocol, response.status, error_detail)
+                raise RuntimeError(f"{protocol} 失败: HTTP {response.status}")
+
+            location = response.headers.get('Location', '')
+            logger.info("Location header: %s", location)
+
+            session_id = None
+            match = LOCATION_PATTERN.search(location)
+            if match:
+                stream_id = match.group(1)
+                session_id = match.group(2)
+                logger.info("解析到 Stream ID: %s, Session ID: %s", stream_id, session_id)
+            else:
+                logger.warning("无法从Location解析Session ID: %s", location)
+
+            answer_sdp = await response.text()
+
+        return WhipSession(stream_id, session_id, location, answer_sdp)
+
+    async def streams(self):
+        """live777 的流列表（GET /api/streams/），每路流带推流和拉流会话"""
+        async with self.session.get(f"{self.base_url}/api/streams/") as response:
+            response.raise_for_status()
+            return await response.json()
+
+    async def patch(self, whip_session, sdpfrag):
+        """
+        向会话 Location 发送 trickle ICE 候选（application/trickle-ice-sdpfrag），
+        成功返回 True；405/501 等表示服务器不支持 trickle，返回 False
+        """
+        if whip_session is None or not whip_session.location:
+            return False
+        patch_url = urljoin(self.base_url + "/", whip_session.location)
+        try:
+            async with self.session.patch(
+                    patch_url,
+                    data=sdpfrag,
+                    headers={"Content-Type": "application/trickle-ice-sdpfrag"}
+            ) as response:
+                await response.read()
+                if 200 <= response.status < 300:
+                    self.trickle_supported = True
+                    return True
+                logger.warning("PATCH 被拒绝: HTTP %d", response.status)
+        except Exception as e:
+            logger.warning("发送PATCH请求时出错: %s", e)
+        self.trickle_supported = False
+        return False
+
+    async def delete(self, whip_session):
+        """通知服务器结束会话，成功返回 True"""
+        if whip_session is None or not whip_session.session_id:
+            return False
+        delete_url = self.session_url(whip_session)
+        logger.info("发送DELETE请求到: %s", delete_url)
+        try:
+            async with self.session.delete(delete_url) as resp:
+                if resp.status == 204:
+                    logger.info("成功终止服务器端会话")
+                    return True
+                logger.error("DELETE请求失败: HTTP %d", resp.status)
+        except Exception as e:
+            logger.error("发送DELETE请求时出错: %s", str(e))
+        return False
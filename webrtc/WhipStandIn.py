@@ -0,0 +1,490 @@
+"""
+本地 WHIP/WHEP 测试服务（live777 的替身），用于在没有 live777 的环境下测试推流和拉流：
+
+    python -m webrtc.WhipStandIn --port 7778 --stun-port 3478 --stun-delay 2
+
+支持 POST /whip/{stream}、POST /whep/{stream}、PATCH/DELETE /session/{stream}/{session}、
+GET /api/streams/ 和 DELETE /api/streams/{stream}，
+--no-trickle 时 PATCH 返回 405，用于测试推流端的回退逻辑；
+--stun-port 会同时启动一个 STUN Binding 应答器，--stun-delay 模拟慢速 STUN 服务器。
+
+与 live777 不同，这里的服务端 PeerConnection 会解码收到的视频：推流画面带有 SyntheticSource 的
+时间戳条码时，每帧都会算出端到端延迟。WHEP 订阅经 MediaRelay 转发解码后的帧，由 aiortc 为每个订阅者
+重新编码，因此 WHEP 端测得的延迟比真实的 SFU 转发多一次编解码。
+
+offer 带 a=simulcast:send 时接受全部层，按 rid 统计各层的包数和码率，只把 simulcast_layer 指定的一层
+（默认第一层）交给解码和 WHEP 转发；流列表中拉流会话的 "layer" 即这一层。
+
+推流带音频时逐包用 libopus 解码（aiortc 自带的解码器只接受 20ms 帧），不转发给 WHEP；
+音频是 AudioSource 的合成 beep 时，推流会话的 "audio" 中给出音频端到端延迟。
+"""
+import argparse
+import asyncio
+import collections
+import logging
+import time
+import uuid
+
+import av
+from aiohttp import web
+from aioice import stun
+from aiortc import RTCPeerConnection, RTCSessionDescription
+from aiortc.contrib.media import MediaRelay
+from aiortc.mediastreams import MediaStreamError
+from aiortc.sdp import candidate_from_sdp
+from av import VideoFrame
+
+from .AudioSource import SAMPLE_RATE, BeepDetector
+from .Simulcast import munge_answer, parse_simulcast, rid_extension
+from .SyntheticSource import frame_luma, read_stamp, stamp_latency_ms
+from .TrickleIce import TRICKLE_CONTENT_TYPE, parse_sdpfrag
+
+logger = logging.getLogger("WHIP_Publisher")
+
+
+class StunResponder(asyncio.DatagramProtocol):
+    """只应答 Binding 请求的 STUN 服务器，delay 秒后回复"""
+
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.transport = None
+        self.requests = 0
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def datagram_received(self, data, addr):
+        try:
+            request = stun.parse_message(data)
+        except ValueError:
+            return
+        if request.message_method != stun.Method.BINDING or request.message_class != stun.Class.REQUEST:
+            return
+        self.requests += 1
+        response = stun.Message(
+            message_method=stun.Method.BINDING,
+            message_class=stun.Class.RESPONSE,
+            transaction_id=request.transaction_id,
+        )
+        response.attributes["XOR-MAPPED-ADDRESS"] = addr
+        if self.delay > 0:
+            asyncio.get_running_loop().call_later(self.delay, self.transport.sendto, bytes(response), addr)
+        else:
+            self.transport.sendto(bytes(response), addr)
+
+
+def percentile(values, q):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+class FrameStats:
+    """收到的帧数、帧率和条码延迟，reset() 后重新计数（基准测试跳过预热阶段）"""
+
+    def __init__(self, max_samples=10000):
+        self.latencies = collections.deque(maxlen=max_samples)
+        self.reset()
+
+    def reset(self):
+        self.frames = 0
+        self.stamped = 0
+        self.since = time.monotonic()
+        self.latencies.clear()
+
+    def record(self, frame):
+        self.frames += 1
+        if isinstance(frame, VideoFrame):
+            stamp = read_stamp(frame_luma(frame))
+            if stamp is not None:
+                self.stamped += 1
+                self.latencies.append(stamp_latency_ms(stamp))
+
+    def to_dict(self):
+        elapsed = max(time.monotonic() - self.since, 1e-6)
+        latencies = list(self.latencies)
+        return {
+            "frames": self.frames,
+            "fps": round(self.frames / elapsed, 2),
+            "stamped": self.stamped,
+            "latency_p50_ms": percentile(latencies, 0.5),
+            "latency_p95_ms": percentile(latencies, 0.95),
+            "latency_max_ms": max(latencies, default=None),
+        }
+
+
+class LayerStats:
+    """simulcast 一层收到的 RTP 包数和负载字节数"""
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.packets = 0
+        self.bytes = 0
+        self.since = time.monotonic()
+
+    def record(self, size):
+        self.packets += 1
+        self.bytes += size
+
+    def to_dict(self):
+        elapsed = max(time.monotonic() - self.since, 1e-6)
+        return {"packets": self.packets, "kbps": round(self.bytes * 8 / elapsed / 1000, 1)}
+
+
+class AudioStats:
+    """收到的音频包数、码率和 beep 延迟（到达时刻减去 beep 所在的整秒，含解码前的全部环节）"""
+
+    def __init__(self, max_samples=1000):
+        self.latencies = collections.deque(maxlen=max_samples)
+        self.detector = BeepDetector()
+        self.decoder = av.CodecContext.create("libopus", "r")
+        self.decoder.sample_rate = SAMPLE_RATE
+        self.decoder.layout = "mono"
+        self.decoder.format = "s16"
+        self.reset()
+
+    def reset(self):
+        self.packets = 0
+        self.bytes = 0
+        self.since = time.monotonic()
+        self.latencies.clear()
+
+    def record(self, payload):
+        arrival = time.time()
+        self.packets += 1
+        self.bytes += len(payload)
+        for frame in self.decoder.decode(av.Packet(payload)):
+            latency = self.detector.feed(frame.to_ndarray().reshape(-1), arrival)
+            if latency is not None:
+                self.latencies.append(latency)
+
+    def to_dict(self):
+        elapsed = max(time.monotonic() - self.since, 1e-6)
+        latencies = list(self.latencies)
+        return {
+            "packets": self.packets,
+            "kbps": round(self.bytes * 8 / elapsed / 1000, 1),
+            "beeps": len(latencies),
+            "latency_p50_ms": percentile(latencies, 0.5),
+            "latency_p95_ms": percentile(latencies, 0.95),
+        }
+
+
+class StandInSession:
+    """一个推流（whip）或拉流（whep）会话：服务端 PeerConnection 及帧统计"""
+
+    def __init__(self, stream_id, session_id, pc, kind="whip"):
+        self.stream_id = stream_id
+        self.session_id = session_id
+        self.pc = pc
+        self.kind = kind
+        self.stats = FrameStats()
+        self.layers = {}
+        self.layer = None
+        self.audio = None
+        self.candidates = 0
+        self.created_at = time.time()
+        self._tasks = []
+
+    @property
+    def frames(self):
+        return self.stats.frames
+
+    def consume(self, track):
+        self._tasks.append(asyncio.ensure_future(self._consume(track)))
+
+    def receive_audio(self, receiver):
+        """直接接收音频 RTP 包并解码，绕过 aiortc 的抖动缓冲和解码线程"""
+        self.audio = AudioStats()
+
+        async def _handle_rtp_packet(packet, arrival_time_ms):
+            if packet.payload:
+                self.audio.record(packet.payload)
+
+        receiver._handle_rtp_packet = _handle_rtp_packet
+
+    async def _consume(self, track):
+        try:
+            while True:
+                self.stats.record(await track.recv())
+        except MediaStreamError:
+            pass
+
+    def to_dict(self):
+        result = {
+            "id": self.session_id,
+            "createdAt": int(self.created_at * 1000),
+            "state": self.pc.connectionState,
+            **self.stats.to_dict(),
+        }
+        if self.layers:
+            result["layers"] = {rid: stats.to_dict() for rid, stats in self.layers.items()}
+        if self.layer is not None:
+            result["layer"] = self.layer
+        if self.audio is not None:
+            result["audio"] = self.audio.to_dict()
+        return result
+
+    async def close(self):
+        for task in self._tasks:
+            task.cancel()
+        await self.pc.close()
+
+
+class StandInStream:
+    """一路流：当前的推流会话、其视频轨道（经 MediaRelay 分发）和拉流会话"""
+
+    def __init__(self, stream_id):
+        self.stream_id = stream_id
+        self.relay = MediaRelay()
+        self.track = None
+        self.layer = None
+        self.publisher = None
+        self.subscribers = {}
+        self.created_at = time.time()
+
+    def to_dict(self):
+        return {
+            "id": self.stream_id,
+            "createdAt": int(self.created_at * 1000),
+            "publish": {"sessions": [self.publisher.to_dict()] if self.publisher is not None else []},
+            "subscribe": {"sessions": [s.to_dict() for s in self.subscribers.values()]},
+        }
+
+
+class WhipStandIn:
+    """aiohttp 实现的 WHIP 服务端，接口与 live777 一致"""
+
+    def __init__(self, host="127.0.0.1", port=7778, trickle=True, stun_port=None, stun_delay=0.0,
+                 simulcast_layer=None):
+        self.host = host
+        self.port = port
+        self.trickle = trickle
+        self.stun_port = stun_port
+        self.stun_delay = stun_delay
+        self.simulcast_layer = simulcast_layer
+        self.sessions = {}
+        self.streams = {}
+        self.stun = None
+        self.patches = 0
+        self._runner = None
+        self._stun_transport = None
+
+        self.app = web.Application()
+        self.app.router.add_route("OPTIONS", "/whip/{tail:.*}", self.handle_options)
+        self.app.router.add_route("OPTIONS", "/whep/{tail:.*}", self.handle_options)
+        self.app.router.add_post("/whip/{stream}", self.handle_whip)
+        self.app.router.add_post("/whep/{stream}", self.handle_whep)
+        self.app.router.add_patch("/session/{stream}/{session}", self.handle_patch)
+        self.app.router.add_delete("/session/{stream}/{session}", self.handle_delete)
+        self.app.router.add_get("/api/streams/", self.handle_list_streams)
+        self.app.router.add_get("/api/streams", self.handle_list_streams)
+        self.app.router.add_delete("/api/streams/{stream}", self.handle_delete_stream)
+
+    @property
+    def url(self):
+        return f"http://{self.host}:{self.port}"
+
+    async def start(self):
+        self._runner = web.AppRunner(self.app)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, self.host, self.port)
+        await site.start()
+        if self.stun_port is not None:
+            loop = asyncio.get_running_loop()
+            self._stun_transport, self.stun = await loop.create_datagram_endpoint(
+                lambda: StunResponder(self.stun_delay), local_addr=("0.0.0.0", self.stun_port)
+            )
+        logger.info("WHIP 测试服务已启动: %s (trickle=%s)", self.url, self.trickle)
+
+    async def stop(self):
+        for session in list(self.sessions.values()):
+            await session.close()
+        self.sessions.clear()
+        self.streams.clear()
+        if self._stun_transport is not None:
+            self._stun_transport.close()
+        if self._runner is not None:
+            await self._runner.cleanup()
+
+    async def handle_options(self, request):
+        headers = {"Accept-Post": "application/sdp"}
+        if self.trickle:
+            headers["Accept-Patch"] = TRICKLE_CONTENT_TYPE
+        return web.Response(status=204, headers=headers)
+
+    def _stream(self, stream_id):
+        stream = self.streams.get(stream_id)
+        if stream is None:
+            stream = self.streams[stream_id] = StandInStream(stream_id)
+        return stream
+
+    async def _answer(self, session, offer):
+        pc = session.pc
+        await pc.setRemoteDescription(RTCSessionDescription(sdp=offer, type="offer"))
+        await pc.setLocalDescription(await pc.createAnswer())
+        answer = pc.localDescription.sdp
+        rids, rid_id = parse_simulcast(offer, "send") if session.kind == "whip" else ((), None)
+        if rids:
+            answer = munge_answer(answer, rids, rid_id)
+            self._filter_layers(session, rids, rid_id)
+        self.sessions[session.session_id] = session
+        return web.Response(
+            status=201,
+            text=answer,
+            content_type="application/sdp",
+            headers={"Location": f"/session/{session.stream_id}/{session.session_id}"},
+        )
+
+    def _filter_layers(self, session, rids, rid_id):
+        """按 rid 统计各层，只把选中的一层交给接收端（aiortc 的接收端只能解码一路 SSRC）"""
+        transport = session.pc.getTransceivers()[0].receiver.transport
+        transport._rtp_header_extensions_map.configure(rid_extension(rid_id))
+        session.layers = {rid: LayerStats() for rid in rids}
+        session.layer = self.simulcast_layer if self.simulcast_layer in rids else rids[0]
+        router = transport._rtp_router
+        route_rtp = router.route_rtp
+        ssrc_rids = {}
+
+        def route_layer(packet):
+            # rid 可能只出现在每路 SSRC 的前几个包里，之后按 SSRC 对应
+            rid = packet.extensions.rtp_stream_id
+            if rid is not None:
+                ssrc_rids[packet.ssrc] = rid
+            else:
+                rid = ssrc_rids.get(packet.ssrc)
+            stats = session.layers.get(rid)
+            if stats is not None:
+                stats.record(len(packet.payload))
+                if rid != session.layer:
+                    return None
+            return route_rtp(packet)
+
+        router.route_rtp = route_layer
+
+    async def handle_whip(self, request):
+        stream = self._stream(request.match_info["stream"])
+        offer = await request.text()
+        session = StandInSession(stream.stream_id, uuid.uuid4().hex[:12], RTCPeerConnection())
+
+        @session.pc.on("track")
+        def on_track(track):
+            if track.kind == "audio":
+                session.receive_audio(
+                    next(t.receiver for t in session.pc.getTransceivers() if t.receiver.track is track)
+                )
+                return
+            # 重新推流（同一个 stream id）时后来的会话成为新的源
+            stream.track = track
+            stream.relay = MediaRelay()
+            session.consume(stream.relay.subscribe(track, buffered=False))
+
+        stream.publisher = session
+        response = await self._answer(session, offer)
+        stream.layer = session.layer
+        return response
+
+    async def handle_whep(self, request):
+        stream = self.streams.get(request.match_info["stream"])
+        if stream is None or stream.track is None:
+            return web.Response(status=404, text="stream not found")
+        offer = await request.text()
+        session = StandInSession(stream.stream_id, uuid.uuid4().hex[:12], RTCPeerConnection(), kind="whep")
+        session.layer = stream.layer
+        session.pc.addTrack(stream.relay.subscribe(stream.track, buffered=False))
+        stream.subscribers[session.session_id] = session
+        return await self._answer(session, offer)
+
+    async def handle_patch(self, request):
+        session = self.sessions.get(request.match_info["session"])
+        if session is None:
+            return web.Response(status=404)
+        if not self.trickle:
+            return web.Response(status=405)
+        if request.content_type != TRICKLE_CONTENT_TYPE:
+            return web.Response(status=415)
+        self.patches += 1
+        _, _, entries = parse_sdpfrag(await request.text())
+        for mid, line in entries:
+            if line is None:
+                continue
+            candidate = candidate_from_sdp(line)
+            candidate.sdpMid = mid
+            await session.pc.addIceCandidate(candidate)
+            session.candidates += 1
+        return web.Response(status=204)
+
+    async def _close_session(self, session):
+        self.sessions.pop(session.session_id, None)
+        stream = self.streams.get(session.stream_id)
+        if stream is not None:
+            if stream.publisher is session:
+                stream.publisher = None
+            stream.subscribers.pop(session.session_id, None)
+            if stream.publisher is None and not stream.subscribers:
+                del self.streams[stream.stream_id]
+        await session.close()
+
+    async def handle_delete(self, request):
+        session = self.sessions.get(request.match_info["session"])
+        if session is None:
+            return web.Response(status=404)
+        await self._close_session(session)
+        return web.Response(status=204)
+
+    async def handle_list_streams(self, request):
+        return web.json_response([stream.to_dict() for stream in self.streams.values()])
+
+    async def handle_delete_stream(self, request):
+        stream = self.streams.get(request.match_info["stream"])
+        if stream is None:
+            return web.Response(status=404)
+        sessions = list(stream.subscribers.values())
+        if stream.publisher is not None:
+            sessions.append(stream.publisher)
+        for session in sessions:
+            await self._close_session(session)
+        self.streams.pop(stream.stream_id, None)
+        return web.Response(status=204)
+
+    def reset_stats(self):
+        """所有会话重新开始统计"""
+        for session in self.sessions.values():
+            session.stats.reset()
+            for stats in session.layers.values():
+                stats.reset()
+            if session.audio is not None:
+                session.audio.reset()
+
+
+async def serve(**kwargs):
+    server = WhipStandIn(**kwargs)
+    await server.start()
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await server.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="本地 WHIP 测试服务")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=7778)
+    parser.add_argument("--no-trickle", action="store_true", help="PATCH 返回 405")
+    parser.add_argument("--stun-port", type=int, default=None)
+    parser.add_argument("--stun-delay", type=float, default=0.0, help="STUN 应答延迟（秒）")
+    parser.add_argument("--simulcast-layer", default=None, help="simulcast 推流时解码和转发的 RID（默认第一层）")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(serve(
+        host=args.host, port=args.port, trickle=not args.no_trickle,
+        stun_port=args.stun_port, stun_delay=args.stun_delay, simulcast_layer=args.simulcast_layer,
+    ))
+
+
+if __name__ == "__main__":
+    main()
@@ -4,16 +4,25 @@
 import asyncio
 import random
 import logging
-from fractions import Fraction
+import sys
 
 import cv2
 import os
-import time
 from aiohttp import ClientSession
-from aiortc import RTCPeerConnection, VideoStreamTrack, RTCConfiguration, RTCSessionDescription, RTCIceServer
-from av import VideoFrame
+from aiortc import VideoStreamTrack
 from aiortc.contrib.media import MediaBlackhole
 
+if not __package__:
+    # 作为脚本直接运行（python webrtc/main.py）时按包导入，兄弟模块都只用相对导入
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    __package__ = "webrtc"
+
+from .FrameGrabber import ThreadedFrameGrabber
+from .FrameConverter import create_converter
+from .FramePacer import FramePacer, MediaClock
+from .PublishSupervisor import PublishSupervisor
+from .WhipClient import WhipClient, create_http_session
+
 # 禁用IPv6以避免潜在问题
 os.environ['AIORTC_IPv6'] = '0'
 
@@ -22,36 +31,51 @@ logger = logging.getLogger("WHIP_Publisher")
 
 
 class CameraStreamTrack(VideoStreamTrack):
-    def __init__(self, camera_index=0, width=640, height=480, fps=30):
+    def __init__(self, camera_index=0, width=640, height=480, fps=30, conversion="zerocopy"):
         super().__init__()
         self.camera = cv2.VideoCapture(camera_index)
         self.camera.set(cv2.CAP_PROP_FRAME_WIDTH, width)
         self.camera.set(cv2.CAP_PROP_FRAME_HEIGHT, height)
         self.camera.set(cv2.CAP_PROP_FPS, fps)
-        self.frame_interval = 1.0 / fps
-        self.last_frame_time = time.time()
+        # 单调时钟节拍 + 90kHz 采集时间戳，不受系统校时影响
+        self.clock = MediaClock()
+        self.pacer = FramePacer(fps)
+
+        # 采集和颜色转换在独立线程中完成，不阻塞事件循环
+        self.grabber = ThreadedFrameGrabber(
+            self.camera,
+            converter=create_converter(conversion),
+            name=f"camera{camera_index}",
+        )
+        self.grabber.start()
 
     async def recv(self):
         # 控制帧率
-        now = time.time()
-        elapsed = now - self.last_frame_time
-        if elapsed < self.frame_interval:
-            await asyncio.sleep(self.frame_interval - elapsed)
-        self.last_frame_time = now
-
-        # 读取并转换帧
-        ret, frame = self.camera.read()
-        if not ret:
-            raise RuntimeError("摄像头读取失败")
+        await self.pacer.wait()
 
-        frame = cv2.cvtColor(frame, cv2.COLOR_BGR2YUV_I420)
-        av_frame = VideoFrame.from_ndarray(frame, format="yuv420p")
+        # 等待采集线程送来的最新帧（已转换为I420 VideoFrame）
+        av_frame, capture_time = await self.grabber.read_timed()
 
-        av_frame.pts = int(now * 1000)  # 毫秒时间戳
-        av_frame.time_base = Fraction(1, 1000)
+        av_frame.pts = self.clock.pts(capture_time)
+        av_frame.time_base = self.clock.time_base
+        self.pacer.record_send()
 
         return av_frame
 
+    def stats(self):
+        """采集统计（丢帧数、队列等待时间等）"""
+        return self.grabber.stats()
+
+    def pacing_stats(self):
+        """发送间隔直方图及跳帧数"""
+        return self.pacer.stats()
+
+    def stop(self):
+        super().stop()
+        self.grabber.stop()
+        if self.camera.isOpened():
+            self.camera.release()
+
     def __del__(self):
         if self.camera.isOpened():
             self.camera.release()
@@ -60,79 +84,44 @@ async def whip_publish_webrtc(
         live777_base_url="http://huai-xhy.site:7777",
         live_stream_id=None,
 ):
-    pc = None
+    video_track = None
+    supervisor = None
     # 如果没有提供stream_id，生成一个随机ID
     if live_stream_id is None:
         live_stream_id = str(random.randint(100000000, 999999999))
-    try:
-        # 配置ICE服务器（STUN+TURN）
-        pc = RTCPeerConnection(
-            configuration=RTCConfiguration(
-                iceServers=[
-                    # live777 配置了 stun和turn 无需推流和拉流 配置
-                ]
-            )
-        )
-
-        # 添加ICE状态监控
-        @pc.on("iceconnectionstatechange")
-        async def on_ice_change():
-            state = pc.iceConnectionState
-            logger.info(f"ICE状态变化: {state}")
-            if state == "failed":
-                logger.error("ICE连接失败!")
 
-        # 添加候选收集监控
-        @pc.on("icecandidate")
-        def on_ice_candidate(candidate):
-            if candidate:
-                logger.debug(f"发现候选: {candidate.candidate}")
+    # 配置ICE服务器（STUN+TURN）
+    ice_servers = [
+        # live777 配置了 stun和turn 无需推流和拉流 配置
+    ]
 
+    http_session = create_http_session()
+    whip_client = WhipClient(live777_base_url, http_session)
+    try:
         # 添加视频轨道
         video_track = CameraStreamTrack()
-        pc.addTrack(video_track)
-
-        # 创建并设置offer
-        offer = await pc.createOffer()
-        await pc.setLocalDescription(offer)
-
-        # 发送WHIP请求
-        whip_url = f"{live777_base_url}/whip/{live_stream_id}"
-        async with ClientSession() as session:
-            async with session.post(
-                    whip_url,
-                    data=pc.localDescription.sdp,
-                    headers={"Content-Type": "application/sdp"}
-            ) as response:
-                if response.status != 201:
-                    error = await response.text()
-                    logger.error(f"WHIP请求失败: {response.status} - {error}")
-                    raise RuntimeError(f"WHIP请求失败: {response.status}")
-
-                # 处理响应
-                location = response.headers.get('Location', '')
-                logger.info(f"WHIP Location: {location}")
-
-                answer_sdp = await response.text()
-                answer = RTCSessionDescription(sdp=answer_sdp, type="answer")
-                await pc.setRemoteDescription(answer)
-
-        logger.info("WebRTC连接已建立")
-
-        # 保持连接
-        while pc.iceConnectionState not in ["failed", "disconnected", "closed"]:
-            await asyncio.sleep(1)
+
+        # 连接失效（ICE失败、服务器断开）时用同一个 stream id 自动重新推流，摄像头保持打开
+        supervisor = PublishSupervisor(whip_client, video_track, live_stream_id, ice_servers=ice_servers)
+        await supervisor.run()
 
     except Exception as e:
         logger.error(f"发生错误: {str(e)}", exc_info=True)
     finally:
         logger.info("开始清理资源...")
 
-        # 关闭WebRTC连接
-        if pc is not None:
-            await pc.close()
+        # 关闭WebRTC连接并结束当前会话
+        if supervisor is not None:
+            logger.info("重连统计: %s", supervisor.stats())
+            await supervisor.close()
             logger.info("WebRTC连接已关闭")
 
+        # 停止采集线程
+        if video_track is not None:
+            logger.info("采集统计: %s", video_track.stats())
+            logger.info("发送节拍: %s", video_track.pacing_stats())
+            video_track.stop()
+
         # 发送DELETE请求通知服务器
         if live_stream_id:
             delete_url = f"{live777_base_url}/api/streams/{live_stream_id}"
@@ -146,6 +135,7 @@ async def whip_publish_webrtc(
                             logger.error("DELETE请求失败: HTTP %d", resp.status)
             except Exception as e:
                 logger.error("发送DELETE请求时出错: %s", str(e))
+        await http_session.close()
 
 
 if __name__ == "__main__":